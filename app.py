@@ -1,45 +1,34 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, current_app, stream_with_context, session
+from markupsafe import Markup
+from werkzeug.datastructures import ContentRange
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField
 from wtforms.validators import DataRequired
 import os
-from dotenv import load_dotenv
+import json
+import time
+import asyncio
+import logging
+import shutil
+import tempfile
+import zipfile
+from datetime import timezone
+from io import BytesIO
 
-# Load environment variables
-load_dotenv()
-
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "products.db")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Import models and services
+# Models and lightweight utilities only; services (Pillow, requests) load lazily
 from models.product import Product, db
-from services.product_service import ProductService
-from services.image_search import ImageSearchService
-from services.image_processor import ImageProcessor
+from models.catalog_version import CatalogVersion
+from models.image_file import ImageFile
+from models.superseded_image import SupersededImage
+from models.task_lease import TaskLease
+from models.work_lease import WorkLease
+from services.container import ServiceContainer
+from services.work_scheduler import INTERACTIVE
+from utils.log import configure_logging, log_event
+from utils.metrics import registry, instrument_sqlalchemy, HTTP_REQUEST_SECONDS
+from utils.profiling import RequestProfiler
 
-# Initialize database with app
-def init_db():
-    # Ensure database directory exists
-    database_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database")
-    os.makedirs(database_dir, exist_ok=True)
-    
-    # Initialize the database with the app
-    db.init_app(app)
-    
-    with app.app_context():
-        db.create_all()
-
-# Initialize database first
-init_db()
-
-# Initialize services after database is ready
-product_service = ProductService()
-image_search_service = ImageSearchService()
-image_processor = ImageProcessor()
+logger = logging.getLogger(__name__)
 
 # Forms
 class ProductForm(FlaskForm):
@@ -51,149 +40,750 @@ class ImageSearchForm(FlaskForm):
     search_term = StringField('Search Term', validators=[DataRequired()])
     submit = SubmitField('Search Images')
 
-# Routes
-@app.route('/')
-def index():
-    """Home page"""
-    # Get statistics
-    total_products = product_service.get_products_count()
-    products_with_images = product_service.get_products_with_images_count()
-    products_without_images = total_products - products_with_images
-    completion_percentage = round((products_with_images / total_products * 100) if total_products > 0 else 0, 1)
-    
-    # Get recent products (last 5)
-    recent_products = Product.query.order_by(Product.created_at.desc()).limit(5).all()
-    
-    # Get products needing images (first 5)
-    products_needing_images = product_service.get_products_without_images()[:5]
-    
-    return render_template('index.html', 
-                         total_products=total_products,
-                         products_with_images=products_with_images,
-                         products_without_images=products_without_images,
-                         completion_percentage=completion_percentage,
-                         recent_products=recent_products,
-                         products_needing_images=products_needing_images)
-
-@app.route('/products')
-def product_list():
-    """List all products"""
-    products = product_service.get_all_products()
-    return render_template('products/list.html', products=products)
-
-@app.route('/products/add', methods=['GET', 'POST'])
-def add_product():
-    """Add new product"""
-    form = ProductForm()
-    if form.validate_on_submit():
-        product = Product(
-            name=form.name.data,
-            code=form.code.data,
-            image_path=None
-        )
-        product_service.add_product(product)
-        flash('Product added successfully!', 'success')
-        return redirect(url_for('product_list'))
-    return render_template('products/add.html', form=form)
-
-@app.route('/products/<int:product_id>/search')
-def search_images(product_id):
-    """Search for images for a specific product"""
-    product = product_service.get_product_by_id(product_id)
-    if not product:
-        flash('Product not found!', 'error')
-        return redirect(url_for('product_list'))
-    
-    form = ImageSearchForm()
-    
-    # Pre-populate with product name and perform initial search
-    form.search_term.data = product.name
-    images = image_search_service.search_images(product.name)
-    
-    return render_template('products/search.html', 
-                         product=product, 
-                         form=form, 
-                         initial_images=images,
-                         search_term=product.name)
-
-@app.route('/products/<int:product_id>/search', methods=['POST'])
-def perform_image_search(product_id):
-    """Perform image search for a product"""
-    form = ImageSearchForm()
-    
-    # Get search term from form data directly if validation fails
-    search_term = form.search_term.data if form.search_term.data else request.form.get('search_term')
-    
-    # If no search term provided, use the product name as default
-    if not search_term:
-        product = product_service.get_product_by_id(product_id)
-        if product:
-            search_term = product.name
+def create_app(config_name: str = None, background_tasks: bool = True) -> Flask:
+    """
+    Application factory
+
+    Args:
+        config_name: Key into config.config (defaults to FLASK_CONFIG or 'default')
+        background_tasks: Start periodic maintenance threads (image GC)
+
+    Returns:
+        Configured Flask application
+    """
+    from config import config
+
+    app = Flask(__name__)
+    app.config.from_object(config[config_name or os.getenv('FLASK_CONFIG', 'default')])
+
+    configure_logging()
+    instrument_sqlalchemy()
+    RequestProfiler(app)
+
+    init_db(app)
+    app.extensions['services'] = ServiceContainer(app.config)
+
+    register_instrumentation(app)
+    register_routes(app)
+    register_async_routes(app)
+
+    if background_tasks:
+        start_background_tasks(app)
+    return app
+
+def init_db(app: Flask):
+    """Initialize the database with the app (safe to call more than once)"""
+    # Ensure database directory exists
+    os.makedirs(app.config.get('DATABASE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "database")),
+                exist_ok=True)
+
+    # Initialize the database with the app
+    if 'sqlalchemy' not in app.extensions:
+        db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        Product.add_missing_columns()
+        Product.add_missing_indexes()
+        CatalogVersion.ensure()
+
+def start_background_tasks(app: Flask):
+    """Start the periodic superseded-image garbage collector"""
+    interval = app.config.get('IMAGE_GC_INTERVAL', 0)
+    if interval <= 0 or 'image_gc' in app.extensions:
+        return
+
+    from services.image_gc import ImageGarbageCollector
+
+    collector = ImageGarbageCollector(upload_folder=app.config['UPLOAD_FOLDER'],
+                                      batch_size=app.config.get('IMAGE_GC_BATCH_SIZE', 500),
+                                      grace_seconds=app.config.get('IMAGE_GC_GRACE_SECONDS', 300),
+                                      storage=app.extensions['services'].storage)
+    collector.start_background(app, interval)
+    app.extensions['image_gc'] = collector
+
+def get_services() -> ServiceContainer:
+    """Services of the current application"""
+    return current_app.extensions['services']
+
+def batch_items_from_request():
+    """Items of a batch request body, or an error response"""
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'items' in data:
+        items = data['items']
+    elif isinstance(data, dict):
+        items = [{'product_id': pid, 'image_url': url} for pid, url in data.items()]
+    else:
+        items = data
+
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({'error': 'A non-empty list of items is required'}), 400)
+    if len(items) > current_app.config['BATCH_MAX_ITEMS']:
+        return None, (jsonify({'error': f"At most {current_app.config['BATCH_MAX_ITEMS']} items per request; "
+                                        f"use the streaming endpoint for more"}), 413)
+    return items, None
+
+def archive_from_request():
+    """
+    Seekable file holding the ZIP archive of an ingest request, or an error response
+
+    The caller owns the file: Flask closes request.files as soon as the view
+    returns, before a streamed response has read the archive.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('archive')
+        if upload is None:
+            return None, (jsonify({'error': 'A ZIP file is required in the "archive" field'}), 400)
+        # Take over the spooled upload so closing the request leaves it open
+        archive, upload.stream = upload.stream, BytesIO()
+    else:
+        archive = tempfile.SpooledTemporaryFile(max_size=current_app.config['INGEST_SPOOL_BYTES'])
+        shutil.copyfileobj(request.stream, archive, 1024 * 1024)
+
+    if not zipfile.is_zipfile(archive):
+        archive.close()
+        return None, (jsonify({'error': 'Not a ZIP archive'}), 400)
+    return archive, None
+
+def export_options_from_request():
+    """ExportSelection and manifest format of an export request, or an error response"""
+    from services.catalog_export import ExportSelection, MANIFEST_FORMATS
+
+    manifest_format = request.args.get('manifest', 'csv')
+    if manifest_format not in MANIFEST_FORMATS:
+        return None, None, (jsonify({'error': f"manifest must be one of {', '.join(MANIFEST_FORMATS)}"}), 400)
+    try:
+        selection = ExportSelection.parse(request.args.get('after_id'), request.args.get('until_id'),
+                                          request.args.get('since'))
+    except ValueError as e:
+        return None, None, (jsonify({'error': str(e)}), 400)
+    return selection, manifest_format, None
+
+def range_applies(etag: str, last_modified) -> bool:
+    """Whether a Range header may be honoured: If-Range, when sent, must match the current representation"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified is not None and if_range.date >= last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    return True
+
+def save_selected_image(product_id: int, image_url: str, product_code: str, progress=None,
+                        crop_mode: str = None) -> str:
+    """
+    Save the image a user picked, from the prefetch cache when it was warmed
+
+    Runs in the work scheduler's interactive lane, ahead of queued batch items.
+    """
+    services = get_services()
+    prefetcher, processor = services.prefetcher, services.image_processor
+    prefetcher.cancel(product_id, keep=[image_url])
+
+    def save():
+        # Prefetched copies are cropped with the configured mode
+        if crop_mode in (None, processor.crop_mode):
+            prepared = prefetcher.take(image_url)
+            if prepared is not None:
+                return processor.save_prepared(prepared, image_url, product_code, progress)
+        return processor.process_and_save_image(image_url, product_code, progress, crop_mode)
+
+    return services.work_scheduler.run(INTERACTIVE, save)
+
+def crop_mode_from_request(data: dict):
+    """Optional crop_mode of an image update body, or an error response"""
+    from services.cropping import CROP_MODES
+
+    crop_mode = data.get('crop_mode')
+    if crop_mode is not None and crop_mode not in CROP_MODES:
+        return None, (jsonify({'error': f"crop_mode must be one of {', '.join(CROP_MODES)}"}), 400)
+    return crop_mode, None
+
+def cached_page(key, render):
+    """
+    Serve a catalog page from the render cache with ETag/Last-Modified validators
+
+    Pages with pending flash messages belong to one session, so they are
+    rendered fresh and sent without validators.
+    """
+    if session.get('_flashes'):
+        return render()
+
+    entry = get_services().render_cache.render(key, render)
+    response = Response(entry.body, mimetype='text/html')
+    response.set_etag(entry.etag)
+    if entry.last_modified:
+        response.last_modified = entry.last_modified
+    # Let browsers keep the page but revalidate it on every view
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def register_instrumentation(app: Flask):
+    """Time every request per endpoint"""
+    @app.before_request
+    def start_request_timer():
+        request.environ['app.request_started'] = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        started = request.environ.get('app.request_started')
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                         endpoint=request.endpoint or 'unknown',
+                                         status=response.status_code)
+        return response
+
+def register_routes(app: Flask):
+    """Register the application's routes"""
+
+    @app.route('/')
+    def index():
+        """Home page"""
+        product_service = get_services().product_service
+
+        # Get statistics
+        total_products = product_service.get_products_count()
+        products_with_images = product_service.get_products_with_images_count()
+        products_without_images = total_products - products_with_images
+        completion_percentage = round((products_with_images / total_products * 100) if total_products > 0 else 0, 1)
+
+        # Get recent products (last 5)
+        recent_products = Product.query.order_by(Product.created_at.desc()).limit(5).all()
+
+        # Get products needing images (first 5)
+        products_needing_images = product_service.get_products_without_images(limit=5)
+
+        return render_template('index.html',
+                             total_products=total_products,
+                             products_with_images=products_with_images,
+                             products_without_images=products_without_images,
+                             completion_percentage=completion_percentage,
+                             recent_products=recent_products,
+                             products_needing_images=products_needing_images)
+
+    @app.route('/products')
+    def product_list():
+        """List all products"""
+        return cached_page(('product_list',), lambda: render_template(
+            'products/list.html', products=get_services().product_service.get_all_products()))
+
+    @app.route('/products/add', methods=['GET', 'POST'])
+    def add_product():
+        """Add new product"""
+        form = ProductForm()
+        if form.validate_on_submit():
+            product = Product(
+                name=form.name.data,
+                code=form.code.data,
+                image_path=None
+            )
+            get_services().product_service.add_product(product)
+            flash('Product added successfully!', 'success')
+            return redirect(url_for('product_list'))
+        return render_template('products/add.html', form=form)
+
+    @app.route('/products/<int:product_id>/search')
+    def search_images(product_id):
+        """Search for images for a specific product"""
+        services = get_services()
+        product = services.product_service.get_product_by_id(product_id)
+        if not product:
+            flash('Product not found!', 'error')
+            return redirect(url_for('product_list'))
+
+        form = ImageSearchForm()
+
+        # Pre-populate with product name; the initial results are a cached fragment
+        # because the form carries a per-session CSRF token
+        form.search_term.data = product.name
+        results = services.render_cache.render(('search_results', product_id, product.name), lambda: render_template(
+            'products/_search_results.html',
+            product=product,
+            initial_images=services.image_search_service.search_images(product.name),
+            search_term=product.name))
+
+        return render_template('products/search.html',
+                             product=product,
+                             form=form,
+                             results_html=Markup(results.body.decode('utf-8')),
+                             search_term=product.name)
+
+    @app.route('/products/<int:product_id>/search', methods=['POST'])
+    def perform_image_search(product_id):
+        """Perform image search for a product"""
+        services = get_services()
+        form = ImageSearchForm()
+
+        # Get search term from form data directly if validation fails
+        search_term = form.search_term.data if form.search_term.data else request.form.get('search_term')
+
+        # If no search term provided, use the product name as default
+        if not search_term:
+            product = services.product_service.get_product_by_id(product_id)
+            if product:
+                search_term = product.name
+            else:
+                return jsonify({'error': 'Product not found'}), 404
+
+        if search_term:
+            product = services.product_service.get_product_by_id(product_id)
+            if not product:
+                return jsonify({'error': 'Product not found'}), 404
+
+            def render_preview():
+                images = services.image_search_service.search_images(search_term)
+                log_event(logger, logging.INFO, 'product_image_search', product_id=product_id,
+                          term=search_term, results=len(images))
+                return render_template('products/preview.html',
+                                     product=product,
+                                     images=images,
+                                     search_term=search_term)
+
+            return cached_page(('search_preview', product_id, search_term), render_preview)
         else:
+            log_event(logger, logging.WARNING, 'product_image_search_missing_term',
+                      product_id=product_id, form_errors=form.errors)
+
+        return redirect(url_for('search_images', product_id=product_id))
+
+    @app.route('/products/<int:product_id>/update-image', methods=['POST'])
+    def update_product_image(product_id):
+        """Update product image"""
+        services = get_services()
+        data = request.get_json()
+        image_url = data.get('image_url')
+
+        if not image_url:
+            return jsonify({'error': 'Image URL is required'}), 400
+        crop_mode, error = crop_mode_from_request(data)
+        if error:
+            return error
+
+        product = services.product_service.get_product_by_id(product_id)
+        if not product:
             return jsonify({'error': 'Product not found'}), 404
-    
-    if search_term:
-        product = product_service.get_product_by_id(product_id)
+
+        try:
+            # Download and process image (or take the prefetched copy)
+            image_path = save_selected_image(product_id, image_url, product.code, crop_mode=crop_mode)
+
+            # Update product with new image path and its metadata
+            services.product_service.update_product_image(product_id, image_path,
+                                                          services.image_processor.image_metadata(image_path))
+
+            return jsonify({
+                'success': True,
+                'message': 'Image updated successfully',
+                'image_path': image_path
+            })
+        except Exception as e:
+            log_event(logger, logging.ERROR, 'product_image_update_failed', product_id=product_id,
+                      url=image_url, error=str(e))
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/products/<int:product_id>/prefetch', methods=['POST'])
+    def prefetch_candidates(product_id):
+        """Warm the top search candidates shown for a product before one is selected"""
+        services = get_services()
+        data = request.get_json(silent=True) or {}
+        image_urls = data.get('image_urls')
+        if not isinstance(image_urls, list):
+            return jsonify({'error': 'A list of image URLs is required'}), 400
+        if not services.product_service.get_product_by_id(product_id):
+            return jsonify({'error': 'Product not found'}), 404
+        if app.config.get('PREFETCH_TOP_N', 0) <= 0:
+            return jsonify({'scheduled': 0}), 202
+
+        scheduled = services.prefetcher.prefetch(product_id, [url for url in image_urls if isinstance(url, str)])
+        return jsonify({'scheduled': scheduled}), 202
+
+    @app.route('/products/<int:product_id>/prefetch', methods=['DELETE'])
+    def cancel_prefetch(product_id):
+        """Cancel the prefetches of a product (the user left the results page)"""
+        services = get_services()
+        if not services.is_loaded('prefetcher'):
+            return jsonify({'cancelled': 0})
+        return jsonify({'cancelled': services.prefetcher.cancel(product_id)})
+
+    @app.route('/products/batch/update-images', methods=['POST'])
+    def batch_update_images():
+        """Update many product images in one call
+
+        Body: {"items": [{"product_id": 1, "image_url": "..."}, ...]}
+        or a plain {"<product_id>": "<image_url>", ...} mapping.
+        """
+        items, error = batch_items_from_request()
+        if error:
+            return error
+
+        results = list(get_services().batch_updater.run(items))
+        succeeded = sum(1 for result in results if result['success'])
+        return jsonify({
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
+        })
+
+    @app.route('/products/batch/update-images/stream', methods=['POST'])
+    def batch_update_images_stream():
+        """Streaming variant: JSON-lines items in, one JSON-lines result per item out"""
+        def read_items():
+            for line in request.stream:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield {'_invalid': line.decode(errors='replace')[:200]}
+
+        def generate():
+            for result in get_services().batch_updater.run(read_items()):
+                yield json.dumps(result) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    @app.route('/products/ingest', methods=['POST'])
+    def ingest_images():
+        """Set images from an uploaded ZIP of files named after product codes
+
+        Body: the archive itself (Content-Type: application/zip) or a multipart
+        form with it in the "archive" field. One JSON-lines result per image
+        file out, as entries are processed.
+        """
+        archive, error = archive_from_request()
+        if error:
+            return error
+
+        def generate():
+            from services.image_ingest import open_zip
+
+            try:
+                with open_zip(archive) as entries:
+                    for result in get_services().image_ingester.run(entries):
+                        yield json.dumps(result) + '\n'
+            finally:
+                archive.close()
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    @app.route('/products/export.<any(zip, tar):archive_format>')
+    def export_images(archive_format):
+        """Stream every product image plus a manifest as a ZIP or TAR archive
+
+        Query: manifest=csv|json, after_id, until_id, since (ISO 8601). TAR
+        exports have a Content-Length and honour Range/If-Range, so interrupted
+        downloads resume where they stopped.
+        """
+        selection, manifest_format, error = export_options_from_request()
+        if error:
+            return error
+        exporter = get_services().catalog_exporter
+        disposition = {'Content-Disposition': f'attachment; filename=catalog-images.{archive_format}'}
+
+        if archive_format == 'zip':
+            response = Response(stream_with_context(exporter.zip_stream(selection, manifest_format)),
+                                mimetype='application/zip', headers=disposition)
+            response.accept_ranges = 'none'
+            return response
+
+        # Tag first: a write during planning must not carry the older tag
+        etag, last_modified = exporter.version_tag('tar', manifest_format, selection)
+        export = exporter.plan_tar(selection, manifest_format)
+        start, stop, status = 0, export.size, 200
+        if request.range and len(request.range.ranges) == 1 and range_applies(etag, last_modified):
+            byte_range = request.range.range_for_length(export.size)
+            if byte_range is None:
+                export.close()
+                response = Response(status=416)
+                response.content_range = ContentRange('bytes', None, None, export.size)
+                return response
+            (start, stop), status = byte_range, 206
+
+        response = Response(stream_with_context(export.iter_bytes(start, stop)), status=status,
+                            mimetype='application/x-tar', headers=disposition)
+        response.content_length = stop - start
+        response.accept_ranges = 'bytes'
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+        if status == 206:
+            response.content_range = ContentRange('bytes', start, stop, export.size)
+        return response
+
+    def start_job(job, work):
+        """Run work() for a tracked job on the job pool, inside an app context"""
+        services = get_services()
+        tracker = services.job_tracker
+
+        def run():
+            with app.app_context():
+                try:
+                    tracker.update(job.id, 'done', result=work(tracker.progress_callback(job.id)))
+                except Exception as e:
+                    log_event(logger, logging.ERROR, 'image_job_failed', job_id=job.id, kind=job.kind,
+                              error=str(e))
+                    tracker.update(job.id, 'failed', error=str(e))
+
+        services.job_executor.submit(run)
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', ids=job.id)
+        }), 202
+
+    @app.route('/products/<int:product_id>/update-image/async', methods=['POST'])
+    def update_product_image_async(product_id):
+        """Start an image update in the background and return its job id"""
+        services = get_services()
+        data = request.get_json(silent=True) or {}
+        image_url = data.get('image_url')
+        if not image_url:
+            return jsonify({'error': 'Image URL is required'}), 400
+        crop_mode, error = crop_mode_from_request(data)
+        if error:
+            return error
+
+        product = services.product_service.get_product_by_id(product_id)
         if not product:
             return jsonify({'error': 'Product not found'}), 404
-        
-        print(f"Searching for: {search_term}")  # Debug print
-        images = image_search_service.search_images(search_term)
-        print(f"Found {len(images)} images")  # Debug print
-        
-        return render_template('products/preview.html', 
-                             product=product, 
-                             images=images, 
-                             search_term=search_term)
-    else:
-        print("No search term provided!")
-        print(f"Form errors: {form.errors}")
-    
-    return redirect(url_for('search_images', product_id=product_id))
-
-@app.route('/products/<int:product_id>/update-image', methods=['POST'])
-def update_product_image(product_id):
-    """Update product image"""
-    data = request.get_json()
-    image_url = data.get('image_url')
-    
-    if not image_url:
-        return jsonify({'error': 'Image URL is required'}), 400
-    
-    product = product_service.get_product_by_id(product_id)
-    if not product:
-        return jsonify({'error': 'Product not found'}), 404
-    
+        product_code = product.code
+
+        def work(progress):
+            image_path = save_selected_image(product_id, image_url, product_code, progress, crop_mode)
+            services.product_service.update_product_image(product_id, image_path,
+                                                          services.image_processor.image_metadata(image_path))
+            return {'product_id': product_id, 'image_path': image_path}
+
+        job = services.job_tracker.create('single', product_id=product_id)
+        return start_job(job, work)
+
+    @app.route('/products/batch/update-images/async', methods=['POST'])
+    def batch_update_images_async():
+        """Start a batch image update in the background and return its job id"""
+        items, error = batch_items_from_request()
+        if error:
+            return error
+        services = get_services()
+
+        def work(progress):
+            results = list(services.batch_updater.run(items, progress))
+            succeeded = sum(1 for result in results if result['success'])
+            return {'succeeded': succeeded, 'failed': len(results) - succeeded}
+
+        job = services.job_tracker.create('batch', total=len(items))
+        return start_job(job, work)
+
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        """Current state of a background image job"""
+        job = get_services().job_tracker.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job.to_dict())
+
+    @app.route('/jobs/events')
+    def job_events():
+        """Server-Sent Events stream of progress for one or more jobs
+
+        Follow several jobs over one connection with ?ids=<id>,<id>. Each event
+        carries its sequence number as the SSE id, so a reconnecting EventSource
+        resumes after Last-Event-ID. The stream ends once every job finished.
+        """
+        tracker = get_services().job_tracker
+        job_ids = [job_id for job_id in request.args.get('ids', '').split(',') if job_id]
+        if not job_ids:
+            return jsonify({'error': 'ids is required'}), 400
+        keepalive = app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+        resume_from = request.headers.get('Last-Event-ID', request.args.get('after', ''))
+
+        def message(event, payload, seq=None):
+            prefix = f'id: {seq}\n' if seq is not None else ''
+            return f'{prefix}event: {event}\ndata: {json.dumps(payload)}\n\n'
+
+        def generate():
+            if resume_from.isdigit():
+                last = int(resume_from)
+            else:
+                # Fresh follower: start from the current state of each job
+                last = tracker.last_seq
+                for job_id in job_ids:
+                    job = tracker.get(job_id)
+                    yield message('snapshot', job.to_dict() if job else {'id': job_id, 'state': 'unknown'})
+
+            while not tracker.all_finished(job_ids):
+                events = tracker.events_since(last, job_ids, timeout=keepalive)
+                if not events:
+                    yield ': keepalive\n\n'
+                for seq, event, payload in events:
+                    last = seq
+                    yield message(event, payload, seq)
+
+            # Deliver anything published between the last wait and the final state
+            for seq, event, payload in tracker.events_since(last, job_ids, timeout=0):
+                yield message(event, payload, seq)
+            yield message('end', {'ids': job_ids})
+
+        return Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/products/without-images')
+    def products_without_images():
+        """Show products without images"""
+        return cached_page(('products_without_images',), lambda: render_template(
+            'products/list.html', products=get_services().product_service.get_products_without_images(),
+            title="Products Without Images"))
+
+    @app.route('/uploads/<path:filename>')
+    def uploaded_file(filename):
+        """Serve uploaded images"""
+        from flask import send_from_directory, abort
+        from services.storage import LocalStorage
+
+        storage = get_services().storage
+        if isinstance(storage, LocalStorage):
+            uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+            return send_from_directory(uploads_dir, filename)
+
+        # Remote storage: 'products/<key>' maps to the backend key
+        products_prefix = os.path.basename(os.path.normpath(app.config['UPLOAD_FOLDER'])) + '/'
+        if not filename.startswith(products_prefix):
+            abort(404)
+        key = filename[len(products_prefix):]
+        url = storage.url(key)
+        if url:
+            return redirect(url)
+        if not storage.exists(key):
+            abort(404)
+        return Response(storage.stream(key), mimetype='image/jpeg',
+                        headers={'Cache-Control': 'public, max-age=86400'})
+
+    @app.route('/origins')
+    def origin_status():
+        """Rate, concurrency and circuit breaker state of every remote origin contacted so far"""
+        return jsonify({'origins': get_services().origin_scheduler.status()})
+
+    @app.route('/metrics')
+    def metrics():
+        """Expose application metrics in Prometheus text format"""
+        return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def register_async_routes(app: Flask):
+    """
+    Async variants of the I/O-bound routes under /async/...
+
+    Downloads go through the httpx-based AsyncImageFetcher, so a worker thread
+    awaiting slow origins can keep many fetches open at once; CPU work (search
+    term generation, decode, resize, encode) runs in threads. Needs Flask's
+    async extra and httpx (pip install "flask[async]" httpx); without them the
+    routes are left out and a warning is logged.
+    """
     try:
-        # Download and process image
-        image_path = image_processor.process_and_save_image(
-            image_url, 
-            product.code
-        )
-        
-        # Update product with new image path
-        product_service.update_product_image(product_id, image_path)
-        
+        import asgiref  # noqa: F401 (Flask's async extra)
+        import httpx  # noqa: F401
+    except ImportError as e:
+        log_event(logger, logging.WARNING, 'async_routes_disabled', error=str(e))
+        return
+
+    async def search_results(product_id):
+        services = get_services()
+        product = services.product_service.get_product_by_id(product_id)
+        if not product:
+            return None, None, []
+
+        search_term = request.form.get('search_term') or request.args.get('q') or product.name
+        images = await asyncio.to_thread(services.image_search_service.search_images, search_term)
+        if request.values.get('validate') == '1' and images:
+            reachable = await services.async_fetcher.check_many([image['url'] for image in images])
+            images = [image for image in images if reachable[image['url']]]
+        return product, search_term, images
+
+    @app.route('/async/products/<int:product_id>/search')
+    async def search_images_async(product_id):
+        """Async variant of search_images (?validate=1 HEAD-checks candidates concurrently)"""
+        product, search_term, images = await search_results(product_id)
+        if not product:
+            flash('Product not found!', 'error')
+            return redirect(url_for('product_list'))
+
+        form = ImageSearchForm()
+        form.search_term.data = search_term
+        return render_template('products/search.html', product=product, form=form,
+                               initial_images=images, search_term=search_term)
+
+    @app.route('/async/products/<int:product_id>/search', methods=['POST'])
+    async def perform_image_search_async(product_id):
+        """Async variant of perform_image_search"""
+        product, search_term, images = await search_results(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        log_event(logger, logging.INFO, 'product_image_search', product_id=product_id,
+                  term=search_term, results=len(images), mode='async')
+        return render_template('products/preview.html', product=product, images=images,
+                               search_term=search_term)
+
+    @app.route('/async/products/<int:product_id>/update-image', methods=['POST'])
+    async def update_product_image_async_io(product_id):
+        """Async variant of update_product_image"""
+        services = get_services()
+        data = request.get_json(silent=True) or {}
+        image_url = data.get('image_url')
+        if not image_url:
+            return jsonify({'error': 'Image URL is required'}), 400
+        crop_mode, error = crop_mode_from_request(data)
+        if error:
+            return error
+
+        product = services.product_service.get_product_by_id(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        try:
+            async with services.async_fetcher.client() as client:
+                image_data = await services.async_fetcher.fetch(client, image_url)
+            image_path = await asyncio.wrap_future(services.work_scheduler.submit(
+                INTERACTIVE, services.image_processor.process_and_save_downloaded,
+                image_data, image_url, product.code, None, crop_mode))
+            services.product_service.update_product_image(product_id, image_path,
+                                                          services.image_processor.image_metadata(image_path))
+            return jsonify({
+                'success': True,
+                'message': 'Image updated successfully',
+                'image_path': image_path
+            })
+        except Exception as e:
+            log_event(logger, logging.ERROR, 'product_image_update_failed', product_id=product_id,
+                      url=image_url, error=str(e), mode='async')
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/async/products/batch/update-images', methods=['POST'])
+    async def batch_update_images_async_io():
+        """Async variant of batch_update_images: every download in flight at once"""
+        items, error = batch_items_from_request()
+        if error:
+            return error
+
+        services = get_services()
+        results = await services.batch_updater.run_async(items, services.async_fetcher)
+        succeeded = sum(1 for result in results if result['success'])
         return jsonify({
-            'success': True,
-            'message': 'Image updated successfully',
-            'image_path': image_path
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
         })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/products/without-images')
-def products_without_images():
-    """Show products without images"""
-    products = product_service.get_products_without_images()
-    return render_template('products/list.html', products=products, title="Products Without Images")
-
-@app.route('/uploads/<path:filename>')
-def uploaded_file(filename):
-    """Serve uploaded images"""
-    from flask import send_from_directory
-    uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
-    return send_from_directory(uploads_dir, filename)
+
+def __getattr__(name):
+    """
+    Create the app on first access to ``app.app`` (e.g. gunicorn app:app)
+
+    This is the deployment entry point, so it uses FLASK_CONFIG or
+    'production'; run.py and ``python app.py`` keep the development default.
+    """
+    if name == 'app':
+        global app
+        app = create_app(os.getenv('FLASK_CONFIG', 'production'))
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
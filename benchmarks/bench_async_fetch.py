@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Async vs sync image download benchmark
+Downloads the same set of images from a local stub origin that holds every
+request for --delay-ms, once through the sync path (ImageProcessor downloads
+on a pool of --threads workers, like a sync gunicorn process) and once through
+AsyncImageFetcher on a single event loop. Reports throughput and the largest
+number of downloads in progress at the same time (for the async path this
+includes downloads waiting for one of the --max-connections pooled connections).
+
+Example:
+    python -m benchmarks.bench_async_fetch --images 500 --delay-ms 200 --threads 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+
+class InFlight:
+    """Thread-safe counter that remembers its peak"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+def run_sync(urls: List[str], threads: int, workdir: str) -> Dict:
+    from services.image_processor import ImageProcessor
+
+    processor = ImageProcessor(os.path.join(workdir, 'products'), os.path.join(workdir, 'temp'))
+    in_flight = InFlight()
+
+    def download(url):
+        with in_flight:
+            return processor._download_image(url) is not None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        ok = sum(pool.map(download, urls))
+    return _result('sync', len(urls), ok, time.perf_counter() - started, in_flight.peak)
+
+
+def run_async(urls: List[str], max_connections: int) -> Dict:
+    from services.async_fetcher import AsyncImageFetcher, FETCHES_IN_FLIGHT
+
+    fetcher = AsyncImageFetcher(max_connections=max_connections)
+    in_flight = InFlight()
+
+    async def sample(done: asyncio.Event):
+        # The fetcher's own gauge counts open downloads; sample it while they run
+        while not done.is_set():
+            in_flight.peak = max(in_flight.peak, int(FETCHES_IN_FLIGHT.value()))
+            await asyncio.sleep(0.005)
+
+    async def main():
+        done = asyncio.Event()
+        sampler = asyncio.create_task(sample(done))
+        results = await fetcher.fetch_many(urls)
+        done.set()
+        await sampler
+        return results
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    ok = sum(1 for result in results if not isinstance(result, Exception))
+    return _result('async', len(urls), ok, time.perf_counter() - started, in_flight.peak)
+
+
+def _result(path: str, images: int, ok: int, elapsed: float, peak: int) -> Dict:
+    return {'path': path, 'images': images, 'succeeded': ok, 'seconds': round(elapsed, 3),
+            'images_per_sec': round(images / max(elapsed, 1e-9), 1), 'peak_in_flight': peak}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark sync thread-pool vs async image downloads')
+    parser.add_argument('--images', type=int, default=400, help='Images to download per path')
+    parser.add_argument('--delay-ms', type=float, default=200.0, help='Origin latency per request')
+    parser.add_argument('--threads', type=int, default=8, help='Worker threads for the sync path')
+    parser.add_argument('--max-connections', type=int, default=200, help='Connection cap for the async path')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='bench-async-')
+    origin = ImageOriginServer(make_stub_image(), delay_ms=args.delay_ms).start()
+    urls = [f'{origin.base_url}/{i}.jpg' for i in range(args.images)]
+
+    try:
+        results = [run_sync(urls, args.threads, workdir), run_async(urls, args.max_connections)]
+    finally:
+        origin.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'PATH':<6} {'IMAGES':>7} {'OK':>6} {'SECONDS':>9} {'IMAGES/s':>10} {'PEAK':>6}")
+    for result in results:
+        print(f"{result['path']:<6} {result['images']:>7} {result['succeeded']:>6} {result['seconds']:>9.2f} "
+              f"{result['images_per_sec']:>10.1f} {result['peak_in_flight']:>6}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
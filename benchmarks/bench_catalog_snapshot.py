@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Catalog snapshot benchmark
+Seeds a file-backed SQLite catalog and times the hot reads (counts, code
+lookup, has-image check, first page of missing images) through the ORM and
+through the in-memory CatalogSnapshot. Also reports the snapshot's build time,
+the time to apply a batch of updates incrementally and its memory per product.
+
+Example:
+    python -m benchmarks.bench_catalog_snapshot --rows 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def per_call_us(action: Callable[[], object], calls: int) -> float:
+    """Average microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(calls):
+        action()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def run(rows: int, calls: int) -> Dict:
+    from app import create_app
+    from sqlalchemy import text
+
+    from models.product import Product, db
+    from services.catalog_snapshot import CatalogSnapshot
+    from services.product_service import ProductService
+
+    app = create_app(background_tasks=False)
+    orm = ProductService(batch_size=5000)
+    rng = random.Random(7)
+
+    with app.app_context():
+        orm.add_products({'name': f'Product {i}', 'code': f'SNAP-{i:07d}',
+                          'image_path': f'img/{i}.jpg' if rng.random() < 0.7 else None} for i in range(rows))
+        # Spread the seeded rows over the past, a second apart, so the delta refresh below only
+        # sees the updated ones (a shared timestamp would put every row in the overlap window)
+        db.session.execute(text("UPDATE products SET updated_at = "
+                                "strftime('%Y-%m-%d %H:%M:%f', :then, '-' || (:rows - id) || ' seconds')"),
+                           {'then': (datetime.utcnow() - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S'),
+                            'rows': rows})
+        db.session.commit()
+        snapshot = CatalogSnapshot(version_ttl=3600)
+        cached = ProductService(snapshot=snapshot)
+
+        started = time.perf_counter()
+        snapshot.refresh(full=True)
+        build_seconds = time.perf_counter() - started
+
+        codes = [f'SNAP-{rng.randrange(rows):07d}' for _ in range(calls)]
+        product_ids = [rng.randrange(1, rows + 1) for _ in range(calls)]
+        queries = {
+            'count': lambda service: service.get_products_count(),
+            'count_with_images': lambda service: service.get_products_with_images_count(),
+            'id_for_code': lambda service: (service.snapshot.id_for_code(codes.pop()) if service.snapshot else
+                                            db.session.query(Product.id).filter_by(code=codes.pop()).scalar()),
+            'has_image': lambda service: service.product_has_image(product_ids.pop()),
+            'missing_first_50': lambda service: service.get_missing_image_ids(limit=50),
+        }
+        results: List[Dict] = []
+        for name, query in queries.items():
+            orm_us = per_call_us(lambda: query(orm), calls)
+            codes[:] = [f'SNAP-{rng.randrange(rows):07d}' for _ in range(calls)]
+            product_ids[:] = [rng.randrange(1, rows + 1) for _ in range(calls)]
+            snapshot_us = per_call_us(lambda: query(cached), calls)
+            results.append({'query': name, 'orm_us': round(orm_us, 1), 'snapshot_us': round(snapshot_us, 2),
+                            'speedup': round(orm_us / snapshot_us, 1)})
+
+        updates = {rng.randrange(1, rows + 1): f'img/new-{i}.jpg' for i in range(1000)}
+        orm.update_images_bulk(updates)
+        started = time.perf_counter()
+        snapshot.refresh()
+        delta_seconds = time.perf_counter() - started
+
+    return {'rows': rows, 'build_seconds': round(build_seconds, 2),
+            'delta_1000_updates_ms': round(delta_seconds * 1000, 1),
+            'bytes_per_product': round(snapshot.memory_bytes() / rows, 1),
+            'queries': results}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ORM reads against the in-memory catalog snapshot')
+    parser.add_argument('--rows', type=int, default=100000, help='Products in the catalog')
+    parser.add_argument('--calls', type=int, default=200, help='Calls timed per query')
+    parser.add_argument('--workdir', default=None, help='Directory for the SQLite database (default: temp)')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench-snapshot-')
+    os.makedirs(workdir, exist_ok=True)
+
+    # config.py reads DATABASE_URL at import time, so set it before importing the app
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(os.path.abspath(workdir), 'bench.db')
+    sys.path.insert(0, PROJECT_ROOT)
+
+    try:
+        result = run(args.rows, args.calls)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{result['rows']} products: full build {result['build_seconds']}s, "
+          f"1000 updates applied in {result['delta_1000_updates_ms']} ms, "
+          f"{result['bytes_per_product']} bytes/product (~{result['bytes_per_product']:.0f} MB per million)")
+    print(f"{'QUERY':<18} {'ORM us':>10} {'SNAPSHOT us':>12} {'SPEEDUP':>9}")
+    for query in result['queries']:
+        print(f"{query['query']:<18} {query['orm_us']:>10.1f} {query['snapshot_us']:>12.2f} {query['speedup']:>8.1f}x")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
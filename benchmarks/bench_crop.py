@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Crop mode benchmark
+Builds synthetic product shots with the product off-center on a plain, slightly
+noisy background, then compares the center crop with the smart crop modes.
+Reports the time to choose the crop window, the time for the whole
+crop-and-resize step, and how much of the product each window keeps.
+
+Example:
+    python -m benchmarks.bench_crop --repeat 20
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+# (width, height, product left edge as a fraction of the long side)
+SCENES = [
+    (800, 600, 0.02),
+    (2000, 1200, 0.05),
+    (4000, 2000, 0.70),
+    (1200, 3000, 0.10),
+]
+
+
+def make_scene(width: int, height: int, position: float, seed: int = 7) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """Off-center product on a noisy background; returns the image and the product box"""
+    rng = random.Random(seed)
+    image = Image.effect_noise((width, height), 6).convert('RGB')
+    image = Image.blend(image, Image.new('RGB', (width, height), (235, 235, 235)), 0.85)
+    draw = ImageDraw.Draw(image)
+
+    long_side, short_side = max(width, height), min(width, height)
+    size = int(short_side * 0.6)
+    start = int(long_side * position)
+    across = (short_side - size) // 2
+    box = (start, across, start + size, across + size) if width >= height else (across, start, across + size, start + size)
+
+    draw.rectangle(box, fill=(40, 60, 90))
+    for _ in range(60):
+        x = rng.randint(box[0], box[2] - 10)
+        y = rng.randint(box[1], box[3] - 10)
+        radius = rng.randint(4, max(5, size // 12))
+        draw.ellipse((x, y, x + radius, y + radius), fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    return image, box
+
+
+def coverage(product: Tuple[int, int, int, int], crop: Tuple[int, int, int, int]) -> float:
+    """Fraction of the product box inside the crop box"""
+    width = max(0, min(product[2], crop[2]) - max(product[0], crop[0]))
+    height = max(0, min(product[3], crop[3]) - max(product[1], crop[1]))
+    return width * height / ((product[2] - product[0]) * (product[3] - product[1]))
+
+
+def run(repeat: int) -> List[Dict]:
+    from services.cropping import CROP_MODES, crop_box
+    from services.image_processor import ImageProcessor
+
+    workdir = tempfile.mkdtemp(prefix='bench-crop-')
+    processor = ImageProcessor(os.path.join(workdir, 'products'), os.path.join(workdir, 'temp'))
+    results = []
+    for width, height, position in SCENES:
+        image, product = make_scene(width, height, position)
+        for mode in CROP_MODES:
+            choose, total = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                box = crop_box(image, mode)
+                choose.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                processor._resize_to_square(image, processor.image_size, mode)
+                total.append(time.perf_counter() - started)
+            results.append({'size': f'{width}x{height}', 'mode': mode,
+                            'choose_ms': round(statistics.median(choose) * 1000, 2),
+                            'crop_resize_ms': round(statistics.median(total) * 1000, 2),
+                            'product_kept': round(coverage(product, box), 3)})
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark center vs smart crop modes')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per scene and mode')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args.repeat)
+
+    print(f"{'SIZE':<10} {'MODE':<8} {'CHOOSE ms':>10} {'CROP+RESIZE ms':>15} {'PRODUCT KEPT':>13}")
+    for result in results:
+        print(f"{result['size']:<10} {result['mode']:<8} {result['choose_ms']:>10.2f} "
+              f"{result['crop_resize_ms']:>15.2f} {result['product_kept']:>12.0%}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
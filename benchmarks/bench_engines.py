@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Image engine benchmark
+Runs the same corpus of synthetic product photos (JPEG and PNG, up to 24 MP)
+through every available engine's process-and-encode path, each engine in a
+fresh interpreter so peak memory is its own. Reports throughput, time per
+image and peak resident memory above the interpreter's baseline.
+Engines whose dependencies are missing (pyvips) are listed as skipped.
+
+Example:
+    python -m benchmarks.bench_engines --repeat 3
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+# (width, height, format)
+CORPUS = [
+    (800, 600, 'JPEG'),
+    (2000, 1500, 'JPEG'),
+    (4000, 3000, 'JPEG'),
+    (6000, 4000, 'JPEG'),
+    (1600, 1600, 'PNG'),
+]
+
+
+def make_corpus() -> List[Tuple[str, bytes]]:
+    from benchmarks.bench_crop import make_scene
+
+    corpus = []
+    for width, height, image_format in CORPUS:
+        image, _ = make_scene(width, height, 0.3)
+        buffer = BytesIO()
+        image.save(buffer, image_format, **({'quality': 90} if image_format == 'JPEG' else {}))
+        corpus.append((f'{width}x{height}.{image_format.lower()}', buffer.getvalue()))
+    return corpus
+
+
+def _peak_rss_mb() -> float:
+    # VmHWM starts afresh with the spawned interpreter; ru_maxrss carries the
+    # parent's peak across fork+exec on Linux
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_engine(name: str, corpus: List[Tuple[str, bytes]], repeat: int, results):
+    from services.engines import PillowEngine, VipsEngine
+
+    try:
+        engine = VipsEngine() if name == 'vips' else PillowEngine()
+    except RuntimeError as e:
+        results.put({'engine': name, 'skipped': str(e)})
+        return
+
+    baseline = _peak_rss_mb()
+    per_image: Dict[str, float] = {}
+    output_bytes = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for label, data in corpus:
+            image_started = time.perf_counter()
+            image = engine.process(BytesIO(data), (500, 500), 'center')
+            output = BytesIO()
+            engine.encode_jpeg(image, output)
+            per_image[label] = per_image.get(label, 0.0) + time.perf_counter() - image_started
+            output_bytes += output.tell()
+    elapsed = time.perf_counter() - started
+
+    count = repeat * len(corpus)
+    results.put({
+        'engine': name,
+        'images': count,
+        'images_per_second': round(count / elapsed, 1),
+        'ms_per_image': {label: round(total / repeat * 1000, 1) for label, total in per_image.items()},
+        'peak_rss_mb': round(_peak_rss_mb() - baseline, 1),
+        'avg_output_kb': round(output_bytes / count / 1024, 1)
+    })
+
+
+def run(engines: List[str], repeat: int) -> List[Dict]:
+    # spawn: every engine starts from a clean interpreter and its own peak RSS
+    context = multiprocessing.get_context('spawn')
+    # Encoded once here so building the scenes never counts towards an engine's peak
+    corpus = make_corpus()
+    results = []
+    for name in engines:
+        queue = context.Queue()
+        process = context.Process(target=_run_engine, args=(name, corpus, repeat, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Pillow and libvips image engines')
+    parser.add_argument('--engines', default='pillow,vips', help='Comma-separated engines to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the corpus per engine')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run([name.strip() for name in args.engines.split(',') if name.strip()], args.repeat)
+
+    labels = [f'{width}x{height}.{image_format.lower()}' for width, height, image_format in CORPUS]
+    print(f"{'ENGINE':<8} {'IMG/S':>7} {'PEAK RSS MB':>12} {'OUT KB':>7}  " +
+          ' '.join(f'{label:>15}' for label in labels))
+    for result in results:
+        if 'skipped' in result:
+            print(f"{result['engine']:<8} skipped: {result['skipped']}")
+            continue
+        print(f"{result['engine']:<8} {result['images_per_second']:>7.1f} {result['peak_rss_mb']:>12.1f} "
+              f"{result['avg_output_kb']:>7.1f}  " +
+              ' '.join(f"{result['ms_per_image'][label]:>12.1f} ms" for label in labels))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
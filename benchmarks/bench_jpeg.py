@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+JPEG encoding benchmark
+Encodes a set of 500x500 product images (busy scenes, flat shots, text-like
+labels) with the fixed quality-85 settings and with the adaptive budget and
+quality modes. Reports total bytes, bytes saved against fixed, and the encode
+time for the first encode (parameter search) and for a repeat (cached
+parameters).
+
+Example:
+    python -m benchmarks.bench_jpeg --target-kb 40 --target-psnr 43
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.bench_crop import make_scene
+from benchmarks.load_test import make_stub_image
+
+
+def make_samples(size: int = 500) -> List[Tuple[str, Image.Image]]:
+    """Processed-size images spanning flat to detailed content"""
+    samples = []
+    for index, (width, height) in enumerate(((2000, 1200), (1200, 1600), (900, 900))):
+        scene, _ = make_scene(width, height, 0.2 + 0.2 * index, seed=index)
+        side = min(width, height)
+        samples.append((f'scene-{index}', scene.crop((0, 0, side, side)).resize((size, size), Image.Resampling.LANCZOS)))
+    for seed in range(2):
+        stub = Image.open(BytesIO(make_stub_image(seed=seed))).convert('RGB')
+        samples.append((f'shapes-{seed}', stub.crop((0, 0, 800, 800)).resize((size, size), Image.Resampling.LANCZOS)))
+    samples.append(('flat', Image.new('RGB', (size, size), (236, 236, 236))))
+
+    label = Image.new('RGB', (size, size), (255, 255, 255))
+    draw = ImageDraw.Draw(label)
+    for y in range(0, size, 12):
+        draw.text((5, y), 'RED TEXT LABEL 12345 ' * 3, fill=(220, 0, 0))
+    samples.append(('label', label))
+    return samples
+
+
+def run(target_bytes: int, target_psnr: float) -> List[Dict]:
+    from services.engines import PillowEngine
+    from services.jpeg_encoder import JpegEncoder
+
+    samples = make_samples()
+    engine = PillowEngine()
+    fixed_sizes = {}
+    results = []
+    for mode in ('fixed', 'budget', 'quality'):
+        encoder = JpegEncoder(engine, mode, target_bytes=target_bytes, target_psnr=target_psnr)
+        total, first, cached = 0, [], []
+        for name, image in samples:
+            started = time.perf_counter()
+            size = encoder.encode(image, BytesIO(), source_key=name)
+            first.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            encoder.encode(image, BytesIO(), source_key=name)
+            cached.append(time.perf_counter() - started)
+            if mode == 'fixed':
+                fixed_sizes[name] = size
+            total += size
+        fixed_total = sum(fixed_sizes.values())
+        results.append({'mode': mode, 'images': len(samples), 'total_kb': round(total / 1024, 1),
+                        'saved_pct': round((fixed_total - total) / fixed_total * 100, 1),
+                        'first_ms': round(statistics.mean(first) * 1000, 2),
+                        'cached_ms': round(statistics.mean(cached) * 1000, 2)})
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark fixed vs adaptive JPEG encoding')
+    parser.add_argument('--target-kb', type=float, default=40, help='Byte budget for budget mode, in KiB')
+    parser.add_argument('--target-psnr', type=float, default=43.0, help='Luma PSNR target for quality mode')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(int(args.target_kb * 1024), args.target_psnr)
+
+    print(f"{'MODE':<8} {'IMAGES':>6} {'TOTAL KB':>9} {'SAVED':>7} {'FIRST ms':>9} {'CACHED ms':>10}")
+    for result in results:
+        print(f"{result['mode']:<8} {result['images']:>6} {result['total_kb']:>9.1f} {result['saved_pct']:>6.1f}% "
+              f"{result['first_ms']:>9.2f} {result['cached_ms']:>10.2f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
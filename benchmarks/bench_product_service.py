@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+ProductService write benchmark
+Compares per-row mutators (one commit each) with the batch variants
+(one executemany statement and commit per batch) on a file-backed SQLite
+database, so every commit pays for a real fsync.
+
+Example:
+    python -m benchmarks.bench_product_service --rows 5000 --batch-size 1000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(rows: int, action: Callable[[], None]) -> float:
+    """Run action once and return rows per second"""
+    started = time.perf_counter()
+    action()
+    return rows / max(time.perf_counter() - started, 1e-9)
+
+
+def run(rows: int, batch_size: int) -> List[Dict]:
+    """Benchmark insert, image update and delete; returns one result per operation"""
+    from app import create_app
+    from models.product import Product, db
+    from services.product_service import ProductService
+
+    app = create_app(background_tasks=False)
+    service = ProductService(batch_size=batch_size)
+    results = []
+
+    with app.app_context():
+        def ids(prefix):
+            return [product_id for (product_id,) in
+                    db.session.query(Product.id).filter(Product.code.like(f'{prefix}-%')).order_by(Product.id)]
+
+        per_row = {
+            'insert': lambda: [service.add_product(Product(f'Row {i}', f'ROW-{i}')) for i in range(rows)],
+            'update': lambda: [service.update_product_image(product_id, f'img/row-{product_id}.jpg')
+                               for product_id in ids('ROW')],
+            'delete': lambda: [service.delete_product(product_id) for product_id in ids('ROW')],
+        }
+        batched = {
+            'insert': lambda: service.add_products({'name': f'Bulk {i}', 'code': f'BULK-{i}'}
+                                                   for i in range(rows)),
+            'update': lambda: service.update_images_bulk({product_id: f'img/bulk-{product_id}.jpg'
+                                                          for product_id in ids('BULK')}),
+            'delete': lambda: service.delete_products(ids('BULK')),
+        }
+
+        for operation in ('insert', 'update', 'delete'):
+            single = measure(rows, per_row[operation])
+            bulk = measure(rows, batched[operation])
+            db.session.expunge_all()
+            results.append({'operation': operation, 'rows': rows, 'per_row_rows_per_sec': round(single, 1),
+                            'batched_rows_per_sec': round(bulk, 1), 'speedup': round(bulk / single, 1)})
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ProductService per-row vs batched writes')
+    parser.add_argument('--rows', type=int, default=2000, help='Rows per operation')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per batch statement')
+    parser.add_argument('--workdir', default=None, help='Directory for the SQLite database (default: temp)')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench-products-')
+    os.makedirs(workdir, exist_ok=True)
+
+    # config.py reads DATABASE_URL at import time, so set it before importing the app
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(os.path.abspath(workdir), 'bench.db')
+    sys.path.insert(0, PROJECT_ROOT)
+
+    try:
+        results = run(args.rows, args.batch_size)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'OPERATION':<10} {'ROWS':>7} {'PER-ROW/s':>12} {'BATCHED/s':>12} {'SPEEDUP':>8}")
+    for result in results:
+        print(f"{result['operation']:<10} {result['rows']:>7} {result['per_row_rows_per_sec']:>12.1f} "
+              f"{result['batched_rows_per_sec']:>12.1f} {result['speedup']:>7.1f}x")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Work leasing benchmark
+Seeds a file-backed SQLite catalog of products without images, then runs 1,
+2, 4... worker processes that claim batches through WorkLeases, spend a fixed
+time per product (standing in for the search and download), record an
+image for each and complete them. Reports products per second for each
+worker count, the speedup over one worker, and checks that no product was
+claimed twice. Timing starts once every worker has its app up.
+
+Example:
+    python -m benchmarks.bench_work_leases --rows 4000 --workers 1,2,4,8
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _worker(claim_size: int, work_ms: float, ready, start, queue):
+    from app import create_app
+    from services.product_service import ProductService
+    from services.work_leases import WorkLeases
+
+    app = create_app(background_tasks=False)
+    claimed: List[int] = []
+    with app.app_context():
+        leases = WorkLeases(lease_seconds=60)
+        service = ProductService()
+        cursor = 0
+        ready.put(True)
+        start.wait()
+        while True:
+            product_ids = leases.claim(claim_size, after_id=cursor)
+            if not product_ids and cursor:
+                cursor = 0
+                product_ids = leases.claim(claim_size)
+            if not product_ids:
+                break
+            cursor = product_ids[-1]
+            time.sleep(len(product_ids) * work_ms / 1000)
+            service.update_images_bulk({product_id: f'img/{product_id}.jpg' for product_id in product_ids})
+            leases.complete(product_ids)
+            claimed.extend(product_ids)
+    queue.put(claimed)
+
+
+def run(rows: int, worker_counts: List[int], claim_size: int, work_ms: float) -> List[Dict]:
+    from app import create_app
+    from sqlalchemy import text
+
+    from models.product import db
+    from services.product_service import ProductService
+
+    app = create_app(background_tasks=False)
+    with app.app_context():
+        ProductService(batch_size=5000).add_products(
+            {'name': f'Product {i}', 'code': f'LEASE-{i:07d}'} for i in range(rows))
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for workers in worker_counts:
+        with app.app_context():
+            db.session.execute(text('DELETE FROM work_leases'))
+            db.session.execute(text('UPDATE products SET image_path = NULL'))
+            db.session.commit()
+
+        ready, start, queue = context.Queue(), context.Event(), context.Queue()
+        processes = [context.Process(target=_worker, args=(claim_size, work_ms, ready, start, queue))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get()
+        started = time.perf_counter()
+        start.set()
+        claimed = [product_id for _ in processes for product_id in queue.get()]
+        seconds = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        duplicates = sum(count - 1 for count in Counter(claimed).values() if count > 1)
+        results.append({'workers': workers, 'claimed': len(claimed), 'duplicates': duplicates,
+                        'seconds': round(seconds, 2), 'products_per_second': round(len(claimed) / seconds, 1)})
+
+    base = results[0]['products_per_second']
+    for result in results:
+        result['speedup'] = round(result['products_per_second'] / base, 2)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark lease-based work claiming across worker processes')
+    parser.add_argument('--rows', type=int, default=4000, help='Products without images')
+    parser.add_argument('--workers', default='1,2,4,8', help='Comma-separated worker process counts')
+    parser.add_argument('--claim-size', type=int, default=100, help='Products leased per batch')
+    parser.add_argument('--work-ms', type=float, default=2.0, help='Simulated work per product')
+    parser.add_argument('--workdir', default=None, help='Directory for the SQLite database (default: temp)')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench-leases-')
+    os.makedirs(workdir, exist_ok=True)
+
+    # config.py reads DATABASE_URL at import time; worker processes inherit it
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(os.path.abspath(workdir), 'bench.db')
+    sys.path.insert(0, PROJECT_ROOT)
+
+    try:
+        results = run(args.rows, [int(count) for count in args.workers.split(',')], args.claim_size, args.work_ms)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'WORKERS':>7} {'CLAIMED':>8} {'DUPLICATES':>10} {'SECONDS':>8} {'PRODUCTS/S':>11} {'SPEEDUP':>8}")
+    for result in results:
+        print(f"{result['workers']:>7} {result['claimed']:>8} {result['duplicates']:>10} {result['seconds']:>8.2f} "
+              f"{result['products_per_second']:>11.1f} {result['speedup']:>7.2f}x")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 1 if any(result['duplicates'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+HTTP load-test harness for Smart Image Updater
+Seeds a catalog of configurable size, serves stub product images from a
+local origin, runs the app under gunicorn and reports per-route latency
+histograms.
+
+Example:
+    python -m benchmarks.load_test --products 100000 --concurrency 32 --requests 5000
+"""
+
+import argparse
+import bisect
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Histogram bucket upper bounds in milliseconds
+BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+# Default traffic mix (relative weights)
+DEFAULT_MIX = 'index=2,list=1,search=3,preview=2,update=1'
+
+
+class LatencyHistogram:
+    """Collects request latencies and renders a bucketed histogram"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: List[float] = []
+        self.errors = 0
+        self.status_counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, status: int):
+        with self._lock:
+            self.samples.append(latency_ms)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if status == 0 or status >= 500:
+                self.errors += 1
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def buckets(self) -> List[int]:
+        counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        for sample in self.samples:
+            counts[bisect.bisect_left(BUCKET_BOUNDS_MS, sample)] += 1
+        return counts
+
+    def summary(self, elapsed: float) -> Dict:
+        return {
+            'route': self.name,
+            'requests': len(self.samples),
+            'errors': self.errors,
+            'status_counts': self.status_counts,
+            'rps': round(len(self.samples) / elapsed, 2) if elapsed > 0 else 0.0,
+            'p50_ms': round(self.percentile(50), 2),
+            'p90_ms': round(self.percentile(90), 2),
+            'p99_ms': round(self.percentile(99), 2),
+            'max_ms': round(max(self.samples), 2) if self.samples else 0.0,
+            'buckets': dict(zip([f'<={b}ms' for b in BUCKET_BOUNDS_MS] + ['>30000ms'], self.buckets()))
+        }
+
+    def render(self, elapsed: float, width: int = 40) -> str:
+        summary = self.summary(elapsed)
+        lines = [
+            f"{self.name}: {summary['requests']} requests, {summary['errors']} errors, "
+            f"{summary['rps']} req/s",
+            f"  p50={summary['p50_ms']}ms p90={summary['p90_ms']}ms "
+            f"p99={summary['p99_ms']}ms max={summary['max_ms']}ms"
+        ]
+        counts = self.buckets()
+        peak = max(counts) if counts else 0
+        for label, count in zip(summary['buckets'].keys(), counts):
+            if count == 0:
+                continue
+            bar = '#' * max(1, int(width * count / peak))
+            lines.append(f"  {label:>10} | {bar} {count}")
+        return '\n'.join(lines)
+
+
+def make_stub_image(size=(1200, 800), seed: int = 0) -> bytes:
+    """Generate a JPEG that the origin server hands out for every image URL"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(20):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(50, 400), y0 + rng.randrange(50, 400)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class OriginHTTPServer(ThreadingHTTPServer):
+    """Threaded server with a listen backlog deep enough for hundreds of concurrent clients"""
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class ImageOriginServer:
+    """Local HTTP server standing in for remote image origins"""
+
+    def __init__(self, image_bytes: bytes, delay_ms: float = 0.0, host: str = '127.0.0.1'):
+        payload = image_bytes
+        delay = delay_ms / 1000.0
+        self.hits = 0
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                origin.hits += 1
+                if delay:
+                    time.sleep(delay)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = OriginHTTPServer((host, 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """Parse a 'route=weight,...' traffic mix"""
+    weights = {}
+    for part in mix.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = int(weight or 1)
+    unknown = set(weights) - {'index', 'list', 'search', 'preview', 'update'}
+    if unknown:
+        raise ValueError(f"Unknown routes in mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def seed_database(database_url: str, products: int, image_ratio: float, env: Dict[str, str]):
+    """Seed the load-test database through sample_data.py"""
+    print(f"Seeding {products} products into {database_url} ...")
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(PROJECT_ROOT, 'sample_data.py'),
+         '--count', str(products), '--image-ratio', str(image_ratio)],
+        cwd=PROJECT_ROOT, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+
+def start_gunicorn(bind: str, workers: int, threads: int, workdir: str, env: Dict[str, str],
+                   timeout: int) -> subprocess.Popen:
+    """Start the app under gunicorn with uploads written into workdir"""
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--bind', bind,
+        '--workers', str(workers),
+        '--threads', str(threads),
+        '--timeout', str(timeout),
+        '--chdir', workdir,
+        '--pythonpath', PROJECT_ROOT,
+        '--log-level', 'warning',
+        'app:app'
+    ]
+    return subprocess.Popen(command, env=env)
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 60.0):
+    """Poll the app until it answers or the process dies"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/', timeout=5).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Timed out waiting for the app to start")
+
+
+class LoadDriver:
+    """Issues requests against the app at a fixed concurrency"""
+
+    def __init__(self, base_url: str, origin_url: str, products: int, mix: Dict[str, int],
+                 timeout: float, seed: int = 1):
+        self.base_url = base_url
+        self.origin_url = origin_url
+        self.products = max(products, 1)
+        self.routes = list(mix.keys())
+        self.weights = list(mix.values())
+        self.timeout = timeout
+        self.histograms = {name: LatencyHistogram(name) for name in self.routes}
+        self._local = threading.local()
+        self._seed = seed
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            with self._counter_lock:
+                self._counter += 1
+                self._local.rng = random.Random(self._seed + self._counter)
+        return self._local.session
+
+    def _issue(self, route: str):
+        session = self._session()
+        product_id = self._local.rng.randint(1, self.products)
+
+        if route == 'index':
+            call = lambda: session.get(f'{self.base_url}/', timeout=self.timeout)
+        elif route == 'list':
+            call = lambda: session.get(f'{self.base_url}/products', timeout=self.timeout)
+        elif route == 'search':
+            call = lambda: session.get(f'{self.base_url}/products/{product_id}/search',
+                                       timeout=self.timeout)
+        elif route == 'preview':
+            call = lambda: session.post(f'{self.base_url}/products/{product_id}/search',
+                                        data={'search_term': 'wireless headphones'},
+                                        timeout=self.timeout)
+        else:
+            image_url = f'{self.origin_url}/images/{product_id}.jpg'
+            call = lambda: session.post(f'{self.base_url}/products/{product_id}/update-image',
+                                        json={'image_url': image_url}, timeout=self.timeout)
+
+        started = time.perf_counter()
+        try:
+            status = call().status_code
+        except requests.RequestException:
+            status = 0
+        self.histograms[route].record((time.perf_counter() - started) * 1000.0, status)
+
+    def run(self, total_requests: int, concurrency: int, duration: Optional[float] = None) -> float:
+        rng = random.Random(self._seed)
+        plan = rng.choices(self.routes, weights=self.weights, k=total_requests)
+        deadline = time.perf_counter() + duration if duration else None
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            def worker(route):
+                if deadline and time.perf_counter() > deadline:
+                    return
+                self._issue(route)
+            list(executor.map(worker, plan))
+        return time.perf_counter() - started
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the Flask routes against a seeded catalog')
+    parser.add_argument('--products', type=int, default=10000, help='Catalog size to seed')
+    parser.add_argument('--image-ratio', type=float, default=0.5,
+                        help='Fraction of seeded products that already have images')
+    parser.add_argument('--requests', type=int, default=2000, help='Total requests to issue')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Stop issuing requests after this many seconds')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client connections')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--port', type=int, default=5099, help='Port to bind gunicorn on')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Route weights, e.g. "index=1,update=2"')
+    parser.add_argument('--origin-delay-ms', type=float, default=0.0,
+                        help='Artificial latency added by the stub image origin')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request client timeout')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for the database and uploads (default: a temp dir)')
+    parser.add_argument('--reuse-db', action='store_true',
+                        help='Skip seeding if the workdir already holds a database')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write the report as JSON')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the request plan')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='image-updater-load-')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'loadtest.db')
+
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    if not (args.reuse_db and os.path.exists(db_path)):
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        seed_database(env['DATABASE_URL'], args.products, args.image_ratio, env)
+
+    origin = ImageOriginServer(make_stub_image(), delay_ms=args.origin_delay_ms).start()
+    base_url = f'http://127.0.0.1:{args.port}'
+    server = start_gunicorn(f'127.0.0.1:{args.port}', args.workers, args.threads, workdir, env,
+                            timeout=int(args.timeout) + 30)
+
+    try:
+        wait_until_ready(base_url, server)
+        print(f"Driving {args.requests} requests at concurrency {args.concurrency} "
+              f"({args.workers} workers x {args.threads} threads, {args.products} products)")
+
+        driver = LoadDriver(base_url, origin.base_url, args.products, mix, args.timeout, seed=args.seed)
+        elapsed = driver.run(args.requests, args.concurrency, duration=args.duration)
+
+        print("=" * 60)
+        print(f"Completed in {elapsed:.1f}s")
+        print("=" * 60)
+        for histogram in driver.histograms.values():
+            if histogram.samples:
+                print(histogram.render(elapsed))
+                print()
+
+        if args.json_path:
+            report = {
+                'products': args.products,
+                'concurrency': args.concurrency,
+                'workers': args.workers,
+                'threads': args.threads,
+                'elapsed_s': round(elapsed, 3),
+                'routes': [h.summary(elapsed) for h in driver.histograms.values()]
+            }
+            with open(args.json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.json_path}")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        origin.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,101 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class Config:
     """Base configuration class"""
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
-    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///database/products.db')
+    DATABASE_DIR = os.path.join(BASE_DIR, 'database')
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(DATABASE_DIR, "products.db")}')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Image processing settings
     IMAGE_SIZE = (500, 500)  # Square format
     UPLOAD_FOLDER = 'uploads/products'
     TEMP_FOLDER = 'uploads/temp'
+    IMAGE_SHARD_DEPTH = 2  # hash-prefix directory levels under UPLOAD_FOLDER (ab/cd/<file>)
+    IMAGE_CROP_MODE = os.getenv('IMAGE_CROP_MODE', 'center')  # center, edges or entropy (smart modes need numpy, else center)
+    IMAGE_ENGINE = os.getenv('IMAGE_ENGINE', 'pillow')  # pillow, vips (pyvips; falls back to pillow) or auto
+    # JPEG parameters: fixed (quality 85), budget (fit JPEG_TARGET_BYTES) or quality (reach JPEG_TARGET_PSNR dB)
+    JPEG_ENCODING = os.getenv('JPEG_ENCODING', 'fixed')
+    JPEG_TARGET_BYTES = 40 * 1024
+    JPEG_TARGET_PSNR = 43.0
+    
+    # Shared image pipeline workers: interactive updates, then batch jobs, then prefetches
+    WORK_MAX_WORKERS = 10  # per worker process
+    WORK_INTERACTIVE_RESERVED = 2  # workers only interactive updates may use
+    
+    # Batch image updates
+    BATCH_MAX_WORKERS = 8  # most pipeline workers batch items may hold at once
+    BATCH_CHUNK_SIZE = 100  # items committed per transaction
+    BATCH_MAX_ITEMS = 10000  # items accepted by one non-streaming request
+    INGEST_MAX_FILE_BYTES = 20 * 1024 * 1024  # larger files in an ingested ZIP/directory are rejected
+    INGEST_SPOOL_BYTES = 16 * 1024 * 1024  # uploaded archives above this are spooled to a temporary file
+
+    # Streamed ZIP/TAR exports of product images (GET /products/export.zip|.tar)
+    EXPORT_BATCH_SIZE = 500  # products read per query
+    EXPORT_SPOOL_BYTES = 16 * 1024 * 1024  # manifest/directory bytes held in memory before a temporary file
+
+    # Image-fill workers sharing the database (manage.py fill-images)
+    FILL_CLAIM_SIZE = 100  # products leased per batch
+    FILL_LEASE_SECONDS = 300  # a worker silent this long is presumed dead and its products taken over
+    FILL_RETRY_SECONDS = 600  # first back-off for a product that failed; doubles per attempt
+    
+    # Background image jobs followed over Server-Sent Events
+    JOB_MAX_WORKERS = 4  # jobs run concurrently per worker process
+    JOB_RETENTION_SECONDS = 600  # finished jobs stay queryable this long
+    SSE_KEEPALIVE_SECONDS = 15
+    # Jobs live in the worker process that started them; only let the image pages use
+    # them when one process (or sticky sessions) serves every /jobs request
+    JOB_PROGRESS_UI = os.getenv('JOB_PROGRESS_UI', 'false').lower() == 'true'
+    
+    # Async routes (/async/...): downloads on an httpx client inside one event loop
+    ASYNC_MAX_CONNECTIONS = 200  # concurrent image fetches per async request
+    ASYNC_FETCH_TIMEOUT = 30  # seconds
+    
+    # Rendered list/search pages, cached per catalog version
+    RENDER_CACHE_MAX_BYTES = 32 * 1024 * 1024  # rendered output kept per worker process
+    CATALOG_VERSION_TTL = 1.0  # seconds between re-reads of the catalog version
+    
+    # In-memory columnar copy of ids, codes, timestamps and has-image bits for counts and lookups
+    CATALOG_SNAPSHOT = os.getenv('CATALOG_SNAPSHOT', 'false').lower() == 'true'
+    CATALOG_SNAPSHOT_OVERLAP = 5.0  # seconds re-read before the newest updated_at held (clock skew, late commits)
+    CATALOG_SNAPSHOT_FULL_REFRESH = 3600  # seconds between full rebuilds
+    
+    # Per-origin scheduling of search and download traffic (see GET /origins)
+    ORIGIN_RATE = 50.0  # requests per second per origin, 0 for no rate limit
+    ORIGIN_BURST = 100
+    ORIGIN_INITIAL_CONCURRENCY = 4  # AIMD starting point, between the min and max below
+    ORIGIN_MIN_CONCURRENCY = 1
+    ORIGIN_MAX_CONCURRENCY = 32
+    ORIGIN_LATENCY_TARGET = 2.0  # seconds; slower responses shrink the concurrency limit
+    ORIGIN_FAILURE_THRESHOLD = 5  # consecutive faults that open the circuit
+    ORIGIN_OPEN_SECONDS = 30  # fail fast this long before probing again
+    ORIGIN_MAX_WAIT = 10  # seconds a request may queue for a slot
+    
+    # Concurrent identical searches/downloads share one execution; downloads
+    # across worker processes too through file locks under TEMP_FOLDER/singleflight
+    SINGLE_FLIGHT_ACROSS_WORKERS = True
+    
+    # Speculative warming of the top search candidates before one is selected
+    PREFETCH_TOP_N = 4  # candidates warmed per search, 0 disables
+    PREFETCH_MAX_WORKERS = 2  # most pipeline workers prefetches may hold at once
+    PREFETCH_MAX_BYTES = 64 * 1024 * 1024  # processed JPEGs kept under TEMP_FOLDER/prefetch
+    PREFETCH_TTL_SECONDS = 600
+    
+    # Image storage backend: 'local' (UPLOAD_FOLDER) or 's3' (any S3-compatible store; pip install boto3)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', 'products/')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # e.g. http://minio:9000
+    S3_PUBLIC_BASE_URL = os.getenv('S3_PUBLIC_BASE_URL')  # CDN/bucket URL; presigned URLs if unset
+    S3_PART_SIZE = 8 * 1024 * 1024
+    
+    # Superseded image garbage collection
+    IMAGE_GC_INTERVAL = 60  # seconds between background passes (one worker per deployment runs them), 0 disables
+    IMAGE_GC_GRACE_SECONDS = 300  # keep replaced images this long for in-flight page loads
+    IMAGE_GC_BATCH_SIZE = 500
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
     
@@ -25,11 +110,18 @@ class Config:
     USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     REQUEST_TIMEOUT = 10  # seconds
     MAX_RETRIES = 3
+    
+    # Request profiling settings
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # fraction of requests
+    PROFILE_MODE = os.getenv('PROFILE_MODE', 'sampling')  # Options: sampling, cprofile
+    PROFILE_ALLOW_REQUEST_FLAG = os.getenv('PROFILE_ALLOW_REQUEST_FLAG', 'false').lower() == 'true'  # honour X-Profile: 1 / ?profile=1
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
+    PROFILE_ALLOW_REQUEST_FLAG = os.getenv('PROFILE_ALLOW_REQUEST_FLAG', 'true').lower() == 'true'
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -41,6 +133,8 @@ class TestingConfig(Config):
     TESTING = True
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+    IMAGE_GC_INTERVAL = 0
 
 # Configuration dictionary
 config = {
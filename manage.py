@@ -1 +1,346 @@
- 
\ No newline at end of file
+#!/usr/bin/env python3
+"""
+Management commands for Smart Image Updater
+
+Usage:
+    python manage.py profiles list [--endpoint NAME] [--limit N]
+    python manage.py profiles aggregate [--endpoint NAME] [--limit N] [--output FILE]
+    python manage.py scan-images [--root DIR] [--workers N] [--watch SECONDS] [--json FILE]
+    python manage.py migrate-shards [--depth N] [--batch-size N] [--dry-run]
+    python manage.py gc-images [--grace SECONDS] [--batch-size N]
+    python manage.py backfill-image-metadata [--batch-size N] [--workers N] [--force]
+    python manage.py ingest-images SOURCE [--json FILE]
+    python manage.py export-images OUTPUT.zip|OUTPUT.tar [--manifest csv|json] [--after-id N] [--until-id N] [--since ISO]
+    python manage.py fill-images [--claim-size N] [--max-batches N] [--watch SECONDS] [--status]
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+
+
+def cmd_profiles_list(args):
+    """List recent request profiles"""
+    from utils.profiling import list_profiles
+
+    profiles = list_profiles(args.dir, endpoint=args.endpoint)[:args.limit]
+    if not profiles:
+        print(f"No profiles found in {args.dir}")
+        return 0
+
+    print(f"{'ID':<48} {'METHOD':<7} {'STATUS':<7} {'MS':>9}  PATH")
+    for meta in profiles:
+        print(f"{meta['id']:<48} {meta['method']:<7} {meta['status']:<7} "
+              f"{meta['duration_ms']:>9.1f}  {meta['path']}")
+    return 0
+
+
+def cmd_profiles_aggregate(args):
+    """Merge recent sampling profiles into one collapsed-stack file"""
+    from utils.profiling import list_profiles, aggregate_profiles
+
+    profiles = list_profiles(args.dir, endpoint=args.endpoint)[:args.limit]
+    merged = aggregate_profiles(args.dir, profiles)
+    if not merged:
+        print("No sampling profiles to aggregate")
+        return 1
+
+    lines = [f'{stack} {count}' for stack, count in sorted(merged.items())]
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        print(f"Aggregated {len(profiles)} profiles into {args.output}")
+    else:
+        print('\n'.join(lines))
+
+    # Summarise the hottest leaf frames
+    leaves = {}
+    for stack, count in merged.items():
+        leaf = stack.rsplit(';', 1)[-1]
+        leaves[leaf] = leaves.get(leaf, 0) + count
+    total = sum(leaves.values())
+    print(f"\nTop frames across {len(profiles)} profiles ({total} samples):", file=sys.stderr)
+    for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {count / total * 100:5.1f}%  {leaf}", file=sys.stderr)
+    return 0
+
+
+def cmd_scan_images(args):
+    """Incrementally verify the uploads directory against the catalog"""
+    from app import create_app
+    from services.image_scanner import ImageHealthScanner
+
+    app = create_app(args.config, background_tasks=False)
+    scanner = ImageHealthScanner(root=args.root or app.config['UPLOAD_FOLDER'],
+                                 max_workers=args.workers, batch_size=args.batch_size)
+
+    while True:
+        with app.app_context():
+            report = scanner.scan()
+
+        print(f"Scanned {report.files_seen} files in {report.duration:.2f}s: "
+              f"{report.files_unchanged} unchanged, {report.files_verified} verified, "
+              f"{report.files_removed} removed")
+        print(f"  corrupt: {len(report.corrupt)}  orphaned: {len(report.orphaned)}  "
+              f"missing: {len(report.missing)}")
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report.to_dict(), f, indent=2)
+
+        if not args.watch:
+            return 1 if report.corrupt or report.missing else 0
+        time.sleep(args.watch)
+
+
+def cmd_migrate_shards(args):
+    """Move flat uploads into the hash-prefix sharded layout"""
+    from app import create_app
+    from services.shard_migration import ShardMigrator
+
+    app = create_app(args.config, background_tasks=False)
+    depth = args.depth if args.depth is not None else app.config['IMAGE_SHARD_DEPTH']
+    migrator = ShardMigrator(upload_folder=app.config['UPLOAD_FOLDER'], shard_depth=depth,
+                             batch_size=args.batch_size, dry_run=args.dry_run)
+
+    with app.app_context():
+        report = migrator.migrate()
+
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"{prefix}Moved {report.products_moved} product images in {report.batches} batches "
+          f"({report.products_skipped} skipped, {report.products_missing} missing), "
+          f"{report.orphans_moved} unreferenced files")
+    return 0
+
+
+def cmd_gc_images(args):
+    """Delete superseded images that no product references any more"""
+    from app import create_app
+    from services.image_gc import ImageGarbageCollector
+    from utils.helpers import format_file_size
+
+    app = create_app(args.config, background_tasks=False)
+    grace = args.grace if args.grace is not None else app.config['IMAGE_GC_GRACE_SECONDS']
+    collector = ImageGarbageCollector(upload_folder=app.config['UPLOAD_FOLDER'],
+                                      batch_size=args.batch_size, grace_seconds=grace,
+                                      storage=app.extensions['services'].storage)
+
+    with app.app_context():
+        result = collector.collect()
+
+    print(f"Examined {result.examined} superseded images: deleted {result.deleted} "
+          f"({format_file_size(result.bytes_freed)}), {result.retained} still referenced")
+    return 0
+
+
+def cmd_backfill_image_metadata(args):
+    """Record dimensions, size, hash and placeholder for images saved before they were kept"""
+    from app import create_app
+    from services.image_metadata import ImageMetadataBackfill
+
+    app = create_app(args.config, background_tasks=False)
+    backfill = ImageMetadataBackfill(upload_folder=app.config['UPLOAD_FOLDER'],
+                                     storage=app.extensions['services'].storage,
+                                     batch_size=args.batch_size, max_workers=args.workers, force=args.force)
+
+    with app.app_context():
+        report = backfill.run()
+
+    print(f"Recorded metadata for {report.products_updated} products in {report.batches} batches "
+          f"({report.products_missing} missing, {report.products_failed} unreadable)")
+    return 1 if report.products_failed else 0
+
+
+def cmd_ingest_images(args):
+    """Set product images from a ZIP archive or directory of files named after product codes"""
+    from app import create_app
+    from services.image_ingest import open_source
+
+    app = create_app(args.config, background_tasks=False)
+    counts = {'succeeded': 0, 'unmatched': 0, 'failed': 0}
+    results = []
+
+    try:
+        with app.app_context(), open_source(args.source) as entries:
+            for result in app.extensions['services'].image_ingester.run(entries):
+                if result['success']:
+                    counts['succeeded'] += 1
+                elif result['product_id'] is None:
+                    counts['unmatched'] += 1
+                else:
+                    counts['failed'] += 1
+                    print(f"  {result['file']}: {result['error']}", file=sys.stderr)
+                if args.json:
+                    results.append(result)
+    except ValueError as e:
+        print(f"Cannot ingest {args.source}: {e}", file=sys.stderr)
+        return 2
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(f"Set {counts['succeeded']} product images ({counts['unmatched']} files matched no product code, "
+          f"{counts['failed']} failed)")
+    return 1 if counts['failed'] else 0
+
+
+def cmd_export_images(args):
+    """Write product images and a manifest to a ZIP or TAR archive"""
+    from app import create_app
+    from services.catalog_export import EXPORT_FORMATS, ExportReport, ExportSelection
+
+    archive_format = os.path.splitext(args.output)[1].lstrip('.').lower()
+    if archive_format not in EXPORT_FORMATS:
+        print(f"Cannot export to {args.output}: the name must end in .zip or .tar", file=sys.stderr)
+        return 2
+    try:
+        selection = ExportSelection.parse(args.after_id, args.until_id, args.since)
+    except ValueError as e:
+        print(f"Cannot export: {e}", file=sys.stderr)
+        return 2
+
+    app = create_app(args.config, background_tasks=False)
+    partial = f"{args.output}.partial"
+    with app.app_context():
+        exporter = app.extensions['services'].catalog_exporter
+        if archive_format == 'zip':
+            report = ExportReport()
+            chunks = exporter.zip_stream(selection, args.manifest, report)
+        else:
+            export = exporter.plan_tar(selection, args.manifest)
+            report, chunks = export.report, export.iter_bytes()
+        try:
+            with open(partial, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except Exception as e:
+            os.remove(partial)
+            print(f"Export failed: {e}", file=sys.stderr)
+            return 1
+    os.replace(partial, args.output)
+
+    print(f"Exported {report.images} product images to {args.output} "
+          f"({report.missing} products with a missing image file)")
+    return 0
+
+
+def cmd_fill_images(args):
+    """Give products without images the first image their name finds, alongside workers on other nodes"""
+    from app import create_app
+
+    app = create_app(args.config, background_tasks=False)
+    stop = threading.Event()
+    # Finish the batch in hand, then release any lease still held
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    with app.app_context():
+        worker = app.extensions['services'].image_fill_worker
+        if args.status:
+            counts = worker.leases.status()
+            print(f"Leases: {counts['held']} held, {counts['expired']} expired, "
+                  f"{counts['deferred']} backing off after a failure, {counts['ready']} ready to retry")
+            return 0
+        if args.claim_size:
+            worker.claim_size = args.claim_size
+
+        while True:
+            report = worker.run(max_batches=args.max_batches, stop=stop)
+            print(f"{worker.leases.owner}: filled {report.filled} products in {report.batches} batches "
+                  f"({report.failed} failed and deferred, {report.skipped} already handled elsewhere)")
+            if not args.watch or stop.is_set():
+                return 0
+            stop.wait(args.watch)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Smart Image Updater management commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    profiles = commands.add_parser('profiles', help='Inspect request profiles')
+    profile_commands = profiles.add_subparsers(dest='profiles_command', required=True)
+
+    for name, handler, help_text in (
+        ('list', cmd_profiles_list, 'List recent profiles'),
+        ('aggregate', cmd_profiles_aggregate, 'Merge profiles into one collapsed-stack file'),
+    ):
+        sub = profile_commands.add_parser(name, help=help_text)
+        sub.add_argument('--dir', default=DEFAULT_PROFILE_DIR, help='Profile directory')
+        sub.add_argument('--endpoint', default=None, help='Only include this Flask endpoint')
+        sub.add_argument('--limit', type=int, default=50, help='Number of recent profiles to use')
+        if name == 'aggregate':
+            sub.add_argument('--output', default=None, help='Write merged stacks to this file')
+            sub.add_argument('--top', type=int, default=15, help='Number of hot frames to summarise')
+        sub.set_defaults(handler=handler)
+
+    scan = commands.add_parser('scan-images', help='Verify uploaded images incrementally')
+    scan.add_argument('--config', default=None, help='Configuration name (see config.py)')
+    scan.add_argument('--root', default=None, help='Directory to scan (default: UPLOAD_FOLDER)')
+    scan.add_argument('--workers', type=int, default=8, help='Parallel verification threads')
+    scan.add_argument('--batch-size', type=int, default=1000, help='Records written per transaction')
+    scan.add_argument('--watch', type=float, default=0, help='Re-scan every N seconds')
+    scan.add_argument('--json', default=None, help='Write the last report to this file')
+    scan.set_defaults(handler=cmd_scan_images)
+
+    migrate = commands.add_parser('migrate-shards', help='Move flat uploads into shard directories')
+    migrate.add_argument('--config', default=None, help='Configuration name (see config.py)')
+    migrate.add_argument('--depth', type=int, default=None, help='Shard levels (default: IMAGE_SHARD_DEPTH)')
+    migrate.add_argument('--batch-size', type=int, default=500, help='Products rewritten per transaction')
+    migrate.add_argument('--dry-run', action='store_true', help='Report what would move')
+    migrate.set_defaults(handler=cmd_migrate_shards)
+
+    gc = commands.add_parser('gc-images', help='Delete superseded images no longer referenced')
+    gc.add_argument('--config', default=None, help='Configuration name (see config.py)')
+    gc.add_argument('--grace', type=float, default=None,
+                    help='Only collect images superseded this many seconds ago')
+    gc.add_argument('--batch-size', type=int, default=500, help='Images examined per batch')
+    gc.set_defaults(handler=cmd_gc_images)
+
+    backfill = commands.add_parser('backfill-image-metadata',
+                                   help='Store image metadata for products saved before it was recorded')
+    backfill.add_argument('--config', default=None, help='Configuration name (see config.py)')
+    backfill.add_argument('--batch-size', type=int, default=500, help='Products updated per transaction')
+    backfill.add_argument('--workers', type=int, default=8, help='Parallel image reads')
+    backfill.add_argument('--force', action='store_true', help='Also re-describe products that have metadata')
+    backfill.set_defaults(handler=cmd_backfill_image_metadata)
+
+    ingest = commands.add_parser('ingest-images', help='Set product images from files named after product codes')
+    ingest.add_argument('source', help='ZIP archive or directory of images')
+    ingest.add_argument('--config', default=None, help='Configuration name (see config.py)')
+    ingest.add_argument('--json', default=None, help='Write every file\'s result to this file')
+    ingest.set_defaults(handler=cmd_ingest_images)
+
+    export = commands.add_parser('export-images', help='Write product images and a manifest to a ZIP or TAR')
+    export.add_argument('output', help='Archive to write; the format follows the .zip or .tar extension')
+    export.add_argument('--config', default=None, help='Configuration name (see config.py)')
+    export.add_argument('--manifest', choices=('csv', 'json'), default='csv', help='Manifest format')
+    export.add_argument('--after-id', default=None, help='Only products with a larger id')
+    export.add_argument('--until-id', default=None, help='Only products up to this id')
+    export.add_argument('--since', default=None, help='Only products updated at or after this ISO 8601 time')
+    export.set_defaults(handler=cmd_export_images)
+
+    fill = commands.add_parser('fill-images', help='Fill in missing product images; run one per node')
+    fill.add_argument('--config', default=None, help='Configuration name (see config.py)')
+    fill.add_argument('--claim-size', type=int, default=None,
+                      help='Products leased per batch (default: FILL_CLAIM_SIZE)')
+    fill.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+    fill.add_argument('--watch', type=float, default=0, help='Look for new work every N seconds once done')
+    fill.add_argument('--status', action='store_true', help='Only print lease counts across all workers')
+    fill.set_defaults(handler=cmd_fill_images)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
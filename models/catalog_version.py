@@ -0,0 +1,44 @@
+from models.product import db
+from datetime import datetime
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+# Committed catalog changes made by this process; lets caches skip their
+# re-check interval after a local write
+local_changes = 0
+
+class CatalogVersion(db.Model):
+    """Single-row counter bumped by every product write; keys the page caches"""
+
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def ensure(cls):
+        """Create the counter row if it does not exist yet"""
+        if db.session.get(cls, 1) is None:
+            db.session.add(cls(id=1, version=0, updated_at=datetime.utcnow()))
+            db.session.commit()
+
+    @classmethod
+    def bump(cls):
+        """Increment the version inside the caller's transaction"""
+        db.session.execute(update(cls.__table__).where(cls.__table__.c.id == 1)
+                           .values(version=cls.__table__.c.version + 1, updated_at=datetime.utcnow()))
+        db.session.info['catalog_changed'] = True
+
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
+
+@event.listens_for(Session, 'after_commit')
+def _count_local_change(session):
+    global local_changes
+    if session.info.pop('catalog_changed', False):
+        local_changes += 1
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_local_change(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,36 @@
+from models.product import db
+from datetime import datetime
+
+class ImageFile(db.Model):
+    """Health record for an image file in the uploads directory"""
+    
+    __tablename__ = 'image_files'
+    
+    # Path relative to the scanned uploads directory
+    path = db.Column(db.String(500), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    status = db.Column(db.String(20), nullable=False, index=True)  # ok, corrupt
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    format = db.Column(db.String(20), nullable=True)
+    error = db.Column(db.String(500), nullable=True)
+    referenced = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ImageFile {self.path} ({self.status})>'
+    
+    def to_dict(self):
+        """Convert record to dictionary"""
+        return {
+            'path': self.path,
+            'size': self.size,
+            'status': self.status,
+            'width': self.width,
+            'height': self.height,
+            'format': self.format,
+            'error': self.error,
+            'referenced': self.referenced,
+            'checked_at': self.checked_at.isoformat() if self.checked_at else None
+        }
@@ -1,9 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
 
 # Create SQLAlchemy instance
 db = SQLAlchemy()
 
+# Columns describing the saved image, recorded with image_path (see services.image_metadata)
+IMAGE_METADATA_COLUMNS = ('image_width', 'image_height', 'image_bytes', 'image_format', 'image_hash',
+                          'image_placeholder')
+
 class Product(db.Model):
     """Product model for storing product information"""
     
@@ -13,8 +19,15 @@ class Product(db.Model):
     name = db.Column(db.String(255), nullable=False)
     code = db.Column(db.String(100), unique=True, nullable=False)
     image_path = db.Column(db.String(500), nullable=True)
+    image_width = db.Column(db.Integer, nullable=True)
+    image_height = db.Column(db.Integer, nullable=True)
+    image_bytes = db.Column(db.Integer, nullable=True)
+    image_format = db.Column(db.String(20), nullable=True)
+    image_hash = db.Column(db.String(64), nullable=True)  # sha256 of the stored file
+    image_placeholder = db.Column(db.Text, nullable=True)  # data: URI of a tiny blurred preview
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed: the catalog snapshot fetches rows changed since its last refresh
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __init__(self, name, code, image_path=None):
         self.name = name
@@ -31,6 +44,12 @@ class Product(db.Model):
             'name': self.name,
             'code': self.code,
             'image_path': self.image_path,
+            'image_width': self.image_width,
+            'image_height': self.image_height,
+            'image_bytes': self.image_bytes,
+            'image_format': self.image_format,
+            'image_hash': self.image_hash,
+            'image_placeholder': self.image_placeholder,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -38,4 +57,41 @@ class Product(db.Model):
     @property
     def has_image(self):
         """Check if product has an image"""
-        return bool(self.image_path) 
\ No newline at end of file
+        return bool(self.image_path) 
+    
+    @classmethod
+    def add_missing_columns(cls) -> list:
+        """
+        Add columns introduced after a database was created (create_all only creates tables)
+
+        Every added column is nullable, so existing rows stay valid. Returns the
+        names of the columns added.
+        """
+        table = cls.__table__
+        existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+        added = []
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            try:
+                db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                db.session.commit()
+                added.append(column.name)
+            except OperationalError:
+                # Another worker starting up at the same time added it first
+                db.session.rollback()
+                if column.name not in {c['name'] for c in inspect(db.engine).get_columns(table.name)}:
+                    raise
+        return added
+    
+    @classmethod
+    def add_missing_indexes(cls) -> list:
+        """Create indexes declared after a database was created; returns their names"""
+        existing = {index['name'] for index in inspect(db.engine).get_indexes(cls.__table__.name)}
+        added = []
+        for index in cls.__table__.indexes:
+            if index.name not in existing:
+                index.create(db.engine, checkfirst=True)
+                added.append(index.name)
+        return added
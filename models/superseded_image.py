@@ -0,0 +1,17 @@
+from models.product import db
+from datetime import datetime
+
+class SupersededImage(db.Model):
+    """Image file that was replaced or orphaned and is waiting for garbage collection"""
+    
+    __tablename__ = 'superseded_images'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(500), nullable=False)
+    superseded_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __init__(self, path):
+        self.path = path
+    
+    def __repr__(self):
+        return f'<SupersededImage {self.path}>'
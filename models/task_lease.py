@@ -0,0 +1,19 @@
+from models.product import db
+
+class TaskLease(db.Model):
+    """
+    Deployment-wide claim on a periodic maintenance task (e.g. image GC)
+
+    Every worker process may run the task's loop, but only the owner of the
+    unexpired row does the work. The owner renews the lease on each run; once
+    it stops (the worker died), another worker takes it over after expires_at.
+    """
+
+    __tablename__ = 'task_leases'
+
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<TaskLease {self.name} ({self.owner})>'
@@ -0,0 +1,23 @@
+from models.product import db
+from datetime import datetime
+
+class WorkLease(db.Model):
+    """
+    Claim on a product's image-fill work, shared by every node using the database
+
+    A row with an owner and a future expires_at is held; the owner extends it
+    with heartbeats. Once expires_at passes, the owner is presumed dead and any
+    worker may take the product over. A row without an owner is a failed
+    product waiting until expires_at before it is retried.
+    """
+
+    __tablename__ = 'work_leases'
+
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    owner = db.Column(db.String(100), nullable=True, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<WorkLease {self.product_id} ({self.owner or "waiting"})>'
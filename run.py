@@ -6,21 +6,17 @@ Simple script to start the Flask application
 
 import os
 import sys
-from app import app, init_db
+from app import create_app
 
 def main():
     """Main function to run the application"""
     print("Starting Smart Image Updater...")
     print("=" * 50)
     
-    # Check if database exists, if not initialize it
-    db_path = 'database/products.db'
-    if not os.path.exists(db_path):
-        print("Initializing database...")
-        init_db()
-        print("Database initialized successfully!")
-    else:
-        print("Database already exists!")
+    # Create the app; the factory creates the database tables if needed
+    db_exists = os.path.exists('database/products.db')
+    app = create_app()
+    print("Database already exists!" if db_exists else "Database initialized successfully!")
     
     print("\nStarting web server...")
     print("Application will be available at: http://localhost:5000")
@@ -6,10 +6,22 @@ Adds sample products to the database for testing
 
 import os
 import sys
+import argparse
+import random
+from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, init_db
+from app import create_app
 from models.product import Product, db
+from models.catalog_version import CatalogVersion
+
+# Vocabulary used to build synthetic product names for large catalogs
+SEED_ADJECTIVES = ['Wireless', 'Portable', 'Ergonomic', 'Compact', 'Premium', 'Gaming',
+                   'Adjustable', 'Bluetooth', 'Smart', 'Heavy-Duty', 'Slim', 'RGB']
+SEED_NOUNS = ['Headphones', 'Phone Case', 'USB Cable', 'Laptop Stand', 'Mouse', 'Keyboard',
+              'Tablet', 'Watch', 'Camera', 'Speaker', 'Monitor Stand', 'Microphone']
+
+app = create_app(background_tasks=False)
 
 def add_sample_products():
     """Add sample products to the database"""
@@ -90,6 +102,7 @@ def add_sample_products():
             db.session.add(product)
             added_count += 1
         
+        CatalogVersion.bump()
         db.session.commit()
         print(f"Added {added_count} new sample products to the database.")
         
@@ -102,12 +115,82 @@ def add_sample_products():
                 else:
                     print(f"- {product_data['name']} ({product_data['code']}) - Added")
 
+def seed_catalog(count: int, image_ratio: float = 0.5, batch_size: int = 10000,
+                 code_prefix: str = 'LT', seed: int = 42) -> int:
+    """
+    Seed a large synthetic catalog for load testing
+    
+    Args:
+        count: Number of products to generate
+        image_ratio: Fraction of products that get a (fake) image path
+        batch_size: Rows inserted per transaction
+        code_prefix: Prefix for generated product codes
+        seed: Random seed so catalogs are reproducible
+        
+    Returns:
+        Number of products inserted
+    """
+    from sqlalchemy import insert
+    
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    inserted = 0
+    
+    with app.app_context():
+        # Continue after the highest existing number; counting rows would reuse codes once some were deleted
+        start = 0
+        for (code,) in db.session.query(Product.code).filter(
+                Product.code.like(f'{code_prefix}-%')).yield_per(batch_size):
+            suffix = code[len(code_prefix) + 1:]
+            if suffix.isdigit():
+                start = max(start, int(suffix) + 1)
+        
+        for batch_start in range(start, start + count, batch_size):
+            batch_end = min(batch_start + batch_size, start + count)
+            rows = []
+            for i in range(batch_start, batch_end):
+                code = f'{code_prefix}-{i:07d}'
+                rows.append({
+                    'name': f'{rng.choice(SEED_ADJECTIVES)} {rng.choice(SEED_NOUNS)} {i}',
+                    'code': code,
+                    'image_path': f'uploads/products/{code}.jpg' if rng.random() < image_ratio else None,
+                    'created_at': now,
+                    'updated_at': now
+                })
+            
+            # Core INSERT with executemany keeps 1M rows in the order of seconds
+            db.session.execute(insert(Product), rows)
+            CatalogVersion.bump()
+            db.session.commit()
+            inserted += len(rows)
+            print(f"Seeded {inserted}/{count} products...")
+    
+    return inserted
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Add sample products to the database')
+    parser.add_argument('--count', type=int, default=0,
+                        help='Seed this many synthetic products instead of the sample set')
+    parser.add_argument('--image-ratio', type=float, default=0.5,
+                        help='Fraction of synthetic products that get an image path')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='Rows inserted per transaction when seeding')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for synthetic data')
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
     print("Smart Image Updater - Sample Data Generator")
     print("=" * 50)
     
-    # Add sample products (database is already initialized in app.py)
-    add_sample_products()
+    args = parse_args()
+    
+    if args.count > 0:
+        seed_catalog(args.count, image_ratio=args.image_ratio,
+                     batch_size=args.batch_size, seed=args.seed)
+    else:
+        # Add sample products (database is initialized by create_app)
+        add_sample_products()
     
     print("\nSample data generation complete!")
     print("You can now run the application with: python app.py") 
\ No newline at end of file
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from services.origin_scheduler import OriginScheduler
+from utils.log import log_event
+from utils.metrics import registry, STAGE_SECONDS, FAILURES
+
+logger = logging.getLogger(__name__)
+
+FETCHES_IN_FLIGHT = registry.gauge('async_image_fetches_in_flight', 'Image downloads currently open on the async client')
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
+# Report download progress at most once per this many bytes
+PROGRESS_STEP_BYTES = 64 * 1024
+
+
+class AsyncImageFetcher:
+    """
+    Downloads images on an asyncio event loop with httpx
+
+    A download waiting on a slow origin costs a coroutine rather than a worker
+    thread, so one request can keep hundreds of fetches in flight. Connections
+    are capped by ``max_connections``, and per origin by ``origins`` when given.
+    httpx is an optional dependency, imported when the first client is created.
+    """
+
+    def __init__(self, max_connections: int = 200, timeout: float = 30.0,
+                 max_bytes: int = 10 * 1024 * 1024, origins: Optional[OriginScheduler] = None):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.origins = origins
+
+    @asynccontextmanager
+    async def _slot(self, url: str):
+        if self.origins is None:
+            yield
+            return
+        async with self.origins.slot_async(url):
+            yield
+
+    def client(self):
+        """New AsyncClient; use one per event loop (Flask runs each async view in its own loop)"""
+        try:
+            import httpx
+        except ImportError as e:
+            raise RuntimeError("The async fetcher needs httpx (pip install httpx)") from e
+
+        return httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=min(self.max_connections, 100))
+        )
+
+    async def fetch(self, client, url: str,
+                    progress: Optional[Callable[[str, dict], None]] = None) -> BytesIO:
+        """Download one image; raises on HTTP errors, non-image content or oversize bodies"""
+        FETCHES_IN_FLIGHT.inc()
+        try:
+            with STAGE_SECONDS.time(stage='download'):
+                async with self._slot(url), client.stream('GET', url) as response:
+                    response.raise_for_status()
+
+                    content_type = response.headers.get('content-type', '')
+                    if not content_type.startswith('image/'):
+                        raise ValueError(f"Invalid content type: {content_type}")
+                    content_length = response.headers.get('content-length')
+                    if content_length and int(content_length) > self.max_bytes:
+                        raise ValueError("Image file too large")
+
+                    total = int(content_length) if content_length else None
+                    image_data = BytesIO()
+                    reported = 0
+                    async for chunk in response.aiter_bytes(8192):
+                        image_data.write(chunk)
+                        if image_data.tell() > self.max_bytes:
+                            raise ValueError("Image file too large")
+                        if progress and image_data.tell() - reported >= PROGRESS_STEP_BYTES:
+                            reported = image_data.tell()
+                            progress('download', {'bytes': reported, 'total_bytes': total})
+                    if progress:
+                        progress('download', {'bytes': image_data.tell(), 'total_bytes': total})
+            image_data.seek(0)
+            return image_data
+        except Exception as e:
+            FAILURES.inc(component='async_fetcher', reason='download')
+            log_event(logger, logging.WARNING, 'image_download_failed', url=url, error=str(e))
+            raise
+        finally:
+            FETCHES_IN_FLIGHT.dec()
+
+    async def fetch_many(self, urls: Sequence[str],
+                         progress_for: Optional[Callable[[int], Callable[[str, dict], None]]] = None
+                         ) -> List[Union[BytesIO, Exception]]:
+        """Download all URLs concurrently; failures are returned in place rather than raised"""
+        async with self.client() as client:
+            return await asyncio.gather(
+                *(self.fetch(client, url, progress_for(index) if progress_for else None)
+                  for index, url in enumerate(urls)),
+                return_exceptions=True
+            )
+
+    async def check_many(self, urls: Sequence[str]) -> Dict[str, bool]:
+        """HEAD every URL concurrently and report which ones serve an image"""
+        async def check(client, url):
+            try:
+                async with self._slot(url):
+                    response = await client.head(url)
+                return response.status_code == 200 and \
+                    response.headers.get('content-type', '').startswith('image/')
+            except Exception:
+                return False
+
+        async with self.client() as client:
+            results = await asyncio.gather(*(check(client, url) for url in urls))
+        return dict(zip(urls, results))
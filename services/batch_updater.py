@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from models.product import Product, db
+from models.superseded_image import SupersededImage
+from services.work_scheduler import BATCH
+from utils.log import log_event
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BATCH_ITEMS = registry.counter('batch_image_items_total', 'Batch image update items by outcome')
+
+
+def parse_batch_item(raw) -> dict:
+    """Validate one {product_id, image_url} item; raises ValueError when malformed"""
+    if not isinstance(raw, dict):
+        raise ValueError('Item must be an object')
+    if '_invalid' in raw:
+        raise ValueError('Item is not valid JSON')
+    try:
+        product_id = int(raw.get('product_id'))
+    except (TypeError, ValueError):
+        raise ValueError('product_id must be an integer')
+    image_url = raw.get('image_url')
+    if not image_url or not isinstance(image_url, str):
+        raise ValueError('image_url is required')
+    return {'product_id': product_id, 'image_url': image_url}
+
+
+class BatchImageUpdater:
+    """
+    Applies many product_id -> image_url updates with bounded parallelism
+
+    Items are handled in chunks: images for a chunk are downloaded and
+    processed concurrently on a shared thread pool, then every successful
+    update in the chunk is committed in a single transaction. With a
+    ``scheduler`` the pool is the WorkScheduler's batch lane, shared fairly
+    between concurrent batches and behind interactive updates.
+
+    With ``only_missing`` an update only applies to a product that still
+    has no image; one given an image meanwhile keeps it.
+    """
+
+    def __init__(self, image_processor, product_service, max_workers: int = 8, chunk_size: int = 100,
+                 scheduler=None, only_missing: bool = False):
+        self.image_processor = image_processor
+        self.product_service = product_service
+        self.chunk_size = chunk_size
+        self.scheduler = scheduler
+        self.only_missing = only_missing
+        self.executor = None if scheduler else ThreadPoolExecutor(max_workers=max_workers,
+                                                                  thread_name_prefix='batch-image')
+        self._batch_ids = itertools.count(1)
+
+    def _submit(self, batch_id: int, fn: Callable, *args) -> Future:
+        if self.scheduler:
+            return self.scheduler.submit(BATCH, fn, *args, group=batch_id)
+        return self.executor.submit(fn, *args)
+
+    def run(self, items: Iterable, progress: Optional[Callable[[str, dict], None]] = None) -> Iterator[dict]:
+        """
+        Yield one result per item, chunk by chunk (requires an app context)
+
+        ``progress(stage, data)`` receives every item's pipeline stages (with
+        ``item`` and ``product_id`` in data), an 'item' event with each result
+        and a 'chunk' event with running totals after every commit.
+        """
+        totals = {'completed': 0, 'succeeded': 0, 'failed': 0}
+        batch_id = next(self._batch_ids)
+        chunk: List = []
+        for raw in items:
+            chunk.append(raw)
+            if len(chunk) >= self.chunk_size:
+                yield from self._run_reported(chunk, totals, progress, batch_id)
+                chunk = []
+        if chunk:
+            yield from self._run_reported(chunk, totals, progress, batch_id)
+
+    def _run_reported(self, chunk: List, totals: dict, progress, batch_id: int = 0) -> List[dict]:
+        offset = totals['completed']
+        results = self._run_chunk(chunk, offset, progress, batch_id)
+        for result in results:
+            totals['completed'] += 1
+            totals['succeeded' if result['success'] else 'failed'] += 1
+        if progress:
+            for index, result in enumerate(results):
+                progress('item', dict(result, item=offset + index))
+            progress('chunk', dict(totals))
+        return results
+
+    @staticmethod
+    def _item_progress(progress, item: int, product_id: int):
+        def report(stage: str, data: dict):
+            progress(stage, dict(data, item=item, product_id=product_id))
+        return report
+
+    def _prepare(self, raw_items: List):
+        """Validate items and load their products; returns (results, valid, products)"""
+        results: List[dict] = [None] * len(raw_items)
+        valid: Dict[int, dict] = {}
+        for index, raw in enumerate(raw_items):
+            try:
+                valid[index] = parse_batch_item(raw)
+            except ValueError as e:
+                product_id = raw.get('product_id') if isinstance(raw, dict) else None
+                results[index] = {'product_id': product_id, 'success': False, 'error': str(e)}
+
+        products = {
+            product.id: product for product in
+            Product.query.filter(Product.id.in_({item['product_id'] for item in valid.values()}))
+        } if valid else {}
+
+        for index, item in list(valid.items()):
+            if item['product_id'] not in products:
+                results[index] = {'product_id': item['product_id'], 'success': False,
+                                  'error': 'Product not found'}
+                del valid[index]
+        return results, valid, products
+
+    def _run_chunk(self, raw_items: List, offset: int = 0, progress=None, batch_id: int = 0) -> List[dict]:
+        results, valid, products = self._prepare(raw_items)
+
+        futures = {}
+        for index, item in valid.items():
+            product = products[item['product_id']]
+            futures[index] = self._submit(
+                batch_id, self.image_processor.process_and_save_image, item['image_url'], product.code,
+                self._item_progress(progress, offset + index, product.id) if progress else None)
+
+        saved: Dict[int, str] = {}
+        for index, future in futures.items():
+            product_id = valid[index]['product_id']
+            try:
+                saved[index] = future.result()
+            except Exception as e:
+                results[index] = {'product_id': product_id, 'success': False, 'error': str(e)}
+
+        return self._finish(results, valid, saved)
+
+    async def run_async(self, items: List, fetcher) -> List[dict]:
+        """
+        Async variant of run() for use from async views
+
+        Downloads run on the async fetcher instead of threads; decoding and
+        encoding still run on the thread pool. At most ``chunk_size`` items are
+        downloading or waiting to be processed at once, so only that many
+        images are ever held in memory, and updates are committed
+        ``chunk_size`` at a time as their images are saved.
+        """
+        batch_id = next(self._batch_ids)
+        results, valid, products = self._prepare(items)
+        # Read before any commit expires the products; pool threads have no app context to reload them
+        codes = {index: products[item['product_id']].code for index, item in valid.items()}
+        window = asyncio.Semaphore(self.chunk_size)
+        saved: Dict[int, str] = {}
+
+        def process(index, image_data):
+            return self.image_processor.process_and_save_downloaded(image_data, valid[index]['image_url'],
+                                                                    codes[index])
+
+        def commit():
+            # Runs between awaits, so no other item touches ``saved`` meanwhile
+            chunk = dict(saved)
+            saved.clear()
+            self._finish(results, valid, chunk, count=False)
+
+        async def handle(client, index):
+            product_id = valid[index]['product_id']
+            async with window:
+                try:
+                    image_data = await fetcher.fetch(client, valid[index]['image_url'])
+                except Exception as e:
+                    results[index] = {'product_id': product_id, 'success': False,
+                                      'error': f'Error processing image: Failed to download image ({e})'}
+                    return
+                try:
+                    saved[index] = await asyncio.wrap_future(self._submit(batch_id, process, index, image_data))
+                except Exception as e:
+                    results[index] = {'product_id': product_id, 'success': False, 'error': str(e)}
+                    return
+            if len(saved) >= self.chunk_size:
+                commit()
+
+        if valid:
+            async with fetcher.client() as client:
+                await asyncio.gather(*(handle(client, index) for index in valid))
+        if saved:
+            commit()
+        self._count(results)
+        return results
+
+    def _finish(self, results: List[dict], valid: Dict[int, dict], saved: Dict[int, str],
+                count: bool = True) -> List[dict]:
+        # One transaction for every successful update in the chunk
+        if saved:
+            try:
+                self._commit_chunk(saved, valid, results)
+            except Exception as e:
+                db.session.rollback()
+                log_event(logger, logging.ERROR, 'batch_image_commit_failed', items=len(saved), error=str(e))
+                for index in saved:
+                    results[index] = {'product_id': valid[index]['product_id'], 'success': False,
+                                      'error': f'Database update failed: {e}'}
+                # The new files were never referenced; let the GC reclaim them
+                try:
+                    db.session.add_all([SupersededImage(path) for path in saved.values()])
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+
+        if count:
+            self._count(results)
+        return results
+
+    @staticmethod
+    def _count(results: List[dict]):
+        succeeded = sum(1 for result in results if result['success'])
+        BATCH_ITEMS.inc(succeeded, outcome='success')
+        BATCH_ITEMS.inc(len(results) - succeeded, outcome='failure')
+
+    def _commit_chunk(self, saved: Dict[int, str], valid: Dict[int, dict], results: List[dict]):
+        """Point products at their new images in one transaction
+
+        ProductService.update_images_bulk guards each row on its current
+        image_path, so an image set concurrently (e.g. by /update-image) while
+        this chunk was downloading is kept and our file queued for GC instead.
+        """
+        images: Dict[int, str] = {}
+        duplicates = []
+        for index, image_path in saved.items():
+            product_id = valid[index]['product_id']
+            if product_id in images:
+                duplicates.append(images[product_id])
+            images[product_id] = image_path
+
+        metadata = {product_id: self.image_processor.image_metadata(image_path)
+                    for product_id, image_path in images.items()}
+        expected = dict.fromkeys(images) if self.only_missing else None
+        with self.product_service.unit_of_work():
+            applied = self.product_service.update_images_bulk(images, metadata, expected)
+            # Earlier items for the same product were replaced by later ones, and
+            # products deleted meanwhile will never reference their new file
+            unreferenced = duplicates + [path for product_id, path in images.items() if product_id not in applied]
+            db.session.add_all([SupersededImage(path) for path in unreferenced])
+
+        for index, image_path in saved.items():
+            product_id = valid[index]['product_id']
+            if images[product_id] != image_path:
+                results[index] = {'product_id': product_id, 'success': False,
+                                  'error': 'Superseded by a later item for the same product'}
+            elif product_id not in applied:
+                results[index] = {'product_id': product_id, 'success': False, 'error': 'Product not found'}
+            elif applied[product_id]:
+                results[index] = {'product_id': product_id, 'success': True, 'image_path': image_path}
+            else:
+                results[index] = {'product_id': product_id, 'success': False,
+                                  'error': 'Product image changed concurrently'}
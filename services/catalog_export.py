@@ -0,0 +1,428 @@
+"""
+Streaming export of product images as a ZIP or TAR archive with a manifest
+
+Archives are produced on the fly: products are read in keyset pages, each
+image is copied from storage as it stands (JPEGs are stored, never
+recompressed) and the manifest, one Product.to_dict() row per product plus
+the archive member holding its image, is appended last. Memory stays
+constant: one image and one page of products at a time, with the manifest,
+the ZIP central directory and the TAR plan spooled to temporary files once
+they outgrow ``spool_bytes``.
+"""
+
+import calendar
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import tarfile
+import tempfile
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+
+from models.catalog_version import CatalogVersion
+from models.product import Product, db
+from services.storage import StorageBackend, LocalStorage
+from utils.log import log_event
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('zip', 'tar')
+MANIFEST_FORMATS = ('csv', 'json')
+
+EXPORT_IMAGES = registry.counter('catalog_export_images_total', 'Product images written to exports by outcome')
+EXPORT_BYTES = registry.counter('catalog_export_bytes_total', 'Archive bytes produced by catalog exports')
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Beyond these a ZIP needs ZIP64 records; the classic fields then hold the markers
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP_MAX_ENTRIES = 0xFFFF
+_ZIP64_MARKER = 0xFFFFFFFF
+_ZIP64_ENTRIES_MARKER = 0xFFFF
+_UTF8_NAMES = 0x800
+_DOS_EPOCH = datetime(1980, 1, 1)
+
+
+@dataclass(frozen=True)
+class ExportSelection:
+    """Products to export: those with an image, in id order, narrowed by an id range and update time"""
+    after_id: int = 0
+    until_id: Optional[int] = None
+    updated_since: Optional[datetime] = None
+
+    @classmethod
+    def parse(cls, after_id=None, until_id=None, since=None) -> 'ExportSelection':
+        """Selection from request or command-line values; raises ValueError when one is malformed"""
+        try:
+            updated_since = datetime.fromisoformat(since) if since else None
+            if updated_since is not None and updated_since.tzinfo is not None:
+                # updated_at is stored as naive UTC
+                updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+            return cls(after_id=int(after_id or 0),
+                       until_id=int(until_id) if until_id not in (None, '') else None,
+                       updated_since=updated_since)
+        except ValueError:
+            raise ValueError('after_id and until_id must be integers and since an ISO 8601 date')
+
+    def page(self, after_id: int, limit: int):
+        query = Product.query.filter(Product.image_path.isnot(None), Product.id > after_id)
+        if self.until_id is not None:
+            query = query.filter(Product.id <= self.until_id)
+        if self.updated_since is not None:
+            query = query.filter(Product.updated_at >= self.updated_since)
+        return query.order_by(Product.id).limit(limit).all()
+
+
+@dataclass
+class ExportReport:
+    images: int = 0
+    missing: int = 0  # products whose image could not be read; listed in the manifest without a file
+
+
+def member_name(product: Product) -> str:
+    """Archive path of a product's image, images/<code><ext>, so an export can be ingested again"""
+    code = ''.join('_' if char in '/\\' or ord(char) < 32 else char for char in product.code).lstrip('.') or '_'
+    extension = os.path.splitext(product.image_path)[1].lower() or '.jpg'
+    return f'images/{code}{extension}'
+
+
+def _manifest_fields() -> Tuple[str, ...]:
+    # to_dict of a blank product gives the column order
+    return ('file',) + tuple(Product('', '').to_dict())
+
+
+def _read_chunks(spool, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+    spool.seek(start)
+    remaining = None if stop is None else stop - start
+    while remaining is None or remaining > 0:
+        chunk = spool.read(COPY_CHUNK_SIZE if remaining is None else min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+class _Manifest:
+    """Manifest rows serialised as CSV or a JSON array into a spool, optionally deflated"""
+
+    def __init__(self, manifest_format: str, spool_bytes: int, deflate: bool = False):
+        if manifest_format not in MANIFEST_FORMATS:
+            raise ValueError(f"Unknown manifest format: {manifest_format}")
+        self.format = manifest_format
+        self.name = f'manifest.{manifest_format}'
+        self.fields = _manifest_fields()
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        self.size = 0  # uncompressed
+        self.stored_size = 0
+        self.crc = 0
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if deflate else None
+        self._rows = 0
+        self._write(self._csv_line(self.fields) if manifest_format == 'csv' else b'[')
+
+    @staticmethod
+    def _csv_line(values) -> bytes:
+        line = io.StringIO()
+        csv.writer(line).writerow(values)
+        return line.getvalue().encode('utf-8')
+
+    def _write(self, data: bytes):
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        self.spool.write(self._compressor.compress(data) if self._compressor else data)
+
+    def add(self, product: Product, file: str):
+        row = dict(product.to_dict(), file=file)
+        if self.format == 'csv':
+            self._write(self._csv_line([row[field] for field in self.fields]))
+        else:
+            self._write((',\n' if self._rows else '\n').encode() + json.dumps(row).encode('utf-8'))
+        self._rows += 1
+
+    def finish(self):
+        if self.format == 'json':
+            self._write(b'\n]\n')
+        if self._compressor:
+            self.spool.write(self._compressor.flush())
+        self.stored_size = self.spool.tell()
+
+    def close(self):
+        self.spool.close()
+
+
+def _dos_datetime(moment: Optional[datetime]) -> Tuple[int, int]:
+    moment = max(moment or _DOS_EPOCH, _DOS_EPOCH)
+    return ((moment.hour << 11) | (moment.minute << 5) | (moment.second // 2),
+            ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day)
+
+
+class _ZipStream:
+    """
+    Writes a ZIP archive front to back
+
+    Every entry's size and CRC are known before its local header, so no data
+    descriptors are needed; central directory records are spooled and written
+    at the end. ZIP64 fields are only used where an offset, a size or the
+    entry count needs them.
+    """
+
+    def __init__(self, spool_bytes: int):
+        self.offset = 0
+        self.entries = 0
+        self.directory = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+
+    def entry(self, name: str, crc: int, size: int, stored_size: int, deflated: bool,
+              modified: Optional[datetime]) -> bytes:
+        """Local header of the next entry, whose stored_size data bytes must follow it"""
+        encoded = name.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(modified)
+        method = zlib.DEFLATED if deflated else 0
+
+        large = size >= _ZIP64_LIMIT or stored_size >= _ZIP64_LIMIT
+        local_extra = struct.pack('<HHQQ', 1, 16, size, stored_size) if large else b''
+        header = struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if large else 20, _UTF8_NAMES, method, dos_time,
+                             dos_date, crc, _ZIP64_MARKER if large else stored_size,
+                             _ZIP64_MARKER if large else size, len(encoded), len(local_extra)) + encoded + local_extra
+
+        # The central record carries 64-bit values in an extra field in this order
+        extra_values = [size, stored_size] if large else []
+        far = self.offset >= _ZIP64_LIMIT
+        if far:
+            extra_values.append(self.offset)
+        central_extra = struct.pack(f'<HH{len(extra_values)}Q', 1, 8 * len(extra_values), *extra_values) \
+            if extra_values else b''
+        version = 45 if extra_values else 20
+        record = struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version, _UTF8_NAMES, method, dos_time, dos_date,
+            crc, _ZIP64_MARKER if large else stored_size, _ZIP64_MARKER if large else size, len(encoded),
+            len(central_extra), 0, 0, 0, 0o100644 << 16, _ZIP64_MARKER if far else self.offset)
+        self.directory.write(record + encoded + central_extra)
+
+        self.entries += 1
+        self.offset += len(header) + stored_size
+        return header
+
+    def finish(self) -> Iterator[bytes]:
+        """Central directory and end records"""
+        directory_offset, directory_size = self.offset, self.directory.tell()
+        yield from _read_chunks(self.directory)
+
+        if (self.entries >= _ZIP_MAX_ENTRIES or directory_offset >= _ZIP64_LIMIT
+                or directory_size >= _ZIP64_LIMIT):
+            yield (struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, self.entries, self.entries,
+                               directory_size, directory_offset)
+                   + struct.pack('<IIQI', 0x07064b50, 0, directory_offset + directory_size, 1)
+                   + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, _ZIP64_ENTRIES_MARKER, _ZIP64_ENTRIES_MARKER,
+                                 _ZIP64_MARKER, _ZIP64_MARKER, 0))
+        else:
+            yield struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, self.entries, self.entries,
+                              directory_size, directory_offset, 0)
+
+    def close(self):
+        self.directory.close()
+
+
+def _tar_header(name: str, size: int, mtime: int) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    # GNU long-name blocks keep headers a pure function of name, size and mtime
+    return info.tobuf(tarfile.GNU_FORMAT, 'utf-8', 'surrogateescape')
+
+
+def _tar_padding(size: int) -> int:
+    return -size % tarfile.BLOCKSIZE
+
+
+def _window(data: bytes, offset: int, start: int, stop: int) -> bytes:
+    """The part of data (which begins at offset in the archive) inside [start, stop)"""
+    return data[max(start - offset, 0):max(stop - offset, 0)]
+
+
+class TarExport:
+    """
+    A planned TAR export
+
+    Planning fixes every member's size up front (one stat per image), so
+    the archive's length is known and any byte range of it can be produced
+    without reading the images before it.
+    Images are immutable once saved, so a resumed download of an unchanged
+    catalog continues the same bytes. iter_bytes may be called once.
+    """
+
+    def __init__(self, storage: StorageBackend, plan, manifest: _Manifest, members_size: int, mtime: int,
+                 report: ExportReport):
+        self.storage = storage
+        self._plan = plan
+        self._manifest = manifest
+        # Dated like the newest image, so the same catalog always gives the same bytes
+        self._manifest_header = _tar_header(manifest.name, manifest.size, mtime)
+        self.report = report
+        self.size = (members_size + len(self._manifest_header) + manifest.size + _tar_padding(manifest.size)
+                     + 2 * tarfile.BLOCKSIZE)
+
+    def iter_bytes(self, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """Archive bytes in [start, stop)"""
+        stop = self.size if stop is None else min(stop, self.size)
+        try:
+            offset = 0
+            self._plan.seek(0)
+            for line in self._plan:
+                if offset >= stop:
+                    return
+                key, name, size, mtime, header_size = json.loads(line)
+                end = offset + header_size + size + _tar_padding(size)
+                if end > start:
+                    chunk = _window(self._member(key, name, size, mtime), offset, start, stop)
+                    EXPORT_IMAGES.inc(outcome='exported')
+                    EXPORT_BYTES.inc(len(chunk), format='tar')
+                    yield chunk
+                offset = end
+
+            # Manifest member, then two zero blocks
+            manifest = self._manifest
+            header = self._manifest_header
+            if offset + len(header) > start and offset < stop:
+                yield _window(header, offset, start, stop)
+            offset += len(header)
+            if offset + manifest.size > start and offset < stop:
+                yield from _read_chunks(manifest.spool, max(start - offset, 0), min(stop - offset, manifest.size))
+            offset += manifest.size
+            tail = bytes(_tar_padding(manifest.size) + 2 * tarfile.BLOCKSIZE)
+            if offset < stop:
+                yield _window(tail, offset, start, stop)
+        finally:
+            self.close()
+
+    def _member(self, key: str, name: str, size: int, mtime: int) -> bytes:
+        try:
+            data = self.storage.get(key)
+            error = None if len(data) == size else f'{len(data)} bytes stored'
+        except Exception as e:
+            error = str(e)
+        if error is not None:
+            # The planned layout can no longer be honoured; end the response short
+            log_event(logger, logging.ERROR, 'catalog_export_image_changed', key=key, planned_bytes=size,
+                      error=error)
+            raise RuntimeError(f'{key} changed since the export was planned')
+        return _tar_header(name, size, mtime) + data + bytes(_tar_padding(size))
+
+    def close(self):
+        self._plan.close()
+        self._manifest.close()
+
+
+class CatalogExporter:
+    """Builds ZIP and TAR exports of product images with a manifest (requires an app context)"""
+
+    def __init__(self, storage: Optional[StorageBackend] = None, upload_folder: str = 'uploads/products',
+                 batch_size: int = 500, spool_bytes: int = 16 * 1024 * 1024):
+        self.upload_folder = upload_folder
+        self.storage = storage or LocalStorage(upload_folder)
+        self.batch_size = batch_size  # products read per query
+        self.spool_bytes = spool_bytes  # manifest, plan and directory bytes kept in memory
+
+    def _storage_key(self, image_path: str) -> Optional[str]:
+        relative = os.path.relpath(os.path.normpath(image_path), os.path.normpath(self.upload_folder))
+        if relative.startswith('..') or os.path.isabs(relative):
+            return None
+        return relative.replace(os.sep, '/')
+
+    def _products(self, selection: ExportSelection) -> Iterator[Product]:
+        last_id = selection.after_id
+        while True:
+            page = selection.page(last_id, self.batch_size)
+            if not page:
+                return
+            yield from page
+            last_id = page[-1].id
+
+    def version_tag(self, *options) -> Tuple[str, Optional[datetime]]:
+        """
+        ETag for an export of the catalog as it is now, and when the catalog last changed
+
+        Take it before planning: a write that lands meanwhile changes the next
+        tag, so a resume never splices two versions together.
+        """
+        version, updated_at = db.session.query(CatalogVersion.version, CatalogVersion.updated_at) \
+            .filter_by(id=1).one()
+        return hashlib.sha1(repr((version,) + options).encode()).hexdigest(), updated_at
+
+    def zip_stream(self, selection: ExportSelection, manifest_format: str = 'csv',
+                   report: Optional[ExportReport] = None) -> Iterator[bytes]:
+        """ZIP archive bytes; images are stored as they are, the manifest is deflated"""
+        report = report if report is not None else ExportReport()
+        manifest = _Manifest(manifest_format, self.spool_bytes, deflate=True)
+        archive = _ZipStream(self.spool_bytes)
+        try:
+            for product in self._products(selection):
+                data = self._read_image(product)
+                if data is None:
+                    report.missing += 1
+                    manifest.add(product, '')
+                    continue
+                name = member_name(product)
+                chunk = archive.entry(name, zlib.crc32(data), len(data), len(data), False, product.updated_at) + data
+                EXPORT_BYTES.inc(len(chunk), format='zip')
+                yield chunk
+                report.images += 1
+                manifest.add(product, name)
+
+            manifest.finish()
+            yield archive.entry(manifest.name, manifest.crc, manifest.size, manifest.stored_size, True,
+                                datetime.utcnow())
+            yield from _read_chunks(manifest.spool)
+            yield from archive.finish()
+        finally:
+            manifest.close()
+            archive.close()
+
+    def _read_image(self, product: Product) -> Optional[bytes]:
+        key = self._storage_key(product.image_path)
+        try:
+            data = self.storage.get(key) if key is not None else None
+        except Exception as e:
+            log_event(logger, logging.WARNING, 'catalog_export_image_missing', product_id=product.id,
+                      image_path=product.image_path, error=str(e))
+            data = None
+        EXPORT_IMAGES.inc(outcome='exported' if data is not None else 'missing')
+        return data
+
+    def plan_tar(self, selection: ExportSelection, manifest_format: str = 'csv') -> TarExport:
+        """
+        Lay out a TAR export without reading any image
+
+        Each member is sized from storage rather than the recorded image_bytes,
+        so a file that has gone missing is left out of the archive here instead
+        of cutting the download short later.
+        """
+        report = ExportReport()
+        manifest = _Manifest(manifest_format, self.spool_bytes)
+        plan = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes, mode='w+', encoding='utf-8')
+        offset = latest = 0
+        for product in self._products(selection):
+            key = self._storage_key(product.image_path)
+            size = self.storage.size(key) if key is not None else None
+            if key is None or size is None:
+                report.missing += 1
+                EXPORT_IMAGES.inc(outcome='missing')
+                manifest.add(product, '')
+                continue
+            name = member_name(product)
+            mtime = calendar.timegm(product.updated_at.utctimetuple()) if product.updated_at else 0
+            header_size = len(_tar_header(name, size, mtime))
+            plan.write(json.dumps([key, name, size, mtime, header_size]) + '\n')
+            offset += header_size + size + _tar_padding(size)
+            latest = max(latest, mtime)
+            report.images += 1
+            manifest.add(product, name)
+        manifest.finish()
+        return TarExport(self.storage, plan, manifest, offset, latest, report)
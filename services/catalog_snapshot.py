@@ -0,0 +1,360 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from models.product import Product, db
+from models import catalog_version
+from models.catalog_version import CatalogVersion
+from utils.metrics import registry
+
+SNAPSHOT_ROWS = registry.gauge('catalog_snapshot_rows', 'Products held by the in-memory catalog snapshot')
+SNAPSHOT_BYTES = registry.gauge('catalog_snapshot_bytes', 'Memory held by the in-memory catalog snapshot')
+SNAPSHOT_REFRESH_SECONDS = registry.histogram('catalog_snapshot_refresh_seconds',
+                                              'Catalog snapshot refresh time by kind')
+
+# Index slot markers
+_EMPTY, _DELETED = -1, -2
+
+# Rebuild the code index once live plus deleted slots pass this share of the table
+_MAX_LOAD = 0.6
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _micros(value: Optional[datetime]) -> int:
+    return (value - _EPOCH) // timedelta(microseconds=1) if value else 0
+
+
+class _Columns:
+    """
+    Column store behind CatalogSnapshot: one array entry per product, in id order
+
+    Codes are UTF-8 slices of one bytearray, found through an open-addressing
+    hash table of row numbers. That is 36 bytes a product for the arrays,
+    14 to 28 for the hash table and the code's own bytes: about 65 MB per
+    million products with 12-character codes.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.created = array('q')  # microseconds since the epoch
+        self.updated = array('q')
+        self.code_start = array('q')
+        self.code_length = array('i')
+        self.codes = bytearray()
+        self.live = bytearray()  # bit per row: the product exists
+        self.has_image = bytearray()  # bit per row: image_path is set
+        self.slots = array('i', [_EMPTY]) * 1024
+        self.slots_used = 0  # live and deleted slots
+        self.live_count = 0
+        self.image_count = 0
+        self.garbage = 0  # bytes of codes no row points at any more
+        self.max_updated = 0
+
+    # Bits
+
+    @staticmethod
+    def bit(bits: bytearray, row: int) -> bool:
+        return bool(bits[row >> 3] & (1 << (row & 7)))
+
+    @staticmethod
+    def set_bit(bits: bytearray, row: int, value: bool):
+        if value:
+            bits[row >> 3] |= 1 << (row & 7)
+        else:
+            bits[row >> 3] &= ~(1 << (row & 7)) & 0xFF
+
+    # Code index
+
+    def code_at(self, row: int) -> bytes:
+        start = self.code_start[row]
+        return bytes(self.codes[start:start + self.code_length[row]])
+
+    def _find_slot(self, code: bytes) -> Tuple[int, int]:
+        """(slot holding code or -1, first free slot on its probe path)"""
+        mask = len(self.slots) - 1
+        slot = hash(code) & mask
+        free = -1
+        while True:
+            row = self.slots[slot]
+            if row == _EMPTY:
+                return -1, slot if free < 0 else free
+            if row == _DELETED:
+                if free < 0:
+                    free = slot
+            elif self.code_at(row) == code:
+                return slot, free
+            slot = (slot + 1) & mask
+
+    def _index(self, row: int, code: bytes):
+        if self.slots_used + 1 > len(self.slots) * _MAX_LOAD:
+            # Grow while live rows fill over half the allowed load; otherwise only clear the deleted slots
+            size = len(self.slots)
+            while self.live_count > size * _MAX_LOAD / 2:
+                size *= 2
+            self._rehash(size)
+        found, free = self._find_slot(code)
+        if found >= 0:
+            self.slots[found] = row
+            return
+        if self.slots[free] == _EMPTY:
+            self.slots_used += 1
+        self.slots[free] = row
+
+    def _unindex(self, row: int, code: bytes):
+        found, _ = self._find_slot(code)
+        # Codes are unique but may have moved to another row already applied
+        if found >= 0 and self.slots[found] == row:
+            self.slots[found] = _DELETED
+
+    def _rehash(self, size: int):
+        self.slots = array('i', [_EMPTY]) * size
+        self.slots_used = 0
+        for row in range(len(self.ids)):
+            if self.bit(self.live, row):
+                _, free = self._find_slot(self.code_at(row))
+                self.slots[free] = row
+                self.slots_used += 1
+
+    def row_for_code(self, code: str) -> int:
+        found, _ = self._find_slot(code.encode('utf-8'))
+        return self.slots[found] if found >= 0 else -1
+
+    def row_for_id(self, product_id: int) -> int:
+        row = bisect_left(self.ids, product_id)
+        return row if row < len(self.ids) and self.ids[row] == product_id else -1
+
+    # Mutation
+
+    def _store_code(self, row: int, code: bytes):
+        self.code_start[row] = len(self.codes)
+        self.code_length[row] = len(code)
+        self.codes += code
+
+    def apply(self, product_id: int, code: str, created: int, updated: int, has_image: bool) -> bool:
+        """Insert or update one product; False when its id is below the last row's (needs a rebuild)"""
+        encoded = code.encode('utf-8')
+        row = self.row_for_id(product_id)
+        if row < 0:
+            if self.ids and product_id < self.ids[-1]:
+                return False
+            row = len(self.ids)
+            self.ids.append(product_id)
+            self.created.append(created)
+            self.updated.append(updated)
+            self.code_start.append(0)
+            self.code_length.append(0)
+            if row % 8 == 0:
+                self.live.append(0)
+                self.has_image.append(0)
+            self._store_code(row, encoded)
+            self.set_bit(self.live, row, True)
+            self.live_count += 1
+            self._index(row, encoded)
+        else:
+            live = self.bit(self.live, row)
+            old = self.code_at(row)
+            if old != encoded:
+                if live:
+                    self._unindex(row, old)
+                self.garbage += len(old)
+                self._store_code(row, encoded)
+            if not live:
+                self.set_bit(self.live, row, True)
+                self.live_count += 1
+            if old != encoded or not live:
+                self._index(row, encoded)
+            if self.bit(self.has_image, row) and live:
+                self.image_count -= 1
+            self.created[row] = created
+            self.updated[row] = updated
+
+        self.set_bit(self.has_image, row, has_image)
+        if has_image:
+            self.image_count += 1
+        self.max_updated = max(self.max_updated, updated)
+        return True
+
+    def remove(self, row: int):
+        if not self.bit(self.live, row):
+            return
+        self._unindex(row, self.code_at(row))
+        self.set_bit(self.live, row, False)
+        self.live_count -= 1
+        if self.bit(self.has_image, row):
+            self.set_bit(self.has_image, row, False)
+            self.image_count -= 1
+
+    # Queries
+
+    def missing_image_ids(self, limit: Optional[int], after_id: int) -> List[int]:
+        """Ids of live products without an image, ascending, after ``after_id``"""
+        result = []
+        row = bisect_right(self.ids, after_id)
+        for index in range(row >> 3, len(self.live)):
+            missing = self.live[index] & ~self.has_image[index] & 0xFF
+            if index == row >> 3:
+                missing &= 0xFF << (row & 7) & 0xFF
+            while missing:
+                bit = missing & -missing
+                result.append(self.ids[(index << 3) + bit.bit_length() - 1])
+                if limit is not None and len(result) >= limit:
+                    return result
+                missing ^= bit
+        return result
+
+    def memory_bytes(self) -> int:
+        arrays = (self.ids, self.created, self.updated, self.code_start, self.code_length, self.slots)
+        return (sum(column.buffer_info()[1] * column.itemsize for column in arrays)
+                + len(self.codes) + len(self.live) + len(self.has_image))
+
+
+class CatalogSnapshot:
+    """
+    Read-mostly in-memory copy of the catalog's hottest columns
+
+    Counts, code-to-id lookups, has-image checks and missing-image listings are
+    answered from compact arrays (see _Columns) in microseconds, without
+    building Product objects. Like the render cache it re-reads the catalog
+    version at most every ``version_ttl`` seconds, or right after a commit
+    from this process. When the version moved it fetches only the rows whose
+    updated_at is at or after the newest one it holds, minus
+    ``overlap_seconds``, so a write stamped by a worker with a slightly
+    behind clock or committed late is still picked up. Deletes are detected by
+    comparing the row count and reconciled against the id list. A full
+    rebuild, done aside and swapped in, runs on first use, every
+    ``full_refresh_seconds`` and when an id arrives out of order.
+    """
+
+    def __init__(self, version_ttl: float = 1.0, overlap_seconds: float = 5.0,
+                 full_refresh_seconds: float = 3600.0, batch_size: int = 10000):
+        self.version_ttl = version_ttl
+        self.overlap_seconds = overlap_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self.batch_size = batch_size
+        self._columns: Optional[_Columns] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+        self._seen_changes = -1
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # Queries (require an app context)
+
+    def count(self) -> int:
+        """Number of products"""
+        return self._current().live_count
+
+    def count_with_images(self) -> int:
+        """Number of products with an image"""
+        return self._current().image_count
+
+    def id_for_code(self, code: str) -> Optional[int]:
+        """Id of the product with ``code``, or None"""
+        columns = self._current()
+        with self._lock:
+            row = columns.row_for_code(code)
+            return columns.ids[row] if row >= 0 else None
+
+    def has_image(self, product_id: int) -> Optional[bool]:
+        """Whether a product has an image; None when there is no such product"""
+        columns = self._current()
+        with self._lock:
+            row = columns.row_for_id(product_id)
+            if row < 0 or not columns.bit(columns.live, row):
+                return None
+            return columns.bit(columns.has_image, row)
+
+    def missing_image_ids(self, limit: Optional[int] = None, after_id: int = 0) -> List[int]:
+        """Ids of products without an image in id order; page with ``after_id``"""
+        columns = self._current()
+        with self._lock:
+            return columns.missing_image_ids(limit, after_id)
+
+    def memory_bytes(self) -> int:
+        columns = self._columns
+        return columns.memory_bytes() if columns else 0
+
+    def __len__(self) -> int:
+        columns = self._columns
+        return columns.live_count if columns else 0
+
+    # Refresh
+
+    def _current(self) -> _Columns:
+        now = time.monotonic()
+        columns = self._columns
+        if (columns is not None and now - self._checked_at < self.version_ttl
+                and self._seen_changes == catalog_version.local_changes):
+            return columns
+        self.refresh()
+        return self._columns
+
+    def refresh(self, full: bool = False):
+        """Bring the snapshot up to date with the database now"""
+        with self._refresh_lock:
+            changes = catalog_version.local_changes
+            version = db.session.query(CatalogVersion.version).filter_by(id=1).scalar() or 0
+            now = time.monotonic()
+            if full or self._columns is None or now - self._built_at >= self.full_refresh_seconds:
+                self._rebuild(version)
+            elif version != self._version and not self._apply_changes():
+                self._rebuild(version)
+            self._version = version
+            self._checked_at = now
+            self._seen_changes = changes
+
+    def _rows(self, query) -> Iterable[tuple]:
+        return (query.with_entities(Product.id, Product.code, Product.created_at, Product.updated_at,
+                                    Product.image_path.isnot(None))
+                .order_by(Product.id)
+                .execution_options(yield_per=self.batch_size))
+
+    def _rebuild(self, version: int):
+        started = time.perf_counter()
+        columns = _Columns()
+        for product_id, code, created, updated, has_image in self._rows(db.session.query(Product)):
+            columns.apply(product_id, code, _micros(created), _micros(updated), bool(has_image))
+        with self._lock:
+            self._columns = columns
+        self._built_at = time.monotonic()
+        self._publish(columns)
+        SNAPSHOT_REFRESH_SECONDS.observe(time.perf_counter() - started, kind='full')
+
+    def _apply_changes(self) -> bool:
+        """Apply rows changed since the last refresh; False when a full rebuild is needed"""
+        started = time.perf_counter()
+        columns = self._columns
+        since = _EPOCH + timedelta(microseconds=columns.max_updated) - timedelta(seconds=self.overlap_seconds)
+        rows = self._rows(db.session.query(Product).filter(Product.updated_at >= since)).all()
+        with self._lock:
+            for product_id, code, created, updated, has_image in rows:
+                if not columns.apply(product_id, code, _micros(created), _micros(updated), bool(has_image)):
+                    return False
+            # Every current row is held now, so more live rows than the table has means deletes
+            if columns.live_count != db.session.query(Product.id).count():
+                self._remove_deleted(columns)
+            if columns.garbage > len(columns.codes) // 2:
+                return False
+        self._publish(columns)
+        SNAPSHOT_REFRESH_SECONDS.observe(time.perf_counter() - started, kind='delta')
+        return True
+
+    def _remove_deleted(self, columns: _Columns):
+        existing = db.session.query(Product.id).order_by(Product.id).execution_options(yield_per=self.batch_size)
+        current = iter(product_id for (product_id,) in existing)
+        next_id = next(current, None)
+        for row, product_id in enumerate(columns.ids):
+            while next_id is not None and next_id < product_id:
+                next_id = next(current, None)
+            if next_id != product_id:
+                columns.remove(row)
+
+    @staticmethod
+    def _publish(columns: _Columns):
+        SNAPSHOT_ROWS.set(columns.live_count)
+        SNAPSHOT_BYTES.set(columns.memory_bytes())
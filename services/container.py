@@ -0,0 +1,225 @@
+import os
+import threading
+from typing import Callable, Dict
+
+
+class ServiceContainer:
+    """
+    Lazily constructs and caches the application's services
+
+    Services (and the heavy modules they import, such as Pillow and requests)
+    are only created the first time a request needs them, which keeps worker
+    boot and test start-up cheap.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self._instances: Dict[str, object] = {}
+        # Re-entrant: factories resolve their own dependencies (e.g. storage) while
+        # the lock is held
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, factory: Callable[[], object]):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = factory()
+        return instance
+
+    @property
+    def product_service(self):
+        def factory():
+            from services.product_service import ProductService
+            return ProductService(snapshot=self.catalog_snapshot if self.config.get('CATALOG_SNAPSHOT') else None)
+        return self._get('product_service', factory)
+
+    @property
+    def catalog_snapshot(self):
+        def factory():
+            from services.catalog_snapshot import CatalogSnapshot
+            return CatalogSnapshot(version_ttl=self.config.get('CATALOG_VERSION_TTL', 1.0),
+                                   overlap_seconds=self.config.get('CATALOG_SNAPSHOT_OVERLAP', 5.0),
+                                   full_refresh_seconds=self.config.get('CATALOG_SNAPSHOT_FULL_REFRESH', 3600))
+        return self._get('catalog_snapshot', factory)
+
+    @property
+    def render_cache(self):
+        def factory():
+            from services.render_cache import RenderCache
+            return RenderCache(max_bytes=self.config.get('RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+                               version_ttl=self.config.get('CATALOG_VERSION_TTL', 1.0))
+        return self._get('render_cache', factory)
+
+    @property
+    def origin_scheduler(self):
+        def factory():
+            from services.origin_scheduler import OriginScheduler
+            return OriginScheduler(
+                rate=self.config.get('ORIGIN_RATE', 50.0),
+                burst=self.config.get('ORIGIN_BURST', 100),
+                initial_concurrency=self.config.get('ORIGIN_INITIAL_CONCURRENCY', 4),
+                min_concurrency=self.config.get('ORIGIN_MIN_CONCURRENCY', 1),
+                max_concurrency=self.config.get('ORIGIN_MAX_CONCURRENCY', 32),
+                latency_target=self.config.get('ORIGIN_LATENCY_TARGET', 2.0),
+                failure_threshold=self.config.get('ORIGIN_FAILURE_THRESHOLD', 5),
+                open_seconds=self.config.get('ORIGIN_OPEN_SECONDS', 30),
+                max_wait=self.config.get('ORIGIN_MAX_WAIT', 10)
+            )
+        return self._get('origin_scheduler', factory)
+
+    def _single_flight(self, name: str, dumps=None, loads=None):
+        """Coalescer for one kind of operation; shared across workers (unless disabled) when given dumps/loads"""
+        from utils.singleflight import SingleFlight
+
+        lock_dir = None
+        if dumps and loads and self.config.get('SINGLE_FLIGHT_ACROSS_WORKERS', True):
+            lock_dir = os.path.join(self.config.get('TEMP_FOLDER', 'uploads/temp'), 'singleflight')
+        return SingleFlight(name, lock_dir=lock_dir, dumps=dumps, loads=loads)
+
+    @property
+    def image_search_service(self):
+        def factory():
+            from services.image_search import ImageSearchService
+            # Searches are cheap to repeat, so they coalesce within the process only
+            return ImageSearchService(single_flight=self._single_flight('search'), origins=self.origin_scheduler)
+        return self._get('image_search_service', factory)
+
+    @property
+    def storage(self):
+        def factory():
+            from services.storage import create_storage
+            return create_storage(self.config)
+        return self._get('storage', factory)
+
+    @property
+    def image_processor(self):
+        def factory():
+            from services.engines import create_engine
+            from services.image_processor import ImageProcessor
+            from services.jpeg_encoder import JpegEncoder
+
+            engine = create_engine(self.config.get('IMAGE_ENGINE', 'pillow'))
+            return ImageProcessor(
+                upload_folder=self.config.get('UPLOAD_FOLDER', 'uploads/products'),
+                temp_folder=self.config.get('TEMP_FOLDER', 'uploads/temp'),
+                shard_depth=self.config.get('IMAGE_SHARD_DEPTH', 2),
+                storage=self.storage,
+                crop_mode=self.config.get('IMAGE_CROP_MODE', 'center'),
+                single_flight=self._single_flight('download', dumps=bytes, loads=bytes),
+                origins=self.origin_scheduler,
+                engine=engine,
+                encoder=JpegEncoder(engine, mode=self.config.get('JPEG_ENCODING', 'fixed'),
+                                    target_bytes=self.config.get('JPEG_TARGET_BYTES', 40 * 1024),
+                                    target_psnr=self.config.get('JPEG_TARGET_PSNR', 43.0))
+            )
+        return self._get('image_processor', factory)
+
+    @property
+    def work_scheduler(self):
+        def factory():
+            from services.work_scheduler import WorkScheduler, BATCH, BACKGROUND
+            return WorkScheduler(
+                max_workers=self.config.get('WORK_MAX_WORKERS', 10),
+                interactive_reserved=self.config.get('WORK_INTERACTIVE_RESERVED', 2),
+                lane_limits={BATCH: self.config.get('BATCH_MAX_WORKERS', 8),
+                             BACKGROUND: self.config.get('PREFETCH_MAX_WORKERS', 2)}
+            )
+        return self._get('work_scheduler', factory)
+
+    @property
+    def batch_updater(self):
+        def factory():
+            from services.batch_updater import BatchImageUpdater
+            return BatchImageUpdater(
+                self.image_processor,
+                self.product_service,
+                chunk_size=self.config.get('BATCH_CHUNK_SIZE', 100),
+                scheduler=self.work_scheduler
+            )
+        return self._get('batch_updater', factory)
+
+    @property
+    def image_ingester(self):
+        def factory():
+            from services.image_ingest import ImageIngester
+            return ImageIngester(
+                self.image_processor,
+                self.product_service,
+                chunk_size=self.config.get('BATCH_CHUNK_SIZE', 100),
+                scheduler=self.work_scheduler,
+                max_entry_bytes=self.config.get('INGEST_MAX_FILE_BYTES', 20 * 1024 * 1024)
+            )
+        return self._get('image_ingester', factory)
+
+    @property
+    def catalog_exporter(self):
+        def factory():
+            from services.catalog_export import CatalogExporter
+            return CatalogExporter(self.storage,
+                                   upload_folder=self.config.get('UPLOAD_FOLDER', 'uploads/products'),
+                                   batch_size=self.config.get('EXPORT_BATCH_SIZE', 500),
+                                   spool_bytes=self.config.get('EXPORT_SPOOL_BYTES', 16 * 1024 * 1024))
+        return self._get('catalog_exporter', factory)
+
+    @property
+    def image_fill_worker(self):
+        def factory():
+            from services.batch_updater import BatchImageUpdater
+            from services.image_fill import ImageFillWorker
+            from services.work_leases import WorkLeases
+            updater = BatchImageUpdater(
+                self.image_processor,
+                self.product_service,
+                chunk_size=self.config.get('BATCH_CHUNK_SIZE', 100),
+                scheduler=self.work_scheduler,
+                only_missing=True
+            )
+            leases = WorkLeases(lease_seconds=self.config.get('FILL_LEASE_SECONDS', 300),
+                                retry_seconds=self.config.get('FILL_RETRY_SECONDS', 600))
+            return ImageFillWorker(leases, self.image_search_service, updater,
+                                   claim_size=self.config.get('FILL_CLAIM_SIZE', 100))
+        return self._get('image_fill_worker', factory)
+
+    @property
+    def prefetcher(self):
+        def factory():
+            from services.prefetcher import ImagePrefetcher
+            return ImagePrefetcher(
+                self.image_processor,
+                cache_dir=os.path.join(self.config.get('TEMP_FOLDER', 'uploads/temp'), 'prefetch'),
+                top_n=self.config.get('PREFETCH_TOP_N', 4),
+                max_bytes=self.config.get('PREFETCH_MAX_BYTES', 64 * 1024 * 1024),
+                ttl_seconds=self.config.get('PREFETCH_TTL_SECONDS', 600),
+                scheduler=self.work_scheduler
+            )
+        return self._get('prefetcher', factory)
+
+    @property
+    def async_fetcher(self):
+        def factory():
+            from services.async_fetcher import AsyncImageFetcher
+            return AsyncImageFetcher(max_connections=self.config.get('ASYNC_MAX_CONNECTIONS', 200),
+                                     timeout=self.config.get('ASYNC_FETCH_TIMEOUT', 30),
+                                     origins=self.origin_scheduler)
+        return self._get('async_fetcher', factory)
+
+    @property
+    def job_tracker(self):
+        def factory():
+            from services.progress import JobTracker
+            return JobTracker(retention_seconds=self.config.get('JOB_RETENTION_SECONDS', 600))
+        return self._get('job_tracker', factory)
+
+    @property
+    def job_executor(self):
+        def factory():
+            from concurrent.futures import ThreadPoolExecutor
+            return ThreadPoolExecutor(max_workers=self.config.get('JOB_MAX_WORKERS', 4),
+                                      thread_name_prefix='image-job')
+        return self._get('job_executor', factory)
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether a service has been constructed yet"""
+        return name in self._instances
@@ -0,0 +1,124 @@
+import logging
+from functools import lru_cache
+from typing import Tuple
+
+from PIL import Image
+
+from utils.log import log_event
+
+logger = logging.getLogger(__name__)
+
+# Crop modes accepted by ImageProcessor: a fixed center window, or the square
+# window with the most edge energy / grey-level entropy
+CROP_MODES = ('center', 'edges', 'entropy')
+
+# Long side of the grey copy the smart modes score on
+ANALYSIS_SIZE = 160
+
+# Grey levels per histogram bin for the entropy score (256 / 16 bins)
+ENTROPY_BINS = 16
+
+# Windows scoring within this fraction of the best count as ties; the one
+# nearest the center wins, so flat images keep the classic center crop
+TIE_TOLERANCE = 0.02
+
+Box = Tuple[int, int, int, int]
+
+
+@lru_cache(maxsize=None)
+def smart_crop_available() -> bool:
+    """Whether numpy, which the smart modes score with, can be imported (warns once when not)"""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        log_event(logger, logging.WARNING, 'smart_crop_unavailable', fallback='center',
+                  error='numpy is not installed (pip install numpy)')
+        return False
+    return True
+
+
+def center_crop_box(width: int, height: int) -> Box:
+    """Largest centered square inside a width x height image"""
+    side = min(width, height)
+    left = (width - side) // 2
+    top = (height - side) // 2
+    return left, top, left + side, top + side
+
+
+def smart_crop_box(image: Image.Image, mode: str = 'edges', analysis_size: int = ANALYSIS_SIZE) -> Box:
+    """
+    Largest square window with the most detail, as a crop box on ``image``
+
+    The image is scored on a grey copy whose long side is ``analysis_size``
+    pixels. A summed-area table of the per-pixel score (gradient magnitude for
+    'edges', one plane per grey-level bin for 'entropy') gives every candidate
+    window's total in O(1), so choosing the window is a handful of vectorized
+    NumPy operations whatever the source resolution.
+    """
+    if mode not in ('edges', 'entropy'):
+        raise ValueError(f"Unknown smart crop mode: {mode}")
+    width, height = image.size
+    if width == height:
+        return 0, 0, width, height
+
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise RuntimeError("Smart cropping requires numpy (pip install numpy)") from e
+
+    scale = max(width, height) / analysis_size
+    small_size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    grey = np.asarray(image.resize(small_size, Image.Resampling.BILINEAR, reducing_gap=2.0).convert('L'),
+                      dtype=np.float32)
+    small_height, small_width = grey.shape
+    side = min(small_height, small_width)
+
+    if mode == 'edges':
+        planes = np.zeros((1,) + grey.shape, dtype=np.float32)
+        planes[0, :, 1:] += np.abs(np.diff(grey, axis=1))
+        planes[0, 1:, :] += np.abs(np.diff(grey, axis=0))
+    else:
+        levels = (grey * (ENTROPY_BINS / 256.0)).astype(np.intp)
+        planes = (levels[None, :, :] == np.arange(ENTROPY_BINS)[:, None, None]).astype(np.float32)
+
+    # Summed-area table with a zero first row/column: window sum = D - B - C + A
+    table = np.zeros((planes.shape[0], small_height + 1, small_width + 1), dtype=np.float64)
+    table[:, 1:, 1:] = planes.cumsum(axis=1).cumsum(axis=2)
+    offsets = np.arange(max(small_width, small_height) - side + 1)
+    if small_width > small_height:
+        sums = (table[:, side, offsets + side] - table[:, 0, offsets + side]
+                - table[:, side, offsets] + table[:, 0, offsets])
+    else:
+        sums = (table[:, offsets + side, side] - table[:, offsets, side]
+                - table[:, offsets + side, 0] + table[:, offsets, 0])
+
+    if mode == 'edges':
+        scores = sums[0]
+    else:
+        p = sums / float(side * side)
+        scores = -(p * np.log2(np.where(p > 0, p, 1.0))).sum(axis=0)
+
+    best = scores.max()
+    ties = np.flatnonzero(scores >= best - abs(best) * TIE_TOLERANCE)
+    center = (len(offsets) - 1) / 2.0
+    offset = int(ties[np.argmin(np.abs(ties - center))])
+    if abs(offset - center) <= 1:
+        return center_crop_box(width, height)
+
+    # Back to source pixels, keeping the full short side
+    full_side = min(width, height)
+    start = round(offset / (len(offsets) - 1) * (max(width, height) - full_side))
+    if width > height:
+        return start, 0, start + full_side, full_side
+    return 0, start, full_side, start + full_side
+
+
+def crop_box(image: Image.Image, mode: str = 'center') -> Box:
+    """Square crop box for ``image`` in one of CROP_MODES; the smart modes fall back to center without numpy"""
+    if mode == 'center':
+        return center_crop_box(*image.size)
+    if mode in CROP_MODES:
+        if not smart_crop_available():
+            return center_crop_box(*image.size)
+        return smart_crop_box(image, mode)
+    raise ValueError(f"Unknown crop mode: {mode}")
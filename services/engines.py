@@ -0,0 +1,196 @@
+import logging
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import Any, BinaryIO, Callable, Optional, Tuple
+
+from PIL import Image
+
+from services.cropping import crop_box
+from utils.log import log_event
+from utils.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# progress(stage, data) callback, as in ImageProcessor
+ProgressCallback = Callable[[str, dict], None]
+
+# Engines accepted by IMAGE_ENGINE; 'auto' picks vips when pyvips is installed
+ENGINES = ('pillow', 'vips', 'auto')
+
+# libvips' built-in crop strategy closest to each of services.cropping.CROP_MODES
+VIPS_CROP = {'center': 'centre', 'edges': 'attention', 'entropy': 'entropy'}
+
+
+class ImageEngine(ABC):
+    """
+    Decode, square-crop, resize and JPEG-encode backend of ImageProcessor
+
+    Engine images are opaque to the processor: whatever ``process`` returns is
+    only handed back to ``size``, ``probe`` and ``encode_jpeg`` of the same engine.
+    """
+
+    name = ''
+
+    @abstractmethod
+    def process(self, image_data: BinaryIO, size: Tuple[int, int], crop_mode: str,
+                progress: Optional[ProgressCallback] = None) -> Any:
+        """Decode an encoded image into an RGB square of ``size``; raises on undecodable data"""
+
+    @abstractmethod
+    def size(self, image: Any) -> Tuple[int, int]:
+        """(width, height) of an engine image"""
+
+    @abstractmethod
+    def probe(self, image: Any, size: Tuple[int, int]) -> Image.Image:
+        """Downscaled Pillow copy of an engine image, for trial encodes"""
+
+    @abstractmethod
+    def encode_jpeg(self, image: Any, writer: BinaryIO, quality: int = 85, optimize: bool = True,
+                    progressive: bool = False, subsampling: Optional[int] = None):
+        """
+        Write an engine image to ``writer`` as JPEG
+
+        ``subsampling`` follows Pillow: 0 for 4:4:4, 2 for 4:2:0, None for the
+        encoder's default.
+        """
+
+
+class PillowEngine(ImageEngine):
+    """The default engine: Pillow decode, services.cropping crop, Lanczos resize"""
+
+    name = 'pillow'
+
+    def process(self, image_data: BinaryIO, size: Tuple[int, int], crop_mode: str,
+                progress: Optional[ProgressCallback] = None) -> Image.Image:
+        with STAGE_SECONDS.time(stage='decode'):
+            # Open image
+            image = Image.open(image_data)
+
+            # Convert to RGB if necessary
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Create white background
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                if image.mode == 'P':
+                    image = image.convert('RGBA')
+                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+        if progress:
+            progress('decoded', {'width': image.width, 'height': image.height})
+
+        # Resize to square format
+        with STAGE_SECONDS.time(stage='resize'):
+            processed_image = self.resize_to_square(image, size, crop_mode)
+        if progress:
+            progress('resized', {'width': processed_image.width, 'height': processed_image.height})
+        return processed_image
+
+    def resize_to_square(self, image: Image.Image, size: Tuple[int, int], crop_mode: str) -> Image.Image:
+        """Crop the center or the most detailed square, then resize it to ``size``"""
+        width, height = image.size
+
+        if width != height:
+            with STAGE_SECONDS.time(stage='crop'):
+                box = crop_box(image, crop_mode)
+            image = image.crop(box)
+
+        # Resize to target size
+        return image.resize(size, Image.Resampling.LANCZOS)
+
+    def size(self, image: Image.Image) -> Tuple[int, int]:
+        return image.size
+
+    def probe(self, image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        # Box-averaging by a whole factor is several times cheaper than a filtered resize
+        factor = max(1, min(image.width // size[0], image.height // size[1]))
+        small = image.reduce(factor) if factor > 1 else image
+        return small if small.size == size else small.resize(size, Image.Resampling.BILINEAR)
+
+    def encode_jpeg(self, image: Image.Image, writer: BinaryIO, quality: int = 85, optimize: bool = True,
+                    progressive: bool = False, subsampling: Optional[int] = None):
+        options = {} if subsampling is None else {'subsampling': subsampling}
+        with STAGE_SECONDS.time(stage='encode'):
+            image.save(writer, 'JPEG', quality=quality, optimize=optimize, progressive=progressive, **options)
+
+
+class VipsEngine(ImageEngine):
+    """
+    libvips engine through pyvips
+
+    ``thumbnail_buffer`` shrinks on load (JPEG DCT scaling, WebP and PNG
+    subsampling), so a 24 MP source is never decoded at full size, and it crops
+    and resizes in the same pass with libvips' own centre, attention or entropy
+    strategy. The pipeline is lazy and runs only while the JPEG is streamed to
+    the writer, a region at a time, so memory stays flat whatever the source
+    resolution. pyvips is imported when the engine is created.
+    """
+
+    name = 'vips'
+
+    def __init__(self):
+        try:
+            import pyvips
+        except (ImportError, OSError) as e:
+            # OSError: pyvips is installed but libvips itself cannot be loaded
+            raise RuntimeError("The vips engine needs pyvips and libvips (pip install pyvips)") from e
+        self.pyvips = pyvips
+
+    def process(self, image_data: BinaryIO, size: Tuple[int, int], crop_mode: str,
+                progress: Optional[ProgressCallback] = None):
+        data = image_data.getvalue() if isinstance(image_data, BytesIO) else image_data.read()
+        with STAGE_SECONDS.time(stage='decode'):
+            # Header only; pixels are decoded while encoding
+            source = self.pyvips.Image.new_from_buffer(data, '', access='sequential')
+        if progress:
+            progress('decoded', {'width': source.width, 'height': source.height})
+
+        with STAGE_SECONDS.time(stage='resize'):
+            image = self.pyvips.Image.thumbnail_buffer(data, size[0], height=size[1],
+                                                       crop=VIPS_CROP.get(crop_mode, 'centre'))
+            if image.hasalpha():
+                image = image.flatten(background=[255, 255, 255])
+            if image.interpretation != 'srgb':
+                image = image.colourspace('srgb')
+        if progress:
+            progress('resized', {'width': image.width, 'height': image.height})
+        return image
+
+    def size(self, image) -> Tuple[int, int]:
+        return image.width, image.height
+
+    def probe(self, image, size: Tuple[int, int]) -> Image.Image:
+        small = image.resize(size[0] / image.width, vscale=size[1] / image.height)
+        return Image.frombytes('RGB', (small.width, small.height), small.write_to_memory())
+
+    def encode_jpeg(self, image, writer: BinaryIO, quality: int = 85, optimize: bool = True,
+                    progressive: bool = False, subsampling: Optional[int] = None):
+        def write(chunk):
+            writer.write(chunk)
+            return len(chunk)
+
+        options = {'optimize_coding': optimize, 'interlace': progressive, 'strip': True}
+        if subsampling is not None:
+            options['subsample_mode'] = 'off' if subsampling == 0 else 'on'
+        target = self.pyvips.TargetCustom()
+        target.on_write(write)
+        with STAGE_SECONDS.time(stage='encode'):
+            image.jpegsave_target(target, Q=quality, **options)
+
+
+def create_engine(name: str = 'pillow') -> ImageEngine:
+    """
+    Engine selected by IMAGE_ENGINE
+
+    'vips' falls back to Pillow with a warning when pyvips or libvips is
+    missing, so one config works on hosts with and without it.
+    """
+    if name not in ENGINES:
+        raise ValueError(f"Unknown image engine: {name}")
+    if name in ('vips', 'auto'):
+        try:
+            return VipsEngine()
+        except RuntimeError as e:
+            if name == 'vips':
+                log_event(logger, logging.WARNING, 'image_engine_fallback', engine=name, error=str(e))
+    return PillowEngine()
@@ -0,0 +1,163 @@
+"""
+Filling in missing product images on any number of nodes
+
+Each node runs an ImageFillWorker against the shared catalog database. A
+worker leases a batch of products without images (services.work_leases),
+searches an image for each by name and saves the first result through the
+BatchImageUpdater, then settles the leases. Nodes never process the same
+product while its lease is alive, and only talk to each other through a few
+statements per batch, so throughput grows with the number of nodes until the
+image hosts or the database become the limit.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional
+
+from flask import current_app
+
+from models.product import Product
+from services.work_leases import WorkLeases
+from utils.log import log_event
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+FILL_PRODUCTS = registry.counter('image_fill_products_total', 'Products handled by image-fill workers by outcome')
+
+# Results that settle a product for good: it has an image now, or is gone
+_SETTLED_ERRORS = frozenset({'Product image changed concurrently', 'Product not found'})
+
+
+@dataclass
+class FillReport:
+    """Outcome of an image-fill run on one worker"""
+    filled: int = 0
+    failed: int = 0  # deferred for a later retry
+    skipped: int = 0  # given an image or deleted by someone else meanwhile
+    batches: int = 0
+
+
+class ImageFillWorker:
+    """
+    Claims batches of products without images and gives each the first image its name finds
+
+    Leases are extended by a heartbeat thread every ``heartbeat_interval``
+    seconds (a third of the lease by default) while a batch is processed.
+    Should a lease be lost anyway (a long stall), the image update is still
+    guarded on the product having no image, so a second worker's result is
+    kept and the extra file left to the GC. The claim cursor walks the id
+    range and wraps around, so products released or taken over behind it
+    are picked up on the next pass.
+    """
+
+    def __init__(self, leases: WorkLeases, image_search_service, batch_updater, claim_size: int = 100,
+                 heartbeat_interval: Optional[float] = None):
+        self.leases = leases
+        self.image_search_service = image_search_service
+        self.batch_updater = batch_updater
+        self.claim_size = claim_size
+        self.heartbeat_interval = heartbeat_interval or leases.lease_seconds / 3
+        self._cursor = 0
+
+    def _choose_image(self, product: Product) -> Optional[str]:
+        results = self.image_search_service.search_images(product.name)
+        return results[0]['url'] if results else None
+
+    def _claim(self) -> List[int]:
+        product_ids = self.leases.claim(self.claim_size, after_id=self._cursor)
+        if not product_ids and self._cursor:
+            self._cursor = 0
+            product_ids = self.leases.claim(self.claim_size)
+        if product_ids:
+            self._cursor = product_ids[-1]
+        return product_ids
+
+    @contextmanager
+    def _heartbeat(self):
+        """Extend this worker's leases in the background until the block exits"""
+        app = current_app._get_current_object()
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.heartbeat_interval):
+                try:
+                    with app.app_context():
+                        self.leases.heartbeat()
+                except Exception as e:
+                    log_event(logger, logging.ERROR, 'image_fill_heartbeat_failed', owner=self.leases.owner,
+                              error=str(e))
+
+        thread = threading.Thread(target=run, name='image-fill-heartbeat', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def run_batch(self, report: FillReport) -> int:
+        """Claim and process one batch (requires an app context); returns the number of products claimed"""
+        product_ids = self._claim()
+        if not product_ids:
+            return 0
+
+        filled, skipped, failed, items = [], [], [], []
+        try:
+            with self._heartbeat():
+                products = {product.id: product
+                            for product in Product.query.filter(Product.id.in_(product_ids))}
+                for product_id in product_ids:
+                    product = products.get(product_id)
+                    if product is None or product.image_path:
+                        skipped.append(product_id)
+                        continue
+                    image_url = self._choose_image(product)
+                    if image_url:
+                        items.append({'product_id': product_id, 'image_url': image_url})
+                    else:
+                        failed.append(product_id)
+
+                for result in self.batch_updater.run(items):
+                    if result['success']:
+                        filled.append(result['product_id'])
+                    elif result.get('error') in _SETTLED_ERRORS:
+                        skipped.append(result['product_id'])
+                    else:
+                        failed.append(result['product_id'])
+        except Exception:
+            # Back off from the whole batch rather than hand it straight to the next worker
+            self.leases.defer(product_ids)
+            raise
+
+        self.leases.complete(filled + skipped)
+        self.leases.defer(failed)
+        report.filled += len(filled)
+        report.skipped += len(skipped)
+        report.failed += len(failed)
+        report.batches += 1
+        for outcome, outcome_ids in (('filled', filled), ('skipped', skipped), ('failed', failed)):
+            FILL_PRODUCTS.inc(len(outcome_ids), outcome=outcome)
+        log_event(logger, logging.INFO, 'image_fill_batch', owner=self.leases.owner, claimed=len(product_ids),
+                  filled=len(filled), skipped=len(skipped), failed=len(failed), cursor=self._cursor)
+        return len(product_ids)
+
+    def run(self, max_batches: Optional[int] = None, stop: Optional[threading.Event] = None) -> FillReport:
+        """
+        Process batches until nothing is left to claim, ``max_batches`` or ``stop`` (requires an app context)
+
+        Any lease still held on the way out is released for other workers.
+        """
+        report = FillReport()
+        try:
+            while max_batches is None or report.batches < max_batches:
+                if stop is not None and stop.is_set():
+                    break
+                if not self.run_batch(report):
+                    self.leases.purge()
+                    break
+        finally:
+            self.leases.release()
+        return report
@@ -0,0 +1,168 @@
+import os
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from sqlalchemy import delete, or_
+
+from models.product import Product, db
+from models.superseded_image import SupersededImage
+from utils.log import log_event
+from utils.metrics import registry
+from services.storage import StorageBackend, LocalStorage
+
+logger = logging.getLogger(__name__)
+
+GC_DELETED = registry.counter('image_gc_deleted_total', 'Superseded image files deleted')
+GC_RETAINED = registry.counter('image_gc_retained_total', 'Superseded images still referenced')
+
+# File names matched per reference query; keeps the OR chain well inside SQLite's expression depth limit
+REFERENCE_QUERY_NAMES = 100
+
+
+@dataclass
+class CollectionResult:
+    """Outcome of one garbage collection pass"""
+    examined: int = 0
+    deleted: int = 0
+    retained: int = 0
+    bytes_freed: int = 0
+
+
+class ImageGarbageCollector:
+    """
+    Reference-counted collector for superseded product images
+
+    ProductService queues a path in superseded_images whenever an image is
+    replaced or its product deleted. The collector takes queued paths in batches,
+    counts the products still referencing each one, and deletes the file once
+    that count is zero. Paths are compared as storage keys, so './uploads/...'
+    or backslash spellings of an image in use still count as references. A
+    grace period lets pages rendered just before the replacement finish
+    loading the old file.
+    """
+
+    def __init__(self, upload_folder: str = 'uploads/products', batch_size: int = 500,
+                 grace_seconds: float = 300.0, storage: Optional[StorageBackend] = None):
+        self.upload_folder = upload_folder
+        self.storage = storage or LocalStorage(upload_folder)
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _storage_key(self, path: str) -> Optional[str]:
+        """Storage key for a path; None for anything outside the upload folder"""
+        root = os.path.abspath(self.upload_folder.replace('\\', '/'))
+        absolute = os.path.abspath(path.replace('\\', '/'))
+        if not absolute.startswith(root + os.sep):
+            return None
+        return absolute[len(root) + 1:].replace(os.sep, '/')
+
+    def _referenced_keys(self, keys: Set[str]) -> Set[str]:
+        """The subset of ``keys`` some product's image_path still points at"""
+        referenced: Set[str] = set()
+        names = sorted({key.rsplit('/', 1)[-1] for key in keys})
+        # Narrow by file name in SQL, then compare normalised keys
+        for start in range(0, len(names), REFERENCE_QUERY_NAMES):
+            chunk = names[start:start + REFERENCE_QUERY_NAMES]
+            for (image_path,) in db.session.query(Product.image_path).filter(
+                    or_(*(Product.image_path.endswith(name, autoescape=True) for name in chunk))):
+                key = self._storage_key(image_path)
+                if key in keys:
+                    referenced.add(key)
+        return referenced
+
+    def collect_batch(self) -> CollectionResult:
+        """Process one batch of queued paths (requires an app context)"""
+        result = CollectionResult()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_seconds)
+        rows = (db.session.query(SupersededImage.id, SupersededImage.path)
+                .filter(SupersededImage.superseded_at <= cutoff)
+                .order_by(SupersededImage.id)
+                .limit(self.batch_size)
+                .all())
+        if not rows:
+            return result
+
+        paths = {path for _, path in rows}
+        referenced = self._referenced_keys({self._storage_key(path) for path in paths} - {None})
+
+        for path in paths:
+            result.examined += 1
+            key = self._storage_key(path)
+            if key is None or key in referenced:
+                result.retained += 1
+                continue
+            local_path = self.storage.local_path(key)
+            try:
+                size = os.path.getsize(local_path) if local_path else 0
+            except FileNotFoundError:
+                size = 0
+            if self.storage.delete(key):
+                result.bytes_freed += size
+            result.deleted += 1
+
+        db.session.execute(delete(SupersededImage).where(
+            SupersededImage.id.in_([row_id for row_id, _ in rows])))
+        db.session.commit()
+
+        GC_DELETED.inc(result.deleted)
+        GC_RETAINED.inc(result.retained)
+        return result
+
+    def collect(self, max_batches: Optional[int] = None) -> CollectionResult:
+        """Drain the queue batch by batch"""
+        total = CollectionResult()
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            result = self.collect_batch()
+            if result.examined == 0:
+                break
+            batches += 1
+            total.examined += result.examined
+            total.deleted += result.deleted
+            total.retained += result.retained
+            total.bytes_freed += result.bytes_freed
+
+        if total.examined:
+            log_event(logger, logging.INFO, 'image_gc_complete', batches=batches, examined=total.examined,
+                      deleted=total.deleted, retained=total.retained, bytes_freed=total.bytes_freed)
+        return total
+
+    def start_background(self, app, interval: float = 60.0):
+        """
+        Collect periodically in a daemon thread
+
+        Every worker process starts one, but a pass only runs in the worker
+        holding the deployment-wide 'image_gc' lease, so one GC runs at a time.
+        """
+        from services.work_leases import TaskLeader
+
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        leader = TaskLeader('image_gc', lease_seconds=3 * interval)
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    with app.app_context():
+                        if leader.acquire():
+                            self.collect()
+                except Exception as e:
+                    log_event(logger, logging.ERROR, 'image_gc_failed', error=str(e))
+            try:
+                with app.app_context():
+                    leader.release()
+            except Exception:
+                pass
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name='image-gc', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop_background(self):
+        self._stop.set()
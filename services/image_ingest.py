@@ -0,0 +1,144 @@
+"""
+Ingest of supplier image dumps: a ZIP archive or a directory of files named
+after product codes (``ABC-123.jpg`` sets the image of product ``ABC-123``)
+"""
+
+import os
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, Iterator, List
+
+from services.batch_updater import BatchImageUpdater
+
+# Files with other extensions (readmes, .DS_Store, Thumbs.db) are skipped
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'})
+
+# Larger entries are rejected without being decoded
+MAX_ENTRY_BYTES = 20 * 1024 * 1024
+
+
+@dataclass
+class IngestEntry:
+    """One image file of a dump, opened only when a worker reads it"""
+    name: str
+    opener: Callable[[], BinaryIO]
+
+    @property
+    def code(self) -> str:
+        """Product code the file is named after"""
+        return os.path.splitext(os.path.basename(self.name))[0].strip()
+
+    def read(self, limit: int) -> bytes:
+        with self.opener() as f:
+            data = f.read(limit + 1)
+        if len(data) > limit:
+            raise ValueError('Image file too large')
+        return data
+
+
+def _is_image(name: str) -> bool:
+    filename = os.path.basename(name)
+    return not filename.startswith('.') and os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+
+@contextmanager
+def open_zip(source) -> Iterator[Iterator[IngestEntry]]:
+    """
+    Image entries of a ZIP archive (a path or a seekable file)
+
+    Nothing is extracted: each entry is inflated straight from the archive
+    when it is read, and ZipFile serialises the underlying seeks so workers
+    may read different entries at once. The archive stays open until the
+    block exits. Raises ValueError when the source is not a ZIP archive.
+    """
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        raise ValueError('Not a ZIP archive')
+
+    def entries():
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith('__MACOSX/') or not _is_image(info.filename):
+                continue
+            yield IngestEntry(info.filename, partial(archive.open, info))
+
+    with archive:
+        yield entries()
+
+
+@contextmanager
+def open_directory(root: str) -> Iterator[Iterator[IngestEntry]]:
+    """Image files under a directory, recursively and in name order, skipping hidden directories"""
+    def entries():
+        for directory, subdirectories, filenames in os.walk(root):
+            subdirectories[:] = sorted(name for name in subdirectories if not name.startswith('.'))
+            for filename in sorted(filenames):
+                if _is_image(filename):
+                    path = os.path.join(directory, filename)
+                    yield IngestEntry(os.path.relpath(path, root).replace(os.sep, '/'), partial(open, path, 'rb'))
+
+    yield entries()
+
+
+def open_source(path: str):
+    """open_directory or open_zip for a path; raises ValueError for anything else"""
+    if os.path.isdir(path):
+        return open_directory(path)
+    if os.path.isfile(path):
+        return open_zip(path)
+    raise ValueError(f'{path} is neither a directory nor a ZIP archive')
+
+
+class ImageIngester(BatchImageUpdater):
+    """
+    Sets product images from a dump of files named after product codes
+
+    Entries are taken a chunk at a time: the chunk's codes are resolved with
+    one ProductService.get_product_ids_by_codes lookup, the matched files are
+    read, square-cropped and encoded in parallel on the batch lane, and the
+    chunk's images are committed with one bulk update. Only the images in
+    flight are held in memory. When several files share a code the last one
+    wins, as with repeated items in a batch update.
+    """
+
+    def __init__(self, image_processor, product_service, max_workers: int = 8, chunk_size: int = 100,
+                 scheduler=None, max_entry_bytes: int = MAX_ENTRY_BYTES):
+        super().__init__(image_processor, product_service, max_workers=max_workers, chunk_size=chunk_size,
+                         scheduler=scheduler)
+        self.max_entry_bytes = max_entry_bytes
+
+    def _save_entry(self, entry: IngestEntry, progress=None) -> str:
+        data = entry.read(self.max_entry_bytes)
+        return self.image_processor.process_and_save_downloaded(BytesIO(data), entry.name, entry.code, progress)
+
+    def _run_chunk(self, entries: List[IngestEntry], offset: int = 0, progress=None,
+                   batch_id: int = 0) -> List[dict]:
+        results: List[dict] = [None] * len(entries)
+        product_ids = self.product_service.get_product_ids_by_codes(entry.code for entry in entries)
+
+        valid: Dict[int, dict] = {}
+        futures = {}
+        for index, entry in enumerate(entries):
+            product_id = product_ids.get(entry.code)
+            if product_id is None:
+                results[index] = {'product_id': None, 'success': False, 'error': 'Product not found'}
+                continue
+            valid[index] = {'product_id': product_id, 'image_url': entry.name}
+            futures[index] = self._submit(
+                batch_id, self._save_entry, entry,
+                self._item_progress(progress, offset + index, product_id) if progress else None)
+
+        saved: Dict[int, str] = {}
+        for index, future in futures.items():
+            try:
+                saved[index] = future.result()
+            except Exception as e:
+                results[index] = {'product_id': valid[index]['product_id'], 'success': False, 'error': str(e)}
+
+        self._finish(results, valid, saved)
+        for entry, result in zip(entries, results):
+            result.update(file=entry.name, code=entry.code)
+        return results
@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, features
+from sqlalchemy import update, bindparam
+
+from models.product import Product, IMAGE_METADATA_COLUMNS, db
+from models.catalog_version import CatalogVersion
+from services.storage import StorageBackend, LocalStorage
+from utils.log import log_event
+
+logger = logging.getLogger(__name__)
+
+# Longest side of the inline placeholder; browsers stretch it, so it shows as a blur
+PLACEHOLDER_SIZE = 16
+
+# WebP keeps a 16 px placeholder around 100 bytes; PNG is the fallback for Pillow builds without it
+PLACEHOLDER_FORMAT = 'WEBP' if features.check('webp') else 'PNG'
+
+
+def placeholder_size(width: int, height: int) -> Tuple[int, int]:
+    """Placeholder dimensions for an image: longest side PLACEHOLDER_SIZE, aspect ratio kept"""
+    scale = min(1.0, PLACEHOLDER_SIZE / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def placeholder_uri(small: Image.Image) -> str:
+    """data: URI of a placeholder-sized image"""
+    output = BytesIO()
+    small.convert('RGB').save(output, PLACEHOLDER_FORMAT, quality=40)
+    return f'data:image/{PLACEHOLDER_FORMAT.lower()};base64,{base64.b64encode(output.getvalue()).decode()}'
+
+
+def describe_image(data: bytes) -> Dict[str, object]:
+    """
+    Product image columns for an encoded image: dimensions, byte size, format,
+    sha256 and a data: URI placeholder
+
+    Raises on data Pillow cannot decode.
+    """
+    with Image.open(BytesIO(data)) as image:
+        width, height = image.size
+        image_format = image.format
+        # JPEG decodes straight to 1/8 scale; the placeholder never needs more
+        image.draft('RGB', (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        small = image.convert('RGB')
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_bytes': len(data),
+        'image_format': image_format,
+        'image_hash': hashlib.sha256(data).hexdigest(),
+        'image_placeholder': placeholder_uri(small)
+    }
+
+
+@dataclass
+class BackfillReport:
+    """Outcome of a metadata backfill run"""
+    products_updated: int = 0
+    products_missing: int = 0
+    products_failed: int = 0
+    batches: int = 0
+
+
+class ImageMetadataBackfill:
+    """
+    Records image metadata for products saved before it was kept in the database
+
+    Products with an image but no image_hash are read back from storage in
+    batches (in parallel, so remote storage is not read one object at a time)
+    and their metadata written in one UPDATE per batch, guarded on image_path so
+    an image replaced meanwhile keeps the metadata it was saved with.
+    """
+
+    def __init__(self, upload_folder: str = 'uploads/products', storage: Optional[StorageBackend] = None,
+                 batch_size: int = 500, max_workers: int = 8, force: bool = False):
+        self.upload_folder = upload_folder
+        self.storage = storage or LocalStorage(upload_folder)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.force = force  # re-describe products that already have metadata
+
+    def _storage_key(self, image_path: str) -> Optional[str]:
+        relative = os.path.relpath(os.path.normpath(image_path), os.path.normpath(self.upload_folder))
+        if relative.startswith('..') or os.path.isabs(relative):
+            return None
+        return relative.replace(os.sep, '/')
+
+    def _describe(self, image_path: str) -> Tuple[str, Optional[dict]]:
+        """('ok', metadata), ('missing', None) or ('failed', None) for one image_path"""
+        key = self._storage_key(image_path)
+        if key is None or not self.storage.exists(key):
+            return 'missing', None
+        try:
+            return 'ok', describe_image(self.storage.get(key))
+        except Exception as e:
+            log_event(logger, logging.WARNING, 'image_metadata_failed', image_path=image_path, error=str(e))
+            return 'failed', None
+
+    def _backfill_batch(self, rows: List[Tuple[int, str]], report: BackfillReport, executor: ThreadPoolExecutor):
+        updates = []
+        for (product_id, image_path), (outcome, metadata) in zip(
+                rows, executor.map(lambda row: self._describe(row[1]), rows)):
+            if outcome == 'missing':
+                report.products_missing += 1
+            elif outcome == 'failed':
+                report.products_failed += 1
+            else:
+                updates.append(dict({f'b_{name}': value for name, value in metadata.items()},
+                                    b_id=product_id, b_path=image_path))
+        if not updates:
+            return
+
+        table = Product.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .where(table.c.image_path == bindparam('b_path'))
+            .values({name: bindparam(f'b_{name}') for name in IMAGE_METADATA_COLUMNS})
+        )
+        db.session.execute(statement, updates)
+        # List pages render the placeholders, so cached pages must go
+        CatalogVersion.bump()
+        db.session.commit()
+        report.products_updated += len(updates)
+
+    def run(self) -> BackfillReport:
+        """Backfill every product that needs it (requires an app context)"""
+        report = BackfillReport()
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='image-metadata') as executor:
+            while True:
+                query = db.session.query(Product.id, Product.image_path).filter(
+                    Product.id > last_id, Product.image_path.isnot(None))
+                if not self.force:
+                    query = query.filter(Product.image_hash.is_(None))
+                rows = query.order_by(Product.id).limit(self.batch_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                self._backfill_batch(rows, report, executor)
+                report.batches += 1
+                log_event(logger, logging.INFO, 'image_metadata_backfill_batch', batch=report.batches,
+                          last_id=last_id, updated=report.products_updated)
+        return report
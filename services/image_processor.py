@@ -1,145 +1,333 @@
 import requests
 import os
+import logging
 from PIL import Image
 from io import BytesIO
 import hashlib
-from typing import Tuple, Optional
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Tuple, Optional
 from urllib.parse import urlparse
 import time
+from contextlib import nullcontext
+from utils.log import log_event
+from utils.metrics import STAGE_SECONDS, FAILURES
+from utils.helpers import shard_path
+from services.storage import StorageBackend, LocalStorage
+from services.cropping import CROP_MODES
+from services.engines import ImageEngine, PillowEngine
+from services.image_metadata import describe_image, placeholder_size, placeholder_uri
+from services.jpeg_encoder import JpegEncoder
+from services.origin_scheduler import OriginScheduler
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Saved images whose metadata is kept for image_metadata()
+RECENT_METADATA_SIZE = 1024
+
+# Report download progress at most once per this many bytes
+PROGRESS_STEP_BYTES = 64 * 1024
+
+# progress(stage, data) callback: 'download', 'decoded', 'resized', 'saved'
+ProgressCallback = Callable[[str, dict], None]
+
+class _HashingWriter:
+    """Passes writes on to a storage writer, counting and hashing the bytes on the way"""
+    
+    def __init__(self, writer: BinaryIO):
+        self.writer = writer
+        self.bytes = 0
+        self.sha256 = hashlib.sha256()
+    
+    def write(self, data) -> int:
+        self.writer.write(data)
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self.bytes
+    
+    def flush(self):
+        self.writer.flush()
 
 class ImageProcessor:
     """Service for processing and saving images"""
     
-    def __init__(self, upload_folder: str = 'uploads/products', temp_folder: str = 'uploads/temp'):
+    def __init__(self, upload_folder: str = 'uploads/products', temp_folder: str = 'uploads/temp',
+                 shard_depth: int = 2, storage: Optional[StorageBackend] = None, crop_mode: str = 'center',
+                 single_flight: Optional[SingleFlight] = None, origins: Optional[OriginScheduler] = None,
+                 engine: Optional[ImageEngine] = None, encoder: Optional[JpegEncoder] = None):
+        if crop_mode not in CROP_MODES:
+            raise ValueError(f"Unknown crop mode: {crop_mode}")
         self.upload_folder = upload_folder
         self.temp_folder = temp_folder
+        self.shard_depth = shard_depth  # levels of hash-prefix directories, 0 for a flat layout
         self.image_size = (500, 500)  # Square format
+        self.crop_mode = crop_mode  # default for calls that don't pass one, see services.cropping
+        self.single_flight = single_flight  # shares one download between concurrent callers of a URL
+        self.origins = origins  # per-origin rate, concurrency and circuit breaker gate for downloads
+        self.engine = engine or PillowEngine()  # decode/crop/resize/encode backend, see services.engines
+        self.encoder = encoder or JpegEncoder(self.engine)  # JPEG parameters, fixed or adaptive
         self.allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+        # Metadata of recently saved images, so recording it with image_path needs no read back
+        self._recent_metadata: 'OrderedDict[str, dict]' = OrderedDict()
+        self._metadata_lock = threading.Lock()
         
-        # Create directories if they don't exist
-        os.makedirs(self.upload_folder, exist_ok=True)
+        # Local storage creates the upload and temp directories if they don't exist
         os.makedirs(self.temp_folder, exist_ok=True)
+        self.storage = storage or LocalStorage(self.upload_folder, self.temp_folder)
     
-    def process_and_save_image(self, image_url: str, product_code: str) -> str:
+    def process_and_save_image(self, image_url: str, product_code: str,
+                               progress: Optional[ProgressCallback] = None,
+                               crop_mode: Optional[str] = None) -> str:
         """
         Download, process, and save an image
         
         Args:
             image_url: URL of the image to download
             product_code: Product code to use in filename
+            progress: Optional callback receiving (stage, data) as each stage completes
+            crop_mode: One of CROP_MODES, defaults to the processor's crop_mode
             
         Returns:
             Path to the saved image
         """
         try:
             # Download image
-            image_data = self._download_image(image_url)
+            with STAGE_SECONDS.time(stage='download'):
+                image_data = self._download_image(image_url, progress)
             if not image_data:
                 raise Exception("Failed to download image")
             
-            # Process image
-            processed_image = self._process_image(image_data)
-            if not processed_image:
-                raise Exception("Failed to process image")
-            
-            # Save image
-            filename = self._generate_filename(product_code, image_url)
-            filepath = os.path.join(self.upload_folder, filename)
-            
-            processed_image.save(filepath, 'JPEG', quality=85, optimize=True)
-            
-            return filepath
+            return self._save_image_data(image_data, image_url, product_code, progress, crop_mode)
             
         except Exception as e:
+            FAILURES.inc(component='image_processor', reason='process_and_save')
+            raise Exception(f"Error processing image: {str(e)}")
+    
+    def process_and_save_downloaded(self, image_data: BytesIO, image_url: str, product_code: str,
+                                    progress: Optional[ProgressCallback] = None,
+                                    crop_mode: Optional[str] = None) -> str:
+        """
+        Process and save an image that was already downloaded (e.g. by the async fetcher)
+        
+        Returns:
+            Path to the saved image
+        """
+        try:
+            return self._save_image_data(image_data, image_url, product_code, progress, crop_mode)
+        except Exception as e:
+            FAILURES.inc(component='image_processor', reason='process_and_save')
             raise Exception(f"Error processing image: {str(e)}")
     
-    def _download_image(self, image_url: str) -> Optional[BytesIO]:
-        """Download image from URL"""
+    def prepare_image(self, image_url: str, progress: Optional[ProgressCallback] = None,
+                      crop_mode: Optional[str] = None) -> Optional[bytes]:
+        """
+        Download and process an image into JPEG bytes without saving it
+        
+        Used to warm images ahead of selection; pass the bytes to save_prepared.
+        
+        Returns:
+            Encoded JPEG, or None if the download or processing failed
+        """
+        with STAGE_SECONDS.time(stage='download'):
+            image_data = self._download_image(image_url, progress)
+        if not image_data:
+            return None
+        processed_image = self._process_image(image_data, progress, crop_mode)
+        if processed_image is None:
+            return None
+        
+        output = BytesIO()
+        self.encoder.encode(processed_image, output, self._source_key(image_data, crop_mode))
+        return output.getvalue()
+    
+    def save_prepared(self, jpeg: bytes, image_url: str, product_code: str,
+                      progress: Optional[ProgressCallback] = None) -> str:
+        """
+        Save JPEG bytes from prepare_image for a product
+        
+        Returns:
+            Path to the saved image
+        """
+        def write(writer):
+            writer.write(jpeg)
+            try:
+                return describe_image(jpeg)
+            except Exception as e:
+                log_event(logger, logging.WARNING, 'image_metadata_failed', error=str(e))
+                return None
+        
+        return self._store(image_url, product_code, write, progress)
+    
+    def _save_image_data(self, image_data: BytesIO, image_url: str, product_code: str,
+                         progress: Optional[ProgressCallback] = None, crop_mode: Optional[str] = None) -> str:
+        # Process image
+        processed_image = self._process_image(image_data, progress, crop_mode)
+        if processed_image is None:
+            raise Exception("Failed to process image")
+        
+        def encode(writer):
+            # The JPEG streams to storage; its metadata comes from the image and the bytes passing through
+            tee = _HashingWriter(writer)
+            self.encoder.encode(processed_image, tee, self._source_key(image_data, crop_mode))
+            return self._describe_encoded(processed_image, tee)
+        
+        return self._store(image_url, product_code, encode, progress)
+    
+    def _source_key(self, image_data: BytesIO, crop_mode: Optional[str]) -> Optional[tuple]:
+        """Key the encoder caches chosen parameters under: the source bytes and the crop"""
+        if self.encoder.mode == 'fixed':
+            return None
+        return hashlib.sha1(image_data.getvalue()).hexdigest(), crop_mode or self.crop_mode
+    
+    def _store(self, image_url: str, product_code: str, write: Callable[[BinaryIO], Optional[dict]],
+               progress: Optional[ProgressCallback] = None) -> str:
+        # Write straight into storage under the image's shard key; write() returns the image's metadata
+        filename = self._generate_filename(product_code, image_url)
+        key = shard_path(filename, self.shard_depth)
+        
+        writer = self.storage.open_writer(key, content_type='image/jpeg')
+        try:
+            metadata = write(writer)
+            with STAGE_SECONDS.time(stage='save'):
+                writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        
+        image_path = self.path_for_key(key)
+        if metadata is not None:
+            self._remember_metadata(image_path, metadata)
+        if progress:
+            progress('saved', {'image_path': image_path})
+        return image_path
+    
+    def image_metadata(self, image_path: str) -> Optional[dict]:
+        """
+        Product image columns for a saved image (see services.image_metadata)
+        
+        Images saved by this processor are described from the bytes it wrote;
+        anything else is read back from storage. Returns None when the image
+        is missing or cannot be decoded.
+        """
+        with self._metadata_lock:
+            metadata = self._recent_metadata.get(image_path)
+        if metadata is not None:
+            return metadata
+        key = self.key_for_path(image_path)
+        try:
+            return describe_image(self.storage.get(key)) if key is not None else None
+        except Exception as e:
+            log_event(logger, logging.WARNING, 'image_metadata_failed', image_path=image_path, error=str(e))
+            return None
+    
+    def _describe_encoded(self, image, tee: _HashingWriter) -> Optional[dict]:
+        """Metadata of an image encoded through ``tee``, without reading the JPEG back"""
+        try:
+            width, height = self.engine.size(image)
+            placeholder = placeholder_uri(self.engine.probe(image, placeholder_size(width, height)))
+        except Exception as e:
+            log_event(logger, logging.WARNING, 'image_metadata_failed', error=str(e))
+            return None
+        return {
+            'image_width': width,
+            'image_height': height,
+            'image_bytes': tee.bytes,
+            'image_format': 'JPEG',
+            'image_hash': tee.sha256.hexdigest(),
+            'image_placeholder': placeholder
+        }
+    
+    def _remember_metadata(self, image_path: str, metadata: dict):
+        with self._metadata_lock:
+            self._recent_metadata[image_path] = metadata
+            while len(self._recent_metadata) > RECENT_METADATA_SIZE:
+                self._recent_metadata.popitem(last=False)
+    
+    def path_for_key(self, key: str) -> str:
+        """Product.image_path value for a storage key"""
+        return os.path.join(self.upload_folder, key).replace(os.sep, '/')
+    
+    def key_for_path(self, image_path: str) -> Optional[str]:
+        """Storage key for a Product.image_path value, or None if outside the upload folder"""
+        relative = os.path.relpath(os.path.normpath(image_path), os.path.normpath(self.upload_folder))
+        if relative.startswith('..') or os.path.isabs(relative):
+            return None
+        return relative.replace(os.sep, '/')
+    
+    def _download_image(self, image_url: str, progress: Optional[ProgressCallback] = None) -> Optional[BytesIO]:
+        """Download image from URL; concurrent downloads of the same URL share one fetch"""
+        if self.single_flight is None:
+            return self._fetch_image(image_url, progress)
+        
+        def fetch():
+            image_data = self._fetch_image(image_url, progress)
+            return image_data.getvalue() if image_data else None
+        
+        data, shared = self.single_flight.do(image_url, fetch)
+        if data is None:
+            return None
+        if shared and progress:
+            progress('download', {'bytes': len(data), 'total_bytes': len(data), 'shared': True})
+        return BytesIO(data)
+    
+    def _fetch_image(self, image_url: str, progress: Optional[ProgressCallback] = None) -> Optional[BytesIO]:
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
             
-            response = requests.get(image_url, headers=headers, timeout=30, stream=True)
-            response.raise_for_status()
-            
-            # Check content type
-            content_type = response.headers.get('content-type', '')
-            if not content_type.startswith('image/'):
-                raise Exception(f"Invalid content type: {content_type}")
-            
-            # Check file size (max 10MB)
-            content_length = response.headers.get('content-length')
-            if content_length and int(content_length) > 10 * 1024 * 1024:
-                raise Exception("Image file too large")
-            
-            # Read image data
-            image_data = BytesIO()
-            for chunk in response.iter_content(chunk_size=8192):
-                image_data.write(chunk)
+            with self.origins.slot(image_url) if self.origins else nullcontext():
+                response = requests.get(image_url, headers=headers, timeout=30, stream=True)
+                response.raise_for_status()
+                
+                # Check content type
+                content_type = response.headers.get('content-type', '')
+                if not content_type.startswith('image/'):
+                    raise ValueError(f"Invalid content type: {content_type}")
+                
+                # Check file size (max 10MB)
+                content_length = response.headers.get('content-length')
+                if content_length and int(content_length) > 10 * 1024 * 1024:
+                    raise ValueError("Image file too large")
+                
+                # Read image data
+                image_data = BytesIO()
+                total = int(content_length) if content_length else None
+                reported = 0
+                for chunk in response.iter_content(chunk_size=8192):
+                    image_data.write(chunk)
+                    if progress and image_data.tell() - reported >= PROGRESS_STEP_BYTES:
+                        reported = image_data.tell()
+                        progress('download', {'bytes': reported, 'total_bytes': total})
+                if progress:
+                    progress('download', {'bytes': image_data.tell(), 'total_bytes': total})
             
             image_data.seek(0)
             return image_data
             
         except Exception as e:
-            print(f"Error downloading image: {e}")
+            FAILURES.inc(component='image_processor', reason='download')
+            log_event(logger, logging.WARNING, 'image_download_failed', url=image_url, error=str(e))
             return None
     
-    def _process_image(self, image_data: BytesIO) -> Optional[Image.Image]:
-        """Process image to square format"""
+    def _process_image(self, image_data: BytesIO, progress: Optional[ProgressCallback] = None,
+                       crop_mode: Optional[str] = None):
+        """Process image to square format; returns an engine image, or None if it can't be decoded"""
         try:
-            # Open image
-            image = Image.open(image_data)
-            
-            # Convert to RGB if necessary
-            if image.mode in ('RGBA', 'LA', 'P'):
-                # Create white background
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize to square format
-            processed_image = self._resize_to_square(image, self.image_size)
-            
-            return processed_image
-            
+            return self.engine.process(image_data, self.image_size, crop_mode or self.crop_mode, progress)
         except Exception as e:
-            print(f"Error processing image: {e}")
+            FAILURES.inc(component='image_processor', reason='decode')
+            log_event(logger, logging.WARNING, 'image_processing_failed', error=str(e))
             return None
     
-    def _resize_to_square(self, image: Image.Image, size: Tuple[int, int]) -> Image.Image:
-        """Resize image to square format with proper cropping"""
-        width, height = image.size
-        target_width, target_height = size
-        
-        # Calculate aspect ratio
-        aspect_ratio = width / height
-        
-        if aspect_ratio > 1:  # Landscape
-            # Crop to square from center
-            crop_size = height
-            left = (width - crop_size) // 2
-            top = 0
-            right = left + crop_size
-            bottom = crop_size
-            image = image.crop((left, top, right, bottom))
-        elif aspect_ratio < 1:  # Portrait
-            # Crop to square from center
-            crop_size = width
-            left = 0
-            top = (height - crop_size) // 2
-            right = crop_size
-            bottom = top + crop_size
-            image = image.crop((left, top, right, bottom))
-        
-        # Resize to target size
-        image = image.resize(size, Image.Resampling.LANCZOS)
-        
-        return image
+    def _resize_to_square(self, image: Image.Image, size: Tuple[int, int],
+                          crop_mode: Optional[str] = None) -> Image.Image:
+        """Resize a Pillow image to square format, cropping the center or the most detailed square"""
+        return PillowEngine().resize_to_square(image, size, crop_mode or self.crop_mode)
     
     def _generate_filename(self, product_code: str, image_url: str) -> str:
         """Generate unique filename for the image"""
@@ -154,9 +342,9 @@ class ImageProcessor:
                 extension = ext
                 break
         
-        # Generate hash for uniqueness
-        timestamp = str(int(time.time()))
-        hash_string = hashlib.md5(f"{product_code}{timestamp}".encode()).hexdigest()[:8]
+        # Generate hash for uniqueness (nanoseconds so quick re-images never collide)
+        timestamp = str(time.time_ns())
+        hash_string = hashlib.md5(f"{product_code}{image_url}{timestamp}".encode()).hexdigest()[:8]
         
         # Clean product code for filename
         clean_code = "".join(c for c in product_code if c.isalnum() or c in ('-', '_')).rstrip()
@@ -188,11 +376,11 @@ class ImageProcessor:
     def cleanup_temp_files(self):
         """Clean up temporary files"""
         try:
-            for filename in os.listdir(self.temp_folder):
-                filepath = os.path.join(self.temp_folder, filename)
-                if os.path.isfile(filepath):
-                    # Remove files older than 1 hour
-                    if time.time() - os.path.getmtime(filepath) > 3600:
-                        os.remove(filepath)
+            cutoff = time.time() - 3600
+            with os.scandir(self.temp_folder) as entries:
+                for entry in entries:
+                    # Remove files older than 1 hour (DirEntry caches the stat result)
+                    if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
         except Exception as e:
-            print(f"Error cleaning up temp files: {e}") 
\ No newline at end of file
+            log_event(logger, logging.WARNING, 'temp_cleanup_failed', folder=self.temp_folder, error=str(e)) 
\ No newline at end of file
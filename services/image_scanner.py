@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, update, delete
+
+from models.product import Product, db
+from models.image_file import ImageFile
+from utils.log import log_event
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+@dataclass
+class ScanReport:
+    """Summary of one scan of the uploads directory"""
+    files_seen: int = 0
+    files_unchanged: int = 0
+    files_verified: int = 0
+    files_removed: int = 0
+    corrupt: List[str] = field(default_factory=list)
+    orphaned: List[str] = field(default_factory=list)
+    missing: List[Tuple[int, str]] = field(default_factory=list)
+    duration: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'files_seen': self.files_seen,
+            'files_unchanged': self.files_unchanged,
+            'files_verified': self.files_verified,
+            'files_removed': self.files_removed,
+            'corrupt': self.corrupt,
+            'orphaned': self.orphaned,
+            'missing': [{'product_id': pid, 'image_path': path} for pid, path in self.missing],
+            'duration': round(self.duration, 3)
+        }
+
+
+def verify_image_file(path: str) -> dict:
+    """Fully decode-check an image file and return its health fields"""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            image_format = img.format
+            img.verify()
+        return {'status': 'ok', 'width': width, 'height': height, 'format': image_format, 'error': None}
+    except Exception as e:
+        return {'status': 'corrupt', 'width': None, 'height': None, 'format': None, 'error': str(e)[:500]}
+
+
+class ImageHealthScanner:
+    """
+    Incremental health scanner for the uploads directory
+
+    Files whose size and mtime match the stored record are skipped; new or
+    changed files are verified in parallel. Each scan also reconciles the
+    directory with Product.image_path to flag orphaned files and missing images.
+    """
+
+    def __init__(self, root: str = 'uploads/products', max_workers: int = 8, batch_size: int = 1000):
+        self.root = root
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def relative_path(self, image_path: str) -> Optional[str]:
+        """Map a stored Product.image_path to a path relative to the scan root"""
+        if not image_path:
+            return None
+        normalized = os.path.normpath(image_path)
+        root = os.path.normpath(self.root)
+        if os.path.isabs(normalized) != os.path.isabs(root):
+            normalized, root = os.path.abspath(normalized), os.path.abspath(root)
+        if normalized.startswith(root + os.sep):
+            return normalized[len(root) + 1:].replace(os.sep, '/')
+        return None
+
+    def walk(self):
+        """Yield (relative_path, size, mtime_ns) for image files under the root"""
+        stack = [('', self.root)]
+        while stack:
+            prefix, directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((prefix + entry.name + '/', entry.path))
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            stat = entry.stat(follow_symlinks=False)
+                            yield prefix + entry.name, stat.st_size, stat.st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+    def scan(self) -> ScanReport:
+        """Run one incremental scan (requires an app context)"""
+        started = time.perf_counter()
+        report = ScanReport()
+
+        known: Dict[str, Tuple[int, int, bool]] = {
+            path: (size, mtime_ns, referenced)
+            for path, size, mtime_ns, referenced in db.session.query(
+                ImageFile.path, ImageFile.size, ImageFile.mtime_ns, ImageFile.referenced)
+        }
+
+        referenced_by: Dict[str, Tuple[int, str]] = {}
+        for product_id, image_path in db.session.query(Product.id, Product.image_path).filter(
+                Product.image_path.isnot(None)):
+            relative = self.relative_path(image_path)
+            if relative is None:
+                report.missing.append((product_id, image_path))
+            else:
+                referenced_by[relative] = (product_id, image_path)
+
+        # Walk the directory and split files into unchanged and to-verify
+        on_disk = set()
+        changed: List[Tuple[str, int, int]] = []
+        for path, size, mtime_ns in self.walk():
+            on_disk.add(path)
+            previous = known.get(path)
+            if previous is not None and previous[0] == size and previous[1] == mtime_ns:
+                report.files_unchanged += 1
+            else:
+                changed.append((path, size, mtime_ns))
+        report.files_seen = len(on_disk)
+
+        # Verify new or changed files in parallel and upsert their records
+        now = datetime.utcnow()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for offset in range(0, len(changed), self.batch_size):
+                batch = changed[offset:offset + self.batch_size]
+                results = executor.map(verify_image_file,
+                                       [os.path.join(self.root, path) for path, _, _ in batch])
+                inserts, updates = [], []
+                for (path, size, mtime_ns), result in zip(batch, results):
+                    row = dict(result, path=path, size=size, mtime_ns=mtime_ns,
+                               referenced=path in referenced_by, checked_at=now)
+                    (updates if path in known else inserts).append(row)
+                if inserts:
+                    db.session.execute(insert(ImageFile), inserts)
+                if updates:
+                    db.session.execute(update(ImageFile), updates)
+                db.session.commit()
+                report.files_verified += len(batch)
+
+        # Drop records for files that disappeared
+        removed = [path for path in known if path not in on_disk]
+        for offset in range(0, len(removed), self.batch_size):
+            batch = removed[offset:offset + self.batch_size]
+            db.session.execute(delete(ImageFile).where(ImageFile.path.in_(batch)))
+            db.session.commit()
+        report.files_removed = len(removed)
+
+        # Refresh the referenced flag only where it changed
+        changed_paths = {path for path, _, _ in changed}
+        flips = [{'path': path, 'referenced': path in referenced_by}
+                 for path, (_, _, referenced) in known.items()
+                 if path in on_disk and path not in changed_paths and referenced != (path in referenced_by)]
+        for offset in range(0, len(flips), self.batch_size):
+            db.session.execute(update(ImageFile), flips[offset:offset + self.batch_size])
+            db.session.commit()
+
+        # Reconcile files and products
+        report.orphaned = sorted(path for path in on_disk if path not in referenced_by)
+        report.missing.extend(info for path, info in referenced_by.items() if path not in on_disk)
+        report.corrupt = sorted(path for (path,) in db.session.query(ImageFile.path).filter(
+            ImageFile.status != 'ok'))
+
+        report.duration = time.perf_counter() - started
+        log_event(logger, logging.INFO, 'image_scan_complete', root=self.root,
+                  seen=report.files_seen, unchanged=report.files_unchanged,
+                  verified=report.files_verified, removed=report.files_removed,
+                  corrupt=len(report.corrupt), orphaned=len(report.orphaned),
+                  missing=len(report.missing), duration=round(report.duration, 3))
+        return report
+
+    def start_background(self, app, interval: float = 300.0):
+        """Re-scan periodically in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    with app.app_context():
+                        self.scan()
+                except Exception as e:
+                    log_event(logger, logging.ERROR, 'image_scan_failed', root=self.root, error=str(e))
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name='image-health-scanner', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop_background(self):
+        self._stop.set()
@@ -1,13 +1,25 @@
 import requests
 import json
-from typing import List, Dict
+import logging
+from typing import List, Dict, Optional
 import random
 import re
+from utils.log import log_event
+from contextlib import nullcontext
+from services.origin_scheduler import OriginScheduler
+from utils.singleflight import SingleFlight
+from utils.metrics import SEARCH_SECONDS, STAGE_SECONDS, FAILURES
+
+logger = logging.getLogger(__name__)
 
 class ImageSearchService:
     """Service for searching images from the web"""
     
-    def __init__(self):
+    def __init__(self, single_flight: Optional[SingleFlight] = None, origins: Optional[OriginScheduler] = None):
+        # Shares one search between concurrent callers of the same term
+        self.single_flight = single_flight
+        # Per-origin rate, concurrency and circuit breaker gate for requests to image hosts
+        self.origins = origins
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -25,21 +37,37 @@ class ImageSearchService:
         Returns:
             List of image dictionaries with 'url', 'title', 'source' keys
         """
+        if self.single_flight is None:
+            return self._search_images(search_term, engine, max_results)
+        
+        results, _ = self.single_flight.do((search_term, engine, max_results),
+                                           lambda: self._search_images(search_term, engine, max_results))
+        # Every caller gets its own dicts
+        return [dict(image) for image in results]
+    
+    def _search_images(self, search_term: str, engine: str, max_results: int) -> List[Dict]:
         try:
-            # Generate product-specific search terms
-            search_terms = self._generate_search_terms(search_term)
-            images = []
-            
-            # Search for each term and collect images
-            for term in search_terms:
-                term_images = self._search_picsum(term, max_results // len(search_terms))
-                images.extend(term_images)
+            with SEARCH_SECONDS.time(engine=engine):
+                # Generate product-specific search terms
+                with STAGE_SECONDS.time(stage='term_generation'):
+                    search_terms = self._generate_search_terms(search_term)
+                images = []
+                
+                # Search for each term and collect images
+                for term in search_terms:
+                    term_images = self._search_picsum(term, max_results // len(search_terms))
+                    images.extend(term_images)
+                
+                # Shuffle and limit results
+                random.shuffle(images)
+                results = self._filter_valid_images(images[:max_results])
             
-            # Shuffle and limit results
-            random.shuffle(images)
-            return self._filter_valid_images(images[:max_results])
+            log_event(logger, logging.DEBUG, 'image_search', term=search_term, engine=engine,
+                      terms=len(search_terms), results=len(results))
+            return results
         except Exception as e:
-            print(f"Error searching images: {e}")
+            FAILURES.inc(component='image_search', reason='search')
+            log_event(logger, logging.WARNING, 'image_search_failed', term=search_term, error=str(e))
             return []
     
     def _generate_search_terms(self, product_name: str) -> List[str]:
@@ -128,7 +156,8 @@ class ImageSearchService:
             return images
             
         except Exception as e:
-            print(f"Error searching Picsum: {e}")
+            FAILURES.inc(component='image_search', reason='picsum')
+            log_event(logger, logging.WARNING, 'picsum_search_failed', term=search_term, error=str(e))
             return []
     
     def _filter_valid_images(self, images: List[Dict]) -> List[Dict]:
@@ -150,7 +179,8 @@ class ImageSearchService:
     def get_image_info(self, image_url: str) -> Dict:
         """Get information about an image"""
         try:
-            response = self.session.head(image_url, timeout=10)
+            with self.origins.slot(image_url) if self.origins else nullcontext():
+                response = self.session.head(image_url, timeout=10)
             if response.status_code == 200:
                 return {
                     'url': image_url,
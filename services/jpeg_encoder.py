@@ -0,0 +1,225 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import BinaryIO, Dict, Hashable, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageStat
+
+from utils.metrics import registry
+
+JPEG_ENCODED_BYTES = registry.counter('jpeg_encoded_bytes_total', 'Bytes of JPEG written by the encoder')
+JPEG_BYTES_SAVED = registry.counter('jpeg_bytes_saved_total',
+                                    'Estimated bytes saved against the fixed quality-85 encoding')
+JPEG_ENCODE_SECONDS = registry.histogram('jpeg_encode_seconds', 'JPEG encoding time, including the parameter search')
+JPEG_PARAM_LOOKUPS = registry.counter('jpeg_param_cache_total', 'Cached encoding parameter lookups by result')
+
+# Encoding modes: fixed quality 85, a byte budget, or a luma PSNR target
+ENCODING_MODES = ('fixed', 'budget', 'quality')
+
+# The encoding every mode is measured against
+FIXED_QUALITY = 85
+
+FIXED_PARAMS = {'quality': FIXED_QUALITY, 'progressive': False, 'subsampling': None, 'fixed_ratio': 1.0}
+
+# Quality range searched by the adaptive modes
+MIN_QUALITY = 40
+MAX_QUALITY = 92
+
+# Long side of the downscaled copy trial encodes run on
+PROBE_SIZE = 250
+
+# Above this RMS chroma loss from 2x2 chroma averaging (saturated edges, text,
+# logos), chroma is kept at full resolution (4:4:4) instead of 4:2:0
+CHROMA_DETAIL_THRESHOLD = 4.0
+
+# Full-size encodes allowed to bring a budget-mode image under its budget
+BUDGET_CORRECTIONS = 2
+
+
+def luma_psnr(reference: Image.Image, encoded: Image.Image) -> float:
+    """Peak signal-to-noise ratio of the luma channel, in dB"""
+    difference = ImageChops.difference(reference.convert('L'), encoded.convert('L'))
+    mse = ImageStat.Stat(difference).rms[0] ** 2
+    return 99.0 if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def chroma_detail(image: Image.Image) -> float:
+    """RMS error of the chroma planes after 4:2:0 subsampling"""
+    _, cb, cr = image.convert('YCbCr').split()
+    return max(ImageStat.Stat(ImageChops.difference(
+        plane, plane.reduce(2).resize(image.size, Image.Resampling.BILINEAR)
+    )).rms[0] for plane in (cb, cr))
+
+
+class _Probe:
+    """Downscaled copy of an image with memoized trial encodes"""
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+        self.luma = image.convert('L')
+        self._encoded: Dict[tuple, bytes] = {}
+
+    def encode(self, quality: int, progressive: bool = False, subsampling: int = 2) -> bytes:
+        key = (quality, progressive, subsampling)
+        data = self._encoded.get(key)
+        if data is None:
+            output = BytesIO()
+            self.image.save(output, 'JPEG', quality=quality, optimize=True, progressive=progressive,
+                            subsampling=subsampling)
+            data = self._encoded[key] = output.getvalue()
+        return data
+
+    def psnr(self, quality: int, subsampling: int) -> float:
+        with Image.open(BytesIO(self.encode(quality, subsampling=subsampling))) as encoded:
+            # Decode the luma plane only
+            encoded.draft('L', encoded.size)
+            return luma_psnr(self.luma, encoded)
+
+
+class JpegEncoder:
+    """
+    Chooses JPEG parameters per image instead of quality 85 for everything
+
+    In 'budget' mode the highest quality whose output fits ``target_bytes``
+    is used; in 'quality' mode the lowest quality whose luma PSNR reaches
+    ``target_psnr`` dB, so flat product shots get far smaller files and busy
+    ones keep their detail. Qualities are binary-searched with trial encodes of
+    a copy downscaled to PROBE_SIZE; budget mode calibrates the probe's sizes
+    against one full-size encode. Chroma subsampling is 4:2:0 unless the chroma
+    planes have sharp detail, and progressive is used when it is smaller on the
+    probe. Chosen parameters are cached per source (the hash of the downloaded
+    bytes and the crop), so re-processing an image skips the search.
+
+    'fixed' mode keeps the original quality-85, optimized encoding.
+    """
+
+    def __init__(self, engine, mode: str = 'fixed', target_bytes: int = 40 * 1024, target_psnr: float = 43.0,
+                 cache_size: int = 4096):
+        if mode not in ENCODING_MODES:
+            raise ValueError(f"Unknown JPEG encoding mode: {mode}")
+        self.engine = engine
+        self.mode = mode
+        self.target_bytes = target_bytes
+        self.target_psnr = target_psnr
+        self.cache_size = cache_size
+        self._params: 'OrderedDict[Hashable, dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, image, writer: BinaryIO, source_key: Optional[Hashable] = None) -> int:
+        """
+        Encode an engine image to ``writer``; returns the bytes written
+
+        ``source_key`` identifies the source the image was made from (see
+        ImageProcessor) and enables the parameter cache. 'fixed' mode streams
+        straight to ``writer``, which must then support tell(); the adaptive
+        modes compare full-size encodings, so they write one finished buffer.
+        """
+        started = time.perf_counter()
+        if self.mode == 'fixed':
+            params = FIXED_PARAMS
+            start = writer.tell()
+            self.engine.encode_jpeg(image, writer, quality=params['quality'], optimize=True,
+                                    progressive=params['progressive'], subsampling=params['subsampling'])
+            size = writer.tell() - start
+        else:
+            params = self._cached(source_key)
+            if params is None:
+                params, data = self._search(image)
+                self._remember(source_key, params)
+            else:
+                data = self._encode(image, params)
+            writer.write(data)
+            size = len(data)
+        saved = max(0, round(size * params['fixed_ratio']) - size)
+
+        JPEG_ENCODE_SECONDS.observe(time.perf_counter() - started, mode=self.mode)
+        JPEG_ENCODED_BYTES.inc(size, mode=self.mode)
+        JPEG_BYTES_SAVED.inc(saved, mode=self.mode)
+        return size
+
+    def _encode(self, image, params: dict) -> bytes:
+        output = BytesIO()
+        self.engine.encode_jpeg(image, output, quality=params['quality'], optimize=True,
+                                progressive=params['progressive'], subsampling=params['subsampling'])
+        return output.getvalue()
+
+    def _search(self, image) -> Tuple[dict, bytes]:
+        """Parameters for an image and its full-size encoding with them"""
+        width, height = self.engine.size(image)
+        scale = min(1.0, PROBE_SIZE / max(width, height))
+        probe = _Probe(self.engine.probe(image, (max(1, round(width * scale)), max(1, round(height * scale)))))
+        subsampling = 0 if chroma_detail(probe.image) > CHROMA_DETAIL_THRESHOLD else 2
+
+        if self.mode == 'quality':
+            quality = self._lowest(MIN_QUALITY, MAX_QUALITY,
+                                   lambda q: probe.psnr(q, subsampling) >= self.target_psnr)
+            fixed_size = None
+        else:
+            # Sizes do not scale with area: calibrate the probe against the full-size fixed encoding
+            fixed_size = len(self._encode(image, FIXED_PARAMS))
+            budget = self.target_bytes * len(probe.encode(FIXED_QUALITY)) / fixed_size
+            quality = self._highest(MIN_QUALITY, MAX_QUALITY,
+                                    lambda q: len(probe.encode(q, subsampling=subsampling)) <= budget)
+
+        progressive = len(probe.encode(quality, True, subsampling)) < len(probe.encode(quality, False, subsampling))
+        params = {'quality': quality, 'progressive': progressive, 'subsampling': subsampling}
+        data = self._encode(image, params)
+
+        if self.mode == 'budget':
+            # Recalibrate on the actual full-size output until it fits
+            for _ in range(BUDGET_CORRECTIONS):
+                if len(data) <= self.target_bytes or params['quality'] <= MIN_QUALITY:
+                    break
+                budget = self.target_bytes * len(probe.encode(params['quality'], progressive, subsampling)) / len(data)
+                params['quality'] = self._highest(MIN_QUALITY, params['quality'] - 1,
+                                                  lambda q: len(probe.encode(q, progressive, subsampling)) <= budget)
+                data = self._encode(image, params)
+
+        if fixed_size is None:
+            fixed_size = len(data) * len(probe.encode(FIXED_QUALITY)) / \
+                len(probe.encode(params['quality'], progressive, subsampling))
+        params['fixed_ratio'] = fixed_size / len(data)
+        return params, data
+
+    @staticmethod
+    def _lowest(low: int, high: int, good) -> int:
+        """Lowest quality in [low, high] for which good(q) holds, high if none does"""
+        while low < high:
+            middle = (low + high) // 2
+            if good(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return high
+
+    @staticmethod
+    def _highest(low: int, high: int, good) -> int:
+        """Highest quality in [low, high] for which good(q) holds, low if none does"""
+        while low < high:
+            middle = (low + high + 1) // 2
+            if good(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _cached(self, key: Optional[Hashable]) -> Optional[dict]:
+        if key is None:
+            return None
+        with self._lock:
+            params = self._params.get(key)
+            if params is not None:
+                self._params.move_to_end(key)
+        JPEG_PARAM_LOOKUPS.inc(result='hit' if params is not None else 'miss')
+        return params
+
+    def _remember(self, key: Optional[Hashable], params: dict):
+        if key is None:
+            return
+        with self._lock:
+            self._params[key] = params
+            while len(self._params) > self.cache_size:
+                self._params.popitem(last=False)
+
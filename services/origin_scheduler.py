@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from utils.log import log_event
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+ORIGIN_REQUESTS = registry.counter('origin_requests_total', 'Requests to remote origins by outcome (ok, fault, rejected)')
+ORIGIN_WAIT_SECONDS = registry.histogram('origin_wait_seconds', 'Time spent waiting for a rate or concurrency slot')
+ORIGINS_OPEN = registry.gauge('origin_circuits_open', 'Origins whose circuit breaker is open or half-open')
+
+# Circuit breaker states
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Weight of the newest sample in the latency moving average
+LATENCY_ALPHA = 0.2
+
+
+class OriginUnavailable(Exception):
+    """Raised instead of sending a request to an origin that is failing or saturated"""
+
+    def __init__(self, origin: str, reason: str, retry_after: float = 0.0):
+        super().__init__(f"Origin {origin} unavailable ({reason}), retry in {retry_after:.1f}s")
+        self.origin = origin
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def is_origin_fault(error: Optional[BaseException]) -> bool:
+    """
+    Whether a failed request counts against the origin's health
+
+    Transport errors, timeouts, 429 and 5xx responses do. Client errors such as
+    404, bad content (ValueError) and cancellations (non-Exception) do not:
+    the origin answered, the request just was not useful.
+    """
+    if error is None or not isinstance(error, Exception) or isinstance(error, OriginUnavailable):
+        return False
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return not isinstance(error, ValueError)
+
+
+class _Origin:
+    """Rate, concurrency and health state of one scheme://host:port"""
+
+    def __init__(self, key: str, tokens: float, limit: float):
+        self.key = key
+        self.tokens = tokens
+        self.refilled_at = time.monotonic()
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0  # callers in acquire(), holding no slot yet
+        self.latency = None
+        self.decreased_at = 0.0
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.probing = False
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.faults = 0
+        self.rejected = 0
+        self.last_used = time.monotonic()
+
+    def to_dict(self, now: float) -> dict:
+        # An open circuit whose wait is over lets the next request through as a probe
+        state = HALF_OPEN if self.state == OPEN and now >= self.open_until else self.state
+        return {
+            'state': state,
+            'concurrency_limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'tokens': round(self.tokens, 2),
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'requests': self.requests,
+            'faults': self.faults,
+            'rejected': self.rejected,
+            'consecutive_failures': self.consecutive_failures,
+            'retry_after': round(max(0.0, self.open_until - now), 2) if self.state != CLOSED else 0.0
+        }
+
+
+class OriginScheduler:
+    """
+    Per-origin politeness and health gate in front of outgoing HTTP requests
+
+    Every request to an origin (scheme, host and port) takes a slot first:
+
+    - a token bucket caps the request rate at ``rate`` per second with bursts
+      of up to ``burst``;
+    - an AIMD concurrency limit starts at ``initial_concurrency``, grows by
+      1/limit for each request answered within ``latency_target`` seconds and
+      is multiplied by ``backoff`` (at most once per observed round trip) when
+      a request is slow or faults, so healthy origins are driven towards
+      ``max_concurrency`` and struggling ones back off;
+    - after ``failure_threshold`` consecutive faults the circuit opens and
+      requests fail fast with OriginUnavailable for ``open_seconds``; then one
+      probe request is let through, closing the circuit on success and
+      reopening it on failure.
+
+    Callers wait up to ``max_wait`` seconds for a slot. Threads wait on a
+    condition variable; coroutines poll with asyncio.sleep.
+    """
+
+    def __init__(self, rate: float = 50.0, burst: float = 100.0, initial_concurrency: float = 4.0,
+                 min_concurrency: float = 1.0, max_concurrency: float = 32.0, latency_target: float = 2.0,
+                 backoff: float = 0.5, failure_threshold: int = 5, open_seconds: float = 30.0,
+                 max_wait: float = 10.0, max_origins: int = 1024):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.initial_concurrency = initial_concurrency
+        self.min_concurrency = max(1.0, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_wait = max_wait
+        self.max_origins = max_origins
+        self._origins: Dict[str, _Origin] = {}
+        self._changed = threading.Condition()
+
+    @staticmethod
+    def origin_key(url: str) -> str:
+        parts = urlsplit(url)
+        return f'{parts.scheme.lower()}://{parts.netloc.lower()}'
+
+    def _origin(self, key: str) -> _Origin:
+        origin = self._origins.get(key)
+        if origin is None:
+            if len(self._origins) >= self.max_origins:
+                self._prune()
+            initial = min(max(self.initial_concurrency, self.min_concurrency), self.max_concurrency)
+            origin = self._origins[key] = _Origin(key, self.burst, initial)
+        origin.last_used = time.monotonic()
+        return origin
+
+    def _prune(self):
+        """Forget the least recently used idle, healthy origins (none with requests in flight or waiting)"""
+        idle = sorted((origin for origin in self._origins.values()
+                       if origin.in_flight == 0 and origin.waiting == 0 and origin.state == CLOSED),
+                      key=lambda origin: origin.last_used)
+        for origin in idle[:max(1, len(idle) // 2)]:
+            del self._origins[origin.key]
+
+    def _try_acquire(self, origin: _Origin, now: float) -> Optional[float]:
+        """Take a slot and return None, or return how long to wait; raises if the circuit is open"""
+        if origin.state == OPEN:
+            if now < origin.open_until:
+                self._reject(origin, 'circuit_open', origin.open_until - now)
+            origin.state = HALF_OPEN
+        if origin.state == HALF_OPEN and origin.probing:
+            self._reject(origin, 'circuit_half_open', self.open_seconds)
+
+        if origin.in_flight >= int(origin.limit):
+            return self.max_wait
+        if self.rate > 0:
+            origin.tokens = min(self.burst, origin.tokens + (now - origin.refilled_at) * self.rate)
+            origin.refilled_at = now
+            if origin.tokens < 1.0:
+                return (1.0 - origin.tokens) / self.rate
+            origin.tokens -= 1.0
+
+        origin.in_flight += 1
+        origin.requests += 1
+        if origin.state == HALF_OPEN:
+            origin.probing = True
+        return None
+
+    def _reject(self, origin: _Origin, reason: str, retry_after: float):
+        origin.rejected += 1
+        ORIGIN_REQUESTS.inc(outcome='rejected')
+        raise OriginUnavailable(origin.key, reason, retry_after)
+
+    def acquire(self, url: str) -> _Origin:
+        """Block until the URL's origin has a slot; raises OriginUnavailable"""
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        with self._changed:
+            origin = self._origin(self.origin_key(url))
+            origin.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._try_acquire(origin, now)
+                    if wait is None:
+                        ORIGIN_WAIT_SECONDS.observe(now - started)
+                        return origin
+                    if now >= deadline:
+                        self._reject(origin, 'busy', wait)
+                    self._changed.wait(min(wait, deadline - now))
+            finally:
+                origin.waiting -= 1
+
+    async def acquire_async(self, url: str) -> _Origin:
+        """acquire() for coroutines; never blocks the event loop"""
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        with self._changed:
+            origin = self._origin(self.origin_key(url))
+            origin.waiting += 1
+        try:
+            while True:
+                with self._changed:
+                    now = time.monotonic()
+                    wait = self._try_acquire(origin, now)
+                    if wait is None:
+                        ORIGIN_WAIT_SECONDS.observe(now - started)
+                        return origin
+                    if now >= deadline:
+                        self._reject(origin, 'busy', wait)
+                await asyncio.sleep(min(wait, deadline - now, 0.05))
+        finally:
+            with self._changed:
+                origin.waiting -= 1
+
+    def release(self, origin: _Origin, latency: float, error: Optional[BaseException] = None):
+        """Return a slot and feed the request's latency and outcome back into the origin's state"""
+        fault = is_origin_fault(error)
+        with self._changed:
+            now = time.monotonic()
+            origin.in_flight -= 1
+            probe, origin.probing = origin.probing, False
+            if fault:
+                origin.faults += 1
+                origin.consecutive_failures += 1
+                self._decrease(origin, now)
+                if probe or origin.consecutive_failures >= self.failure_threshold:
+                    self._open(origin, now)
+            else:
+                origin.consecutive_failures = 0
+                if probe:
+                    origin.state = CLOSED
+                    log_event(logger, logging.INFO, 'origin_circuit_closed', origin=origin.key)
+                origin.latency = latency if origin.latency is None else \
+                    origin.latency + LATENCY_ALPHA * (latency - origin.latency)
+                if latency > self.latency_target:
+                    self._decrease(origin, now)
+                else:
+                    origin.limit = min(self.max_concurrency, origin.limit + 1.0 / origin.limit)
+            self._update_open_gauge()
+            self._changed.notify_all()
+        ORIGIN_REQUESTS.inc(outcome='fault' if fault else 'ok')
+
+    def _decrease(self, origin: _Origin, now: float):
+        # Requests already in flight saw the same conditions: back off once per round trip
+        if now - origin.decreased_at >= (origin.latency or 0.0):
+            origin.limit = max(self.min_concurrency, origin.limit * self.backoff)
+            origin.decreased_at = now
+
+    def _open(self, origin: _Origin, now: float):
+        origin.state = OPEN
+        origin.open_until = now + self.open_seconds
+        log_event(logger, logging.WARNING, 'origin_circuit_opened', origin=origin.key,
+                  failures=origin.consecutive_failures, open_seconds=self.open_seconds)
+
+    def _update_open_gauge(self):
+        ORIGINS_OPEN.set(sum(1 for origin in self._origins.values() if origin.state != CLOSED))
+
+    @contextmanager
+    def slot(self, url: str):
+        """Hold a slot on the URL's origin for the duration of the block"""
+        origin = self.acquire(url)
+        started = time.monotonic()
+        try:
+            yield origin
+        except BaseException as e:
+            self.release(origin, time.monotonic() - started, e)
+            raise
+        self.release(origin, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def slot_async(self, url: str):
+        """slot() for coroutines"""
+        origin = await self.acquire_async(url)
+        started = time.monotonic()
+        try:
+            yield origin
+        except BaseException as e:
+            self.release(origin, time.monotonic() - started, e)
+            raise
+        self.release(origin, time.monotonic() - started)
+
+    def status(self) -> Dict[str, dict]:
+        """Snapshot of every known origin's limits and health"""
+        with self._changed:
+            now = time.monotonic()
+            return {key: origin.to_dict(now) for key, origin in sorted(self._origins.items())}
@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Hashable, Iterable, Optional, Set
+
+from services.work_scheduler import BACKGROUND
+from utils.log import log_event
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_OUTCOMES = registry.counter('image_prefetch_total', 'Speculative image prefetches by outcome')
+PREFETCH_LOOKUPS = registry.counter('image_prefetch_lookups_total', 'Selected images looked up in the prefetch cache')
+
+
+class PrefetchCancelled(BaseException):
+    """
+    Raised from the progress callback to stop a cancelled prefetch
+
+    Not an Exception, so the processor's download and decode error handling
+    lets it through instead of counting it as a failure.
+    """
+
+
+class ImagePrefetcher:
+    """
+    Speculatively downloads and processes image candidates before the user picks one
+
+    When search results are shown, the page asks for its top candidates to be
+    warmed. Each one is downloaded, decoded, resized and encoded in the
+    background and the JPEG is kept in ``cache_dir`` under a hash of its URL,
+    so every worker process sharing the folder can use it. Selecting a warmed
+    candidate only writes those bytes to storage; selecting one that is still
+    warming waits for it instead of starting a second download.
+
+    Candidates are grouped (by product); a new search for the same group or a
+    selection cancels the rest. The cache is held under ``max_bytes`` by
+    evicting the least recently written files, and files older than
+    ``ttl_seconds`` are ignored and removed.
+
+    With a ``scheduler`` the warming runs in the WorkScheduler's background
+    lane, behind interactive and batch work.
+    """
+
+    def __init__(self, image_processor, cache_dir: str, max_workers: int = 2, top_n: int = 4,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 600.0, scheduler=None):
+        self.image_processor = image_processor
+        self.cache_dir = cache_dir
+        self.top_n = top_n
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.scheduler = scheduler
+        self.executor = None if scheduler else ThreadPoolExecutor(max_workers=max_workers,
+                                                                  thread_name_prefix='image-prefetch')
+        self._pending: Dict[str, Future] = {}
+        self._cancelled: Dict[str, threading.Event] = {}
+        self._groups: Dict[Hashable, Set[str]] = {}
+        # Re-entrant: a future that is already done runs its callback (_forget) inside prefetch()
+        self._lock = threading.RLock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, image_url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(image_url.encode('utf-8')).hexdigest() + '.jpg')
+
+    def prefetch(self, group: Hashable, image_urls: Iterable[str]) -> int:
+        """
+        Warm the first ``top_n`` candidates of a group, cancelling its earlier ones
+
+        Returns:
+            Number of candidates scheduled (cached or already warming ones are skipped)
+        """
+        urls = list(dict.fromkeys(url for url in image_urls if url))[:self.top_n]
+        self.cancel(group, keep=urls)
+
+        scheduled = 0
+        with self._lock:
+            self._groups[group] = set(urls)
+            for url in urls:
+                if url in self._pending or self._fresh(self.path_for(url)):
+                    continue
+                cancelled = self._cancelled[url] = threading.Event()
+                if self.scheduler:
+                    future = self.scheduler.submit(BACKGROUND, self._warm, url, cancelled, group=group)
+                else:
+                    future = self.executor.submit(self._warm, url, cancelled)
+                self._pending[url] = future
+                future.add_done_callback(lambda _, url=url: self._forget(url))
+                scheduled += 1
+        return scheduled
+
+    def cancel(self, group: Hashable, keep: Iterable[str] = ()) -> int:
+        """Cancel a group's prefetches except ``keep``; returns how many were stopped"""
+        keep = set(keep)
+        cancelled = 0
+        with self._lock:
+            for url in self._groups.pop(group, set()) - keep:
+                future = self._pending.get(url)
+                if future is None:
+                    continue
+                self._cancelled[url].set()
+                # A running prefetch counts itself when it notices the event
+                if future.cancel():
+                    PREFETCH_OUTCOMES.inc(outcome='cancelled')
+                cancelled += 1
+        return cancelled
+
+    def take(self, image_url: str, timeout: float = 30.0) -> Optional[bytes]:
+        """
+        Prepared JPEG bytes for a selected image, or None on a miss
+
+        Waits up to ``timeout`` seconds for a prefetch of the same URL that is
+        still running. One that has not started yet is cancelled instead: it
+        may be queued behind other work, and the caller downloads sooner itself.
+        """
+        with self._lock:
+            future = self._pending.get(image_url)
+        if future is not None and future.cancel():
+            PREFETCH_OUTCOMES.inc(outcome='cancelled')
+        elif future is not None and not future.cancelled():
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+        path = self.path_for(image_url)
+        try:
+            if self._fresh(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                PREFETCH_LOOKUPS.inc(result='hit')
+                return data
+        except OSError:
+            pass
+        PREFETCH_LOOKUPS.inc(result='miss')
+        return None
+
+    def _forget(self, url: str):
+        with self._lock:
+            self._pending.pop(url, None)
+            self._cancelled.pop(url, None)
+
+    def _fresh(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) < self.ttl_seconds
+        except OSError:
+            return False
+
+    def _warm(self, url: str, cancelled: threading.Event):
+        def check(stage, data):
+            if cancelled.is_set():
+                raise PrefetchCancelled()
+
+        try:
+            check(None, None)
+            jpeg = self.image_processor.prepare_image(url, check)
+            check(None, None)
+        except PrefetchCancelled:
+            PREFETCH_OUTCOMES.inc(outcome='cancelled')
+            return
+        if jpeg is None:
+            PREFETCH_OUTCOMES.inc(outcome='failed')
+            return
+        if len(jpeg) > self.max_bytes:
+            PREFETCH_OUTCOMES.inc(outcome='too_large')
+            return
+
+        path = self.path_for(url)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(jpeg)
+        os.replace(temp_path, path)
+        PREFETCH_OUTCOMES.inc(outcome='warmed')
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        """Drop expired files, then the oldest ones until the cache fits ``max_bytes``"""
+        now = time.time()
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.jpg') or not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            log_event(logger, logging.WARNING, 'prefetch_cache_scan_failed', folder=self.cache_dir, error=str(e))
+            return
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if total <= self.max_bytes and now - mtime < self.ttl_seconds:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
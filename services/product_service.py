@@ -1,54 +1,281 @@
-from models.product import Product, db
-from typing import List, Optional
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Optional, Union
+
+from sqlalchemy import insert, update, delete, bindparam
+
+from models.product import Product, IMAGE_METADATA_COLUMNS, db
+from models.catalog_version import CatalogVersion
+from models.superseded_image import SupersededImage
 
 class ProductService:
-    """Service class for product operations"""
+    """
+    Service class for product operations
+
+    With a ``snapshot`` (services.catalog_snapshot.CatalogSnapshot) counts,
+    code lookups, has-image checks and missing-image listings are answered
+    from memory instead of the ORM.
+    """
+    
+    def __init__(self, batch_size: int = 1000, snapshot=None):
+        self.batch_size = batch_size
+        self.snapshot = snapshot
+    
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Group several mutations into one transaction
+
+        Mutators called inside the block flush instead of committing; the
+        outermost block commits once on success and rolls back on error.
+        Blocks may be nested.
+        """
+        info = db.session.info
+        info['uow_depth'] = info.get('uow_depth', 0) + 1
+        try:
+            yield self
+            if info['uow_depth'] == 1:
+                db.session.commit()
+        except Exception:
+            if info['uow_depth'] == 1:
+                db.session.rollback()
+            raise
+        finally:
+            info['uow_depth'] -= 1
+    
+    def _commit(self):
+        """Bump the catalog version, then commit, or only flush while a unit of work is open"""
+        CatalogVersion.bump()
+        if db.session.info.get('uow_depth', 0) > 0:
+            db.session.flush()
+        else:
+            db.session.commit()
+    
+    @staticmethod
+    def _expire_products(product_ids):
+        """Expire already-loaded products touched by a bulk statement"""
+        for instance in list(db.session.identity_map.values()):
+            if isinstance(instance, Product) and instance.id in product_ids:
+                db.session.expire(instance)
+    
+    def _queue_superseded(self, paths: Iterable[str]):
+        rows = [{'path': path} for path in paths if path]
+        if rows:
+            db.session.execute(insert(SupersededImage), rows)
     
     def get_all_products(self) -> List[Product]:
         """Get all products"""
         return Product.query.all()
     
     def get_product_by_id(self, product_id: int) -> Optional[Product]:
-        """Get product by ID"""
-        return Product.query.get(product_id)
+        """Get product by ID (served from the session identity map when already loaded)"""
+        return db.session.get(Product, product_id)
     
     def get_product_by_code(self, code: str) -> Optional[Product]:
         """Get product by code"""
+        if self.snapshot is not None:
+            product_id = self.snapshot.id_for_code(code)
+            return self.get_product_by_id(product_id) if product_id is not None else None
         return Product.query.filter_by(code=code).first()
     
-    def get_products_without_images(self) -> List[Product]:
-        """Get products that don't have images"""
-        return Product.query.filter(Product.image_path.is_(None)).all()
+    def get_product_ids_by_codes(self, codes: Iterable[str]) -> Dict[str, int]:
+        """Batched get_product_by_code: product ids by code, unknown codes left out"""
+        codes = list(dict.fromkeys(codes))
+        if self.snapshot is not None:
+            ids = {code: self.snapshot.id_for_code(code) for code in codes}
+            return {code: product_id for code, product_id in ids.items() if product_id is not None}
+        found: Dict[str, int] = {}
+        for start in range(0, len(codes), self.batch_size):
+            batch = codes[start:start + self.batch_size]
+            found.update(db.session.query(Product.code, Product.id).filter(Product.code.in_(batch)))
+        return found
+    
+    def get_products_without_images(self, limit: Optional[int] = None) -> List[Product]:
+        """Get products that don't have images, in id order, optionally only the first ``limit``"""
+        if self.snapshot is not None and limit is not None:
+            product_ids = self.snapshot.missing_image_ids(limit)
+            return Product.query.filter(Product.id.in_(product_ids)).order_by(Product.id).all() if product_ids else []
+        query = Product.query.filter(Product.image_path.is_(None)).order_by(Product.id)
+        return (query.limit(limit) if limit is not None else query).all()
+    
+    def get_missing_image_ids(self, limit: Optional[int] = None, after_id: int = 0) -> List[int]:
+        """Ids of products without images in id order; page through them with ``after_id``"""
+        if self.snapshot is not None:
+            return self.snapshot.missing_image_ids(limit, after_id)
+        query = (db.session.query(Product.id)
+                 .filter(Product.image_path.is_(None), Product.id > after_id)
+                 .order_by(Product.id))
+        return [product_id for (product_id,) in (query.limit(limit) if limit is not None else query)]
+    
+    def product_has_image(self, product_id: int) -> Optional[bool]:
+        """Whether a product has an image; None when there is no such product"""
+        if self.snapshot is not None:
+            return self.snapshot.has_image(product_id)
+        row = db.session.query(Product.image_path.isnot(None)).filter(Product.id == product_id).first()
+        return bool(row[0]) if row else None
     
     def add_product(self, product: Product) -> Product:
         """Add a new product"""
         db.session.add(product)
-        db.session.commit()
+        self._commit()
         return product
     
+    def add_products(self, products: Iterable[Union[Product, Mapping]]) -> int:
+        """
+        Insert many products with one multi-row INSERT per batch
+
+        Args:
+            products: Product instances or mappings with name, code and image_path
+
+        Returns:
+            Number of products inserted
+        """
+        inserted = 0
+        batch = []
+        for product in products:
+            if isinstance(product, Product):
+                product = {'name': product.name, 'code': product.code, 'image_path': product.image_path}
+            batch.append(product)
+            if len(batch) >= self.batch_size:
+                inserted += self._insert_batch(batch)
+                batch = []
+        if batch:
+            inserted += self._insert_batch(batch)
+        return inserted
+    
+    def _insert_batch(self, rows: List[Mapping]) -> int:
+        now = datetime.utcnow()
+        db.session.execute(insert(Product), [
+            {'name': row['name'], 'code': row['code'], 'image_path': row.get('image_path'),
+             'created_at': now, 'updated_at': now}
+            for row in rows
+        ])
+        self._commit()
+        return len(rows)
+    
     def update_product(self, product_id: int, **kwargs) -> Optional[Product]:
-        """Update product information"""
+        """Update product information; a new image_path without its metadata columns clears them"""
         product = self.get_product_by_id(product_id)
         if product:
+            old_image_path = product.image_path
+            if kwargs.get('image_path', old_image_path) != old_image_path:
+                kwargs = dict(dict.fromkeys(IMAGE_METADATA_COLUMNS), **kwargs)
             for key, value in kwargs.items():
                 if hasattr(product, key):
                     setattr(product, key, value)
-            db.session.commit()
+            # Queue the replaced image for garbage collection in the same transaction
+            if old_image_path and old_image_path != product.image_path:
+                db.session.add(SupersededImage(old_image_path))
+            self._commit()
         return product
     
-    def update_product_image(self, product_id: int, image_path: str) -> Optional[Product]:
-        """Update product image path"""
-        return self.update_product(product_id, image_path=image_path)
+    def update_product_image(self, product_id: int, image_path: str,
+                             metadata: Optional[Mapping] = None) -> Optional[Product]:
+        """Update product image path, with the image's metadata columns when known"""
+        return self.update_product(product_id, image_path=image_path, **(metadata or {}))
+    
+    def update_images_bulk(self, images: Mapping[int, str],
+                           metadata: Optional[Mapping[int, Optional[Mapping]]] = None,
+                           expected: Optional[Mapping[int, Optional[str]]] = None) -> Dict[int, bool]:
+        """
+        Point many products at new images with one executemany UPDATE per batch
+
+        Each row is guarded on the image_path read just before the update, so
+        an image set concurrently is never overwritten silently: that row is
+        reported as not applied and its new file queued for garbage collection.
+        Replaced images are queued as superseded in the same transaction.
+
+        Args:
+            images: Mapping of product id to new image path
+            metadata: Optional mapping of product id to the new image's
+                metadata columns; products without an entry get them cleared
+            expected: Optional mapping of product id to the image_path the
+                row must still hold (None: still without an image) instead
+                of the one read just before the update
+
+        Returns:
+            Mapping of product id to whether the update applied; ids of
+            products that do not exist are left out
+        """
+        applied: Dict[int, bool] = {}
+        items = list(images.items())
+        for offset in range(0, len(items), self.batch_size):
+            applied.update(self._update_images_batch(dict(items[offset:offset + self.batch_size]), metadata or {},
+                                                     expected or {}))
+        return applied
+    
+    @staticmethod
+    def _image_paths(product_ids) -> Dict[int, Optional[str]]:
+        return dict(db.session.query(Product.id, Product.image_path).filter(Product.id.in_(product_ids)))
+    
+    def _update_images_batch(self, images: Dict[int, str], metadata: Mapping[int, Optional[Mapping]],
+                             expected: Mapping[int, Optional[str]]) -> Dict[int, bool]:
+        table = Product.__table__
+        current = self._image_paths(images)
+        if not current:
+            return {}
+
+        updates = []
+        for product_id in current:
+            old_path = expected[product_id] if product_id in expected else current[product_id]
+            row = {'b_id': product_id, 'b_old': old_path, 'b_new': images[product_id],
+                   'b_now': datetime.utcnow()}
+            image_metadata = metadata.get(product_id) or {}
+            row.update({f'b_{name}': image_metadata.get(name) for name in IMAGE_METADATA_COLUMNS})
+            updates.append(row)
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .where(table.c.image_path.is_not_distinct_from(bindparam('b_old')))
+            .values({'image_path': bindparam('b_new'), 'updated_at': bindparam('b_now'),
+                     **{name: bindparam(f'b_{name}') for name in IMAGE_METADATA_COLUMNS}})
+        )
+        db.session.execute(statement, updates)
+
+        # Read back inside the same transaction to see which rows took the update
+        after = self._image_paths(current)
+        applied, superseded = {}, []
+        for row in updates:
+            applied[row['b_id']] = after.get(row['b_id']) == row['b_new']
+            if not applied[row['b_id']]:
+                superseded.append(row['b_new'])
+            elif row['b_old'] and row['b_old'] != row['b_new']:
+                superseded.append(row['b_old'])
+        self._queue_superseded(superseded)
+        self._expire_products(set(current))
+        self._commit()
+        return applied
     
     def delete_product(self, product_id: int) -> bool:
         """Delete a product"""
         product = self.get_product_by_id(product_id)
         if product:
+            if product.image_path:
+                db.session.add(SupersededImage(product.image_path))
             db.session.delete(product)
-            db.session.commit()
+            self._commit()
             return True
         return False
     
+    def delete_products(self, product_ids: Iterable[int]) -> int:
+        """
+        Delete many products with one DELETE per batch, queueing their images
+
+        Returns:
+            Number of products deleted
+        """
+        ids = list(product_ids)
+        deleted = 0
+        for offset in range(0, len(ids), self.batch_size):
+            batch = ids[offset:offset + self.batch_size]
+            self._queue_superseded(path for (path,) in db.session.query(Product.image_path).filter(
+                Product.id.in_(batch), Product.image_path.isnot(None)))
+            result = db.session.execute(delete(Product).where(Product.id.in_(batch))
+                                        .execution_options(synchronize_session='fetch'))
+            deleted += result.rowcount
+            self._commit()
+        return deleted
+    
     def search_products(self, search_term: str) -> List[Product]:
         """Search products by name or code"""
         return Product.query.filter(
@@ -58,8 +285,12 @@ class ProductService:
     
     def get_products_count(self) -> int:
         """Get total number of products"""
+        if self.snapshot is not None:
+            return self.snapshot.count()
         return Product.query.count()
     
     def get_products_with_images_count(self) -> int:
         """Get number of products with images"""
-        return Product.query.filter(Product.image_path.isnot(None)).count() 
\ No newline at end of file
+        if self.snapshot is not None:
+            return self.snapshot.count_with_images()
+        return Product.query.filter(Product.image_path.isnot(None)).count()
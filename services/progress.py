@@ -0,0 +1,133 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Job states that will never change again
+FINISHED_STATES = ('done', 'failed')
+
+
+class Job:
+    """Progress snapshot of one single or batch image job"""
+
+    def __init__(self, job_id: str, kind: str, total: int = 1, **fields):
+        self.id = job_id
+        self.kind = kind
+        self.state = 'queued'
+        self.stage = None
+        self.total = total
+        self.completed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.fields = fields
+        self.result = None
+        self.error = None
+        self.updated_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def to_dict(self) -> dict:
+        return dict(self.fields, id=self.id, kind=self.kind, state=self.state, stage=self.stage,
+                    total=self.total, completed=self.completed, succeeded=self.succeeded,
+                    failed=self.failed, result=self.result, error=self.error)
+
+
+class JobTracker:
+    """
+    In-process registry of long image jobs and their progress events
+
+    Every update gets a sequence number and is kept in a bounded event log.
+    Followers ask for the events after the last sequence number they saw, for
+    any set of job ids, and block on a condition variable until one arrives,
+    so a single stream can follow many jobs without polling.
+    """
+
+    def __init__(self, max_events: int = 10000, retention_seconds: float = 600.0):
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._events: Deque[Tuple[int, str, dict]] = deque(maxlen=max_events)
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._changed = threading.Condition()
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def create(self, kind: str, total: int = 1, **fields) -> Job:
+        job = Job(uuid.uuid4().hex, kind, total, **fields)
+        with self._changed:
+            self._prune()
+            self._jobs[job.id] = job
+            self._publish(job, 'queued', {})
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id: str, event: str, **data):
+        """Record a progress event; 'done' and 'failed' finish the job"""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            job.updated_at = time.time()
+            if event in FINISHED_STATES:
+                job.state = event
+                job.result = data.get('result', job.result)
+                job.error = data.get('error', job.error)
+            else:
+                job.state = 'running'
+                job.stage = event
+                for name in ('completed', 'succeeded', 'failed'):
+                    if name in data:
+                        setattr(job, name, data[name])
+            self._publish(job, event, data)
+
+    def progress_callback(self, job_id: str, **context) -> Callable[[str, dict], None]:
+        """Adapter for ImageProcessor/BatchImageUpdater progress callbacks"""
+        def report(stage: str, data: dict):
+            self.update(job_id, stage, **context, **data)
+        return report
+
+    def _publish(self, job: Job, event: str, data: dict):
+        seq = next(self._seq)
+        self._last_seq = seq
+        payload = dict(data, job_id=job.id, kind=job.kind, state=job.state, completed=job.completed,
+                       total=job.total)
+        self._events.append((seq, event, payload))
+        self._changed.notify_all()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job.id for job in self._jobs.values() if job.finished and job.updated_at < cutoff]:
+            del self._jobs[job_id]
+
+    def events_since(self, after: int, job_ids: Optional[Iterable[str]] = None,
+                     timeout: float = 15.0) -> List[Tuple[int, str, dict]]:
+        """
+        Events with a sequence number above ``after`` for the given jobs
+
+        Blocks up to ``timeout`` seconds until at least one matching event exists;
+        returns an empty list on timeout.
+        """
+        wanted = set(job_ids) if job_ids else None
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                events = [(seq, event, payload) for seq, event, payload in self._events
+                          if seq > after and (wanted is None or payload['job_id'] in wanted)]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._changed.wait(remaining)
+
+    def all_finished(self, job_ids: Iterable[str]) -> bool:
+        """Whether every listed job has finished (unknown ids count as finished)"""
+        with self._changed:
+            return all(job_id not in self._jobs or self._jobs[job_id].finished for job_id in job_ids)
@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Hashable, Optional, Tuple
+
+from models.product import db
+from models import catalog_version
+from models.catalog_version import CatalogVersion
+from utils.metrics import registry
+
+CACHE_LOOKUPS = registry.counter('render_cache_lookups_total', 'Rendered page/fragment cache lookups by result')
+CACHE_BYTES = registry.gauge('render_cache_bytes', 'Bytes of rendered output held by the page cache')
+
+
+class CachedPage:
+    """Rendered body with the validators used for conditional requests"""
+
+    __slots__ = ('body', 'etag', 'version', 'last_modified')
+
+    def __init__(self, body: bytes, version: int, last_modified: Optional[datetime]):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.version = version
+        self.last_modified = last_modified
+
+
+class RenderCache:
+    """
+    Bounded LRU of rendered pages and fragments, keyed on the catalog version
+
+    Product writes bump the catalog_version row in their own transaction.
+    Entries hold the version they were rendered at, and the whole cache is
+    dropped when a different version is seen, so a lookup never returns output
+    older than the last write it knows about. The version row is re-read at
+    most every ``version_ttl`` seconds, or right away after a commit from
+    this process, which bounds how stale a page can be after another worker
+    process writes. Memory is capped at ``max_bytes`` of rendered output.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, version_ttl: float = 1.0):
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self._entries: 'OrderedDict[Hashable, CachedPage]' = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[int] = None
+        self._last_modified: Optional[datetime] = None
+        self._checked_at = 0.0
+        self._seen_changes = -1
+        self._lock = threading.Lock()
+
+    def version(self) -> Tuple[int, Optional[datetime]]:
+        """Current catalog version and when it last changed"""
+        now = time.monotonic()
+        with self._lock:
+            if (self._version is not None and now - self._checked_at < self.version_ttl
+                    and self._seen_changes == catalog_version.local_changes):
+                return self._version, self._last_modified
+
+        changes = catalog_version.local_changes
+        row = db.session.query(CatalogVersion.version, CatalogVersion.updated_at).filter_by(id=1).first()
+        version, last_modified = row if row else (0, None)
+        with self._lock:
+            if version != self._version:
+                self._clear()
+                self._version, self._last_modified = version, last_modified
+            self._checked_at = now
+            self._seen_changes = changes
+            return self._version, self._last_modified
+
+    def get(self, key: Hashable) -> Optional[CachedPage]:
+        """Entry for ``key`` at the current version, if cached"""
+        version, _ = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                CACHE_LOOKUPS.inc(result='miss')
+                return None
+            self._entries.move_to_end(key)
+        CACHE_LOOKUPS.inc(result='hit')
+        return entry
+
+    def render(self, key: Hashable, render: Callable[[], str]) -> CachedPage:
+        """Cached entry for ``key``, rendering and storing it on a miss"""
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        version, last_modified = self.version()
+        entry = CachedPage(render().encode('utf-8'), version, last_modified)
+        self._put(key, entry)
+        return entry
+
+    def _put(self, key: Hashable, entry: CachedPage):
+        size = len(entry.body)
+        with self._lock:
+            # Rendered against a version that has since been superseded, or too big to keep
+            if entry.version != self._version or size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+            CACHE_BYTES.set(self._bytes)
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        CACHE_BYTES.set(0)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,159 @@
+import os
+import shutil
+import logging
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from sqlalchemy import update, bindparam
+
+from models.product import Product, db
+from models.catalog_version import CatalogVersion
+from utils.helpers import shard_path
+from utils.log import log_event
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MigrationReport:
+    """Outcome of a shard migration run"""
+    products_moved: int = 0
+    products_skipped: int = 0
+    products_missing: int = 0
+    orphans_moved: int = 0
+    batches: int = 0
+
+
+class ShardMigrator:
+    """
+    Online migration of a flat upload directory to the hash-prefix sharded layout
+
+    For each batch of products the image is first hard-linked (or copied) into
+    its shard directory, then Product.image_path is rewritten in one transaction
+    guarded on the old value, and only then is the flat file removed. The app can
+    keep serving throughout: every committed image_path points at an existing file.
+    """
+
+    def __init__(self, upload_folder: str = 'uploads/products', shard_depth: int = 2,
+                 batch_size: int = 500, dry_run: bool = False):
+        self.upload_folder = upload_folder
+        self.shard_depth = shard_depth
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    def target_for(self, image_path: str) -> str:
+        """Sharded image_path for a flat image_path"""
+        return os.path.join(self.upload_folder, shard_path(os.path.basename(image_path), self.shard_depth))
+
+    def _is_flat(self, image_path: str) -> bool:
+        # abspath so './uploads/...' and absolute image paths compare equal to the folder
+        return os.path.abspath(os.path.dirname(image_path)) == os.path.abspath(self.upload_folder)
+
+    @staticmethod
+    def _place(source: str, target: str):
+        """Make target a second name for source (hard link, falling back to copy)"""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            return
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    def _migrate_batch(self, rows: List[Tuple[int, str]], report: MigrationReport):
+        moves = []
+        for product_id, image_path in rows:
+            if not self._is_flat(image_path):
+                report.products_skipped += 1
+                continue
+            if not os.path.exists(image_path):
+                report.products_missing += 1
+                continue
+            target = self.target_for(image_path)
+            moves.append({'b_id': product_id, 'b_old': image_path, 'b_new': target})
+
+        if not moves or self.dry_run:
+            report.products_moved += len(moves)
+            return
+
+        for move in moves:
+            self._place(move['b_old'], move['b_new'])
+
+        statement = (
+            update(Product.__table__)
+            .where(Product.__table__.c.id == bindparam('b_id'))
+            .where(Product.__table__.c.image_path == bindparam('b_old'))
+            .values(image_path=bindparam('b_new'))
+        )
+        db.session.execute(statement, moves)
+        CatalogVersion.bump()
+        db.session.commit()
+
+        # Rows changed concurrently keep their new image; drop our copy for those
+        current = dict(db.session.query(Product.id, Product.image_path).filter(
+            Product.id.in_([move['b_id'] for move in moves])))
+        for move in moves:
+            if current.get(move['b_id']) == move['b_new']:
+                report.products_moved += 1
+                self._remove_if_unreferenced(move['b_old'])
+            else:
+                report.products_skipped += 1
+                self._remove_if_unreferenced(move['b_new'])
+
+    @staticmethod
+    def _spellings(path: str) -> set:
+        """Ways an image_path may refer to the same file (relative, ./-prefixed, absolute)"""
+        relative = os.path.relpath(path)
+        return {path, relative, os.path.join('.', relative), os.path.abspath(path)}
+
+    def _remove_if_unreferenced(self, path: str):
+        if db.session.query(Product.id).filter(Product.image_path.in_(self._spellings(path))).first() is None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _referenced_flat_paths(self) -> set:
+        """Absolute paths of flat files still referenced, however image_path spells them"""
+        referenced = set()
+        rows = (db.session.query(Product.image_path)
+                .filter(Product.image_path.isnot(None))
+                .execution_options(yield_per=self.batch_size))
+        for (image_path,) in rows:
+            if self._is_flat(image_path):
+                referenced.add(os.path.abspath(image_path))
+        return referenced
+
+    def migrate(self) -> MigrationReport:
+        """Run the migration (requires an app context)"""
+        report = MigrationReport()
+        last_id = 0
+        while True:
+            rows = (db.session.query(Product.id, Product.image_path)
+                    .filter(Product.id > last_id, Product.image_path.isnot(None))
+                    .order_by(Product.id)
+                    .limit(self.batch_size)
+                    .all())
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            self._migrate_batch(rows, report)
+            report.batches += 1
+            log_event(logger, logging.INFO, 'shard_migration_batch', batch=report.batches,
+                      last_id=last_id, moved=report.products_moved)
+
+        # Move any unreferenced flat files so the top level stays small
+        if os.path.isdir(self.upload_folder):
+            with os.scandir(self.upload_folder) as entries:
+                flat_files = [entry.path for entry in entries if entry.is_file(follow_symlinks=False)]
+            referenced = self._referenced_flat_paths() if flat_files else set()
+            for path in flat_files:
+                if os.path.abspath(path) in referenced:
+                    continue
+                if not self.dry_run:
+                    target = self.target_for(path)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(path, target)
+                report.orphans_moved += 1
+
+        return report
@@ -0,0 +1,355 @@
+import os
+import errno
+import io
+import tempfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class StorageWriter(io.RawIOBase):
+    """
+    Writable stream for a single stored object
+
+    Encoders write into it like a file. Nothing is visible under the key until
+    commit() succeeds; abort() discards everything written. Used as a context
+    manager it commits on success and aborts on error.
+    """
+
+    def writable(self) -> bool:
+        return True
+
+    @abstractmethod
+    def commit(self):
+        """Publish the written bytes under the key"""
+
+    @abstractmethod
+    def abort(self):
+        """Discard the written bytes"""
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+class StorageBackend(ABC):
+    """Interface for where processed product images live"""
+
+    @abstractmethod
+    def open_writer(self, key: str, content_type: str = 'image/jpeg') -> StorageWriter:
+        """Open a streamed writer for key"""
+
+    def put(self, key: str, data: Union[bytes, bytearray, memoryview, BinaryIO],
+            content_type: str = 'image/jpeg'):
+        """Store bytes or the contents of a file-like object under key"""
+        with self.open_writer(key, content_type) as writer:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                writer.write(data)
+            else:
+                for chunk in iter(lambda: data.read(DEFAULT_CHUNK_SIZE), b''):
+                    writer.write(chunk)
+
+    def get(self, key: str) -> bytes:
+        """Return the whole object"""
+        return b''.join(self.stream(key))
+
+    @abstractmethod
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the object in chunks"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether key is stored"""
+
+    def size(self, key: str) -> Optional[int]:
+        """Stored size of key in bytes, or None if it does not exist"""
+        return len(self.get(key)) if self.exists(key) else None
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Delete key; returns False if it did not exist"""
+
+    def url(self, key: str) -> Optional[str]:
+        """Direct URL clients can fetch key from, or None to serve it through the app"""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of key for local backends, otherwise None"""
+        return None
+
+
+class _LocalWriter(StorageWriter):
+    """Writes to a temp file, then fsyncs and os.replace()s it into place on commit"""
+
+    def __init__(self, target: str, temp_folder: str):
+        super().__init__()
+        self.target = target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self._fd, self._temp_path = tempfile.mkstemp(dir=temp_folder, suffix='.part')
+        self._file = os.fdopen(self._fd, 'wb')
+        self._done = False
+
+    def write(self, data) -> int:
+        return self._file.write(data)
+
+    def commit(self):
+        if self._done:
+            return
+        self._done = True
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            try:
+                os.replace(self._temp_path, self.target)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # temp folder is on another filesystem: stage next to the target instead
+                staged = self.target + '.part'
+                with open(self._temp_path, 'rb') as src, open(staged, 'wb') as dst:
+                    for chunk in iter(lambda: src.read(DEFAULT_CHUNK_SIZE), b''):
+                        dst.write(chunk)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.replace(staged, self.target)
+                os.remove(self._temp_path)
+        except BaseException:
+            self._discard()
+            raise
+        finally:
+            super().close()
+
+    def abort(self):
+        if self._done:
+            return
+        self._done = True
+        self._discard()
+        super().close()
+
+    def _discard(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        # Closing without commit (e.g. by an encoder) must not publish a partial file
+        if not self._done:
+            self.abort()
+        super().close()
+
+
+class LocalStorage(StorageBackend):
+    """Stores objects as files under a root directory with atomic writes"""
+
+    def __init__(self, root: str = 'uploads/products', temp_folder: str = 'uploads/temp'):
+        self.root = root
+        self.temp_folder = temp_folder
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.temp_folder, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not os.path.abspath(path).startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Key escapes storage root: {key}")
+        return path
+
+    def open_writer(self, key: str, content_type: str = 'image/jpeg') -> StorageWriter:
+        return _LocalWriter(self._path(key), self.temp_folder)
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self._path(key), 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+
+class _MultipartWriter(StorageWriter):
+    """
+    Streams an object to S3 with a multipart upload
+
+    Only one part (part_size bytes) is buffered at a time. Objects smaller than
+    one part are sent with a single put_object instead.
+    """
+
+    def __init__(self, backend: 'S3Storage', key: str, content_type: str):
+        super().__init__()
+        self.backend = backend
+        self.key = key
+        self.content_type = content_type
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[dict] = []
+        self._done = False
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.backend.part_size:
+            part = bytes(self._buffer[:self.backend.part_size])
+            del self._buffer[:self.backend.part_size]
+            self._upload_part(part)
+        return len(data)
+
+    def _upload_part(self, body: bytes):
+        client = self.backend.client
+        if self._upload_id is None:
+            self._upload_id = client.create_multipart_upload(
+                Bucket=self.backend.bucket, Key=self.backend.object_key(self.key),
+                ContentType=self.content_type)['UploadId']
+        number = len(self._parts) + 1
+        response = client.upload_part(Bucket=self.backend.bucket, Key=self.backend.object_key(self.key),
+                                      UploadId=self._upload_id, PartNumber=number, Body=body)
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': number})
+
+    def commit(self):
+        if self._done:
+            return
+        self._done = True
+        client = self.backend.client
+        object_key = self.backend.object_key(self.key)
+        try:
+            if self._upload_id is None:
+                client.put_object(Bucket=self.backend.bucket, Key=object_key,
+                                  Body=bytes(self._buffer), ContentType=self.content_type)
+            else:
+                if self._buffer:
+                    self._upload_part(bytes(self._buffer))
+                client.complete_multipart_upload(Bucket=self.backend.bucket, Key=object_key,
+                                                 UploadId=self._upload_id,
+                                                 MultipartUpload={'Parts': self._parts})
+        except BaseException:
+            self._abort_upload()
+            raise
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+    def abort(self):
+        if self._done:
+            return
+        self._done = True
+        self._abort_upload()
+        self._buffer = bytearray()
+        super().close()
+
+    def _abort_upload(self):
+        if self._upload_id is not None:
+            self.backend.client.abort_multipart_upload(
+                Bucket=self.backend.bucket, Key=self.backend.object_key(self.key), UploadId=self._upload_id)
+
+    def close(self):
+        if not self._done:
+            self.abort()
+        super().close()
+
+
+class S3Storage(StorageBackend):
+    """
+    S3-compatible object storage (AWS S3, MinIO, Ceph RGW, ...)
+
+    boto3 is only imported when no client is passed in, so any object exposing
+    the same client methods (e.g. a local stand-in) can be used.
+    """
+
+    def __init__(self, bucket: str, prefix: str = 'products/', client=None, endpoint_url: str = None,
+                 part_size: int = 8 * 1024 * 1024, public_base_url: str = None, url_expiry: int = 3600):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("S3 storage requires boto3 (pip install boto3)") from e
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size  # S3 requires at least 5 MiB for all but the last part
+        self.public_base_url = public_base_url
+        self.url_expiry = url_expiry
+
+    def object_key(self, key: str) -> str:
+        return f'{self.prefix}{key}'
+
+    def open_writer(self, key: str, content_type: str = 'image/jpeg') -> StorageWriter:
+        return _MultipartWriter(self, key, content_type)
+
+    def stream(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))['Body']
+        try:
+            for chunk in iter(lambda: body.read(chunk_size), b''):
+                yield chunk
+        finally:
+            body.close()
+
+    @staticmethod
+    def _is_not_found(error: Exception) -> bool:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except Exception as e:
+            if self._is_not_found(e):
+                return False
+            raise
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))['ContentLength']
+        except Exception as e:
+            if self._is_not_found(e):
+                return None
+            raise
+
+    def delete(self, key: str) -> bool:
+        existed = self.exists(key)
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        return existed
+
+    def url(self, key: str) -> Optional[str]:
+        if self.public_base_url:
+            return f"{self.public_base_url.rstrip('/')}/{self.object_key(key)}"
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self.object_key(key)},
+            ExpiresIn=self.url_expiry)
+
+
+def create_storage(config: dict) -> StorageBackend:
+    """Build the storage backend selected by STORAGE_BACKEND"""
+    backend = config.get('STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(root=config.get('UPLOAD_FOLDER', 'uploads/products'),
+                            temp_folder=config.get('TEMP_FOLDER', 'uploads/temp'))
+    if backend == 's3':
+        return S3Storage(bucket=config['S3_BUCKET'],
+                         prefix=config.get('S3_PREFIX', 'products/'),
+                         endpoint_url=config.get('S3_ENDPOINT_URL'),
+                         part_size=config.get('S3_PART_SIZE', 8 * 1024 * 1024),
+                         public_base_url=config.get('S3_PUBLIC_BASE_URL'))
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,262 @@
+"""
+Lease-based claiming of per-product work across nodes sharing the catalog database
+
+Each claimed product gets a row in work_leases naming its owner and an expiry.
+Claims are plain INSERTs and compare-and-set UPDATEs, so they behave the same
+on SQLite and on a server database without row locking: a product can only be
+inserted once, and an expired lease only taken over by the first UPDATE that
+still sees it expired. Owners extend their leases with heartbeats; a worker
+that dies stops extending them and its products are claimed again once the
+leases run out. TaskLeader applies the same scheme to a whole task, so a
+periodic job started by every worker runs in one of them at a time.
+"""
+
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from models.product import Product, db
+from models.task_lease import TaskLease
+from models.work_lease import WorkLease
+from utils.log import log_event
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LEASE_CLAIMS = registry.counter('work_lease_claims_total',
+                                'Product leases claimed, new or taken over after their owner stopped heartbeating')
+LEASE_RELEASES = registry.counter('work_lease_releases_total', 'Product leases given up by outcome')
+
+# Claim rounds per call; another round starts where a round lost every candidate to other workers
+CLAIM_ROUNDS = 4
+
+
+def default_owner() -> str:
+    """Owner name unique to this worker: host, process and a random suffix"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def _insert_ignore(table, key: str, rows: List[dict]):
+    """Insert lease rows, skipping keys another worker inserted first"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(sqlite.insert(table).on_conflict_do_nothing(index_elements=[key]), rows)
+    elif dialect == 'postgresql':
+        db.session.execute(postgresql.insert(table).on_conflict_do_nothing(index_elements=[key]), rows)
+    elif dialect in ('mysql', 'mariadb'):
+        db.session.execute(insert(table).prefix_with('IGNORE'), rows)
+    else:
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(table), row)
+            except IntegrityError:
+                pass
+
+
+class WorkLeases:
+    """
+    Claims products without images for one worker
+
+    ``claim`` leases products in id order for ``lease_seconds``; the owner
+    keeps them with ``heartbeat``, settles them with ``complete`` (done) or
+    ``defer`` (failed: retried after a back-off that doubles per attempt up to
+    ``max_retry_seconds``), or hands them back with ``release``. Expiry is
+    judged against each node's clock, so lease_seconds must dwarf any clock
+    skew between nodes. Requires an app context.
+    """
+
+    def __init__(self, owner: Optional[str] = None, lease_seconds: float = 300.0, retry_seconds: float = 600.0,
+                 max_retry_seconds: float = 86400.0, clock: Callable[[], datetime] = datetime.utcnow):
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.clock = clock
+
+    def claim(self, limit: int, after_id: int = 0) -> List[int]:
+        """
+        Lease up to ``limit`` products without images after ``after_id``; returns their ids in order
+
+        Products leased by a live worker, or waiting out a retry back-off, are
+        skipped. Fewer ids than ``limit`` means the rest of the id range had
+        nothing claimable.
+        """
+        claimed: List[int] = []
+        for _ in range(CLAIM_ROUNDS):
+            wanted = limit - len(claimed)
+            now = self.clock()
+            candidates = (db.session.query(Product.id, WorkLease.product_id)
+                          .outerjoin(WorkLease, WorkLease.product_id == Product.id)
+                          .filter(Product.image_path.is_(None), Product.id > after_id,
+                                  or_(WorkLease.product_id.is_(None), WorkLease.expires_at <= now))
+                          .order_by(Product.id)
+                          .limit(wanted)
+                          .all())
+            if not candidates:
+                break
+            claimed.extend(self._claim_candidates(candidates, now))
+            if len(claimed) >= limit or len(candidates) < wanted:
+                break
+            after_id = candidates[-1][0]
+        return claimed
+
+    def _claim_candidates(self, candidates, now: datetime) -> List[int]:
+        table = WorkLease.__table__
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        fresh = [product_id for product_id, leased in candidates if leased is None]
+        expired = [product_id for product_id, leased in candidates if leased is not None]
+
+        if fresh:
+            _insert_ignore(table, 'product_id', [{'product_id': product_id, 'owner': self.owner,
+                                                  'expires_at': expires_at, 'heartbeat_at': now, 'attempts': 1}
+                                                 for product_id in fresh])
+        taken_over = 0
+        if expired:
+            # Compare-and-set: only the first worker to update a lease still sees it expired
+            taken_over = db.session.execute(
+                update(table)
+                .where(table.c.product_id.in_(expired), table.c.expires_at <= now)
+                .values(owner=self.owner, expires_at=expires_at, heartbeat_at=now, attempts=table.c.attempts + 1)
+            ).rowcount
+        db.session.commit()
+
+        claimed = [product_id for (product_id,) in db.session.query(WorkLease.product_id).filter(
+            WorkLease.product_id.in_([product_id for product_id, _ in candidates]),
+            WorkLease.owner == self.owner).order_by(WorkLease.product_id)]
+        LEASE_CLAIMS.inc(len(claimed) - taken_over, kind='new')
+        LEASE_CLAIMS.inc(taken_over, kind='taken_over')
+        if taken_over:
+            log_event(logger, logging.INFO, 'work_leases_taken_over', owner=self.owner, products=taken_over)
+        return claimed
+
+    def heartbeat(self) -> int:
+        """Extend every lease this worker holds; returns how many it still holds"""
+        table = WorkLease.__table__
+        now = self.clock()
+        held = db.session.execute(
+            update(table).where(table.c.owner == self.owner)
+            .values(expires_at=now + timedelta(seconds=self.lease_seconds), heartbeat_at=now)
+        ).rowcount
+        db.session.commit()
+        return held
+
+    def complete(self, product_ids: Iterable[int]) -> int:
+        """Drop the leases of finished products; returns how many were still held"""
+        return self._settle(product_ids, 'completed', lambda table, held: delete(table).where(*held))
+
+    def release(self, product_ids: Optional[Iterable[int]] = None) -> int:
+        """Hand products back for any worker to claim at once (every held one by default)"""
+        now = self.clock()
+        return self._settle(product_ids, 'released', lambda table, held: update(table).where(*held).values(
+            owner=None, expires_at=now))
+
+    def defer(self, product_ids: Iterable[int]) -> int:
+        """Give up failed products until their retry back-off has passed; returns how many were held"""
+        ids = list(product_ids)
+        if not ids:
+            return 0
+        now = self.clock()
+        attempts = dict(db.session.query(WorkLease.product_id, WorkLease.attempts).filter(
+            WorkLease.product_id.in_(ids), WorkLease.owner == self.owner))
+        if not attempts:
+            return 0
+        table = WorkLease.__table__
+        statement = (update(table)
+                     .where(table.c.product_id == bindparam('b_id'), table.c.owner == self.owner)
+                     .values(owner=None, expires_at=bindparam('b_expires_at')))
+        db.session.execute(statement, [{'b_id': product_id, 'b_expires_at': now + self._backoff(count)}
+                                       for product_id, count in attempts.items()])
+        db.session.commit()
+        LEASE_RELEASES.inc(len(attempts), outcome='deferred')
+        return len(attempts)
+
+    def _backoff(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(self.retry_seconds * 2 ** max(attempts - 1, 0), self.max_retry_seconds))
+
+    def _settle(self, product_ids: Optional[Iterable[int]], outcome: str, statement) -> int:
+        table = WorkLease.__table__
+        held = [table.c.owner == self.owner]
+        if product_ids is not None:
+            ids = list(product_ids)
+            if not ids:
+                return 0
+            held.append(table.c.product_id.in_(ids))
+        settled = db.session.execute(statement(table, held)).rowcount
+        db.session.commit()
+        LEASE_RELEASES.inc(settled, outcome=outcome)
+        return settled
+
+    def purge(self) -> int:
+        """Delete unheld leases of products that now have an image or no longer exist; returns the count"""
+        table = WorkLease.__table__
+        missing = select(Product.id).where(Product.image_path.is_(None))
+        purged = db.session.execute(
+            delete(table).where(or_(table.c.owner.is_(None), table.c.expires_at <= self.clock()),
+                                table.c.product_id.not_in(missing))
+        ).rowcount
+        db.session.commit()
+        return purged
+
+    def status(self) -> Dict[str, int]:
+        """
+        Lease counts across all workers: held, expired (owner presumed dead),
+        deferred (failed, backing off) and ready (claimable again)
+        """
+        now = self.clock()
+        rows = db.session.query(WorkLease.owner.is_(None), WorkLease.expires_at > now, func.count()) \
+            .group_by(WorkLease.owner.is_(None), WorkLease.expires_at > now).all()
+        counts = {'held': 0, 'expired': 0, 'deferred': 0, 'ready': 0}
+        for unowned, live, count in rows:
+            if unowned:
+                counts['deferred' if live else 'ready'] += count
+            else:
+                counts['held' if live else 'expired'] += count
+        return counts
+
+
+class TaskLeader:
+    """
+    Elects one worker across the deployment to run a periodic task
+
+    ``acquire`` returns True while this worker holds the task's lease,
+    renewing it for ``lease_seconds``; make that a few task intervals so a
+    live leader never loses it between runs. Same compare-and-set scheme as
+    WorkLeases. Requires an app context.
+    """
+
+    def __init__(self, name: str, owner: Optional[str] = None, lease_seconds: float = 180.0,
+                 clock: Callable[[], datetime] = datetime.utcnow):
+        self.name = name
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    def acquire(self) -> bool:
+        """Take or renew the lease; False while another live worker holds it"""
+        table = TaskLease.__table__
+        now = self.clock()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        taken = db.session.execute(
+            update(table)
+            .where(table.c.name == self.name, or_(table.c.owner == self.owner, table.c.expires_at <= now))
+            .values(owner=self.owner, expires_at=expires_at)
+        ).rowcount
+        if not taken:
+            _insert_ignore(table, 'name', [{'name': self.name, 'owner': self.owner, 'expires_at': expires_at}])
+        db.session.commit()
+        held = taken or db.session.query(TaskLease.owner).filter(TaskLease.name == self.name).scalar() == self.owner
+        return bool(held)
+
+    def release(self):
+        """Give the lease up so another worker can take over at once"""
+        table = TaskLease.__table__
+        db.session.execute(delete(table).where(table.c.name == self.name, table.c.owner == self.owner))
+        db.session.commit()
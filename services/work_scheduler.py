@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+from utils.metrics import registry
+
+WORK_QUEUE_DEPTH = registry.gauge('work_queue_depth', 'Image work items waiting per lane')
+WORK_RUNNING = registry.gauge('work_running', 'Image work items running per lane')
+WORK_WAIT_SECONDS = registry.histogram('work_wait_seconds', 'Time image work items spent queued per lane')
+
+# Lanes in priority order: user clicks, bulk re-imaging jobs, speculative prefetches
+INTERACTIVE, BATCH, BACKGROUND = 'interactive', 'batch', 'background'
+LANES = (INTERACTIVE, BATCH, BACKGROUND)
+
+
+class _WorkItem:
+    __slots__ = ('future', 'fn', 'args', 'kwargs', 'queued_at')
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict):
+        self.future: Future = Future()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.queued_at = time.monotonic()
+
+
+class WorkScheduler:
+    """
+    Shared worker pool for the image pipeline with priority lanes
+
+    Work is queued in one of LANES and a free worker always takes the highest
+    priority lane that may run. ``interactive_reserved`` workers never run batch
+    or background work, so a click is picked up at once however deep the bulk
+    queues are; ``lane_limits`` caps how many workers a lane may hold. Within a
+    lane, items are queued per ``group`` (a batch job, a product) and groups are
+    served round-robin, so one large job cannot starve the others.
+    """
+
+    def __init__(self, max_workers: int = 10, interactive_reserved: int = 2,
+                 lane_limits: Optional[Dict[str, int]] = None):
+        self.max_workers = max(1, max_workers)
+        self.interactive_reserved = min(max(0, interactive_reserved), self.max_workers - 1)
+        self.lane_limits = dict(lane_limits or {})
+        self._queues: Dict[str, 'OrderedDict[Hashable, Deque[_WorkItem]]'] = {lane: OrderedDict() for lane in LANES}
+        self._queued = {lane: 0 for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._changed = threading.Condition()
+        self._threads = []
+
+    def submit(self, lane: str, fn: Callable, *args, group: Hashable = None, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) in a lane; the returned future can be cancelled until it starts"""
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane}")
+        item = _WorkItem(fn, args, kwargs)
+        with self._changed:
+            self._start_workers()
+            self._queues[lane].setdefault(group, deque()).append(item)
+            self._queued[lane] += 1
+            WORK_QUEUE_DEPTH.set(self._queued[lane], lane=lane)
+            self._changed.notify()
+        return item.future
+
+    def run(self, lane: str, fn: Callable, *args, group: Hashable = None, **kwargs) -> Any:
+        """submit() and wait for the result"""
+        return self.submit(lane, fn, *args, group=group, **kwargs).result()
+
+    def depth(self, lane: str) -> int:
+        return self._queued[lane]
+
+    def running(self, lane: str) -> int:
+        return self._running[lane]
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        for index in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f'image-work-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _may_run(self, lane: str) -> bool:
+        if lane != INTERACTIVE:
+            shared = sum(self._running[other] for other in LANES if other != INTERACTIVE)
+            if shared >= self.max_workers - self.interactive_reserved:
+                return False
+        limit = self.lane_limits.get(lane)
+        return not limit or self._running[lane] < limit
+
+    def _next(self) -> Optional[tuple]:
+        for lane in LANES:
+            groups = self._queues[lane]
+            if not groups or not self._may_run(lane):
+                continue
+            group, items = next(iter(groups.items()))
+            item = items.popleft()
+            # Round-robin: the group goes to the back of the lane
+            del groups[group]
+            if items:
+                groups[group] = items
+            self._queued[lane] -= 1
+            WORK_QUEUE_DEPTH.set(self._queued[lane], lane=lane)
+            return lane, item
+        return None
+
+    def _work(self):
+        while True:
+            with self._changed:
+                picked = self._next()
+                while picked is None:
+                    self._changed.wait()
+                    picked = self._next()
+                lane, item = picked
+                self._running[lane] += 1
+                WORK_RUNNING.set(self._running[lane], lane=lane)
+
+            try:
+                if item.future.set_running_or_notify_cancel():
+                    WORK_WAIT_SECONDS.observe(time.monotonic() - item.queued_at, lane=lane)
+                    try:
+                        item.future.set_result(item.fn(*item.args, **item.kwargs))
+                    except BaseException as e:
+                        item.future.set_exception(e)
+            finally:
+                with self._changed:
+                    self._running[lane] -= 1
+                    WORK_RUNNING.set(self._running[lane], lane=lane)
+                    # A freed shared slot may let another lane's worker proceed
+                    self._changed.notify_all()
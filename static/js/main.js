@@ -64,6 +64,203 @@ function selectImage(imageUrl, element) {
     }
 }
 
+function updateLoading(message) {
+    const text = document.querySelector('.loading-overlay p');
+    if (text) {
+        text.textContent = message;
+    }
+}
+
+// Background image jobs: one EventSource follows every job started on this page
+const jobFollowers = new Map();
+let jobEventSource = null;
+let lastJobEventId = null;
+const JOB_EVENTS = ['snapshot', 'queued', 'download', 'decoded', 'resized', 'saved', 'item', 'chunk', 'done', 'failed'];
+
+function describeJobProgress(event, data) {
+    switch (event) {
+        case 'download': {
+            const kb = Math.round(data.bytes / 1024);
+            return data.total_bytes
+                ? `Downloading... ${Math.round(data.bytes / data.total_bytes * 100)}% (${kb} KB)`
+                : `Downloading... ${kb} KB`;
+        }
+        case 'decoded':
+            return `Decoded ${data.width}x${data.height} image, resizing...`;
+        case 'resized':
+            return 'Resized, saving...';
+        case 'saved':
+            return 'Saved, updating product...';
+        case 'item':
+        case 'chunk':
+            return `Processed ${data.completed} of ${data.total} images...`;
+        default:
+            return null;
+    }
+}
+
+function handleJobEvent(e) {
+    const data = JSON.parse(e.data);
+    if (e.lastEventId) {
+        lastJobEventId = e.lastEventId;
+    }
+    const jobId = data.job_id || data.id;
+    const follower = jobFollowers.get(jobId);
+    if (!follower) return;
+    
+    const state = e.type === 'snapshot' ? data.state : e.type;
+    if (state === 'unknown') {
+        // Another worker process answered and has never seen this job
+        settleLostJob(jobId);
+        return;
+    }
+    if (state === 'done' || state === 'failed') {
+        jobFollowers.delete(jobId);
+        if (state === 'done') {
+            follower.resolve(data.result);
+        } else {
+            follower.reject(new Error(data.error || 'Job failed'));
+        }
+        return;
+    }
+    
+    const message = describeJobProgress(e.type, data);
+    if (message && follower.onProgress) {
+        follower.onProgress(message, e.type, data);
+    }
+}
+
+// Settle a job whose progress this connection cannot follow: fall back when the
+// caller has a fallback, otherwise fail instead of leaving the promise pending
+function settleLostJob(jobId) {
+    const follower = jobFollowers.get(jobId);
+    if (!follower) return;
+    jobFollowers.delete(jobId);
+    if (follower.fallback) {
+        follower.fallback().then(follower.resolve, follower.reject);
+    } else {
+        follower.reject(new Error('Lost track of the background job; reload the page to see its outcome'));
+    }
+}
+
+function followJobs() {
+    if (jobEventSource) {
+        jobEventSource.close();
+        jobEventSource = null;
+    }
+    if (jobFollowers.size === 0) return;
+    
+    let url = `/jobs/events?ids=${encodeURIComponent(Array.from(jobFollowers.keys()).join(','))}`;
+    if (lastJobEventId) {
+        url += `&after=${lastJobEventId}`;
+    }
+    jobEventSource = new EventSource(url);
+    JOB_EVENTS.forEach(type => jobEventSource.addEventListener(type, handleJobEvent));
+    jobEventSource.addEventListener('end', e => {
+        jobEventSource.close();
+        jobEventSource = null;
+        // Every job on this stream has finished, so any follower still waiting missed its result
+        JSON.parse(e.data).ids.forEach(settleLostJob);
+    });
+}
+
+// Jobs are tracked per worker process, so the pages only use them when the
+// deployment says one process serves them (JOB_PROGRESS_UI)
+function jobProgressEnabled() {
+    return Boolean(window.EventSource) && document.body.dataset.jobProgress === 'true';
+}
+
+// Start a background job and resolve with its result once it finishes
+async function runImageJob(url, body, onProgress, fallback) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(body)
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || 'Failed to start job');
+    }
+    
+    return new Promise((resolve, reject) => {
+        jobFollowers.set(data.job_id, { resolve, reject, onProgress, fallback });
+        followJobs();
+    });
+}
+
+// Update one product image, reporting stage-by-stage progress
+async function startImageUpdate(productId, imageUrl, onProgress) {
+    const updateNow = async () => {
+        const response = await fetch(`/products/${productId}/update-image`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ image_url: imageUrl })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to update image');
+        }
+        return data;
+    };
+    if (!jobProgressEnabled()) {
+        // Wait for the synchronous endpoint instead
+        return updateNow();
+    }
+    // Should the job's progress be lost, setting the image again is harmless: the
+    // later update wins and the other file goes to the GC
+    return runImageJob(`/products/${productId}/update-image/async`, { image_url: imageUrl }, onProgress,
+                       updateNow);
+}
+
+// Update many product images, as one background job when job progress is enabled
+async function startBatchImageUpdate(items, onProgress) {
+    if (!jobProgressEnabled()) {
+        const response = await fetch('/products/batch/update-images', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ items })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to update images');
+        }
+        return data;
+    }
+    return runImageJob('/products/batch/update-images/async', { items }, onProgress);
+}
+
+// Ask the server to warm the candidates shown under root (in page order, it keeps
+// the top few) and cancel whatever is still warming once the user leaves the page
+const prefetchedProducts = new Set();
+
+function prefetchCandidates(root = document) {
+    const candidates = root.querySelectorAll('[data-prefetch-url]');
+    if (!candidates.length) {
+        return;
+    }
+    const productId = candidates[0].dataset.productId;
+    fetch(`/products/${productId}/prefetch`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ image_urls: Array.from(candidates, element => element.dataset.prefetchUrl) })
+    }).catch(() => {});
+    
+    if (!prefetchedProducts.has(productId)) {
+        prefetchedProducts.add(productId);
+        window.addEventListener('pagehide', () => {
+            fetch(`/products/${productId}/prefetch`, { method: 'DELETE', keepalive: true }).catch(() => {});
+        });
+    }
+}
+
 // Update product image
 async function updateProductImage(productId) {
     if (!selectedImageUrl) {
@@ -79,30 +276,15 @@ async function updateProductImage(productId) {
     showLoading('Updating product image...');
     
     try {
-        const response = await fetch(`/products/${productId}/update-image`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                image_url: selectedImageUrl
-            })
-        });
-        
-        const data = await response.json();
+        await startImageUpdate(productId, selectedImageUrl, updateLoading);
+        showAlert('Image updated successfully!', 'success');
         
-        if (response.ok) {
-            showAlert('Image updated successfully!', 'success');
-            
-            // Reload page after a short delay
-            setTimeout(() => {
-                window.location.reload();
-            }, 1500);
-        } else {
-            showAlert(`Error: ${data.error}`, 'danger');
-        }
+        // Reload page after a short delay
+        setTimeout(() => {
+            window.location.reload();
+        }, 1500);
     } catch (error) {
-        showAlert('An error occurred while updating the image.', 'danger');
+        showAlert(`Error: ${error.message}`, 'danger');
         console.error('Error:', error);
     } finally {
         isProcessing = false;
@@ -135,6 +317,7 @@ async function searchImages(productId, searchTerm) {
             const searchContainer = document.getElementById('searchContainer');
             if (searchContainer) {
                 searchContainer.innerHTML = html;
+                prefetchCandidates(searchContainer);
             }
         } else {
             showAlert('Error searching for images.', 'danger');
@@ -307,6 +490,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Setup search suggestions
     setupSearchSuggestions('searchTerm', 'searchSuggestions');
     
+    // Warm the image candidates of a search results page
+    prefetchCandidates();
+    
     // Handle form submissions
     const forms = document.querySelectorAll('form');
     forms.forEach(form => {
@@ -353,6 +539,8 @@ document.addEventListener('DOMContentLoaded', function() {
 // Export functions for global use
 window.selectImage = selectImage;
 window.updateProductImage = updateProductImage;
+window.startImageUpdate = startImageUpdate;
+window.startBatchImageUpdate = startBatchImageUpdate;
 window.searchImages = searchImages;
 window.previewImage = previewImage;
 window.copyToClipboard = copyToClipboard;
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the async (/async/...) route variants
+Needs Flask's async extra and httpx; images are served by a local stub origin.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip('asgiref')
+pytest.importorskip('httpx')
+
+from app import create_app
+from models.product import Product, db
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+def _make_app():
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    app.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    app.config['BATCH_CHUNK_SIZE'] = 2
+    with app.app_context():
+        db.session.add_all([Product(f'Wireless Mouse {i}', f'A-{i}') for i in range(1, 6)])
+        db.session.commit()
+    return app
+
+def test_async_update_image():
+    """The async update route downloads with httpx and saves like the sync one"""
+    app = _make_app()
+    origin = ImageOriginServer(make_stub_image(size=(300, 200))).start()
+    try:
+        client = app.test_client()
+        response = client.post('/async/products/1/update-image', json={'image_url': f'{origin.base_url}/a.jpg'})
+        missing = client.post('/async/products/99/update-image', json={'image_url': f'{origin.base_url}/a.jpg'})
+    finally:
+        origin.stop()
+    
+    assert response.status_code == 200, response.get_data(as_text=True)
+    image_path = response.get_json()['image_path']
+    assert os.path.exists(image_path)
+    assert missing.status_code == 404
+    with app.app_context():
+        assert db.session.get(Product, 1).image_path == image_path
+
+def test_async_batch_update():
+    """Downloads of an async batch run a chunk at a time and commit as their images are saved"""
+    app = _make_app()
+    origin = ImageOriginServer(make_stub_image(size=(300, 200)), delay_ms=200).start()
+    try:
+        response = app.test_client().post('/async/products/batch/update-images', json={'items': [
+            {'product_id': product_id, 'image_url': f'{origin.base_url}/{product_id}.jpg'}
+            for product_id in (1, 2, 3, 4, 5, 99)
+        ] + [{'product_id': 1, 'image_url': 'http://127.0.0.1:9/unreachable.jpg'}]})
+    finally:
+        origin.stop()
+    
+    data = response.get_json()
+    assert response.status_code == 200
+    assert [result['success'] for result in data['results'][:6]] == [True] * 5 + [False]
+    assert data['results'][5]['error'] == 'Product not found'
+    assert 'Failed to download' in data['results'][6]['error']
+    with app.app_context():
+        assert Product.query.filter(Product.image_path.isnot(None)).count() == 5
+
+def test_async_search():
+    """The async search variants render the same templates"""
+    app = _make_app()
+    client = app.test_client()
+    
+    response = client.post('/async/products/1/search', data={'search_term': 'wireless mouse'})
+    assert response.status_code == 200
+    assert b'picsum.photos' in response.data
+    assert client.get('/async/products/1/search').status_code == 200
+    assert client.post('/async/products/99/search').status_code == 404
+
+if __name__ == '__main__':
+    test_async_update_image()
+    test_async_batch_update()
+    test_async_search()
+    print("Async route tests passed!")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests for the batch image update endpoints
+Images are served by a local stub origin, so no network access is needed.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from io import BytesIO
+
+from app import create_app
+from models.product import Product, db
+from services.batch_updater import BatchImageUpdater
+from services.product_service import ProductService
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+def _make_app():
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    app.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    app.config['BATCH_CHUNK_SIZE'] = 2
+    with app.app_context():
+        db.session.add_all([Product(f'Product {i}', f'P-{i}') for i in range(1, 4)])
+        db.session.commit()
+    return app
+
+def test_batch_update_endpoint():
+    """Each item gets its own result and successful items are committed"""
+    app = _make_app()
+    origin = ImageOriginServer(make_stub_image(size=(300, 200))).start()
+    try:
+        response = app.test_client().post('/products/batch/update-images', json={'items': [
+            {'product_id': 1, 'image_url': f'{origin.base_url}/a.jpg'},
+            {'product_id': 2, 'image_url': f'{origin.base_url}/b.jpg'},
+            {'product_id': 99, 'image_url': f'{origin.base_url}/c.jpg'},
+            {'product_id': 3},
+        ]})
+    finally:
+        origin.stop()
+    
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['succeeded'] == 2 and data['failed'] == 2
+    assert [r['success'] for r in data['results']] == [True, True, False, False]
+    assert data['results'][2]['error'] == 'Product not found'
+    
+    with app.app_context():
+        for product_id in (1, 2):
+            image_path = db.session.get(Product, product_id).image_path
+            assert image_path and os.path.exists(image_path)
+        assert db.session.get(Product, 3).image_path is None
+
+def test_batch_update_stream_endpoint():
+    """JSON-lines in, one JSON-lines result per item out"""
+    app = _make_app()
+    origin = ImageOriginServer(make_stub_image(size=(300, 200))).start()
+    try:
+        body = '\n'.join([
+            json.dumps({'product_id': 1, 'image_url': f'{origin.base_url}/a.jpg'}),
+            'not json',
+            json.dumps({'product_id': 3, 'image_url': f'{origin.base_url}/c.jpg'}),
+        ])
+        response = app.test_client().post('/products/batch/update-images/stream', data=body,
+                                          content_type='application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    finally:
+        origin.stop()
+    
+    assert response.mimetype == 'application/x-ndjson'
+    assert [line['success'] for line in lines] == [True, False, True]
+
+def test_concurrent_update_is_not_lost():
+    """An image set while the batch downloads is queued as superseded, not leaked"""
+    from models.superseded_image import SupersededImage
+    from services.batch_updater import BatchImageUpdater
+    from services.product_service import ProductService
+    
+    app = _make_app()
+    
+    class ConcurrentProcessor:
+        def process_and_save_image(self, url, code, progress=None):
+            # A single /update-image lands while the batch is still downloading
+            with app.app_context():
+                ProductService().update_product_image(1, 'uploads/products/concurrent.jpg')
+            return 'uploads/products/batch.jpg'
+        
+        def image_metadata(self, image_path):
+            return None
+    
+    with app.app_context():
+        updater = BatchImageUpdater(ConcurrentProcessor(), ProductService(), max_workers=1)
+        results = list(updater.run([{'product_id': 1, 'image_url': 'http://origin/a.jpg'}]))
+        
+        assert results[0]['success']
+        assert db.session.get(Product, 1).image_path == 'uploads/products/batch.jpg'
+        assert [row.path for row in SupersededImage.query] == ['uploads/products/concurrent.jpg']
+
+def test_async_batch_holds_one_chunk_of_images():
+    """run_async never has more than chunk_size images downloading or waiting to be saved"""
+    app = _make_app()
+    
+    class Fetcher:
+        in_flight = peak = 0
+        
+        @asynccontextmanager
+        async def client(self):
+            yield None
+        
+        async def fetch(self, client, url):
+            Fetcher.in_flight += 1
+            Fetcher.peak = max(Fetcher.peak, Fetcher.in_flight)
+            await asyncio.sleep(0.01)
+            if url.endswith('broken'):
+                Fetcher.in_flight -= 1
+                raise ValueError('Image file too large')
+            return BytesIO(url.encode())
+    
+    class Processor:
+        def process_and_save_downloaded(self, image_data, image_url, product_code):
+            Fetcher.in_flight -= 1
+            return f'uploads/products/{product_code}.jpg'
+        
+        def image_metadata(self, image_path):
+            return None
+    
+    with app.app_context():
+        updater = BatchImageUpdater(Processor(), ProductService(), max_workers=4, chunk_size=2)
+        items = [{'product_id': product_id, 'image_url': f'http://origin/{product_id}'} for product_id in (1, 2, 3)]
+        items.append({'product_id': 2, 'image_url': 'http://origin/broken'})
+        results = asyncio.run(updater.run_async(items, Fetcher()))
+        
+        assert Fetcher.peak == 2
+        assert [result['success'] for result in results] == [True, True, True, False]
+        assert 'Failed to download image' in results[3]['error']
+        assert db.session.get(Product, 3).image_path == 'uploads/products/P-3.jpg'
+
+if __name__ == '__main__':
+    test_batch_update_endpoint()
+    test_batch_update_stream_endpoint()
+    test_concurrent_update_is_not_lost()
+    test_async_batch_holds_one_chunk_of_images()
+    print("Batch update tests passed!")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for streamed ZIP/TAR exports of product images with a manifest
+"""
+
+import csv
+import io
+import json
+import os
+import tarfile
+import tempfile
+import zipfile
+
+from app import create_app
+from models.product import Product, db
+from services import catalog_export
+from services.catalog_export import ExportReport, ExportSelection
+from services.product_service import ProductService
+from benchmarks.load_test import make_stub_image
+
+def _make_app():
+    """Products P-1..P-4 with images (P-3's file is gone, P-4 has no recorded size) and P-5 without one"""
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    app.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    app.config['EXPORT_BATCH_SIZE'] = 2
+    os.makedirs(app.config['UPLOAD_FOLDER'])
+    
+    with app.app_context():
+        for i in range(1, 6):
+            product = Product(f'Product {i}', f'P-{i}')
+            if i < 5:
+                data = make_stub_image(size=(100 + i, 100))
+                product.image_path = os.path.join(app.config['UPLOAD_FOLDER'], f'p{i}.jpg')
+                product.image_bytes = len(data) if i != 4 else None
+                if i != 3:
+                    with open(product.image_path, 'wb') as f:
+                        f.write(data)
+            db.session.add(product)
+        db.session.commit()
+    return app
+
+def _image(app, code):
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], f'p{code[-1]}.jpg'), 'rb') as f:
+        return f.read()
+
+def test_zip_export_stores_images_and_appends_manifest():
+    """Images are stored byte for byte under their codes; the manifest lists every selected product"""
+    app = _make_app()
+    
+    response = app.test_client().get('/products/export.zip')
+    assert response.status_code == 200 and response.mimetype == 'application/zip'
+    assert 'catalog-images.zip' in response.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['images/P-1.jpg', 'images/P-2.jpg', 'images/P-4.jpg', 'manifest.csv']
+        assert archive.getinfo('images/P-1.jpg').compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo('manifest.csv').compress_type == zipfile.ZIP_DEFLATED
+        assert archive.read('images/P-2.jpg') == _image(app, 'P-2')
+        rows = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+    
+    assert [(row['code'], row['file']) for row in rows] == [
+        ('P-1', 'images/P-1.jpg'), ('P-2', 'images/P-2.jpg'), ('P-3', ''), ('P-4', 'images/P-4.jpg')]
+    assert rows[0]['name'] == 'Product 1' and rows[0]['id'] == '1'
+
+def test_export_filters_and_json_manifest():
+    """Id ranges page through the catalog; since keeps recent updates; bad values are rejected"""
+    app = _make_app()
+    client = app.test_client()
+    
+    response = client.get('/products/export.zip?manifest=json&after_id=1&until_id=3')
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.namelist() == ['images/P-2.jpg', 'manifest.json']
+        manifest = json.loads(archive.read('manifest.json'))
+    assert [(entry['code'], entry['file']) for entry in manifest] == [('P-2', 'images/P-2.jpg'), ('P-3', '')]
+    
+    response = client.get('/products/export.tar?since=2999-01-01T00:00:00%2B00:00')
+    with tarfile.open(fileobj=io.BytesIO(response.data)) as archive:
+        assert archive.getnames() == ['manifest.csv']
+    
+    for query in ('after_id=x', 'since=yesterday', 'manifest=xml'):
+        assert client.get(f'/products/export.zip?{query}').status_code == 400
+    assert client.get('/products/export.rar').status_code == 404
+
+def test_tar_export_ranges_resume():
+    """TAR exports have a fixed length and ETag, so a Range request continues the same bytes"""
+    app = _make_app()
+    client = app.test_client()
+    
+    full = client.get('/products/export.tar')
+    assert full.status_code == 200 and full.headers['Accept-Ranges'] == 'bytes'
+    assert int(full.headers['Content-Length']) == len(full.data)
+    with tarfile.open(fileobj=io.BytesIO(full.data)) as archive:
+        assert archive.getnames() == ['images/P-1.jpg', 'images/P-2.jpg', 'images/P-4.jpg', 'manifest.csv']
+        assert archive.extractfile('images/P-4.jpg').read() == _image(app, 'P-4')
+    
+    etag = full.headers['ETag']
+    for start, stop in ((0, 99), (700, 5000), (len(full.data) - 1500, len(full.data) - 1)):
+        part = client.get('/products/export.tar', headers={'Range': f'bytes={start}-{stop}', 'If-Range': etag})
+        assert part.status_code == 206
+        assert part.headers['Content-Range'] == f'bytes {start}-{stop}/{len(full.data)}'
+        assert part.data == full.data[start:stop + 1]
+    
+    stale = client.get('/products/export.tar', headers={'Range': 'bytes=100-', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and stale.data == full.data
+    unsatisfiable = client.get('/products/export.tar', headers={'Range': f'bytes={len(full.data)}-'})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers['Content-Range'] == f'bytes */{len(full.data)}'
+    
+    with app.app_context():
+        ProductService().update_product(5, name='Renamed')
+    assert client.get('/products/export.tar').headers['ETag'] != etag
+
+def test_zip64_records():
+    """Past the classic limits the archive carries ZIP64 records that zipfile reads back"""
+    app = _make_app()
+    limits = catalog_export._ZIP64_LIMIT, catalog_export._ZIP_MAX_ENTRIES
+    catalog_export._ZIP64_LIMIT, catalog_export._ZIP_MAX_ENTRIES = 1000, 2
+    try:
+        with app.app_context():
+            report = ExportReport()
+            exporter = app.extensions['services'].catalog_exporter
+            data = b''.join(exporter.zip_stream(ExportSelection(), 'csv', report))
+    finally:
+        catalog_export._ZIP64_LIMIT, catalog_export._ZIP_MAX_ENTRIES = limits
+    
+    assert (report.images, report.missing) == (3, 1)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert len(archive.namelist()) == 4
+        assert archive.read('images/P-4.jpg') == _image(app, 'P-4')
+
+if __name__ == '__main__':
+    test_zip_export_stores_images_and_appends_manifest()
+    test_export_filters_and_json_manifest()
+    test_tar_export_ranges_resume()
+    test_zip64_records()
+    print("Catalog export tests passed!")
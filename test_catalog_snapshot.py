@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-memory columnar catalog snapshot
+"""
+
+from sqlalchemy import text
+
+from app import create_app
+from models.product import Product, db
+from services.catalog_snapshot import CatalogSnapshot, SNAPSHOT_REFRESH_SECONDS, _Columns
+from services.product_service import ProductService
+
+def _seed(service, count=20):
+    service.add_products([{'name': f'Product {i}', 'code': f'SN-{i}',
+                           'image_path': f'img/{i}.jpg' if i % 3 == 0 else None} for i in range(count)])
+    return {product.code: product.id for product in Product.query}
+
+def test_snapshot_answers_match_the_database():
+    """Counts, code lookups, has-image checks and missing listings agree with the ORM"""
+    app = create_app('testing')
+    
+    with app.app_context():
+        orm = ProductService()
+        ids = _seed(orm)
+        cached = ProductService(snapshot=CatalogSnapshot())
+        
+        assert cached.get_products_count() == orm.get_products_count() == 20
+        assert cached.get_products_with_images_count() == orm.get_products_with_images_count() == 7
+        assert cached.get_product_by_code('SN-4').id == ids['SN-4']
+        assert cached.get_product_by_code('SN-404') is None
+        assert cached.product_has_image(ids['SN-3']) is True and orm.product_has_image(ids['SN-3']) is True
+        assert cached.product_has_image(ids['SN-4']) is False
+        assert cached.product_has_image(9999) is None and orm.product_has_image(9999) is None
+        
+        assert cached.get_missing_image_ids() == orm.get_missing_image_ids()
+        first_page = cached.get_missing_image_ids(limit=5)
+        assert first_page == orm.get_missing_image_ids(limit=5)
+        assert cached.get_missing_image_ids(limit=5, after_id=first_page[-1]) == \
+            orm.get_missing_image_ids(limit=5, after_id=first_page[-1])
+        assert [product.id for product in cached.get_products_without_images(limit=3)] == first_page[:3]
+
+def test_local_writes_are_applied_incrementally():
+    """Updates, code changes and deletes from this process show up on the next read"""
+    app = create_app('testing')
+    
+    with app.app_context():
+        snapshot = CatalogSnapshot(version_ttl=60)
+        service = ProductService(snapshot=snapshot)
+        ids = _seed(service)
+        assert snapshot.count() == 20
+        full_builds = SNAPSHOT_REFRESH_SECONDS.count(kind='full')
+        
+        service.update_product_image(ids['SN-1'], 'img/new.jpg')
+        service.update_product(ids['SN-2'], code='SN-2-RENAMED')
+        assert snapshot.has_image(ids['SN-1']) is True
+        assert snapshot.count_with_images() == 8
+        assert snapshot.id_for_code('SN-2') is None
+        assert snapshot.id_for_code('SN-2-RENAMED') == ids['SN-2']
+        
+        service.delete_products([ids['SN-4'], ids['SN-3']])
+        assert snapshot.count() == 18 and snapshot.count_with_images() == 7
+        assert snapshot.id_for_code('SN-4') is None and snapshot.has_image(ids['SN-3']) is None
+        assert ids['SN-4'] not in snapshot.missing_image_ids()
+        
+        # A product re-created under a deleted id comes back
+        product = Product('Again', 'SN-4-AGAIN')
+        product.id = ids['SN-4']
+        service.add_product(product)
+        assert snapshot.id_for_code('SN-4-AGAIN') == ids['SN-4'] and snapshot.count() == 19
+        assert SNAPSHOT_REFRESH_SECONDS.count(kind='full') == full_builds
+
+def test_other_workers_writes_are_seen_after_the_version_ttl():
+    """Writes committed elsewhere are picked up once the catalog version is re-read"""
+    app = create_app('testing')
+    
+    with app.app_context():
+        snapshot = CatalogSnapshot(version_ttl=60)
+        ids = _seed(ProductService())
+        assert snapshot.has_image(ids['SN-1']) is False
+        
+        # Another process: no local commit is counted here
+        db.session.execute(text("UPDATE products SET image_path = 'img/x.jpg', updated_at = :now WHERE id = :id"),
+                           {'now': db.session.get(Product, ids['SN-1']).updated_at, 'id': ids['SN-1']})
+        db.session.execute(text('UPDATE catalog_version SET version = version + 1'))
+        db.session.commit()
+        assert snapshot.has_image(ids['SN-1']) is False
+        
+        snapshot.refresh()
+        assert snapshot.has_image(ids['SN-1']) is True
+
+def test_columns_stay_compact():
+    """Per-product memory stays bounded and out-of-order ids ask for a rebuild"""
+    columns = _Columns()
+    for product_id in range(1, 100001):
+        columns.apply(product_id, f'CODE-{product_id:06d}', product_id, product_id, product_id % 2 == 0)
+    assert columns.live_count == 100000 and columns.image_count == 50000
+    assert columns.ids[columns.row_for_code('CODE-054321')] == 54321
+    # Under 64 bytes a product, codes included
+    assert columns.memory_bytes() / columns.live_count < 64
+    assert columns.missing_image_ids(3, 10) == [11, 13, 15]
+    assert columns.apply(0, 'LATE', 0, 0, False) is False
+
+def test_index_page_uses_the_snapshot():
+    """CATALOG_SNAPSHOT switches the container's ProductService over"""
+    app = create_app('testing')
+    app.config['CATALOG_SNAPSHOT'] = True
+    
+    with app.app_context():
+        _seed(ProductService())
+        services = app.extensions['services']
+        assert services.product_service.snapshot is services.catalog_snapshot
+        
+        response = app.test_client().get('/')
+        assert response.status_code == 200
+        assert len(services.catalog_snapshot) == 20
+
+if __name__ == '__main__':
+    test_snapshot_answers_match_the_database()
+    test_local_writes_are_applied_incrementally()
+    test_other_workers_writes_are_seen_after_the_version_ttl()
+    test_columns_stay_compact()
+    test_index_page_uses_the_snapshot()
+    print("Catalog snapshot tests passed!")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the center and smart (edges/entropy) crop modes
+"""
+
+import os
+import tempfile
+
+import pytest
+from PIL import Image
+
+np = pytest.importorskip('numpy')
+
+from app import create_app
+from services.cropping import center_crop_box, crop_box, smart_crop_box
+from services.image_processor import ImageProcessor
+from benchmarks.bench_crop import make_scene, coverage
+
+def test_smart_modes_keep_an_off_center_product():
+    """Both smart modes keep a product the center crop cuts off, landscape and portrait"""
+    for width, height, position in ((2000, 1200, 0.05), (1200, 3000, 0.1)):
+        image, product = make_scene(width, height, position)
+        assert coverage(product, crop_box(image, 'center')) < 0.6
+        for mode in ('edges', 'entropy'):
+            box = crop_box(image, mode)
+            assert box[2] - box[0] == box[3] - box[1] == min(width, height)
+            assert 0 <= box[0] and 0 <= box[1] and box[2] <= width and box[3] <= height
+            assert coverage(product, box) > 0.95, (mode, box)
+
+def test_flat_and_square_images_keep_the_center():
+    """Without detail to prefer, the smart modes fall back to the center window"""
+    flat = Image.new('RGB', (900, 300), (200, 200, 200))
+    assert smart_crop_box(flat, 'edges') == center_crop_box(900, 300)
+    assert smart_crop_box(flat, 'entropy') == center_crop_box(900, 300)
+    assert smart_crop_box(Image.new('RGB', (50, 50)), 'edges') == (0, 0, 50, 50)
+    with pytest.raises(ValueError):
+        crop_box(flat, 'faces')
+
+def test_processor_default_and_per_call_mode():
+    """The configured mode is the default; a per-call mode overrides it"""
+    root = tempfile.mkdtemp()
+    processor = ImageProcessor(os.path.join(root, 'products'), os.path.join(root, 'temp'), crop_mode='edges')
+    image, _ = make_scene(2000, 1200, 0.05)
+    
+    def dark_fraction(result):
+        return float((np.asarray(result.convert('L')) < 128).mean())
+    
+    smart = processor._resize_to_square(image, (200, 200))
+    center = processor._resize_to_square(image, (200, 200), 'center')
+    assert smart.size == center.size == (200, 200)
+    assert dark_fraction(smart) > dark_fraction(center) + 0.1
+    with pytest.raises(ValueError):
+        ImageProcessor(os.path.join(root, 'products'), os.path.join(root, 'temp'), crop_mode='faces')
+
+def test_update_route_validates_crop_mode():
+    """An unknown crop_mode is rejected before any download starts"""
+    app = create_app('testing')
+    response = app.test_client().post('/products/1/update-image',
+                                      json={'image_url': 'http://127.0.0.1:9/a.jpg', 'crop_mode': 'faces'})
+    assert response.status_code == 400
+    assert 'crop_mode' in response.get_json()['error']
+
+if __name__ == '__main__':
+    test_smart_modes_keep_an_off_center_product()
+    test_flat_and_square_images_keep_the_center()
+    test_processor_default_and_per_call_mode()
+    test_update_route_validates_crop_mode()
+    print("Cropping tests passed!")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the image engine interface and its Pillow and libvips engines
+"""
+
+import os
+import tempfile
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from services.engines import PillowEngine, create_engine
+from services.image_processor import ImageProcessor
+from benchmarks.load_test import make_stub_image
+
+def _png_with_alpha(size=(900, 600)) -> bytes:
+    image = Image.new('RGBA', size, (0, 0, 0, 0))
+    image.paste((200, 30, 30, 255), (300, 150, 600, 450))
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def test_pillow_engine_squares_and_flattens():
+    """Transparent areas become white and the output is the requested RGB square"""
+    engine = PillowEngine()
+    stages = []
+    image = engine.process(BytesIO(_png_with_alpha()), (200, 200), 'center',
+                           lambda stage, data: stages.append((stage, data['width'], data['height'])))
+    assert engine.size(image) == (200, 200) and image.mode == 'RGB'
+    assert image.getpixel((2, 2)) == (255, 255, 255)
+    assert stages == [('decoded', 900, 600), ('resized', 200, 200)]
+    
+    output = BytesIO()
+    engine.encode_jpeg(image, output, quality=70)
+    assert Image.open(BytesIO(output.getvalue())).format == 'JPEG'
+
+def test_engine_selection_and_fallback():
+    """Unknown engines are rejected; vips falls back to Pillow when pyvips is missing"""
+    with pytest.raises(ValueError):
+        create_engine('imagemagick')
+    assert isinstance(create_engine('pillow'), PillowEngine)
+    try:
+        import pyvips  # noqa: F401
+    except (ImportError, OSError):
+        assert isinstance(create_engine('vips'), PillowEngine)
+        assert isinstance(create_engine('auto'), PillowEngine)
+
+def test_processor_delegates_to_its_engine():
+    """Decode, resize and encode all go through the configured engine"""
+    calls = []
+    
+    class RecordingEngine(PillowEngine):
+        def process(self, image_data, size, crop_mode, progress=None):
+            calls.append(('process', size, crop_mode))
+            return super().process(image_data, size, crop_mode, progress)
+        
+        def encode_jpeg(self, image, writer, quality=85, **options):
+            calls.append(('encode', quality))
+            super().encode_jpeg(image, writer, quality, **options)
+    
+    root = tempfile.mkdtemp()
+    processor = ImageProcessor(os.path.join(root, 'products'), os.path.join(root, 'temp'), engine=RecordingEngine())
+    image_path = processor.process_and_save_downloaded(BytesIO(make_stub_image()), 'http://origin/a.jpg', 'P-1',
+                                                       crop_mode='center')
+    assert calls == [('process', (500, 500), 'center'), ('encode', 85)]
+    with Image.open(image_path) as saved:
+        assert saved.size == (500, 500)
+
+def test_vips_engine_matches_the_interface():
+    """libvips thumbnails to an exact RGB square and streams a JPEG to the writer"""
+    pytest.importorskip('pyvips')
+    engine = create_engine('vips')
+    assert engine.name == 'vips'
+    for data in (make_stub_image(size=(1200, 800)), _png_with_alpha()):
+        image = engine.process(BytesIO(data), (500, 500), 'entropy')
+        assert engine.size(image) == (500, 500)
+        output = BytesIO()
+        engine.encode_jpeg(image, output)
+        with Image.open(BytesIO(output.getvalue())) as decoded:
+            assert decoded.format == 'JPEG' and decoded.size == (500, 500) and decoded.mode == 'RGB'
+
+if __name__ == '__main__':
+    test_pillow_engine_squares_and_flattens()
+    test_engine_selection_and_fallback()
+    test_processor_delegates_to_its_engine()
+    test_vips_engine_matches_the_interface()
+    print("Engine tests passed!")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for atomic image writes and superseded-image garbage collection
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from app import create_app
+from models.product import Product, db
+from models.superseded_image import SupersededImage
+from services.image_gc import ImageGarbageCollector
+from services.storage import LocalStorage
+from services.product_service import ProductService
+from services.work_leases import TaskLeader
+
+def test_atomic_write_leaves_no_temp_files():
+    """Writes land complete at the target and leave nothing in the temp folder"""
+    root = tempfile.mkdtemp()
+    storage = LocalStorage(os.path.join(root, 'products'), os.path.join(root, 'temp'))
+    
+    storage.put('ab/cd/X_1.jpg', b'jpeg-bytes')
+    
+    # An aborted writer publishes nothing
+    writer = storage.open_writer('ab/cd/X_2.jpg')
+    writer.write(b'partial')
+    writer.abort()
+    
+    with open(os.path.join(root, 'products', 'ab', 'cd', 'X_1.jpg'), 'rb') as f:
+        assert f.read() == b'jpeg-bytes'
+    assert not storage.exists('ab/cd/X_2.jpg')
+    assert os.listdir(os.path.join(root, 'temp')) == []
+
+def test_superseded_images_are_collected():
+    """Replaced images are deleted once no product references them"""
+    app = create_app('testing')
+    upload_folder = tempfile.mkdtemp()
+    paths = []
+    for name in ('old.jpg', 'new.jpg', 'shared.jpg'):
+        path = os.path.join(upload_folder, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 10)
+        paths.append(path)
+    old, new, shared = paths
+    
+    with app.app_context():
+        service = ProductService()
+        first = service.add_product(Product('First', 'F-1', old))
+        second = service.add_product(Product('Second', 'S-1', shared))
+        third = service.add_product(Product('Third', 'T-1', shared))
+        
+        service.update_product_image(first.id, new)
+        service.update_product_image(second.id, new)
+        assert SupersededImage.query.count() == 2
+        
+        collector = ImageGarbageCollector(upload_folder=upload_folder, grace_seconds=0)
+        result = collector.collect()
+        
+        # old.jpg had no other reference; shared.jpg is still used by the third product
+        assert result.deleted == 1
+        assert result.retained == 1
+        assert not os.path.exists(old)
+        assert os.path.exists(shared)
+        assert os.path.exists(new)
+        assert SupersededImage.query.count() == 0
+
+def test_references_are_compared_as_storage_keys():
+    """Other spellings of an image's path still count as references; other directories don't"""
+    app = create_app('testing')
+    upload_folder = tempfile.mkdtemp()
+    paths = {}
+    for key in ('ab/cd/dot.jpg', 'ab/cd/slash.jpg', 'ab/cd/moved.jpg', 'ef/gh/moved.jpg'):
+        paths[key] = os.path.join(upload_folder, *key.split('/'))
+        os.makedirs(os.path.dirname(paths[key]), exist_ok=True)
+        with open(paths[key], 'wb') as f:
+            f.write(b'x')
+    
+    with app.app_context():
+        db.session.add_all([Product('Dot', 'D-1', f'{upload_folder}/./ab/cd/dot.jpg'),
+                            Product('Slash', 'S-1', f'{upload_folder}/ab\\cd\\slash.jpg'),
+                            Product('Moved', 'M-1', paths['ef/gh/moved.jpg'])])
+        db.session.add_all([SupersededImage(paths[key]) for key in ('ab/cd/dot.jpg', 'ab/cd/slash.jpg',
+                                                                    'ab/cd/moved.jpg')])
+        db.session.commit()
+        
+        result = ImageGarbageCollector(upload_folder=upload_folder, grace_seconds=0).collect()
+        
+        assert (result.retained, result.deleted) == (2, 1)
+        assert os.path.exists(paths['ab/cd/dot.jpg']) and os.path.exists(paths['ab/cd/slash.jpg'])
+        assert not os.path.exists(paths['ab/cd/moved.jpg']) and os.path.exists(paths['ef/gh/moved.jpg'])
+
+def test_one_worker_leads_the_collector():
+    """Only the lease holder runs the GC; another worker takes over once the lease lapses"""
+    app = create_app('testing')
+    now = [datetime(2026, 1, 1)]
+    clock = lambda: now[0]
+    
+    with app.app_context():
+        first = TaskLeader('image_gc', 'worker-1', lease_seconds=180, clock=clock)
+        second = TaskLeader('image_gc', 'worker-2', lease_seconds=180, clock=clock)
+        assert first.acquire() and not second.acquire()
+        
+        now[0] += timedelta(seconds=120)
+        assert first.acquire() and not second.acquire()
+        
+        # worker-1 died: its lease lapses and worker-2 takes over
+        now[0] += timedelta(seconds=181)
+        assert second.acquire() and not first.acquire()
+        second.release()
+        assert first.acquire()
+
+if __name__ == '__main__':
+    test_atomic_write_leaves_no_temp_files()
+    test_superseded_images_are_collected()
+    test_references_are_compared_as_storage_keys()
+    test_one_worker_leads_the_collector()
+    print("Image GC tests passed!")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for ingesting ZIP archives and directories of images named after product codes
+"""
+
+import json
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+
+from app import create_app
+from models.product import Product, db
+from services.catalog_snapshot import CatalogSnapshot
+from services.image_ingest import open_directory, open_zip
+from services.product_service import ProductService
+from benchmarks.load_test import make_stub_image
+
+def _make_app():
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    app.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    app.config['BATCH_CHUNK_SIZE'] = 2
+    with app.app_context():
+        db.session.add_all([Product(f'Product {i}', f'P-{i}') for i in range(1, 4)])
+        db.session.commit()
+    return app
+
+def _zip(files: dict) -> BytesIO:
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w') as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+    archive.seek(0)
+    return archive
+
+def test_product_ids_by_codes():
+    """One lookup resolves a batch of codes, from the ORM or the snapshot"""
+    app = _make_app()
+    
+    with app.app_context():
+        expected = {product.code: product.id for product in Product.query}
+        for service in (ProductService(batch_size=2), ProductService(snapshot=CatalogSnapshot())):
+            assert service.get_product_ids_by_codes(['P-1', 'P-3', 'NOPE', 'P-2', 'P-1']) == expected
+
+def test_zip_upload_sets_matching_product_images():
+    """Images are matched by file name; other files are skipped and failures reported per file"""
+    app = _make_app()
+    archive = _zip({
+        'P-1.jpg': make_stub_image(size=(640, 480)),
+        'dump/P-2.png': make_stub_image(size=(300, 300)),
+        'UNKNOWN.jpg': make_stub_image(),
+        'P-3.jpg': b'not an image',
+        'readme.txt': b'supplier notes',
+        '__MACOSX/dump/._P-2.png': b'resource fork',
+    })
+    
+    response = app.test_client().post('/products/ingest', data={'archive': (archive, 'dump.zip')},
+                                      content_type='multipart/form-data')
+    assert response.status_code == 200
+    results = {result['file']: result for result in map(json.loads, response.data.decode().splitlines())}
+    assert sorted(results) == ['P-1.jpg', 'P-3.jpg', 'UNKNOWN.jpg', 'dump/P-2.png']
+    assert results['P-1.jpg']['success'] and results['dump/P-2.png']['code'] == 'P-2'
+    assert results['UNKNOWN.jpg'] == {'file': 'UNKNOWN.jpg', 'code': 'UNKNOWN', 'product_id': None,
+                                      'success': False, 'error': 'Product not found'}
+    assert results['P-3.jpg']['success'] is False and results['P-3.jpg']['product_id'] is not None
+    
+    with app.app_context():
+        rows = {product.code: product for product in Product.query}
+        for code, name in (('P-1', 'P-1.jpg'), ('P-2', 'dump/P-2.png')):
+            assert rows[code].image_path == results[name]['image_path']
+            assert os.path.exists(rows[code].image_path)
+            assert (rows[code].image_width, rows[code].image_height) == (500, 500)
+        assert rows['P-3'].image_path is None
+
+def test_zip_upload_body_and_validation():
+    """The archive may also be the raw body; missing or non-ZIP uploads are rejected up front"""
+    app = _make_app()
+    client = app.test_client()
+    response = client.post('/products/ingest', data=_zip({'P-3.jpg': make_stub_image()}).getvalue(),
+                           content_type='application/zip')
+    assert [json.loads(line)['success'] for line in response.data.decode().splitlines()] == [True]
+    with app.app_context():
+        assert Product.query.filter_by(code='P-3').one().image_path
+    
+    assert client.post('/products/ingest', data={}, content_type='multipart/form-data').status_code == 400
+    response = client.post('/products/ingest', data={'archive': (BytesIO(b'plain text'), 'dump.zip')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400 and response.get_json()['error'] == 'Not a ZIP archive'
+    response = client.post('/products/ingest', data=b'plain text', content_type='application/zip')
+    assert response.status_code == 400
+
+def test_directory_ingest():
+    """Directories are walked in name order; the last file for a code wins and oversized files fail"""
+    app = _make_app()
+    root = tempfile.mkdtemp()
+    for name, data in (('a/P-1.jpg', make_stub_image()), ('b/P-1.jpg', make_stub_image(size=(200, 100))),
+                       ('b/P-2.jpg', make_stub_image(size=(3000, 2000))), ('.hidden/P-3.jpg', make_stub_image())):
+        os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(root, name), 'wb') as f:
+            f.write(data)
+    
+    with app.app_context():
+        ingester = app.extensions['services'].image_ingester
+        ingester.max_entry_bytes = 64 * 1024
+        with open_directory(root) as entries:
+            results = list(ingester.run(entries))
+        
+        assert [result['file'] for result in results] == ['a/P-1.jpg', 'b/P-1.jpg', 'b/P-2.jpg']
+        assert results[0]['error'] == 'Superseded by a later item for the same product'
+        assert results[1]['success'] and results[2]['error'] == 'Image file too large'
+        rows = {product.code: product for product in Product.query}
+        assert rows['P-1'].image_path == results[1]['image_path']
+        assert rows['P-2'].image_path is None and rows['P-3'].image_path is None
+
+def test_zip_entries_are_read_lazily():
+    """Entries are only inflated when read, in any order, while the archive is open"""
+    archive = _zip({'P-1.jpg': b'one', 'P-2.jpg': b'two'})
+    with open_zip(archive) as entries:
+        entries = list(entries)
+        assert [entry.code for entry in entries] == ['P-1', 'P-2']
+        assert [entry.read(10) for entry in reversed(entries)] == [b'two', b'one']
+
+if __name__ == '__main__':
+    test_product_ids_by_codes()
+    test_zip_upload_sets_matching_product_images()
+    test_zip_upload_body_and_validation()
+    test_directory_ingest()
+    test_zip_entries_are_read_lazily()
+    print("Image ingest tests passed!")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for image metadata recorded on products, the column migration and the backfill
+"""
+
+import base64
+import os
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+from sqlalchemy import text
+
+from app import create_app
+from models.product import Product, IMAGE_METADATA_COLUMNS, db
+from services.image_metadata import ImageMetadataBackfill, describe_image
+from services.image_processor import ImageProcessor
+from services.product_service import ProductService
+from benchmarks.load_test import make_stub_image
+
+def _jpeg(size=(640, 480)) -> bytes:
+    return make_stub_image(size=size)
+
+def test_describe_image():
+    """Dimensions, size, format and hash come from the bytes; the placeholder is a tiny inline image"""
+    data = _jpeg()
+    metadata = describe_image(data)
+    assert set(metadata) == set(IMAGE_METADATA_COLUMNS)
+    assert (metadata['image_width'], metadata['image_height']) == (640, 480)
+    assert metadata['image_bytes'] == len(data) and metadata['image_format'] == 'JPEG'
+    assert len(metadata['image_hash']) == 64
+    
+    header, encoded = metadata['image_placeholder'].split(',', 1)
+    assert header.startswith('data:image/') and len(metadata['image_placeholder']) < 400
+    with Image.open(BytesIO(base64.b64decode(encoded))) as placeholder:
+        assert placeholder.size == (16, 12)
+
+def test_processor_records_metadata_of_saved_images():
+    """Saved images are described as they stream to storage; others are read back from storage"""
+    root = tempfile.mkdtemp()
+    processor = ImageProcessor(os.path.join(root, 'products'), os.path.join(root, 'temp'))
+    image_path = processor.process_and_save_downloaded(BytesIO(_jpeg()), 'http://origin/a.jpg', 'P-1')
+    
+    with open(image_path, 'rb') as f:
+        expected = describe_image(f.read())
+    recorded = processor.image_metadata(image_path)
+    # The placeholder is made from the processed image rather than the decoded JPEG
+    assert {**recorded, 'image_placeholder': None} == {**expected, 'image_placeholder': None}
+    assert expected['image_width'] == expected['image_height'] == 500
+    with Image.open(BytesIO(base64.b64decode(recorded['image_placeholder'].split(',', 1)[1]))) as placeholder:
+        assert placeholder.size == (16, 16)
+    
+    processor._recent_metadata.clear()
+    assert processor.image_metadata(image_path) == expected
+    assert processor.image_metadata(os.path.join(root, 'products', 'missing.jpg')) is None
+
+def test_product_updates_store_and_clear_metadata():
+    """Metadata is written with image_path and cleared when a path arrives without it"""
+    app = create_app('testing')
+    metadata = describe_image(_jpeg())
+    
+    with app.app_context():
+        service = ProductService()
+        first = service.add_product(Product('First', 'M-1'))
+        second = service.add_product(Product('Second', 'M-2'))
+        
+        service.update_product_image(first.id, 'img/first.jpg', metadata)
+        assert first.image_hash == metadata['image_hash'] and first.to_dict()['image_width'] == 640
+        service.update_product_image(first.id, 'img/other.jpg')
+        assert first.image_hash is None and first.image_placeholder is None
+        
+        applied = service.update_images_bulk({first.id: 'img/a.jpg', second.id: 'img/b.jpg'},
+                                             {second.id: metadata})
+        assert applied == {first.id: True, second.id: True}
+        rows = {product.code: product for product in Product.query}
+        assert rows['M-1'].image_bytes is None
+        assert rows['M-2'].image_bytes == metadata['image_bytes']
+        assert rows['M-2'].image_placeholder == metadata['image_placeholder']
+
+def test_missing_columns_are_added_to_old_databases():
+    """A products table created before the metadata columns is upgraded in place"""
+    app = create_app('testing')
+    
+    with app.app_context():
+        db.session.execute(text('DROP TABLE products'))
+        db.session.execute(text('CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, '
+                                'code VARCHAR(100) NOT NULL UNIQUE, image_path VARCHAR(500), '
+                                'created_at DATETIME, updated_at DATETIME)'))
+        db.session.execute(text("INSERT INTO products (name, code) VALUES ('Old', 'OLD-1')"))
+        db.session.commit()
+        
+        assert Product.add_missing_columns() == list(IMAGE_METADATA_COLUMNS)
+        assert Product.add_missing_columns() == []
+        product = Product.query.filter_by(code='OLD-1').one()
+        assert product.name == 'Old' and product.image_width is None
+
+def test_backfill_describes_existing_images():
+    """Products saved without metadata get it in batches; missing and corrupt files are reported"""
+    app = create_app('testing')
+    upload_folder = os.path.join(tempfile.mkdtemp(), 'products')
+    os.makedirs(os.path.join(upload_folder, 'ab'))
+    paths = {}
+    for name, data in (('a.jpg', _jpeg()), ('ab/b.jpg', _jpeg((300, 300))), ('bad.jpg', b'not an image')):
+        paths[name] = os.path.join(upload_folder, name)
+        with open(paths[name], 'wb') as f:
+            f.write(data)
+    
+    with app.app_context():
+        db.session.add_all([Product('A', 'BF-1', paths['a.jpg']), Product('B', 'BF-2', paths['ab/b.jpg']),
+                            Product('Bad', 'BF-3', paths['bad.jpg']),
+                            Product('Gone', 'BF-4', os.path.join(upload_folder, 'gone.jpg')),
+                            Product('None', 'BF-5')])
+        db.session.commit()
+        
+        backfill = ImageMetadataBackfill(upload_folder=upload_folder, batch_size=2, max_workers=2)
+        report = backfill.run()
+        assert (report.products_updated, report.products_failed, report.products_missing) == (2, 1, 1)
+        assert report.batches == 2
+        
+        rows = {product.code: product for product in Product.query}
+        assert (rows['BF-2'].image_width, rows['BF-2'].image_height) == (300, 300)
+        assert rows['BF-1'].image_placeholder.startswith('data:image/')
+        assert rows['BF-3'].image_hash is None and rows['BF-5'].image_hash is None
+        
+        # Described products are skipped unless forced
+        assert backfill.run().products_updated == 0
+        backfill.force = True
+        assert backfill.run().products_updated == 2
+
+if __name__ == '__main__':
+    test_describe_image()
+    test_processor_records_metadata_of_saved_images()
+    test_product_updates_store_and_clear_metadata()
+    test_missing_columns_are_added_to_old_databases()
+    test_backfill_describes_existing_images()
+    print("Image metadata tests passed!")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental image health scanner
+"""
+
+import os
+import tempfile
+from PIL import Image
+
+from app import create_app
+from models.product import Product, db
+from services.image_scanner import ImageHealthScanner
+
+def _write_image(path, color=(200, 10, 10)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', (40, 30), color).save(path, 'JPEG')
+
+def test_incremental_scan():
+    """Scanner verifies new files once, skips unchanged ones and flags problems"""
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    
+    _write_image(os.path.join(root, 'good.jpg'))
+    _write_image(os.path.join(root, 'ab', 'cd', 'nested.jpg'))
+    _write_image(os.path.join(root, 'orphan.jpg'))
+    with open(os.path.join(root, 'broken.jpg'), 'wb') as f:
+        f.write(b'not really a jpeg')
+    
+    with app.app_context():
+        db.session.add_all([
+            Product('Good', 'G-1', os.path.join(root, 'good.jpg')),
+            Product('Nested', 'N-1', os.path.join(root, 'ab', 'cd', 'nested.jpg')),
+            Product('Broken', 'B-1', os.path.join(root, 'broken.jpg')),
+            Product('Missing', 'M-1', os.path.join(root, 'gone.jpg')),
+        ])
+        db.session.commit()
+        
+        scanner = ImageHealthScanner(root=root, max_workers=2)
+        first = scanner.scan()
+        assert first.files_seen == 4
+        assert first.files_verified == 4
+        assert first.corrupt == ['broken.jpg']
+        assert first.orphaned == ['orphan.jpg']
+        assert [product_id for product_id, _ in first.missing] == [4]
+        
+        # Nothing changed: every file is skipped
+        second = scanner.scan()
+        assert second.files_unchanged == 4
+        assert second.files_verified == 0
+        assert second.corrupt == ['broken.jpg']
+        
+        # Repair one file and delete another
+        _write_image(os.path.join(root, 'broken.jpg'))
+        os.remove(os.path.join(root, 'orphan.jpg'))
+        third = scanner.scan()
+        assert third.files_verified == 1
+        assert third.files_removed == 1
+        assert third.corrupt == []
+        assert third.orphaned == []
+
+if __name__ == '__main__':
+    test_incremental_scan()
+    print("Image scanner tests passed!")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for adaptive JPEG encoding: budget and quality targets, subsampling and
+progressive choice, and the per-source parameter cache
+"""
+
+import os
+import tempfile
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+from services.engines import PillowEngine
+from services.image_processor import ImageProcessor
+from services.jpeg_encoder import JpegEncoder, JPEG_PARAM_LOOKUPS, luma_psnr
+from benchmarks.bench_crop import make_scene
+from benchmarks.load_test import make_stub_image
+
+def _scene(size=500) -> Image.Image:
+    scene, _ = make_scene(1200, 1200, 0.3, seed=3)
+    return scene.resize((size, size), Image.Resampling.LANCZOS)
+
+def _fixed_size(image: Image.Image, quality=85) -> int:
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True)
+    return output.tell()
+
+def test_fixed_mode_matches_the_original_encoding():
+    """'fixed' writes exactly the quality-85 optimized JPEG"""
+    image = _scene()
+    output = BytesIO()
+    size = JpegEncoder(PillowEngine()).encode(image, output, source_key='a')
+    assert size == output.tell() == _fixed_size(image)
+
+def test_quality_mode_meets_the_target_with_fewer_bytes():
+    """A scene that quality 85 over-serves gets the lowest quality reaching the PSNR target"""
+    image = _scene()
+    output = BytesIO()
+    size = JpegEncoder(PillowEngine(), 'quality', target_psnr=40.0).encode(image, output)
+    assert size < _fixed_size(image)
+    with Image.open(BytesIO(output.getvalue())) as encoded:
+        # The search runs on a downscaled probe; the full-size result lands close to the target
+        assert luma_psnr(image, encoded) >= 39.0
+
+def test_budget_mode_fits_the_budget():
+    """The highest quality whose full-size output fits target_bytes is used"""
+    image = _scene()
+    budget = _fixed_size(image, quality=60)
+    encoder = JpegEncoder(PillowEngine(), 'budget', target_bytes=budget)
+    size = encoder.encode(image, BytesIO(), source_key='scene')
+    assert size <= budget
+    assert 50 <= encoder._params['scene']['quality'] <= 60
+    
+    # A budget even the lowest quality cannot meet stops at MIN_QUALITY
+    encoder.target_bytes = 1024
+    encoder.encode(image, BytesIO(), source_key='tiny-budget')
+    assert encoder._params['tiny-budget']['quality'] == 40
+
+def test_sharp_chroma_keeps_full_resolution_chroma():
+    """Saturated text keeps 4:4:4 chroma; a soft photo uses 4:2:0"""
+    label = Image.new('RGB', (500, 500), (255, 255, 255))
+    draw = ImageDraw.Draw(label)
+    for y in range(0, 500, 12):
+        draw.text((5, y), 'RED TEXT LABEL 12345 ' * 3, fill=(220, 0, 0))
+    encoder = JpegEncoder(PillowEngine(), 'budget', target_bytes=200 * 1024)
+    encoder.encode(label, BytesIO(), source_key='label')
+    encoder.encode(_scene(), BytesIO(), source_key='scene')
+    assert encoder._params['label']['subsampling'] == 0
+    assert encoder._params['scene']['subsampling'] == 2
+
+def test_parameters_are_cached_per_source():
+    """Re-encoding the same source reuses its parameters and gives identical bytes"""
+    image = _scene()
+    encoder = JpegEncoder(PillowEngine(), 'quality', target_psnr=40.0, cache_size=1)
+    hits = JPEG_PARAM_LOOKUPS.value(result='hit')
+    first, second = BytesIO(), BytesIO()
+    encoder.encode(image, first, source_key=('sha', 'center'))
+    encoder.encode(image, second, source_key=('sha', 'center'))
+    assert first.getvalue() == second.getvalue()
+    assert JPEG_PARAM_LOOKUPS.value(result='hit') == hits + 1
+    
+    # Least recently used entries are evicted past cache_size
+    encoder.encode(image, BytesIO(), source_key=('other', 'center'))
+    assert list(encoder._params) == [('other', 'center')]
+    
+    with pytest.raises(ValueError):
+        JpegEncoder(PillowEngine(), 'smallest')
+
+def test_processor_saves_with_its_encoder():
+    """ImageProcessor encodes through its JpegEncoder, keyed by the source bytes and crop"""
+    root = tempfile.mkdtemp()
+    engine = PillowEngine()
+    fixed = ImageProcessor(os.path.join(root, 'fixed'), os.path.join(root, 'temp'), engine=engine)
+    adaptive = ImageProcessor(os.path.join(root, 'adaptive'), os.path.join(root, 'temp'), engine=engine,
+                              encoder=JpegEncoder(engine, 'quality', target_psnr=40.0))
+    data = make_stub_image()
+    fixed_path = fixed.process_and_save_downloaded(BytesIO(data), 'http://origin/a.jpg', 'P-1')
+    adaptive_path = adaptive.process_and_save_downloaded(BytesIO(data), 'http://origin/a.jpg', 'P-1')
+    assert os.path.getsize(adaptive_path) < os.path.getsize(fixed_path)
+    assert list(adaptive.encoder._params) == [adaptive._source_key(BytesIO(data), 'center')]
+
+if __name__ == '__main__':
+    test_fixed_mode_matches_the_original_encoding()
+    test_quality_mode_meets_the_target_with_fewer_bytes()
+    test_budget_mode_fits_the_budget()
+    test_sharp_chroma_keeps_full_resolution_chroma()
+    test_parameters_are_cached_per_source()
+    test_processor_saves_with_its_encoder()
+    print("JPEG encoder tests passed!")
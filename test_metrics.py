@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics registry and the /metrics endpoint
+"""
+
+from utils.metrics import MetricsRegistry
+
+def test_counter_and_histogram_rendering():
+    """Counters and histograms render in Prometheus text format"""
+    registry = MetricsRegistry()
+    failures = registry.counter('failures_total', 'Failures')
+    stage = registry.histogram('stage_seconds', 'Stage timings', buckets=(0.1, 1.0))
+    
+    failures.inc(component='download')
+    failures.inc(component='download')
+    stage.observe(0.05, stage='resize')
+    stage.observe(0.5, stage='resize')
+    stage.observe(5.0, stage='resize')
+    
+    output = registry.render()
+    print(output)
+    
+    assert 'failures_total{component="download"} 2.0' in output
+    assert 'stage_seconds_bucket{stage="resize",le="0.1"} 1.0' in output
+    assert 'stage_seconds_bucket{stage="resize",le="1.0"} 2.0' in output
+    assert 'stage_seconds_bucket{stage="resize",le="+Inf"} 3.0' in output
+    assert 'stage_seconds_count{stage="resize"} 3.0' in output
+    assert stage.count(stage='resize') == 3
+
+def test_metrics_endpoint():
+    """The /metrics endpoint exposes request and search timings"""
+    from app import create_app
+    
+    client = create_app('testing').test_client()
+    client.get('/metrics')
+    response = client.get('/metrics')
+    body = response.get_data(as_text=True)
+    
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert 'http_request_seconds_count{endpoint="metrics",status="200"}' in body
+
+if __name__ == '__main__':
+    test_counter_and_histogram_rendering()
+    test_metrics_endpoint()
+    print("Metrics tests passed!")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for per-origin rate limits, adaptive concurrency and circuit breakers
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from services.origin_scheduler import OriginScheduler, OriginUnavailable, is_origin_fault
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.response = type('Response', (), {'status_code': status_code})()
+
+def test_token_bucket_paces_requests():
+    """Beyond the burst, requests to one origin are spaced at the configured rate"""
+    scheduler = OriginScheduler(rate=20, burst=2, initial_concurrency=8)
+    started = time.monotonic()
+    for _ in range(6):
+        with scheduler.slot('http://origin-a/image.jpg'):
+            pass
+    assert time.monotonic() - started >= 0.18
+    
+    # Other origins have their own bucket
+    started = time.monotonic()
+    with scheduler.slot('http://origin-b/image.jpg'):
+        pass
+    assert time.monotonic() - started < 0.05
+
+def test_concurrency_adapts_to_latency_and_faults():
+    """Fast answers grow the limit additively; slow answers and faults halve it"""
+    scheduler = OriginScheduler(rate=0, initial_concurrency=2, max_concurrency=8, latency_target=0.5)
+    url = 'http://origin/image.jpg'
+    for _ in range(40):
+        scheduler.release(scheduler.acquire(url), 0.01)
+    status = scheduler.status()['http://origin']
+    assert status['concurrency_limit'] == 8 and status['latency_ms'] == 10.0
+    
+    scheduler.release(scheduler.acquire(url), 1.0)
+    assert scheduler.status()['http://origin']['concurrency_limit'] == 4
+    time.sleep(0.3)
+    scheduler.release(scheduler.acquire(url), 0.01, ConnectionError('reset'))
+    assert scheduler.status()['http://origin']['concurrency_limit'] == 2
+    
+    # A limit of 2 makes a third concurrent caller wait for a release
+    held = [scheduler.acquire(url), scheduler.acquire(url)]
+    timer = threading.Timer(0.2, scheduler.release, args=(held[0], 0.01))
+    timer.start()
+    started = time.monotonic()
+    scheduler.release(scheduler.acquire(url), 0.01)
+    assert time.monotonic() - started >= 0.15
+    scheduler.release(held[1], 0.01)
+
+def test_circuit_opens_fails_fast_and_probes():
+    """Consecutive faults open the circuit; one probe after the wait decides whether it closes"""
+    scheduler = OriginScheduler(rate=0, failure_threshold=2, open_seconds=0.2)
+    url = 'http://flaky/image.jpg'
+    assert not is_origin_fault(HTTPStatusError(404)) and is_origin_fault(HTTPStatusError(503))
+    for _ in range(3):
+        with pytest.raises(HTTPStatusError):
+            with scheduler.slot(url):
+                raise HTTPStatusError(404)
+    assert scheduler.status()['http://flaky']['state'] == 'closed'
+    
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            with scheduler.slot(url):
+                raise ConnectionError('refused')
+    with pytest.raises(OriginUnavailable) as rejected:
+        scheduler.acquire(url)
+    assert rejected.value.reason == 'circuit_open' and 0 < rejected.value.retry_after <= 0.2
+    
+    time.sleep(0.25)
+    assert scheduler.status()['http://flaky']['state'] == 'half_open'
+    probe = scheduler.acquire(url)
+    with pytest.raises(OriginUnavailable):
+        scheduler.acquire(url)
+    scheduler.release(probe, 0.01, ConnectionError('refused'))
+    assert scheduler.status()['http://flaky']['state'] == 'open'
+    
+    time.sleep(0.25)
+    with scheduler.slot(url):
+        pass
+    assert scheduler.status()['http://flaky']['state'] == 'closed'
+
+def test_async_slots_respect_the_limit():
+    """Coroutines share the same per-origin concurrency limit without blocking the loop"""
+    scheduler = OriginScheduler(rate=0, initial_concurrency=2, max_concurrency=2)
+    active, peak = [0], [0]
+    
+    async def fetch():
+        async with scheduler.slot_async('http://origin/image.jpg'):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.05)
+            active[0] -= 1
+    
+    async def main():
+        await asyncio.gather(*(fetch() for _ in range(6)))
+    
+    asyncio.run(main())
+    assert peak[0] == 2
+
+def test_unreachable_origin_is_cut_off():
+    """Downloads from a dead origin stop reaching it once the circuit opens, as /origins shows"""
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config.update(UPLOAD_FOLDER=os.path.join(root, 'products'), TEMP_FOLDER=os.path.join(root, 'temp'),
+                      ORIGIN_FAILURE_THRESHOLD=2, SINGLE_FLIGHT_ACROSS_WORKERS=False)
+    processor = app.extensions['services'].image_processor
+    for _ in range(4):
+        assert processor._download_image('http://127.0.0.1:9/missing.jpg') is None
+    
+    status = app.test_client().get('/origins').get_json()['origins']['http://127.0.0.1:9']
+    assert status['state'] == 'open'
+    assert status['requests'] == 2 and status['faults'] == 2 and status['rejected'] == 2
+
+def test_origins_with_waiters_are_not_pruned():
+    """An origin whose callers are waiting for a token keeps its bucket when the table is pruned"""
+    scheduler = OriginScheduler(rate=5, burst=1, max_origins=2)
+    with scheduler.slot('http://busy/a.jpg'):
+        pass
+    
+    waiter = threading.Thread(target=lambda: scheduler.acquire('http://busy/b.jpg'))
+    waiter.start()
+    time.sleep(0.05)
+    # Two new origins fill the table and prune the least recently used idle one
+    with scheduler.slot('http://other-1/a.jpg'), scheduler.slot('http://other-2/a.jpg'):
+        pass
+    assert 'http://busy' in scheduler.status()
+    waiter.join()
+    
+    # The bucket is still empty, so the next request waits its turn instead of getting a fresh burst
+    started = time.monotonic()
+    scheduler.acquire('http://busy/c.jpg')
+    assert time.monotonic() - started >= 0.1
+
+if __name__ == '__main__':
+    test_token_bucket_paces_requests()
+    test_concurrency_adapts_to_latency_and_faults()
+    test_circuit_opens_fails_fast_and_probes()
+    test_async_slots_respect_the_limit()
+    test_unreachable_origin_is_cut_off()
+    test_origins_with_waiters_are_not_pruned()
+    print("Origin scheduler tests passed!")
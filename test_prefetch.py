@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for speculative prefetching of image search candidates
+Images are served by a local stub origin, so no network access is needed.
+"""
+
+import os
+import tempfile
+import time
+
+from app import create_app
+from models.product import Product, db
+from services.prefetcher import ImagePrefetcher, PREFETCH_OUTCOMES
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+def _make_app(**config):
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    app.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    app.config.update(config)
+    with app.app_context():
+        db.session.add_all([Product(f'Product {i}', f'P-{i}') for i in range(1, 3)])
+        db.session.commit()
+    return app
+
+def _wait_idle(prefetcher, timeout=10):
+    deadline = time.monotonic() + timeout
+    while prefetcher._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not prefetcher._pending
+
+def test_selecting_a_warmed_candidate_skips_the_download():
+    """A warmed candidate is saved from the prefetch cache even once its origin is gone"""
+    app = _make_app(PREFETCH_TOP_N=2)
+    client = app.test_client()
+    origin = ImageOriginServer(make_stub_image(size=(300, 200))).start()
+    urls = [f'{origin.base_url}/{name}.jpg' for name in ('a', 'b', 'c')]
+    try:
+        response = client.post('/products/1/prefetch', json={'image_urls': urls})
+        assert response.status_code == 202 and response.get_json()['scheduled'] == 2
+        prefetcher = app.extensions['services'].prefetcher
+        _wait_idle(prefetcher)
+        assert client.post('/products/1/prefetch', json={'image_urls': urls}).get_json()['scheduled'] == 0
+    finally:
+        origin.stop()
+    
+    assert os.path.exists(prefetcher.path_for(urls[0])) and not os.path.exists(prefetcher.path_for(urls[2]))
+    response = client.post('/products/1/update-image', json={'image_url': urls[0]})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    image_path = response.get_json()['image_path']
+    assert os.path.exists(image_path)
+    with app.app_context():
+        assert db.session.get(Product, 1).image_path == image_path
+    
+    assert client.post('/products/1/update-image', json={'image_url': urls[2]}).status_code == 500
+    assert client.post('/products/99/prefetch', json={'image_urls': urls}).status_code == 404
+    assert client.post('/products/1/prefetch', json={}).status_code == 400
+
+def test_leaving_the_page_cancels_warming():
+    """Cancelled candidates stop downloading and never reach the cache"""
+    app = _make_app(PREFETCH_TOP_N=3, PREFETCH_MAX_WORKERS=1)
+    client = app.test_client()
+    origin = ImageOriginServer(make_stub_image(size=(300, 200)), delay_ms=300).start()
+    urls = [f'{origin.base_url}/{name}.jpg' for name in ('a', 'b', 'c')]
+    cancelled_before = PREFETCH_OUTCOMES.value(outcome='cancelled')
+    try:
+        assert client.post('/products/2/prefetch', json={'image_urls': urls}).get_json()['scheduled'] == 3
+        assert client.delete('/products/2/prefetch').get_json()['cancelled'] == 3
+        prefetcher = app.extensions['services'].prefetcher
+        _wait_idle(prefetcher)
+    finally:
+        origin.stop()
+    
+    assert not any(os.path.exists(prefetcher.path_for(url)) for url in urls)
+    assert PREFETCH_OUTCOMES.value(outcome='cancelled') > cancelled_before
+
+def test_cache_stays_within_budget():
+    """The oldest warmed files are evicted once the byte budget is exceeded"""
+    class FakeProcessor:
+        def prepare_image(self, url, progress=None):
+            return b'x' * 100
+    
+    prefetcher = ImagePrefetcher(FakeProcessor(), tempfile.mkdtemp(), max_workers=1, top_n=1, max_bytes=250)
+    for index in range(4):
+        prefetcher.prefetch(index, [f'http://origin/{index}.jpg'])
+        _wait_idle(prefetcher)
+    
+    sizes = [os.path.getsize(os.path.join(prefetcher.cache_dir, name)) for name in os.listdir(prefetcher.cache_dir)]
+    assert len(sizes) == 2 and sum(sizes) <= 250
+    assert prefetcher.take('http://origin/3.jpg') == b'x' * 100
+
+if __name__ == '__main__':
+    test_selecting_a_warmed_candidate_skips_the_download()
+    test_leaving_the_page_cancels_warming()
+    test_cache_stays_within_budget()
+    print("Prefetch tests passed!")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for ProductService batch writes and unit-of-work grouping
+"""
+
+import pytest
+
+from app import create_app
+from models.product import Product, db
+from models.superseded_image import SupersededImage
+from services.product_service import ProductService
+
+def _superseded():
+    return sorted(row.path for row in SupersededImage.query)
+
+def test_bulk_add_update_delete():
+    """Batch variants insert, update and delete in batches and queue replaced images"""
+    app = create_app('testing')
+    service = ProductService(batch_size=2)
+    
+    with app.app_context():
+        inserted = service.add_products([{'name': f'Product {i}', 'code': f'B-{i}'} for i in range(5)]
+                                        + [Product('Object', 'B-OBJ', 'img/obj.jpg')])
+        assert inserted == 6 and service.get_products_count() == 6
+        assert service.get_product_by_code('B-OBJ').image_path == 'img/obj.jpg'
+    
+        ids = {product.code: product.id for product in Product.query}
+        loaded = service.get_product_by_id(ids['B-0'])
+        applied = service.update_images_bulk({ids['B-0']: 'img/0.jpg', ids['B-OBJ']: 'img/obj2.jpg',
+                                              9999: 'img/missing.jpg'})
+        assert applied == {ids['B-0']: True, ids['B-OBJ']: True}
+        assert loaded.image_path == 'img/0.jpg'
+        assert _superseded() == ['img/obj.jpg']
+    
+        assert service.delete_products([ids['B-0'], ids['B-1'], 9999]) == 2
+        assert service.get_products_count() == 4
+        assert _superseded() == ['img/0.jpg', 'img/obj.jpg']
+
+def test_bulk_update_keeps_concurrent_change():
+    """A row changed between the read and the guarded UPDATE is left alone"""
+    class RacingService(ProductService):
+        reads = 0
+    
+        def _image_paths(self, product_ids):
+            paths = super()._image_paths(product_ids)
+            self.reads += 1
+            if self.reads == 1:
+                # Another writer sets the image right after the guard value is read
+                db.session.execute(Product.__table__.update().values(image_path='img/theirs.jpg'))
+            return paths
+    
+    app = create_app('testing')
+    service = RacingService()
+    
+    with app.app_context():
+        service.add_products([{'name': 'Racy', 'code': 'R-1'}])
+        product_id = service.get_product_by_code('R-1').id
+    
+        applied = service.update_images_bulk({product_id: 'img/ours.jpg'})
+    
+        assert applied == {product_id: False}
+        assert service.get_product_by_id(product_id).image_path == 'img/theirs.jpg'
+        assert _superseded() == ['img/ours.jpg']
+
+def test_unit_of_work_commits_once_or_rolls_back():
+    """Mutations inside a unit of work share one transaction"""
+    app = create_app('testing')
+    service = ProductService()
+    
+    with app.app_context():
+        with service.unit_of_work():
+            first = service.add_product(Product('First', 'U-1'))
+            with service.unit_of_work():
+                service.update_product_image(first.id, 'img/u1.jpg')
+            service.add_products([{'name': 'Second', 'code': 'U-2'}])
+        assert service.get_products_count() == 2
+    
+        with pytest.raises(RuntimeError):
+            with service.unit_of_work():
+                service.add_product(Product('Third', 'U-3'))
+                service.delete_products([first.id])
+                raise RuntimeError('abort')
+        assert service.get_products_count() == 2
+        assert service.get_product_by_code('U-3') is None
+        assert _superseded() == []
+
+if __name__ == '__main__':
+    test_bulk_add_update_delete()
+    test_bulk_update_keeps_concurrent_change()
+    test_unit_of_work_commits_once_or_rolls_back()
+    print("Product service tests passed!")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for opt-in request profiling and profile aggregation
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from utils import profiling
+from utils.profiling import RequestProfiler, list_profiles, aggregate_profiles, parse_collapsed
+
+def _make_app():
+    app = create_app('testing')
+    profiler = app.extensions['request_profiler']
+    profiler.output_dir = tempfile.mkdtemp()
+    profiler.allow_request_flag = True  # off by default outside development
+    return app, profiler
+
+def _sampler_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'stack-sampler']
+
+def test_profiled_request_writes_files():
+    """X-Profile: 1 writes collapsed, speedscope and metadata files named by X-Profile-Id"""
+    app, profiler = _make_app()
+
+    response = app.test_client().get('/products', headers={'X-Profile': '1'})
+    profile_id = response.headers['X-Profile-Id']
+
+    base = os.path.join(profiler.output_dir, profile_id)
+    for suffix in ('.collapsed', '.speedscope.json', '.meta.json'):
+        assert os.path.exists(base + suffix)
+    with open(base + '.meta.json') as f:
+        meta = json.load(f)
+    assert meta['endpoint'] == 'product_list' and meta['status'] == 200
+    with open(base + '.speedscope.json') as f:
+        assert json.load(f)['profiles'][0]['type'] == 'sampled'
+
+    # Unflagged requests are not profiled
+    assert 'X-Profile-Id' not in app.test_client().get('/products').headers
+    assert len(list_profiles(profiler.output_dir)) == 1
+
+def test_profiler_stops_when_request_raises():
+    """A propagated exception still stops the sampler and records the profile"""
+    app, profiler = _make_app()
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        app.test_client().get('/boom', headers={'X-Profile': '1'})
+
+    assert not _sampler_threads()
+    profiles = list_profiles(profiler.output_dir)
+    assert len(profiles) == 1
+    assert profiles[0]['status'] == 500 and 'boom' in profiles[0]['error']
+
+def test_cprofile_mode_writes_collapsed_stacks_one_request_at_a_time():
+    """cprofile profiles are aggregated like sampled ones; a second concurrent request is not profiled"""
+    app, profiler = _make_app()
+    profiler.mode = 'cprofile'
+
+    def spin():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+
+    @app.route('/spin')
+    def spin_view():
+        spin()
+        return 'ok'
+
+    response = app.test_client().get('/spin', headers={'X-Profile': '1'})
+    profile_id = response.headers['X-Profile-Id']
+    for suffix in ('.prof', '.collapsed', '.meta.json'):
+        assert os.path.exists(os.path.join(profiler.output_dir, profile_id + suffix))
+
+    merged = aggregate_profiles(profiler.output_dir, list_profiles(profiler.output_dir))
+    spin_samples = sum(count for stack, count in merged.items() if 'spin_view' in stack and 'spin (' in stack)
+    assert spin_samples >= 0.03 / profiler.interval
+
+    with profiling._cprofile_lock:
+        assert 'X-Profile-Id' not in app.test_client().get('/spin', headers={'X-Profile': '1'}).headers
+    assert 'X-Profile-Id' in app.test_client().get('/spin', headers={'X-Profile': '1'}).headers
+
+def test_aggregate_profiles_merges_stacks():
+    """Collapsed stacks of several profiles are summed per stack"""
+    profiler = RequestProfiler(output_dir=tempfile.mkdtemp())
+
+    class FakeSampler:
+        interval = 0.005
+        def __init__(self, stacks):
+            self.stacks = stacks
+            self.samples = sum(stacks.values())
+
+    handler = (('handler', 'app.py', 10),)
+    resize = handler + (('resize', 'image_processor.py', 20),)
+    for stacks in ({handler: 2, resize: 3}, {resize: 4}):
+        profiler.write_profile(FakeSampler(stacks), {'method': 'POST', 'path': '/x',
+                                                     'endpoint': 'update_product_image', 'status': 200,
+                                                     'duration_ms': 12.5})
+
+    profiles = list_profiles(profiler.output_dir, endpoint='update_product_image')
+    merged = aggregate_profiles(profiler.output_dir, profiles)
+
+    assert len(profiles) == 2
+    assert merged == parse_collapsed('handler (app.py:10) 2\n'
+                                     'handler (app.py:10);resize (image_processor.py:20) 7\n')
+
+    # The management command writes the same merge
+    import manage
+    output = os.path.join(profiler.output_dir, 'merged.collapsed')
+    assert manage.main(['profiles', 'list', '--dir', profiler.output_dir]) == 0
+    assert manage.main(['profiles', 'aggregate', '--dir', profiler.output_dir, '--output', output]) == 0
+    with open(output) as f:
+        assert parse_collapsed(f.read()) == merged
+
+if __name__ == '__main__':
+    test_profiled_request_writes_files()
+    test_profiler_stops_when_request_raises()
+    test_cprofile_mode_writes_collapsed_stacks_one_request_at_a_time()
+    test_aggregate_profiles_merges_stacks()
+    print("Profiling tests passed!")
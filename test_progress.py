@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for background image jobs and their Server-Sent Events progress stream
+Images are served by a local stub origin, so no network access is needed.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from app import create_app
+from models.product import Product, db
+from services.progress import JobTracker
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+def _make_app():
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    app.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    with app.app_context():
+        db.session.add_all([Product(f'Product {i}', f'P-{i}') for i in range(1, 4)])
+        db.session.commit()
+    return app
+
+def _parse_sse(body):
+    """Return (event, data) pairs from an SSE body, skipping comments"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+def test_tracker_wakes_followers():
+    """A follower blocked on events_since wakes as soon as its job reports"""
+    tracker = JobTracker()
+    first = tracker.create('single')
+    other = tracker.create('single')
+    after = tracker.last_seq
+    
+    timer = threading.Timer(0.05, tracker.update, args=(first.id, 'download'), kwargs={'bytes': 10})
+    timer.start()
+    tracker.update(other.id, 'download', bytes=5)
+    events = tracker.events_since(after, [first.id], timeout=5)
+    
+    assert [(event, payload['bytes']) for _, event, payload in events] == [('download', 10)]
+    assert tracker.events_since(tracker.last_seq, [first.id], timeout=0) == []
+    
+    tracker.update(first.id, 'done', result={'ok': True})
+    tracker.update(first.id, 'download', bytes=20)
+    assert tracker.get(first.id).to_dict()['state'] == 'done'
+    assert tracker.all_finished([first.id, 'unknown']) and not tracker.all_finished([other.id])
+
+def test_single_and_batch_jobs_stream_progress():
+    """One SSE connection follows a single and a batch job through to completion"""
+    app = _make_app()
+    client = app.test_client()
+    origin = ImageOriginServer(make_stub_image(size=(300, 200))).start()
+    try:
+        single = client.post('/products/1/update-image/async', json={'image_url': f'{origin.base_url}/a.jpg'})
+        # The testing database is one shared connection, so the jobs must not commit at the same time
+        deadline = time.monotonic() + 10
+        while client.get(f"/jobs/{single.get_json()['job_id']}").get_json()['state'] not in ('done', 'failed'):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        batch = client.post('/products/batch/update-images/async', json={'items': [
+            {'product_id': 2, 'image_url': f'{origin.base_url}/b.jpg'},
+            {'product_id': 99, 'image_url': f'{origin.base_url}/c.jpg'},
+        ]})
+        assert single.status_code == 202 and batch.status_code == 202
+        single_id, batch_id = single.get_json()['job_id'], batch.get_json()['job_id']
+    
+        response = client.get(f'/jobs/events?ids={single_id},{batch_id}&after=0')
+        events = _parse_sse(response.get_data(as_text=True))
+    finally:
+        origin.stop()
+    
+    assert response.mimetype == 'text/event-stream'
+    assert events[-1][0] == 'end'
+    
+    single_events = [event for event, data in events if data.get('job_id') == single_id]
+    for stage in ('download', 'decoded', 'resized', 'saved', 'done'):
+        assert stage in single_events
+    assert single_events.index('download') < single_events.index('saved') < single_events.index('done')
+    
+    batch_done = [data for event, data in events if event == 'done' and data['job_id'] == batch_id]
+    assert batch_done and batch_done[0]['result'] == {'succeeded': 1, 'failed': 1}
+    assert ('chunk', 2) in [(event, data['completed']) for event, data in events
+                            if data.get('job_id') == batch_id]
+    
+    status = client.get(f'/jobs/{single_id}').get_json()
+    assert status['state'] == 'done'
+    with app.app_context():
+        assert db.session.get(Product, 1).image_path == status['result']['image_path']
+    assert client.get('/jobs/missing').status_code == 404
+
+def test_unknown_job_ends_stream_and_pages_default_to_sync():
+    """A process that never saw a job says so and ends the stream; pages only use jobs when enabled"""
+    app = _make_app()
+    client = app.test_client()
+    
+    events = _parse_sse(client.get('/jobs/events?ids=elsewhere').get_data(as_text=True))
+    assert events == [('snapshot', {'id': 'elsewhere', 'state': 'unknown'}), ('end', {'ids': ['elsewhere']})]
+    
+    assert 'data-job-progress="false"' in client.get('/').get_data(as_text=True)
+    app.config['JOB_PROGRESS_UI'] = True
+    assert 'data-job-progress="true"' in client.get('/').get_data(as_text=True)
+
+if __name__ == '__main__':
+    test_tracker_wakes_followers()
+    test_single_and_batch_jobs_stream_progress()
+    test_unknown_job_ends_stream_and_pages_default_to_sync()
+    print("Progress tests passed!")
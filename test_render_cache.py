@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the catalog-versioned page and fragment cache
+"""
+
+from sqlalchemy import text
+
+from app import create_app
+from models.product import Product, db
+from services.render_cache import RenderCache
+
+def _make_app():
+    app = create_app('testing')
+    with app.app_context():
+        db.session.add_all([Product(f'Desk Lamp {i}', f'L-{i}') for i in range(1, 4)])
+        db.session.commit()
+    return app
+
+def test_product_list_is_cached_until_a_write():
+    """Repeated views reuse the rendered list; a ProductService write invalidates it"""
+    app = _make_app()
+    client = app.test_client()
+    services = app.extensions['services']
+    
+    first = client.get('/products')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert 'no-cache' in first.headers['Cache-Control']
+    assert first.headers['Last-Modified']
+    
+    calls = []
+    original = services.product_service.get_all_products
+    services.product_service.get_all_products = lambda: calls.append(1) or original()
+    
+    second = client.get('/products')
+    assert second.data == first.data and calls == []
+    
+    not_modified = client.get('/products', headers={'If-None-Match': first.headers['ETag']})
+    assert not_modified.status_code == 304 and not_modified.data == b''
+    
+    with app.app_context():
+        services.product_service.add_product(Product('Floor Lamp', 'L-99'))
+    
+    third = client.get('/products', headers={'If-None-Match': first.headers['ETag']})
+    assert third.status_code == 200 and calls == [1]
+    assert b'Floor Lamp' in third.data
+    assert third.headers['ETag'] != first.headers['ETag']
+
+def test_pending_flash_bypasses_cache():
+    """A page carrying a flash message is rendered fresh and sent without validators"""
+    app = _make_app()
+    client = app.test_client()
+    client.get('/products')
+    
+    client.get('/products/99/search')  # flashes 'Product not found!' and redirects
+    response = client.get('/products')
+    assert b'Product not found!' in response.data
+    assert 'ETag' not in response.headers
+    assert b'Product not found!' not in client.get('/products').data
+
+def test_search_preview_and_fragment_reuse_results():
+    """The preview for a term and the initial search results are rendered once per version"""
+    app = _make_app()
+    client = app.test_client()
+    services = app.extensions['services']
+    
+    searches = []
+    original = services.image_search_service.search_images
+    services.image_search_service.search_images = lambda term: searches.append(term) or original(term)
+    
+    first = client.post('/products/1/search', data={'search_term': 'desk lamp'})
+    second = client.post('/products/1/search', data={'search_term': 'desk lamp'})
+    client.post('/products/1/search', data={'search_term': 'table lamp'})
+    assert first.data == second.data
+    
+    client.get('/products/2/search')
+    page = client.get('/products/2/search')
+    assert b'Initial Search Results' in page.data
+    assert searches == ['desk lamp', 'table lamp', 'Desk Lamp 2']
+
+def test_version_written_by_another_process():
+    """A version bump this process did not commit is picked up after the re-check interval"""
+    app = _make_app()
+    app.config['CATALOG_VERSION_TTL'] = 0
+    client = app.test_client()
+    
+    etag = client.get('/products').headers['ETag']
+    with app.app_context():
+        db.session.execute(text("UPDATE products SET name = 'Renamed Lamp' WHERE id = 1"))
+        db.session.execute(text('UPDATE catalog_version SET version = version + 1'))
+        db.session.commit()
+    
+    response = client.get('/products', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and b'Renamed Lamp' in response.data
+
+def test_cache_is_bounded_by_bytes():
+    """Least recently used entries are evicted once the byte budget is exceeded"""
+    app = _make_app()
+    cache = RenderCache(max_bytes=250)
+    with app.app_context():
+        for key in ('a', 'b', 'c'):
+            cache.render(key, lambda: 'x' * 100)
+        assert len(cache) == 2
+        assert cache.get('a') is None and cache.get('c') is not None
+        cache.render('huge', lambda: 'y' * 1000)
+        assert cache.get('huge') is None
+
+if __name__ == '__main__':
+    test_product_list_is_cached_until_a_write()
+    test_pending_flash_bypasses_cache()
+    test_search_preview_and_fragment_reuse_results()
+    test_version_written_by_another_process()
+    test_cache_is_bounded_by_bytes()
+    print("Render cache tests passed!")
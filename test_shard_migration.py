@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for migrating flat uploads into the sharded layout
+"""
+
+import os
+import tempfile
+
+from app import create_app
+from models.product import Product, db
+from services.shard_migration import ShardMigrator
+
+def _write(path, data=b'jpeg'):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def _setup():
+    app = create_app('testing')
+    upload_folder = os.path.join(tempfile.mkdtemp(), 'products')
+    os.makedirs(upload_folder)
+    return app, upload_folder
+
+def test_migrate_moves_flat_images():
+    """Referenced, shared, missing and orphaned flat files are each handled"""
+    app, upload_folder = _setup()
+    moved = _write(os.path.join(upload_folder, 'MOVED_1.jpg'))
+    shared = _write(os.path.join(upload_folder, 'SHARED_1.jpg'))
+    orphan = _write(os.path.join(upload_folder, 'ORPHAN_1.jpg'))
+    missing = os.path.join(upload_folder, 'MISSING_1.jpg')
+
+    with app.app_context():
+        db.session.add_all([Product('Moved', 'M-1', moved), Product('Shared A', 'S-1', shared),
+                            Product('Shared B', 'S-2', shared), Product('Missing', 'X-1', missing)])
+        db.session.commit()
+
+        migrator = ShardMigrator(upload_folder=upload_folder, shard_depth=2, batch_size=2)
+        report = migrator.migrate()
+
+        assert report.products_moved == 3
+        assert report.products_missing == 1
+        assert report.orphans_moved == 1
+
+        paths = {product.code: product.image_path for product in Product.query}
+        assert paths['M-1'] == migrator.target_for(moved) and os.path.exists(paths['M-1'])
+        assert paths['S-1'] == paths['S-2'] == migrator.target_for(shared)
+        assert os.path.exists(paths['S-1'])
+        assert paths['X-1'] == missing
+
+        # Only the missing product's path is left at the top level
+        assert not any(entry.is_file() for entry in os.scandir(upload_folder))
+        assert os.path.exists(migrator.target_for(orphan))
+
+def test_dry_run_changes_nothing():
+    """A dry run reports the work without touching files or rows"""
+    app, upload_folder = _setup()
+    image = _write(os.path.join(upload_folder, 'DRY_1.jpg'))
+    _write(os.path.join(upload_folder, 'ORPHAN_1.jpg'))
+
+    with app.app_context():
+        db.session.add(Product('Dry', 'D-1', image))
+        db.session.commit()
+
+        report = ShardMigrator(upload_folder=upload_folder, dry_run=True).migrate()
+
+        assert report.products_moved == 1 and report.orphans_moved == 1
+        assert Product.query.first().image_path == image
+        assert sorted(os.listdir(upload_folder)) == ['DRY_1.jpg', 'ORPHAN_1.jpg']
+
+def test_differently_spelled_reference_is_not_orphaned():
+    """A flat file referenced by absolute path stays reachable with a relative upload folder"""
+    app, upload_folder = _setup()
+    image = _write(os.path.join(upload_folder, 'SPELLED_1.jpg'))
+
+    with app.app_context():
+        db.session.add(Product('Spelled', 'SP-1', image))
+        db.session.commit()
+
+        migrator = ShardMigrator(upload_folder=os.path.relpath(upload_folder))
+        report = migrator.migrate()
+
+        assert report.orphans_moved == 0
+        assert report.products_moved == 1
+        image_path = Product.query.first().image_path
+        assert os.path.exists(image_path)
+        assert image_path == migrator.target_for(image)
+
+def test_concurrent_update_wins():
+    """A product whose image changes mid-migration keeps the new image"""
+    app, upload_folder = _setup()
+    image = _write(os.path.join(upload_folder, 'RACE_1.jpg'))
+    replacement = _write(os.path.join(upload_folder, 'REPLACEMENT.jpg'))
+
+    class RacingMigrator(ShardMigrator):
+        def _place(self, source, target):
+            super()._place(source, target)
+            # An /update-image lands between the copy and the guarded UPDATE
+            product = Product.query.first()
+            product.image_path = replacement
+            db.session.commit()
+
+    with app.app_context():
+        db.session.add(Product('Race', 'R-1', image))
+        db.session.commit()
+
+        migrator = RacingMigrator(upload_folder=upload_folder)
+        report = migrator.migrate()
+
+        assert report.products_moved == 0
+        assert report.products_skipped == 1
+        assert Product.query.first().image_path == replacement
+        assert os.path.exists(replacement)
+
+        # The superseded original is swept into its shard as an orphan
+        assert report.orphans_moved == 1
+        assert not os.path.exists(image)
+        assert os.path.exists(migrator.target_for(image))
+
+if __name__ == '__main__':
+    test_migrate_moves_flat_images()
+    test_dry_run_changes_nothing()
+    test_differently_spelled_reference_is_not_orphaned()
+    test_concurrent_update_wins()
+    print("Shard migration tests passed!")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for coalescing concurrent identical searches and downloads
+Images are served by a local stub origin, so no network access is needed.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from services.image_processor import ImageProcessor
+from services.image_search import ImageSearchService
+from utils.singleflight import SingleFlight, fcntl
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+def _run_together(count, target):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+    
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+    
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def _slow(calls, value, delay=0.2):
+    def fn():
+        calls.append(value)
+        time.sleep(delay)
+        return value
+    return fn
+
+def test_concurrent_callers_share_one_execution():
+    """Concurrent callers of one key share a run and its errors; other keys and later calls run again"""
+    flight = SingleFlight('test')
+    calls = []
+    results = _run_together(8, lambda: flight.do('a', _slow(calls, 'A')))
+    assert calls == ['A']
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert all(result == 'A' for result, _ in results)
+    
+    assert flight.do('a', _slow(calls, 'A', 0)) == ('A', False) and len(calls) == 2
+    
+    def fail():
+        calls.append('error')
+        time.sleep(0.2)
+        raise ValueError('origin down')
+    
+    errors = _run_together(4, lambda: flight.do('b', fail))
+    assert calls.count('error') == 1
+    assert all(isinstance(error, ValueError) for error in errors)
+
+def test_interrupted_leader_hands_over_to_a_follower():
+    """A leader stopped by a BaseException (like a cancelled prefetch) does not fail its followers"""
+    class Interrupted(BaseException):
+        pass
+    
+    flight = SingleFlight('test')
+    started = threading.Event()
+    
+    def interrupted():
+        started.set()
+        time.sleep(0.1)
+        raise Interrupted()
+    
+    def lead():
+        with pytest.raises(Interrupted):
+            flight.do('key', interrupted)
+    
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait()
+    assert flight.do('key', lambda: 'retried') == ('retried', False)
+    leader.join()
+
+@pytest.mark.skipif(fcntl is None, reason='cross-worker coalescing needs fcntl')
+def test_workers_share_results_through_the_lock_dir():
+    """Instances sharing a lock_dir (one per worker process) run an operation once"""
+    lock_dir = tempfile.mkdtemp()
+    workers = [SingleFlight('test', lock_dir=lock_dir, dumps=str.encode, loads=bytes.decode) for _ in range(3)]
+    calls = []
+    index = iter(range(3))
+    results = _run_together(3, lambda: workers[next(index)].do('key', _slow(calls, 'value')))
+    assert calls == ['value']
+    assert sorted(results) == [('value', False), ('value', True), ('value', True)]
+    # The last worker to read the result deletes it
+    assert not [name for name in os.listdir(lock_dir) if name.endswith('.result')]
+    
+    # Results finished before a caller arrived are never served as a cache
+    assert workers[0].do('key', _slow(calls, 'fresh', 0)) == ('fresh', False)
+    assert not [name for name in os.listdir(lock_dir) if name.endswith('.result')]
+
+def test_processor_and_search_coalesce():
+    """Concurrent downloads of one URL hit the origin once; concurrent searches run once"""
+    root = tempfile.mkdtemp()
+    flight = SingleFlight('download', lock_dir=os.path.join(root, 'locks'), dumps=bytes, loads=bytes)
+    processor = ImageProcessor(os.path.join(root, 'products'), os.path.join(root, 'temp'), single_flight=flight)
+    origin = ImageOriginServer(make_stub_image(), delay_ms=200).start()
+    try:
+        url = f'{origin.base_url}/a.jpg'
+        downloads = _run_together(6, lambda: processor._download_image(url))
+        assert origin.hits == 1
+        assert len({download.getvalue() for download in downloads}) == 1
+    finally:
+        origin.stop()
+    
+    service = ImageSearchService(single_flight=SingleFlight('search'))
+    searches = []
+    original = service._search_images
+    service._search_images = lambda *args: searches.append(args) or time.sleep(0.2) or original(*args)
+    results = _run_together(5, lambda: service.search_images('Blue Widget', max_results=3))
+    assert len(searches) == 1
+    assert all(result == results[0] and result is not results[0] for result in results[1:])
+
+if __name__ == '__main__':
+    test_concurrent_callers_share_one_execution()
+    test_interrupted_leader_hands_over_to_a_follower()
+    test_workers_share_results_through_the_lock_dir()
+    test_processor_and_search_coalesce()
+    print("Single-flight tests passed!")
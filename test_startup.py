@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Startup-time budget tests
+Importing the app and building it must stay cheap: heavy service dependencies
+(Pillow, requests) are only loaded when a request first needs them.
+"""
+
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Budget for "import app; create_app('testing')" in a fresh interpreter
+STARTUP_BUDGET_MS = 1500
+
+STARTUP_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app('testing')
+created = time.perf_counter()
+heavy = [name for name in ('PIL', 'requests') if name in sys.modules]
+print(f"{(imported - started) * 1000:.1f} {(created - started) * 1000:.1f} {','.join(heavy) or '-'}")
+"""
+
+def measure_startup():
+    """Return (import_ms, create_ms, heavy_modules) measured in a fresh interpreter"""
+    output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True, check=True).stdout.split()
+    import_ms, create_ms, heavy = output[-3:]
+    return float(import_ms), float(create_ms), [] if heavy == '-' else heavy.split(',')
+
+def test_startup_budget():
+    """App import plus factory call stays within budget and skips heavy imports"""
+    import_ms, create_ms, heavy = measure_startup()
+    print(f"import app: {import_ms:.1f}ms, create_app: {create_ms:.1f}ms (budget {STARTUP_BUDGET_MS}ms)")
+    
+    assert not heavy, f"Heavy modules imported at startup: {heavy}"
+    assert create_ms < STARTUP_BUDGET_MS
+
+def test_lazy_app_uses_production_config():
+    """gunicorn app:app gets the production config unless FLASK_CONFIG says otherwise"""
+    script = "import app; print(app.app.debug, app.app.config['PROFILE_ALLOW_REQUEST_FLAG'])"
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('FLASK_CONFIG', 'PROFILE_ALLOW_REQUEST_FLAG')}
+    env['DATABASE_URL'] = 'sqlite:///:memory:'
+    output = subprocess.run([sys.executable, '-c', script], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout.split()
+    assert output[-2:] == ['False', 'False']
+
+def test_services_are_lazy():
+    """Services are only constructed on first use"""
+    from app import create_app
+    
+    application = create_app('testing')
+    services = application.extensions['services']
+    assert not services.is_loaded('image_processor')
+    
+    with application.test_client() as client:
+        assert client.get('/products').status_code == 200
+    
+    assert services.is_loaded('product_service')
+    assert not services.is_loaded('image_processor')
+
+def test_image_update_builds_services_on_demand():
+    """The first image update builds image_processor and its storage without pre-warming"""
+    import tempfile
+    from app import create_app
+    from models.product import Product, db
+    from benchmarks.load_test import ImageOriginServer, make_stub_image
+    
+    application = create_app('testing')
+    root = tempfile.mkdtemp()
+    application.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    application.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    services = application.extensions['services']
+    assert not services.is_loaded('storage')
+    
+    with application.app_context():
+        db.session.add(Product('Lazy Product', 'LAZY-1'))
+        db.session.commit()
+        product_id = Product.query.filter_by(code='LAZY-1').first().id
+    
+    origin = ImageOriginServer(make_stub_image(size=(300, 200))).start()
+    try:
+        response = application.test_client().post(f'/products/{product_id}/update-image',
+                                                   json={'image_url': f'{origin.base_url}/lazy.jpg'})
+    finally:
+        origin.stop()
+    
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert os.path.exists(response.get_json()['image_path'])
+    assert services.is_loaded('storage') and services.is_loaded('image_processor')
+
+if __name__ == '__main__':
+    test_startup_budget()
+    test_lazy_app_uses_production_config()
+    test_services_are_lazy()
+    test_image_update_builds_services_on_demand()
+    print("Startup tests passed!")
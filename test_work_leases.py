@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Tests for lease-based work claiming and the image-fill worker
+Images are served by a local stub origin, so no network access is needed.
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from app import create_app
+from models.product import Product, db
+from models.work_lease import WorkLease
+from services.batch_updater import BatchImageUpdater
+from services.image_fill import ImageFillWorker
+from services.product_service import ProductService
+from services.work_leases import WorkLeases
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+class Clock:
+    """Shared clock the test moves forward by hand"""
+    
+    def __init__(self):
+        self.now = datetime(2026, 1, 1)
+    
+    def __call__(self):
+        return self.now
+    
+    def advance(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+
+class StubSearch:
+    """Finds one image per product, except for products named 'Unfindable'"""
+    
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+    
+    def search_images(self, search_term, engine='picsum', max_results=20):
+        if search_term == 'Unfindable':
+            return []
+        return [{'url': f'{self.base_url}/{search_term}.jpg', 'title': search_term, 'source': 'stub'}]
+
+def _make_app(count: int = 6):
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'products')
+    app.config['TEMP_FOLDER'] = os.path.join(root, 'temp')
+    app.config['BATCH_CHUNK_SIZE'] = 2
+    with app.app_context():
+        db.session.add_all([Product(f'Product {i}', f'P-{i}') for i in range(1, count + 1)])
+        db.session.commit()
+    return app
+
+def test_claims_are_disjoint():
+    """Workers never lease the same product; products with images are never claimed"""
+    app = _make_app()
+    clock = Clock()
+    
+    with app.app_context():
+        ProductService().update_product_image(2, 'uploads/products/existing.jpg')
+        first, second = WorkLeases('node-a', clock=clock), WorkLeases('node-b', clock=clock)
+        
+        assert first.claim(2) == [1, 3]
+        assert second.claim(10) == [4, 5, 6]
+        assert first.claim(10) == [] and second.claim(10, after_id=4) == []
+        assert first.status() == {'held': 5, 'expired': 0, 'deferred': 0, 'ready': 0}
+        
+        # Releasing hands products straight to the next claim
+        assert first.release([3]) == 1
+        assert second.claim(10) == [3]
+        assert first.release() == 1
+        assert first.status() == {'held': 4, 'expired': 0, 'deferred': 0, 'ready': 1}
+
+def test_dead_worker_leases_are_taken_over():
+    """Heartbeats keep leases alive; once they stop, another worker takes the products over"""
+    app = _make_app(3)
+    clock = Clock()
+    
+    with app.app_context():
+        dead, live = (WorkLeases(owner, lease_seconds=60, clock=clock) for owner in ('node-a', 'node-b'))
+        assert dead.claim(10) == [1, 2, 3]
+        
+        clock.advance(50)
+        assert dead.heartbeat() == 3
+        clock.advance(50)
+        assert live.claim(10) == []
+        
+        # node-a stops heartbeating
+        clock.advance(11)
+        assert dead.status()['expired'] == 3
+        assert live.claim(2) == [1, 2]
+        assert db.session.get(WorkLease, 1).attempts == 2
+        
+        # The dead owner can no longer settle or extend what it lost
+        assert dead.complete([1, 2]) == 0
+        assert dead.heartbeat() == 1
+        assert live.complete([1, 2]) == 2
+        assert WorkLease.query.count() == 1
+
+def test_failed_products_back_off():
+    """Deferred products wait out a doubling back-off before anyone retries them"""
+    app = _make_app(2)
+    clock = Clock()
+    
+    with app.app_context():
+        first = WorkLeases('node-a', retry_seconds=100, clock=clock)
+        second = WorkLeases('node-b', retry_seconds=100, clock=clock)
+        assert first.claim(10) == [1, 2]
+        assert first.defer([1, 2, 99]) == 2
+        assert first.status() == {'held': 0, 'expired': 0, 'deferred': 2, 'ready': 0}
+        
+        clock.advance(99)
+        assert second.claim(10) == []
+        clock.advance(1)
+        assert second.claim(1) == [1]
+        assert second.defer([1]) == 1
+        clock.advance(100)
+        assert second.claim(10) == [2]
+        clock.advance(100)
+        assert second.claim(10) == [1]
+        
+        # Products given an image elsewhere drop their leftover lease
+        assert second.defer([1]) == 1
+        ProductService().update_product_image(1, 'uploads/products/manual.jpg')
+        assert second.purge() == 1
+        assert [lease.product_id for lease in WorkLease.query] == [2]
+
+def test_fill_worker_fills_missing_images():
+    """Workers sharing the database fill every product once and defer the ones without results"""
+    app = _make_app(5)
+    origin = ImageOriginServer(make_stub_image(size=(300, 200))).start()
+    
+    with app.app_context():
+        ProductService().update_product(4, name='Unfindable')
+        services = app.extensions['services']
+        workers = []
+        for owner in ('node-a', 'node-b'):
+            updater = BatchImageUpdater(services.image_processor, ProductService(), chunk_size=2,
+                                        only_missing=True)
+            workers.append(ImageFillWorker(WorkLeases(owner), StubSearch(origin.base_url), updater,
+                                           claim_size=2))
+        try:
+            # node-a takes the first batch, then both work through the rest
+            reports = [workers[0].run(max_batches=1), workers[1].run(), workers[0].run()]
+        finally:
+            origin.stop()
+        
+        assert origin.hits == 4
+        assert sum(report.filled for report in reports) == 4
+        assert sum(report.failed for report in reports) == 1
+        rows = {product.id: product for product in Product.query}
+        assert all(os.path.exists(rows[i].image_path) for i in (1, 2, 3, 5))
+        assert rows[4].image_path is None
+        assert [(lease.product_id, lease.owner) for lease in WorkLease.query] == [(4, None)]
+
+def test_fill_keeps_image_set_after_lease_loss():
+    """Should two workers end up on one product, the image set first is kept"""
+    app = _make_app(1)
+    
+    class RacingProcessor:
+        def process_and_save_image(self, url, code, progress=None):
+            # Another node sets the image while this one is still downloading
+            with app.app_context():
+                ProductService().update_product_image(1, 'uploads/products/other-node.jpg')
+            return 'uploads/products/this-node.jpg'
+        
+        def image_metadata(self, image_path):
+            return None
+    
+    with app.app_context():
+        updater = BatchImageUpdater(RacingProcessor(), ProductService(), max_workers=1, only_missing=True)
+        worker = ImageFillWorker(WorkLeases('node-a'), StubSearch('http://origin'), updater)
+        report = worker.run()
+        
+        assert (report.filled, report.skipped) == (0, 1)
+        assert db.session.get(Product, 1).image_path == 'uploads/products/other-node.jpg'
+        assert WorkLease.query.count() == 0
+
+if __name__ == '__main__':
+    test_claims_are_disjoint()
+    test_dead_worker_leases_are_taken_over()
+    test_failed_products_back_off()
+    test_fill_worker_fills_missing_images()
+    test_fill_keeps_image_set_after_lease_loss()
+    print("Work lease tests passed!")
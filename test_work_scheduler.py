@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the priority lanes shared by interactive, batch and prefetch image work
+Images are served by a local stub origin, so no network access is needed.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from app import create_app
+from models.product import Product, db
+from services.work_scheduler import WorkScheduler, INTERACTIVE, BATCH, BACKGROUND, WORK_WAIT_SECONDS, WORK_QUEUE_DEPTH
+from benchmarks.load_test import ImageOriginServer, make_stub_image
+
+def _blocker():
+    release = threading.Event()
+    started = threading.Event()
+    
+    def block():
+        started.set()
+        release.wait(5)
+    return block, started, release
+
+def test_interactive_work_skips_the_batch_queue():
+    """Reserved workers pick up a click at once while batch items queue, within their own limit"""
+    scheduler = WorkScheduler(max_workers=3, interactive_reserved=1)
+    peak, running, lock = [0], [0], threading.Lock()
+    
+    def batch_item():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+    
+    futures = [scheduler.submit(BATCH, batch_item, group='job') for _ in range(20)]
+    time.sleep(0.02)
+    assert scheduler.depth(BATCH) > 10
+    
+    waited_before = WORK_WAIT_SECONDS.count(lane=INTERACTIVE)
+    started = time.monotonic()
+    assert scheduler.run(INTERACTIVE, lambda: 'saved') == 'saved'
+    assert time.monotonic() - started < 0.04
+    assert WORK_WAIT_SECONDS.count(lane=INTERACTIVE) == waited_before + 1
+    
+    for future in futures:
+        future.result()
+    assert peak[0] == 2
+    assert WORK_QUEUE_DEPTH.value(lane=BATCH) == 0
+
+def test_lanes_run_in_priority_order_and_batches_share_fairly():
+    """Queued batch jobs alternate, and background work waits until batch work is drained"""
+    scheduler = WorkScheduler(max_workers=2, interactive_reserved=1)
+    block, started, release = _blocker()
+    scheduler.submit(BATCH, block)
+    started.wait(1)
+    
+    order = []
+    futures = [scheduler.submit(BACKGROUND, order.append, 'prefetch')]
+    futures += [scheduler.submit(BATCH, order.append, f'A{i}', group='A') for i in range(3)]
+    futures += [scheduler.submit(BATCH, order.append, f'B{i}', group='B') for i in range(2)]
+    cancelled = scheduler.submit(BACKGROUND, order.append, 'cancelled')
+    assert cancelled.cancel()
+    release.set()
+    for future in futures:
+        future.result(2)
+    
+    assert order == ['A0', 'B0', 'A1', 'B1', 'A2', 'prefetch']
+
+def test_lane_limits_cap_a_lane():
+    """A lane limit leaves shared workers idle rather than exceed it"""
+    scheduler = WorkScheduler(max_workers=4, interactive_reserved=0, lane_limits={BACKGROUND: 1})
+    block, started, release = _blocker()
+    scheduler.submit(BACKGROUND, block)
+    started.wait(1)
+    second = scheduler.submit(BACKGROUND, lambda: 'warmed')
+    time.sleep(0.05)
+    assert not second.done() and scheduler.running(BACKGROUND) == 1
+    release.set()
+    assert second.result(2) == 'warmed'
+
+def test_update_route_runs_in_the_interactive_lane():
+    """A sync /update-image is processed by a scheduler worker in the interactive lane"""
+    app = create_app('testing')
+    root = tempfile.mkdtemp()
+    app.config.update(UPLOAD_FOLDER=os.path.join(root, 'products'), TEMP_FOLDER=os.path.join(root, 'temp'))
+    with app.app_context():
+        db.session.add(Product('Lamp', 'LAMP-1'))
+        db.session.commit()
+    
+    origin = ImageOriginServer(make_stub_image()).start()
+    waited_before = WORK_WAIT_SECONDS.count(lane=INTERACTIVE)
+    try:
+        response = app.test_client().post('/products/1/update-image', json={'image_url': f'{origin.base_url}/a.jpg'})
+    finally:
+        origin.stop()
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert WORK_WAIT_SECONDS.count(lane=INTERACTIVE) == waited_before + 1
+
+if __name__ == '__main__':
+    test_interactive_work_skips_the_batch_queue()
+    test_lanes_run_in_priority_order_and_batches_share_fairly()
+    test_lane_limits_cap_a_lane()
+    test_update_route_runs_in_the_interactive_lane()
+    print("Work scheduler tests passed!")
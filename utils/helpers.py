@@ -1,5 +1,6 @@
 import os
 import re
+import hashlib
 from typing import List, Dict, Any
 from urllib.parse import urlparse
 
@@ -57,6 +58,13 @@ def create_directory_if_not_exists(directory_path: str) -> bool:
     except Exception:
         return False
 
+def shard_path(filename: str, depth: int = 2) -> str:
+    """Prefix a filename with hash-derived shard directories, e.g. 'ab/cd/name.jpg'"""
+    if depth <= 0:
+        return filename
+    digest = hashlib.md5(filename.encode()).hexdigest()
+    return '/'.join([digest[i * 2:i * 2 + 2] for i in range(depth)] + [filename])
+
 def get_image_dimensions(image_path: str) -> tuple:
     """Get image dimensions without loading the entire image"""
     try:
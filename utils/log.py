@@ -0,0 +1,37 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+
+class StructuredFormatter(logging.Formatter):
+    """Render log records as single-line JSON including any structured fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = None):
+    """Install the structured formatter on the root logger (idempotent)"""
+    root = logging.getLogger()
+    if any(isinstance(h.formatter, StructuredFormatter) for h in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter())
+    root.addHandler(handler)
+    root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO'))
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields):
+    """Log an event name with key/value fields attached for the structured formatter"""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields})
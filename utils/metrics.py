@@ -0,0 +1,205 @@
+import threading
+import time
+import bisect
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Default histogram buckets in seconds, from sub-millisecond DB queries up to slow downloads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    """Turn a label dict into a hashable, ordered key"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Format labels in Prometheus exposition syntax"""
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    pairs = []
+    for name, value in items:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(key)} {value}'
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect plus a few additions under a lock"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts, then +Inf count, then sum
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager observing the elapsed wall time of its block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return int(sum(series[:-1])) if series else 0
+
+    def total(self, **labels) -> float:
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0.0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(key, ("le", repr(bound)))} {cumulative}'
+            cumulative += series[len(self.buckets)]
+            yield f'{self.name}_bucket{_format_labels(key, ("le", "+Inf"))} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(key)} {series[-1]}'
+            yield f'{self.name}_count{_format_labels(key)} {cumulative}'
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, description: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, description: str = '') -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str = '') -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str = '',
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            if metric.description:
+                lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# Global registry used by the application
+registry = MetricsRegistry()
+
+# Shared metrics
+STAGE_SECONDS = registry.histogram(
+    'image_pipeline_stage_seconds', 'Time spent in each image pipeline stage')
+SEARCH_SECONDS = registry.histogram(
+    'image_search_seconds', 'Time spent serving an image search')
+DB_QUERY_SECONDS = registry.histogram(
+    'db_query_seconds', 'Time spent executing database statements')
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_seconds', 'Time spent handling HTTP requests')
+FAILURES = registry.counter(
+    'failures_total', 'Failures by component and reason')
+
+
+def instrument_sqlalchemy(engine_class=None):
+    """Time every statement executed through SQLAlchemy engines"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    target = engine_class or Engine
+    if getattr(target, '_metrics_instrumented', False):
+        return
+
+    @event.listens_for(target, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(target, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_start'].pop()
+        operation = statement.lstrip().split(' ', 1)[0].lower()
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(target, 'handle_error')
+    def _error(context):
+        starts = context.connection.info.get('query_start') if context.connection else None
+        if starts:
+            starts.pop()
+        FAILURES.inc(component='db', reason=type(context.original_exception).__name__)
+
+    target._metrics_instrumented = True
@@ -0,0 +1,313 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+# Deepest call chain followed when turning pstats data into stacks
+PSTATS_MAX_DEPTH = 64
+
+# Only one cProfile profiler can be enabled per process (Python 3.12+ raises
+# ValueError for a second one), so cprofile mode profiles one request at a time
+_cprofile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> Tuple[str, str, int]:
+    code = frame.f_code
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+class StackSampler:
+    """Samples the stack of one thread at a fixed interval from a helper thread"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: TallyCounter = TallyCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            # Root first, as expected by collapsed-stack and speedscope formats
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def to_collapsed(stacks: Dict[tuple, int]) -> str:
+    """Render stacks in Brendan Gregg's collapsed format (frame;frame;frame count)"""
+    lines = []
+    for stack, count in sorted(stacks.items()):
+        frames = ';'.join(f'{name} ({os.path.basename(filename)}:{line})' for name, filename, line in stack)
+        lines.append(f'{frames} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def pstats_to_stacks(profiler: cProfile.Profile, interval: float) -> TallyCounter:
+    """
+    Approximate stacks from a finished cProfile run, weighted in ``interval`` units
+
+    pstats only records caller -> callee edges, so each function's time is
+    split between the paths reaching it in proportion to the time its callers
+    spent in it. Good enough to merge with sampled profiles; exact call paths
+    are in the .prof file. Recursive calls are cut where a function reappears.
+    """
+    stats = pstats.Stats(profiler).stats
+    callees: Dict[tuple, Dict[tuple, float]] = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+
+    stacks = TallyCounter()
+
+    def visit(func, path, fraction, depth):
+        _, _, own, total, _ = stats[func]
+        filename, line, name = func
+        path = path + ((name, filename, line),)
+        count = round(own * fraction / interval)
+        if count:
+            stacks[path] += count
+        if depth >= PSTATS_MAX_DEPTH:
+            return
+        on_path = {(frame[1], frame[2], frame[0]) for frame in path}
+        for callee, edge_time in callees.get(func, {}).items():
+            callee_total = stats[callee][3]
+            if callee in on_path or callee_total <= 0:
+                continue
+            visit(callee, path, fraction * edge_time / callee_total, depth + 1)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not any(caller in stats for caller in callers):
+            visit(func, (), 1.0, 0)
+    return stacks
+
+
+def parse_collapsed(text: str) -> TallyCounter:
+    """Parse collapsed-stack text back into a stack -> count tally"""
+    stacks = TallyCounter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+
+def to_speedscope(stacks: Dict[tuple, int], interval: float, name: str) -> dict:
+    """Render stacks as a speedscope sampled profile"""
+    frame_index: Dict[tuple, int] = {}
+    frames: List[dict] = []
+    samples: List[List[int]] = []
+    weights: List[float] = []
+
+    for stack, count in stacks.items():
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+            indices.append(frame_index[frame])
+        samples.append(indices)
+        weights.append(count * interval)
+
+    return {
+        '$schema': SPEEDSCOPE_SCHEMA,
+        'name': name,
+        'exporter': 'smart-image-updater',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights
+        }]
+    }
+
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiler for a Flask app
+
+    A request is profiled when it carries the ``X-Profile: 1`` header or a
+    ``?profile=1`` query flag (if request flags are allowed), or when it is picked
+    by the configured sample rate. Profiles are written into ``output_dir`` as
+    collapsed stacks plus a speedscope file (sampling mode) or a pstats file
+    (cprofile mode), each with a ``.meta.json`` sidecar. cprofile mode also
+    writes collapsed stacks approximated from the pstats data, and profiles
+    one request at a time: requests arriving meanwhile are not profiled.
+    """
+
+    def __init__(self, app=None, output_dir: str = 'profiles', sample_rate: float = 0.0,
+                 mode: str = 'sampling', interval: float = 0.005, allow_request_flag: bool = True):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.interval = interval
+        self.allow_request_flag = allow_request_flag
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.output_dir = app.config.get('PROFILE_DIR', self.output_dir)
+        self.sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE', self.sample_rate))
+        self.mode = app.config.get('PROFILE_MODE', self.mode)
+        self.interval = float(app.config.get('PROFILE_INTERVAL', self.interval))
+        self.allow_request_flag = app.config.get('PROFILE_ALLOW_REQUEST_FLAG', self.allow_request_flag)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        # Stop in teardown so profiles also cover streamed bodies and requests that raise
+        app.teardown_request(self._teardown_request)
+        app.extensions['request_profiler'] = self
+
+    def should_profile(self, request) -> bool:
+        if self.allow_request_flag and (request.headers.get('X-Profile') == '1'
+                                        or request.args.get('profile') == '1'):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def new_profile_id(endpoint: Optional[str]) -> str:
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        return f"{stamp}_{(endpoint or 'unknown').replace('/', '_')}"
+
+    def _before_request(self):
+        from flask import g, request
+
+        if not self.should_profile(request):
+            return None
+
+        if self.mode == 'cprofile':
+            if not _cprofile_lock.acquire(blocking=False):
+                return None
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Some other profiler (a debugger, coverage) holds the hook
+                _cprofile_lock.release()
+                return None
+            g._profiler = profiler
+        else:
+            g._profiler = StackSampler(threading.get_ident(), self.interval).start()
+        g._profile_id = self.new_profile_id(request.endpoint)
+        g._profile_started = time.perf_counter()
+        return None
+
+    def _after_request(self, response):
+        from flask import g
+
+        if g.get('_profiler') is not None:
+            g._profile_status = response.status_code
+            response.headers['X-Profile-Id'] = g._profile_id
+        return response
+
+    def _teardown_request(self, exc):
+        from flask import g, request
+
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return
+
+        duration = time.perf_counter() - g.pop('_profile_started')
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            _cprofile_lock.release()
+        else:
+            profiler.stop()
+
+        meta = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': g.pop('_profile_status', 500),
+            'duration_ms': round(duration * 1000, 2)
+        }
+        if exc is not None:
+            meta['error'] = repr(exc)
+        try:
+            self.write_profile(profiler, meta, g.pop('_profile_id'))
+        except OSError:
+            pass
+
+    def write_profile(self, profiler, meta: dict, profile_id: Optional[str] = None) -> str:
+        """Write a finished profile and its metadata; returns the profile id"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        profile_id = profile_id or self.new_profile_id(meta.get('endpoint'))
+        base = os.path.join(self.output_dir, profile_id)
+
+        meta = dict(meta, id=profile_id, mode=self.mode, created_at=datetime.utcnow().isoformat())
+        if isinstance(profiler, cProfile.Profile):
+            profiler.dump_stats(base + '.prof')
+            meta['interval'] = self.interval
+            with open(base + '.collapsed', 'w') as f:
+                f.write(to_collapsed(pstats_to_stacks(profiler, self.interval)))
+            meta['files'] = [profile_id + '.prof', profile_id + '.collapsed']
+        else:
+            meta['samples'] = profiler.samples
+            meta['interval'] = profiler.interval
+            with open(base + '.collapsed', 'w') as f:
+                f.write(to_collapsed(profiler.stacks))
+            with open(base + '.speedscope.json', 'w') as f:
+                json.dump(to_speedscope(profiler.stacks, profiler.interval,
+                                        f"{meta['method']} {meta['path']}"), f)
+            meta['files'] = [profile_id + '.collapsed', profile_id + '.speedscope.json']
+
+        with open(base + '.meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+        return profile_id
+
+
+def list_profiles(output_dir: str, endpoint: Optional[str] = None) -> List[dict]:
+    """Return profile metadata from output_dir, newest first"""
+    profiles = []
+    if not os.path.isdir(output_dir):
+        return profiles
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.meta.json'):
+                continue
+            with open(entry.path) as f:
+                meta = json.load(f)
+            if endpoint and meta.get('endpoint') != endpoint:
+                continue
+            profiles.append(meta)
+    profiles.sort(key=lambda m: m.get('created_at', ''), reverse=True)
+    return profiles
+
+
+def aggregate_profiles(output_dir: str, profiles: List[dict]) -> TallyCounter:
+    """Merge the collapsed stacks of several profiles (cprofile ones are approximate)"""
+    merged = TallyCounter()
+    for meta in profiles:
+        for filename in meta.get('files', []):
+            if filename.endswith('.collapsed'):
+                with open(os.path.join(output_dir, filename)) as f:
+                    merged.update(parse_collapsed(f.read()))
+    return merged
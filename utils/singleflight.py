@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within the process only
+    fcntl = None
+
+from utils.metrics import registry
+
+SINGLE_FLIGHT_CALLS = registry.counter('single_flight_calls_total',
+                                       'Coalesced operations by name and role (leader, follower, worker_follower)')
+
+# Sweep stale lock files (and results left by killed workers) after this many led executions
+SWEEP_EVERY = 256
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical operations onto one execution
+
+    The first caller for a key runs the operation; callers arriving while it
+    is in flight wait and receive the same result (or exception). With a
+    ``lock_dir`` (and ``dumps``/``loads`` for the result) the leader also takes
+    an flock on a per-key file, so leaders in other worker processes wait for
+    it and read the result it leaves next to the lock instead of repeating the
+    work. Only results written after a caller started waiting are shared:
+    this coalesces in-flight work and never serves an old result as a cache.
+    The last caller through deletes the result file, so results only stay on
+    disk while someone is waiting for them.
+    """
+
+    def __init__(self, name: str, lock_dir: Optional[str] = None,
+                 dumps: Optional[Callable[[Any], bytes]] = None, loads: Optional[Callable[[bytes], Any]] = None,
+                 result_ttl: float = 60.0):
+        self.name = name
+        self.lock_dir = lock_dir if lock_dir and dumps and loads and fcntl else None
+        self.dumps = dumps
+        self.loads = loads
+        self.result_ttl = result_ttl
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._runs = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run ``fn`` once for all concurrent callers with the same key
+
+        Returns:
+            (result, shared), where shared is True if another caller's run produced it
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            call.done.wait()
+            if call.error is None:
+                SINGLE_FLIGHT_CALLS.inc(name=self.name, role='follower')
+                return call.result, True
+            if isinstance(call.error, Exception):
+                raise call.error
+            # The leader was interrupted (e.g. a cancelled prefetch); run it ourselves
+
+        try:
+            call.result, shared = self._run(key, fn)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _run(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        if not self.lock_dir:
+            SINGLE_FLIGHT_CALLS.inc(name=self.name, role='leader')
+            return fn(), False
+
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        lock_path = os.path.join(self.lock_dir, f'{self.name}-{digest}.lock')
+        wait_path = os.path.join(self.lock_dir, f'{self.name}-{digest}.wait')
+        result_path = os.path.join(self.lock_dir, f'{self.name}-{digest}.result')
+        started = time.time()
+
+        with open(wait_path, 'a+b') as wait_file, open(lock_path, 'a+b') as lock_file:
+            # Every caller for the key holds a shared lock on the wait file until it is done,
+            # so the last one through can tell nobody is left to read the result
+            fcntl.flock(wait_file, fcntl.LOCK_SH)
+            # Blocks while a leader in another worker process runs the same operation
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                shared = self._read_result(result_path, started)
+                if shared is not None:
+                    SINGLE_FLIGHT_CALLS.inc(name=self.name, role='worker_follower')
+                    result = shared[0]
+                else:
+                    SINGLE_FLIGHT_CALLS.inc(name=self.name, role='leader')
+                    result = fn()
+                    if result is not None:
+                        temp_path = f'{result_path}.{os.getpid()}.{threading.get_ident()}'
+                        with open(temp_path, 'wb') as f:
+                            f.write(self.dumps(result))
+                        os.replace(temp_path, result_path)
+                self._discard_unread(wait_file, result_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        if shared is not None:
+            return result, True
+        self._runs += 1
+        if self._runs % SWEEP_EVERY == 0:
+            self._sweep()
+        return result, False
+
+    @staticmethod
+    def _discard_unread(wait_file, result_path: str):
+        """Delete the result file unless another caller is still waiting to read it"""
+        try:
+            # Succeeds only if no other caller holds its shared lock
+            fcntl.flock(wait_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        try:
+            os.remove(result_path)
+        except OSError:
+            pass
+
+    def _read_result(self, result_path: str, started: float) -> Optional[Tuple[Any]]:
+        """(result,) if another worker finished the operation after we started waiting"""
+        try:
+            if os.path.getmtime(result_path) < started:
+                return None
+            with open(result_path, 'rb') as f:
+                return (self.loads(f.read()),)
+        except (OSError, ValueError):
+            return None
+
+    def _sweep(self):
+        """
+        Remove lock and result files untouched for result_ttl seconds
+
+        A lock removed while held only means the next caller for that key may
+        run alongside the holder instead of waiting for it.
+        """
+        cutoff = time.time() - self.result_ttl
+        try:
+            with os.scandir(self.lock_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith(f'{self.name}-') and entry.stat().st_mtime < cutoff:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            pass